@@ -21,6 +21,7 @@
 
 from array import array
 
+import numpy
 import ROOT
 import hdtv.util
 from hdtv.color import tcolors
@@ -41,6 +42,38 @@ def MakeCalibration(cal):
     return cal
 
 
+def _Convert(convert, values):
+    values = numpy.ascontiguousarray(values, dtype=numpy.float64)
+    result = numpy.empty_like(values)
+    if values.size > 0:
+        convert(values, result, values.size)
+    return result
+
+
+def Ch2E(cal, channels):
+    """
+    Convert the channels (array-like) to energies with calibration cal
+    (anything accepted by MakeCalibration()), returns a numpy array
+    """
+    return _Convert(MakeCalibration(cal).Ch2E, channels)
+
+
+def E2Ch(cal, energies):
+    """
+    Convert the energies (array-like) to channels with calibration cal
+    (anything accepted by MakeCalibration()), returns a numpy array
+    """
+    return _Convert(MakeCalibration(cal).E2Ch, energies)
+
+
+def dEdCh(cal, channels):
+    """
+    Slope of calibration cal (anything accepted by MakeCalibration()) at
+    the channels (array-like), returns a numpy array
+    """
+    return _Convert(MakeCalibration(cal).dEdCh, channels)
+
+
 def GetCoeffs(cal):
     """
     Get the list of calibration coeffs from the ROOT.HDTV.Calibration object
@@ -44,6 +44,7 @@ except ImportError:
     import __builtin__ as builtins
 
 import hdtv.util
+import hdtv.timing
 from hdtv.color import tcolors
 
 import ROOT
@@ -74,6 +75,17 @@ class HDTVOptionParser(argparse.ArgumentParser):
             raise HDTVCommandError(message)
 
 
+class HDTVLazyCommand(object):
+    """
+    Placeholder for a command of a plugin that has not been loaded yet.
+    load() is called on first use of the command and has to register the
+    real command (e.g. by importing the plugin).
+    """
+
+    def __init__(self, load):
+        self.load = load
+
+
 class HDTVCommandTreeNode(object):
     def __init__(self, parent, title, level):
         self.parent = parent
@@ -156,6 +168,9 @@ class HDTVCommandTree(HDTVCommandTreeNode):
         self.command = None
         self.options = None
         self.default_level = 1
+        # If not None, the (title, level) of all added commands are
+        # appended to this list
+        self.record = None
 
     def SplitCmdline(self, s):
         """
@@ -197,6 +212,19 @@ class HDTVCommandTree(HDTVCommandTreeNode):
                     next = HDTVCommandTreeNode(node, elem, level)
                 node = next
 
+        if self.record is not None:
+            self.record.append((title, level))
+
+        # A placeholder for a command that is not loaded yet is simply
+        # replaced by the command
+        for child in node.childs:
+            if child.title == path[-1] and isinstance(
+                    child.command, HDTVLazyCommand):
+                child.level = level
+                child.command = command
+                child.options = opt
+                return
+
         # Check to see if the node we are trying to add already exists; if it
         # does and we are not allowed to overwrite it, raise an error
         if not overwrite:
@@ -209,6 +237,13 @@ class HDTVCommandTree(HDTVCommandTreeNode):
         node.command = command
         node.options = opt
 
+    def AddLazyCommand(self, title, load, level=None):
+        """
+        Adds a placeholder for a command that is registered by calling
+        load() (see HDTVLazyCommand)
+        """
+        self.AddCommand(title, HDTVLazyCommand(load), level=level)
+
     def FindNode(self, path, use_levels=True):
         """
         Finds the command node given by path, which should be a list
@@ -232,6 +267,26 @@ class HDTVCommandTree(HDTVCommandTreeNode):
 
         return (node, path)
 
+    def FindCommand(self, path):
+        """
+        Finds the node of the command given by path (see FindNode()).
+        Commands of plugins that are not loaded yet are loaded. Returns a
+        tuple consisting of the node found and of the arguments.
+        """
+        (node, args) = self.FindNode(list(path))
+        while node and not node.command:
+            node = node.PrimaryChild()
+
+        if node and isinstance(node.command, HDTVLazyCommand):
+            node.command.load()
+            if isinstance(node.command, HDTVLazyCommand):
+                # The plugin did not register the command after all
+                return (None, args)
+            # Loading may have changed the command tree
+            return self.FindCommand(path)
+
+        return (node, args)
+
     def ExecCommand(self, cmdline):
         # Strip comments
         cmdline = hdtv.util.remove_comments(cmdline)
@@ -248,9 +303,7 @@ class HDTVCommandTree(HDTVCommandTreeNode):
                     print("Inappropriate use of quotation characters.")
                     continue
 
-                (node, args) = self.FindNode(path)
-                while node and not node.command:
-                    node = node.PrimaryChild()
+                (node, args) = self.FindCommand(path)
 
                 if not node or not node.command:
                     raise HDTVCommandError("Command not recognized")
@@ -265,7 +318,8 @@ class HDTVCommandTree(HDTVCommandTreeNode):
                     args = parser.parse_args(args)
 
                 # Execute the command
-                node.command(args)
+                with hdtv.timing.timer.Measure(node.FullTitle()):
+                    node.command(args)
             except HDTVCommandAbort as msg:
                 if msg.value:
                     hdtv.ui.error(msg.value)
@@ -356,8 +410,14 @@ class HDTVCommandTree(HDTVCommandTreeNode):
         # from path above, it now needs to be unambiguous. If is isn't, we
         # cannot suggest any completions.
         try:
-            (node, args) = self.FindNode(path)
-        except RuntimeError:
+            (node, args) = self.FindNode(list(path))
+            # Arguments of commands that are not loaded yet can only be
+            # completed after loading them
+            if isinstance(node.command, HDTVLazyCommand) and (
+                    args or not node.childs):
+                node.command.load()
+                (node, args) = self.FindNode(list(path))
+        except (RuntimeError, HDTVCommandError):
             # Command is ambiguous
             return []
 
@@ -439,6 +499,9 @@ class CommandLine(object):
 
         self.fKeepRunning = True
 
+        # Called once before the first Python code is executed
+        self.fPyPrepare = None
+
         if os.sep == '\\':
             eof = 'Ctrl-Z plus Return'
         else:
@@ -492,7 +555,16 @@ class CommandLine(object):
         else:
             return ("HDTV", s)
 
+    def PreparePython(self):
+        """
+        Call the fPyPrepare hook, if it has not been called yet
+        """
+        if self.fPyPrepare:
+            (prepare, self.fPyPrepare) = (self.fPyPrepare, None)
+            prepare()
+
     def EnterPython(self, args=None):
+        self.PreparePython()
         if os.sep == '\\':
             eof = 'Ctrl-Z plus Return'
         else:
@@ -583,21 +655,28 @@ class CommandLine(object):
         """
         hdtv.ui.msg("Execute file: " + fname)
 
+        log = None
         try:
             file = hdtv.util.TxtFile(fname)
             file.read()
+            log = hdtv.timing.OpenLog(fname)
         except IOError as msg:
             hdtv.ui.error("%s" % msg)
-        for line in file.lines:
+        for (index, line) in enumerate(file.lines):
             print(hdtv.util.get_prompt('file', inputable=False) + line)
+            start = hdtv.timing.Timer.Snapshot()
             self.DoLine(line)
             # TODO: HACK: How should I teach this micky mouse language that a
             # python statement (e.g. "for ...:") has ended???
             if self.fPyMore:
                 self.fPyMore = self._py_console.push("")
+            if log:
+                log.Write(index, line, hdtv.timing.Timer.Since(start))
             if not self.fKeepRunning:
                 print("")
                 break
+        if log:
+            log.Close()
 
     def ExecShell(self, cmd):
         subprocess.call(cmd, shell=True)
@@ -622,6 +701,7 @@ class CommandLine(object):
                 # The push() function returns a boolean indicating
                 #  whether further input from the user is required.
                 #  We set the python mode accordingly.
+                self.PreparePython()
                 self.fPyMore = self._py_console.push(cmd)
             elif cmd_type == "CMDFILE":
                 self.ExecCmdfile(cmd)
@@ -708,6 +788,11 @@ def AddCommand(title, command, **opt):
     command_tree.AddCommand(title, command, **opt)
 
 
+def AddLazyCommand(title, load, level=None):
+    global command_tree
+    command_tree.AddLazyCommand(title, load, level)
+
+
 def ExecCommand(cmdline):
     global command_tree
     command_tree.ExecCommand(cmdline)
@@ -9,13 +9,25 @@ from hdtv.database.common import *
 
 # TODO: integrate this in a class?
 
+def _ReadJSON(fname):
+    with open(fname) as f:
+        return dict((x['nuclide'], x) for x in json.load(f))
+
+
+# All data as dict (nuclide -> data), read on first use
+_alldata = None
+
+
 def SearchNuclide(nuclide):
-    # Get all data as dict from json file
-    alldata = json.loads(open(os.path.join(hdtv.datadir, "IAEA.json")).read())
+    global _alldata
+    if _alldata is None:
+        _alldata = LoadTable(
+            os.path.join(hdtv.datadir, "IAEA.json"), _ReadJSON)
 
     # Select nuclide
-    data = next(x for x in alldata if x['nuclide'] == nuclide)
-    if not data:
+    try:
+        data = dict(_alldata[nuclide])
+    except KeyError:
         errorText = "There is no nuclide called " + nuclide + " in the table."
         raise hdtv.cmdline.HDTVCommandError(errorText)
 
@@ -25,8 +25,8 @@ class PGAAGamma(Gamma):
         super(PGAAGamma, self).__init__(nuclide, energy, sigma, intensity)
         self.halflife = halflife
         self._k0 = k0  # TODO
-        if nuclide == Nuclides(k0_comp[0], k0_comp[1])[
-                0] and not PGAAGamma.k0_norm:
+        if not PGAAGamma.k0_norm and nuclide == Nuclides(
+                k0_comp[0], k0_comp[1])[0]:
             # Normalize reference element to k0=1.0
             PGAAGamma.k0_norm = 1.0 / self.getk0(isNorm=True)
 
@@ -112,44 +112,39 @@ class PGAAlib_IKI2000(GammaLib):
         if self.opened:
             return True
 
-        try:
-            datfile = open(self.csvfile, 'r', encoding='utf-8')
-        except TypeError:
-            datfile = open(self.csvfile, 'rb')
-
-        reader = csv.reader(datfile)
-
-        if self._has_header:
-            next(reader)
+        def convert(line):
+            try:
+                halflife = float(line[7])
+            except ValueError:
+                halflife = None
+            return (int(line[0]), int(line[1]),
+                    (float(line[2]), float(line[3])),
+                    (float(line[4]), float(line[5])),
+                    float(line[6]), halflife)
 
         try:
-            for line in reader:
-                Z = int(line[0])
-                A = int(line[1])
-                energy = ufloat(float(line[2]), float(line[3]))
-                sigma = ufloat(float(line[4]), float(line[5]))
-                intensity = ufloat(float(line[6]), 0) / 100.0
-                try:
-                    halflife = ufloat(float(line[7]), 0)
-                except ValueError:
-                    halflife = None
-                gamma = PGAAGamma(
-                    Nuclides(
-                        Z,
-                        A)[0],
-                    energy,
-                    sigma=sigma,
-                    intensity=intensity,
-                    halflife=halflife,
-                    k0_comp=self.k0_comp)
-                self.append(gamma)
+            table = LoadTable(self.csvfile, lambda fname: ReadCSV(
+                fname, convert, has_header=self._has_header))
         except csv.Error as e:
-            hdtv.ui.error('file %s, line %d: %s' %
-                          (self.csvfile, reader.line_num, e))
-        else:
-            self.opened = True
-        finally:
-            datfile.close()
+            hdtv.ui.error(str(e))
+            return
+
+        nuclides = dict()
+        for (Z, A, energy, sigma, intensity, halflife) in table:
+            if (Z, A) not in nuclides:
+                nuclides[(Z, A)] = Nuclides(Z, A)[0]
+            if halflife is not None:
+                halflife = ufloat(halflife, 0)
+            gamma = PGAAGamma(
+                nuclides[(Z, A)],
+                ufloat(*energy),
+                sigma=ufloat(*sigma),
+                intensity=ufloat(intensity, 0) / 100.0,
+                halflife=halflife,
+                k0_comp=self.k0_comp)
+            self.append(gamma)
+        self.opened = True
+        self.BuildIndex()
 
 
 class PromptGammas(GammaLib):
@@ -187,36 +182,27 @@ class PromptGammas(GammaLib):
         if self.opened:
             return True
 
-        try:
-            datfile = open(self.csvfile, 'r', encoding='utf-8')
-        except TypeError:
-            datfile = open(self.csvfile, 'rb')
-
-        reader = csv.reader(datfile)
-
-        if self._has_header:
-            next(reader)
+        def convert(line):
+            return (int(line[0]), int(line[1]), SplitUFloat(line[2]),
+                    SplitUFloat(line[3]), SplitUFloat(line[4]))
 
         try:
-            for line in reader:
-                A = int(line[0])
-                Z = int(line[1])
-                energy = ufloat_fromstr(line[2])
-                sigma = ufloat_fromstr(line[3])
-                k0 = ufloat_fromstr(line[4])
-                gamma = PGAAGamma(
-                    Nuclides(
-                        Z,
-                        A)[0],
-                    energy,
-                    sigma=sigma,
-                    k0=k0,
-                    k0_comp=self.k0_comp)
-                self.append(gamma)
+            table = LoadTable(self.csvfile, lambda fname: ReadCSV(
+                fname, convert, has_header=self._has_header))
         except csv.Error as e:
-            hdtv.ui.error('file %s, line %d: %s' %
-                          (self.csvfile, reader.line_num, e))
-        else:
-            self.opened = True
-        finally:
-            datfile.close()
+            hdtv.ui.error(str(e))
+            return
+
+        nuclides = dict()
+        for (A, Z, energy, sigma, k0) in table:
+            if (Z, A) not in nuclides:
+                nuclides[(Z, A)] = Nuclides(Z, A)[0]
+            gamma = PGAAGamma(
+                nuclides[(Z, A)],
+                MakeUFloat(energy),
+                sigma=MakeUFloat(sigma),
+                k0=MakeUFloat(k0),
+                k0_comp=self.k0_comp)
+            self.append(gamma)
+        self.opened = True
+        self.BuildIndex()
@@ -1,9 +1,130 @@
 # -*- coding: utf-8 -*-
+import bisect
 import csv
+import hashlib
 import os
-from uncertainties import ufloat_fromstr
+import pickle
+import sys
+from uncertainties import ufloat, ufloat_fromstr
 import hdtv.cmdline
 import hdtv.ui
+from hdtv.rootext.dlmgr import cachepath
+from hdtv.util import AtomicWrite
+
+# Increase whenever the layout of the cached tables changes
+CACHE_VERSION = 1
+
+# Directory holding the cached tables
+cachedir = os.path.join(cachepath, "database")
+
+
+def LoadTable(fname, parse):
+    """
+    Return parse(fname), the contents of the database table in file fname
+    as plain python data (lists, tuples, dicts, numbers and strings).
+
+    The result is cached as pickle in the user cache directory and is used
+    as long as the checksum of fname does not change, so that the table
+    does not have to be parsed again in every session.
+    """
+    with open(fname, "rb") as f:
+        checksum = hashlib.sha1(f.read()).hexdigest()
+    key = (CACHE_VERSION, sys.version_info[0], checksum)
+    entry = os.path.join(cachedir, os.path.basename(fname) + ".pickle")
+
+    try:
+        with open(entry, "rb") as f:
+            if pickle.load(f) == key:
+                return pickle.load(f)
+    except (OSError, IOError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+
+    data = parse(fname)
+    try:
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        with AtomicWrite(entry, "wb") as f:
+            pickle.dump(key, f, protocol=2)
+            pickle.dump(data, f, protocol=2)
+    except (OSError, IOError, pickle.PicklingError) as err:
+        hdtv.ui.debug("Could not write database cache entry: %s" % err)
+    return data
+
+
+def ReadCSV(fname, convert, has_header=True):
+    """
+    Return the list of convert(line) for all lines of the csv file fname
+    (for use with LoadTable). Raises csv.Error with the position of the
+    error in the message on malformed files.
+    """
+    try:
+        datfile = open(fname, 'r', encoding='utf-8')
+    except TypeError:
+        datfile = open(fname, 'rb')
+
+    reader = csv.reader(datfile)
+    try:
+        if has_header:
+            next(reader)
+        return [convert(line) for line in reader]
+    except csv.Error as err:
+        raise csv.Error('file %s, line %d: %s' %
+                        (fname, reader.line_num, err))
+    finally:
+        datfile.close()
+
+
+def SplitUFloat(text):
+    """
+    Parse a value with uncertainty (e.g. "1.234(5)") into the pair
+    (nominal value, std dev), or None if text is empty
+    """
+    text = text.strip()
+    if not text:
+        return None
+    value = ufloat_fromstr(text)
+    return (value.nominal_value, value.std_dev)
+
+
+def MakeUFloat(pair):
+    """
+    Inverse of SplitUFloat()
+    """
+    if pair is None:
+        return None
+    return ufloat(*pair)
+
+
+class _Lazy(object):
+    """
+    Proxy that creates the wrapped object by calling factory on first use
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+
+    def _Get(self):
+        if self._obj is None:
+            self._obj = self._factory()
+        return self._obj
+
+    def __call__(self, *args, **kwargs):
+        return self._Get()(*args, **kwargs)
+
+    def __getitem__(self, index):
+        return self._Get()[index]
+
+    def __iter__(self):
+        return iter(self._Get())
+
+    def __len__(self):
+        return len(self._Get())
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self._Get(), name)
 
 
 class _Element(object):
@@ -50,31 +171,21 @@ class _Elements(list):
 
         super(_Elements, self).__init__()
 
-        tmp = list()
+        def convert(line):
+            try:
+                mass = SplitUFloat(line[3])
+            except ValueError:
+                mass = None
+            return (int(line[0]), line[1].strip(), line[2].strip(), mass)
 
+        tmp = list()
         try:
-            try:
-                datfile = open(csvfile, 'r', encoding='utf-8')
-            except TypeError:
-                datfile = open(csvfile, 'rb')
-            reader = csv.reader(datfile)
-            next(reader)  # Skip header
-
-            for line in reader:
-                Z = int(line[0])
-                Symbol = line[1].strip()
-                Name = line[2].strip()
-                try:
-                    Mass = ufloat_fromstr(line[3].strip())
-                except ValueError:
-                    Mass = None
-                element = _Element(Z, Symbol, Name, Mass)
+            for (Z, Symbol, Name, Mass) in LoadTable(
+                    csvfile, lambda fname: ReadCSV(fname, convert)):
+                element = _Element(Z, Symbol, Name, MakeUFloat(Mass))
                 tmp.append(element)
         except csv.Error as err:
-            hdtv.ui.error('file %s, line %d: %s' %
-                          (csvfile, reader.line_num, err))
-        finally:
-            datfile.close()
+            hdtv.ui.error(str(err))
 
         # Now store elements finally
         maxZ = max(tmp, key=lambda x: x.z)  # Get highest Z
@@ -178,41 +289,28 @@ class _Nuclides(object):
 
     def __init__(self, csvfile=os.path.join(hdtv.datadir, "nuclides.dat")):
 
+        def convert(line):
+            return (int(line[0].strip()), int(line[1].strip()),
+                    SplitUFloat(line[2]), SplitUFloat(line[3]),
+                    SplitUFloat(line[4]))
+
         self._storage = dict()
         try:
-            try:
-                datfile = open(csvfile, 'r', encoding='utf-8')
-            except TypeError:
-                datfile = open(csvfile, 'rb')
-            reader = csv.reader(datfile)
-            next(reader)  # Skip header
-
-            for line in reader:
-                Z = int(line[0].strip())
-                element = Elements(Z)
-                A = int(line[1].strip())
-                if line[2].strip():
-                    abd = ufloat_fromstr(line[2].strip()) / 100.0
-                else:
-                    abd = None
-                if line[3].strip():
-                    M = ufloat_fromstr(line[3].strip())
-                else:
-                    M = None
-                if line[4].strip():
-                    sigma = ufloat_fromstr(line[4].strip())
-                else:
-                    sigma = None
-
-                if Z not in self._storage:
-                    self._storage[Z] = dict()
-                self._storage[Z][A] = _Nuclide(
-                    element, A, abundance=abd, sigma=sigma, M=M)
-        except csv.Error as e:
-            hdtv.ui.error('file %s, line %d: %s' %
-                          (csvfile, reader.line_num, e))
-        finally:
-            datfile.close()
+            table = LoadTable(csvfile, lambda fname: ReadCSV(fname, convert))
+        except csv.Error as err:
+            hdtv.ui.error(str(err))
+            return
+
+        for (Z, A, abd, M, sigma) in table:
+            element = Elements(Z)
+            abd = MakeUFloat(abd)
+            if abd is not None:
+                abd = abd / 100.0
+            if Z not in self._storage:
+                self._storage[Z] = dict()
+            self._storage[Z][A] = _Nuclide(
+                element, A, abundance=abd, sigma=MakeUFloat(sigma),
+                M=MakeUFloat(M))
 
     def __call__(self, Z=None, A=None, symbol=None, name=None):
         '''
@@ -364,7 +462,8 @@ class GammaLib(list):
     """
     Class for storing a gamma library
 
-    The real libs should be derived from this
+    The real libs should be derived from this. They have to call
+    BuildIndex() once all gammas have been read in open().
     """
 
     __slots__ = ("nuclide", "energy", "sigma", "intensity", "E_fuzziness")
@@ -373,25 +472,49 @@ class GammaLib(list):
         list.__init__(self)
         self.fuzziness = fuzziness  # Fuzzyness for energy identification
         self.opened = False
+        self._energies = None       # Sorted nominal energies
+        self._energyOrder = None    # Library positions in energy order
+        self._keyIndex = dict()     # key -> value -> library positions
 
-    def find(self, fuzziness=None, sort_key=None, sort_reverse=False, **args):
+    def BuildIndex(self):
         """
-        Find in gamma lib
-
-        Does a fuzzy compare for floats. All strings are compared lowercase.
+        Build the lookup indexes: the gammas sorted by (nominal) energy, and
+        hash indexes for all integer and string fields (e.g. z, a, symbol)
+        """
+        order = sorted(range(len(self)),
+                       key=lambda i: self[i].energy.nominal_value)
+        self._energyOrder = order
+        self._energies = [self[i].energy.nominal_value for i in order]
 
-        Valid key args are:
+        self._keyIndex = dict()
+        for (key, conv) in list(self.fParamConv.items()):
+            key = key.lower()
+            if conv is not int and conv is not str:
+                continue
+            index = dict()
+            try:
+                for (i, gamma) in enumerate(self):
+                    value = getattr(gamma, key)
+                    if conv is str:
+                        value = value.lower()
+                    index.setdefault(value, []).append(i)
+            except AttributeError:
+                continue
+            self._keyIndex[key] = index
 
-         * sort_key: key to sort
-         * sort_reverse: sort_reverse
-         * "key: value" : key value pairs to find
+    def _CheckIndex(self):
+        """
+        Make sure the lookup indexes are up to date
         """
         if not self.opened:
             self.open()
+        if self._energies is None or len(self._energies) != len(self):
+            self.BuildIndex()
 
-        if fuzziness is None:
-            fuzziness = self.fuzziness
-
+    def _FindArgs(self, args):
+        """
+        Convert the find arguments as described in fParamConv
+        """
         # convert keys to lowercase
         fields_lower = dict()
         args_lower = dict()
@@ -413,16 +536,51 @@ class GammaLib(list):
                 fargs[key] = conv(args_lower[key])
             except KeyError:
                 pass
+        return fargs
 
-        # Do the search
-        results = self[:]
+    def _EnergyRange(self, energy, fuzziness, lo=0, hi=0):
+        """
+        Return the slice (lo, hi) of the energy index that contains all
+        gammas with abs(gamma.energy - energy) <= fuzziness. The returned
+        range may contain a few more gammas at its edges (rounding).
 
-        if fuzziness is None:
-            fuzziness = self.fuzziness
+        lo and hi are lower bounds for the range, which allows to sweep
+        through the index with ascending energies.
+        """
+        eps = 1e-9 * (abs(energy) + abs(fuzziness))
+        lo = bisect.bisect_left(self._energies, energy - fuzziness - eps, lo)
+        hi = bisect.bisect_right(self._energies, energy + fuzziness + eps,
+                                 max(lo, hi))
+        return (lo, hi)
 
-        if not fargs:
-            return []
+    def _EnergyMatches(self, energy, fuzziness, lo, hi):
+        """
+        Return the library positions of the gammas in the slice (lo, hi) of
+        the energy index that match energy within fuzziness
+        """
+        positions = sorted(self._energyOrder[lo:hi])
+        # Compare with uncertainties, exactly as a linear search would
+        return [i for i in positions
+                if abs(self[i].energy - energy) <= fuzziness]
+
+    def _Candidates(self, key, value, fuzziness):
+        """
+        Return the sorted library positions of all gammas matching
+        key=value, or None if there is no index for key
+        """
+        if key == "energy":
+            (lo, hi) = self._EnergyRange(value, fuzziness)
+            return self._EnergyMatches(value, fuzziness, lo, hi)
+        try:
+            index = self._keyIndex[key]
+        except KeyError:
+            return None
+        if isinstance(value, str):
+            value = value.lower()
+        return index.get(value, [])
 
+    @staticmethod
+    def _Filter(results, fargs, fuzziness):
         for (key, value) in list(fargs.items()):
             if value is None:
                 continue
@@ -434,8 +592,10 @@ class GammaLib(list):
             else:  # Do fuzzy compare
                 results = [x for x in results
                            if abs(getattr(x, key) - value) <= fuzziness]
+        return results
 
-        # Sort
+    @staticmethod
+    def _Sort(results, sort_key, sort_reverse):
         try:
             if sort_key is not None:
                 results.sort(key=lambda x: getattr(
@@ -445,8 +605,77 @@ class GammaLib(list):
                          str(sort_key) + "\': No such key")
             raise AttributeError
 
+    def find(self, fuzziness=None, sort_key=None, sort_reverse=False, **args):
+        """
+        Find in gamma lib
+
+        Does a fuzzy compare for floats. All strings are compared lowercase.
+
+        Valid key args are:
+
+         * sort_key: key to sort
+         * sort_reverse: sort_reverse
+         * "key: value" : key value pairs to find
+        """
+        self._CheckIndex()
+
+        if fuzziness is None:
+            fuzziness = self.fuzziness
+
+        fargs = self._FindArgs(args)
+        if not fargs:
+            return []
+
+        # Start with the smallest set of gammas found in the indexes and
+        # check the remaining keys on these
+        start = None
+        for (key, value) in list(fargs.items()):
+            candidates = self._Candidates(key, value, fuzziness)
+            if candidates is not None and (
+                    start is None or len(candidates) < len(start[1])):
+                start = (key, candidates)
+
+        if start is None:
+            results = self[:]
+        else:
+            results = [self[i] for i in start[1]]
+            fargs = dict(fargs)
+            del fargs[start[0]]
+
+        results = self._Filter(results, fargs, fuzziness)
+        self._Sort(results, sort_key, sort_reverse)
         return results
 
+    def findmany(self, energies, fuzziness=None, sort_key=None,
+                 sort_reverse=False, **args):
+        """
+        Find the gammas matching each of the given energies
+
+        Returns a list with one result list (as from find(energy=...)) per
+        energy. All energies are looked up in a single sweep through the
+        energy index. The remaining key args are applied to all lookups.
+        """
+        self._CheckIndex()
+
+        if fuzziness is None:
+            fuzziness = self.fuzziness
 
-Elements = _Elements()
-Nuclides = _Nuclides()
+        fargs = self._FindArgs(args)
+        fargs.pop("energy", None)
+        energies = [float(e) for e in energies]
+
+        allresults = [None] * len(energies)
+        (lo, hi) = (0, 0)
+        for n in sorted(range(len(energies)), key=energies.__getitem__):
+            (lo, hi) = self._EnergyRange(energies[n], fuzziness, lo, hi)
+            results = [self[i] for i in self._EnergyMatches(
+                energies[n], fuzziness, lo, hi)]
+            results = self._Filter(results, fargs, fuzziness)
+            self._Sort(results, sort_key, sort_reverse)
+            allresults[n] = results
+        return allresults
+
+
+# Only read on first use
+Elements = _Lazy(_Elements)
+Nuclides = _Lazy(_Nuclides)
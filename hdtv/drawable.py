@@ -38,6 +38,15 @@ class Drawable(object):
     def name(self):
         return str(self.displayObj)
 
+    @property
+    def headless(self):
+        """
+        True if this is drawn on the viewport of a headless session (see
+        hdtv.window.NullViewport): no display objects are created then, but
+        everything else works as usual
+        """
+        return getattr(self.viewport, "headless", False)
+
     # cal property
     def _set_cal(self, cal):
         self._cal = hdtv.cal.MakeCalibration(cal)
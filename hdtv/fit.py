@@ -20,17 +20,22 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
 import copy
+import math
+import numpy
 from uncertainties import ufloat
 
 import ROOT
 import hdtv.color
 import hdtv.cal
+import hdtv.fitcache
+import hdtv.fitresults
 import hdtv.integral
+import hdtv.options
 import hdtv.ui
 
 from hdtv.drawable import Drawable
 from hdtv.marker import MarkerCollection
-from hdtv.util import Pairs, ID, Table
+from hdtv.util import Pairs, ID, Position, Table
 from hdtv.weakref import weakref
 
 
@@ -64,13 +69,20 @@ class Fit(Drawable):
         self.chi = None
         self.bgChi = None
         self.bgCoeffs = []
+        # Covariance matrix of the (uncalibrated) peak parameters, one row
+        # and column for each parameter of each peak (see
+        # hdtv.fitter.Fitter.PeakCovariance()), if known
+        self.covariance = None
+        # Cached hdtv.fitresults.FitResults of the peaks and integrals
+        self._peakResults = None
+        self._integralResults = None
+        self._integral = None
         self._showDecomp = Fit.showDecomp
         self.dispPeakFunc = None
         self.dispBgFunc = None
         Drawable.__init__(self, color, cal)
         self._spec = None
         self.active = False
-        self.integral = None
 
     # ID property
     def _get_ID(self):
@@ -88,6 +100,13 @@ class Fit(Drawable):
     # cal property
     def _set_cal(self, cal):
         self._cal = hdtv.cal.MakeCalibration(cal)
+        self.InvalidateResults()
+        for integral in (self._integral or dict()).values():
+            if not integral:
+                continue
+            integral.pop("cal", None)
+            if self._cal:
+                hdtv.integral.calibrate_integral(integral, self._cal)
         if self.viewport:
             self.viewport.LockUpdate()
         self.peakMarkers.cal = self._cal
@@ -107,6 +126,16 @@ class Fit(Drawable):
 
     cal = property(_get_cal, _set_cal)
 
+    # integral property
+    def _set_integral(self, integral):
+        self._integral = integral
+        self._integralResults = None
+
+    def _get_integral(self):
+        return self._integral
+
+    integral = property(_get_integral, _set_integral)
+
     # color property
     def _set_color(self, color):
         # we only need the passive color for fits
@@ -167,6 +196,13 @@ class Fit(Drawable):
 
     spec = property(_get_spec, _set_spec)
 
+    @property
+    def headless(self):
+        # Fits are usually done before they are drawn, so this also depends
+        # on the spectrum
+        return (Drawable.headless.fget(self) or
+                (self.spec is not None and bool(self.spec.headless)))
+
     # ids property to get the ids of the peaks
     @property
     def ids(self):
@@ -179,11 +215,13 @@ class Fit(Drawable):
         """
         show fit results in a nice table
         """
-        (objects, params) = self.ExtractParams()
+        results = hdtv.fitresults.WithStatus(
+            self, self.PeakResults()).Sort("id")
         header = "WorkFit on spectrum: " + \
             str(self.spec.ID) + " (" + self.spec.name + ")"
-        footer = "\n" + str(len(objects)) + " peaks in WorkFit"
-        table = Table(objects, list(params), sortBy="id",
+        footer = "\n" + str(len(results)) + " peaks in WorkFit"
+        table = Table(results.StringRows(results.params), list(results.params),
+                      sortBy="id", presorted=True,
                       extra_header=header, extra_footer=footer)
         return str(table)
     
@@ -191,10 +229,11 @@ class Fit(Drawable):
         """
         show integral of fit regions in a nice table
         """
-        (objects, params) = self.ExtractIntegralParams('all')
+        results = hdtv.fitresults.IntegralsFromFits([self], 'all').Sort("id")
         header = "Integrals of WorkFit regions on spectrum: " + \
             str(self.spec.ID) + " (" + self.spec.name + ")"
-        table = Table(objects, list(params), sortBy="id", extra_header=header)
+        table = Table(results.StringRows(results.params), list(results.params),
+                      sortBy="id", presorted=True, extra_header=header)
         return str(table)
 
     def formatted_str(self, verbose=True):
@@ -215,6 +254,35 @@ class Fit(Drawable):
         text += "\n\n chi² of fit: %d" % self.chi
         return text
 
+    def PeakResults(self):
+        """
+        Return the peak parameters as hdtv.fitresults.FitResults (without id
+        and status). The result is cached until the fit changes.
+        """
+        if self._peakResults is None:
+            self._peakResults = hdtv.fitresults.PeakResults(self)
+            # changing the extras of the peaks invalidates the results
+            for peak in self.peaks:
+                peak.extras.SetFit(self)
+        return self._peakResults
+
+    def IntegralResults(self):
+        """
+        Return the integrals of the fit region as hdtv.fitresults.FitResults
+        (without id and status). The result is cached until the fit changes.
+        """
+        if self._integralResults is None:
+            self._integralResults = hdtv.fitresults.IntegralResults(self)
+        return self._integralResults
+
+    def InvalidateResults(self):
+        """
+        Discard the cached results (done automatically on changes of the
+        calibration, the integrals or the extras of the peaks)
+        """
+        self._peakResults = None
+        self._integralResults = None
+
     def ExtractParams(self):
         """
         Helper function for use for printing fit results in a nice table
@@ -223,53 +291,9 @@ class Fit(Drawable):
             peaklist: a list of dicts for each peak in the fit
             params  : a ordered list of valid parameter names
         """
-        peaklist = list()
-        params = ["id", "stat", "chi"]
-        # Get peaks
-        for peak in self.peaks:
-            thispeak = dict()
-            thispeak["chi"] = "%d" % self.chi
-            if self.ID is None:
-                thispeak["id"] = hdtv.util.ID(None, self.peaks.index(peak))
-            else:
-                thispeak["id"] = hdtv.util.ID(
-                    self.ID.major, self.peaks.index(peak))
-            thispeak["stat"] = str()
-            if self.active:
-                thispeak["stat"] += "A"
-            if self.ID in self.spec.visible or self.ID is None:   # ID of workFit is None
-                thispeak["stat"] += "V"
-            # get parameter of this fit
-            for p in self.fitter.peakModel.fOrderedParamKeys:
-                if p == "pos":
-                    # Store channel additionally to position
-                    thispeak["channel"] = getattr(peak, "pos")
-                    if "channel" not in params:
-                        params.append("channel")
-                # Use calibrated values of params if available
-                p_cal = p + "_cal"
-                if hasattr(peak, p_cal):
-                    thispeak[p] = getattr(peak, p_cal)
-                if p not in params:
-                    params.append(p)
-            # add extra params
-            for p in list(peak.extras.keys()):
-                thispeak[p] = peak.extras[p]
-                if p not in params:
-                    params.append(p)
-            # Calculate normalized volume if efficiency calibration is present
-            # FIXME: does this belong here?
-            # if self.spec.effCal is not None:
-            #    volume = thispeak["vol"]
-            #    energy = thispeak["pos"]
-            #    norm_volume = volume / self.spec.effCal(energy)
-            #    par = "vol/eff"
-            #    par_index = params.index("vol") + 1
-            #    params.insert(par_index, par)
-            #    thispeak[par] = norm_volume
-            peaklist.append(thispeak)
-        return (peaklist, params)
-    
+        results = hdtv.fitresults.WithStatus(self, self.PeakResults())
+        return (results.Rows(), results.params)
+
     def ExtractIntegralParams(self, integral_type='auto'):
         """
         Helper function for use for printing fit results in a nice table
@@ -278,65 +302,8 @@ class Fit(Drawable):
             integrallist : a list of dicts for each peak in the fit
             params       : a ordered list of valid parameter names
         """
-        integrallist = list()
-        params = ["id", "stat", "type"]
-        
-        #if not self.integral:
-        #    region = [self.regionMarkers[0].p1.pos_uncal,
-        #              self.regionMarkers[0].p2.pos_uncal]
-        #    self.integral = hdtv.integral.Integrate(
-        #        self.spec, self.fitter.bgFitter, region)
-        integrals = self.integral
-
-        if integral_type == 'all':
-            integral_types = ['tot', 'bg', 'sub']
-        elif integral_type == 'auto':
-            if integrals['sub']:
-                integral_types = ['sub']
-            else:
-                integral_types = ['tot']
-        else:
-            integral_types = [integral_type]
-            
-        for int_type, integral in integrals.items():
-            if not integral or not int_type in integral_types:
-                continue
-            int_res = dict(integral["uncal"])
-
-            int_res["type"] = int_type
-
-            if self.ID is None:
-                int_res["id"] = hdtv.util.ID(None, None)
-            else:
-                int_res["id"] = hdtv.util.ID(self.ID.major, None)
-            int_res["stat"] = str()
-            
-            if self.active:
-                int_res["stat"] += "A"
-            if self.ID in self.spec.visible or self.ID is None: # ID of workFit is None
-                int_res["stat"] += "V"
-
-            for p in integral["uncal"].keys():
-                if p not in params:
-                    params.append(p)
-
-            if self.spec.cal:
-                # rename pos to channel in uncal
-                int_res['channel'] = int_res.pop('pos')
-                integral.pop('cal', None)
-                # Make sure that calibration is up to date
-                integral["cal"] = hdtv.integral.calibrate_integral(
-                    integral, self.spec.cal)['cal']
-                for key, value in integral["cal"].items():
-                    if key == 'vol':
-                        continue
-                    p = key if (key == 'pos') else key + '_cal'
-                    int_res[p] = value
-                    if p not in params:
-                        params.append(p)
-            
-            integrallist.append(int_res)
-        return (integrallist, params)
+        results = hdtv.fitresults.IntegralsFromFits([self], integral_type)
+        return (results.Rows(), results.params)
 
     def ChangeMarker(self, mtype, pos, action):
         """
@@ -356,15 +323,21 @@ class Fit(Drawable):
         """
         Fix marker in calibrated space
         """
-        for m in [self.bgMarkers, self.regionMarkers, self.peakMarkers]:
-            m.FixInCal()
+        markers = [self.bgMarkers, self.regionMarkers, self.peakMarkers]
+        for m in markers:
+            m.fixedInCal = True
+        Position.FixAllInCal(
+            [pos for m in markers for pos in m.positions])
 
     def FixMarkerInUncal(self):
         """
         Fix marker in uncalibrated space
         """
-        for m in [self.bgMarkers, self.regionMarkers, self.peakMarkers]:
-            m.FixInUncal()
+        markers = [self.bgMarkers, self.regionMarkers, self.peakMarkers]
+        for m in markers:
+            m.fixedInCal = False
+        Position.FixAllInUncal(
+            [pos for m in markers for pos in m.positions])
 
     def _get_background_pairs(self):
         if self.bgMarkers.IsPending():
@@ -390,10 +363,11 @@ class Fit(Drawable):
         if len(self.bgMarkers) > 0:
             backgrounds = self._get_background_pairs()
             self.fitter.FitBackground(spec=self.spec, backgrounds=backgrounds)
-            func = self.fitter.bgFitter.GetFunc()
-            self.dispBgFunc = ROOT.HDTV.Display.DisplayFunc(
-                func, hdtv.color.bg)
-            self.dispBgFunc.SetCal(self.cal)
+            if not self.headless:
+                func = self.fitter.bgFitter.GetFunc()
+                self.dispBgFunc = ROOT.HDTV.Display.DisplayFunc(
+                    func, hdtv.color.bg)
+                self.dispBgFunc.SetCal(self.cal)
             self.bgChi = self.fitter.bgFitter.GetChisquare()
             self.bgCoeffs = []
             deg = self.fitter.bgFitter.GetDegree()
@@ -402,9 +376,11 @@ class Fit(Drawable):
                     self.fitter.bgFitter.GetCoeff(i),
                     self.fitter.bgFitter.GetCoeffError(i)))
 
-    def FitPeakFunc(self, spec):
+    def FitPeakFunc(self, spec, result=None):
         """
         Do the actual peak fit and extract the functions for display
+        If result (as returned by CacheEntry()) is given, it is restored
+        instead of doing the fit.
         Note: You still need to call Draw afterwards.
         """
         # Call pre hooks
@@ -413,10 +389,10 @@ class Fit(Drawable):
 
         self.spec = spec
         self.Erase()
-        # fit background
-        if self.fitter.bgdeg != -1 and len(self.bgMarkers) > 0:
+        externalBg = self.fitter.bgdeg != -1 and len(self.bgMarkers) > 0
+        backgrounds = Pairs()
+        if externalBg:
             backgrounds = self._get_background_pairs()
-            self.fitter.FitBackground(spec=self.spec, backgrounds=backgrounds)
         # fit peaks
         if len(self.peakMarkers) > 0 and self.regionMarkers.IsFull():
             region = sorted([self.regionMarkers[0].p1.pos_uncal,
@@ -428,7 +404,28 @@ class Fit(Drawable):
                 if m.p1.pos_uncal < region[0] or m.p1.pos_uncal > region[1]:
                     self.peakMarkers.remove(m)
             peaks = sorted([m.p1.pos_uncal for m in self.peakMarkers])
-            self.fitter.FitPeaks(spec=self.spec, region=region, peaklist=peaks)
+            key = None
+            entry = result
+            if hdtv.options.Get("fit.cache"):
+                key = hdtv.fitcache.cache.Key(self.spec.hist.hist, self.cal,
+                                              self.fitter, region, peaks,
+                                              backgrounds)
+                if entry is None:
+                    entry = hdtv.fitcache.cache.Get(key)
+                    if entry is not None:
+                        # already in the cache
+                        key = None
+            covariance = None
+            if entry is None:
+                if externalBg:
+                    self.fitter.FitBackground(spec=self.spec,
+                                              backgrounds=backgrounds)
+                self.fitter.FitPeaks(spec=self.spec, region=region,
+                                     peaklist=peaks)
+            else:
+                # identical fit done before (or elsewhere): restore its result
+                self.RestoreCacheEntry(entry, region, backgrounds)
+                covariance = entry.get("covar")
             # get background function
             self.bgCoeffs = []
             deg = self.fitter.bgdeg
@@ -444,37 +441,106 @@ class Fit(Drawable):
                     self.bgCoeffs.append(ufloat(
                         self.fitter.bgFitter.GetCoeff(i),
                         self.fitter.bgFitter.GetCoeffError(i)))
-            func = self.fitter.peakFitter.GetBgFunc()
-            self.dispBgFunc = ROOT.HDTV.Display.DisplayFunc(
-                func, hdtv.color.bg)
-            self.dispBgFunc.SetCal(self.cal)
-            # get peak function
-            func = self.fitter.peakFitter.GetSumFunc()
-            self.dispPeakFunc = ROOT.HDTV.Display.DisplayFunc(
-                func, hdtv.color.region)
-            self.dispPeakFunc.SetCal(self.cal)
+            if not self.headless:
+                func = self.fitter.peakFitter.GetBgFunc()
+                self.dispBgFunc = ROOT.HDTV.Display.DisplayFunc(
+                    func, hdtv.color.bg)
+                self.dispBgFunc.SetCal(self.cal)
+                # get peak function
+                func = self.fitter.peakFitter.GetSumFunc()
+                self.dispPeakFunc = ROOT.HDTV.Display.DisplayFunc(
+                    func, hdtv.color.region)
+                self.dispPeakFunc.SetCal(self.cal)
             self.chi = self.fitter.peakFitter.GetChisquare()
             # create peak list
             for i in range(0, self.fitter.peakFitter.GetNumPeaks()):
                 cpeak = self.fitter.peakFitter.GetPeak(i)
                 peak = self.fitter.peakModel.CopyPeak(
-                    cpeak, hdtv.color.peak, self.cal)
+                    cpeak, hdtv.color.peak, self.cal, headless=self.headless)
                 self.peaks.append(peak)
             # in some rare cases it can happen that peaks change position
             # while doing the fit, thus we have to sort here
-            self.peaks.sort()
+            order = sorted(range(len(self.peaks)),
+                           key=lambda i: self.peaks[i])
+            self.peaks = [self.peaks[i] for i in order]
+            if covariance is None:
+                self.covariance = self.fitter.PeakCovariance(order)
+            else:
+                n = int(round(math.sqrt(len(covariance))))
+                self.covariance = numpy.reshape(covariance, (n, n))
+            self.InvalidateResults()
+            if key is not None:
+                hdtv.fitcache.cache.Put(key, self.CacheEntry())
             # update peak markers
             for (marker, peak) in zip(self.peakMarkers, self.peaks):
                 # Marker is fixed in uncalibrated space
                 marker.p1.pos_uncal = peak.pos.nominal_value
+        elif externalBg:
+            # fit background only
+            self.fitter.FitBackground(spec=self.spec, backgrounds=backgrounds)
 
         # Call post hooks
         for func in Fit.FitPeakPostHooks:
             func(self)
 
+    def CacheEntry(self):
+        """
+        Return the result of the peak fit as entry for hdtv.fitcache
+        """
+        entry = dict()
+        entry["chi"] = self.chi
+        entry["bgChi"] = self.bgChi
+        entry["bgCoeffs"] = [(c.nominal_value, c.std_dev)
+                             for c in self.bgCoeffs]
+        entry["bgCovar"] = None
+        bgFitter = self.fitter.bgFitter
+        if bgFitter:
+            n = bgFitter.GetDegree() + 1
+            covar = [bgFitter.GetCovariance(i, j)
+                     for i in range(n) for j in range(n)]
+            if not any(math.isnan(c) for c in covar):
+                entry["bgCovar"] = covar
+        entry["peaks"] = list()
+        for peak in self.peaks:
+            params = dict()
+            for name in self.fitter.peakModel.OrderedParamKeys():
+                value = getattr(peak, name)
+                if value is None:
+                    params[name] = None
+                else:
+                    params[name] = (value.nominal_value, value.std_dev,
+                                    getattr(value, "tag", None))
+            entry["peaks"].append(params)
+        entry["covar"] = None
+        if self.covariance is not None:
+            entry["covar"] = self.covariance.ravel().tolist()
+        return entry
+
+    def RestoreCacheEntry(self, entry, region, backgrounds):
+        """
+        Restore the fitter from an entry of hdtv.fitcache, as if the peak fit
+        had just been done
+        """
+        coeffs = [ufloat(value, error) for (value, error) in entry["bgCoeffs"]]
+        # only fits with an external background have a background chi^2
+        if entry["bgChi"] is not None:
+            self.fitter.RestoreBackground(backgrounds=backgrounds,
+                                          coeffs=coeffs,
+                                          chisquare=entry["bgChi"],
+                                          covar=entry["bgCovar"])
+        peaks = list()
+        for pars in entry["peaks"]:
+            params = dict()
+            for (name, par) in pars.items():
+                params[name] = None if par is None else ufloat(*par)
+            peaks.append(self.fitter.peakModel.Peak(cal=self.cal, **params))
+        self.fitter.RestorePeaks(cal=self.cal, region=region, peaks=peaks,
+                                 chisquare=entry["chi"], coeffs=coeffs)
+
     def Restore(self, spec):
         # do not call Erase() while setting spec!
         self._spec = weakref(spec)
+        self.InvalidateResults()
         self.cal = spec.cal
         self.color = spec.color
         self.FixMarkerInUncal()
@@ -491,22 +557,25 @@ class Fit(Drawable):
         if self.peaks:
             self.fitter.RestorePeaks(cal=self.cal, region=region, peaks=self.peaks,
                                      chisquare=self.chi, coeffs=self.bgCoeffs)
-            # get background function
-            func = self.fitter.peakFitter.GetBgFunc()
-            self.dispBgFunc = ROOT.HDTV.Display.DisplayFunc(func, self.color)
-            self.dispBgFunc.SetCal(self.cal)
-            # get peak function
-            func = self.fitter.peakFitter.GetSumFunc()
-            self.dispPeakFunc = ROOT.HDTV.Display.DisplayFunc(func, self.color)
-            self.dispPeakFunc.SetCal(self.cal)
-
-            # restore display functions of single peaks
-            for i in range(0, self.fitter.peakFitter.GetNumPeaks()):
-                cpeak = self.fitter.peakFitter.GetPeak(i)
-                func = cpeak.GetPeakFunc()
-                self.peaks[i].displayObj = ROOT.HDTV.Display.DisplayFunc(
+            if not self.headless:
+                # get background function
+                func = self.fitter.peakFitter.GetBgFunc()
+                self.dispBgFunc = ROOT.HDTV.Display.DisplayFunc(
+                    func, self.color)
+                self.dispBgFunc.SetCal(self.cal)
+                # get peak function
+                func = self.fitter.peakFitter.GetSumFunc()
+                self.dispPeakFunc = ROOT.HDTV.Display.DisplayFunc(
                     func, self.color)
-                self.peaks[i].displayObj.SetCal(self.cal)
+                self.dispPeakFunc.SetCal(self.cal)
+
+                # restore display functions of single peaks
+                for i in range(0, self.fitter.peakFitter.GetNumPeaks()):
+                    cpeak = self.fitter.peakFitter.GetPeak(i)
+                    func = cpeak.GetPeakFunc()
+                    self.peaks[i].displayObj = ROOT.HDTV.Display.DisplayFunc(
+                        func, self.color)
+                    self.peaks[i].displayObj.SetCal(self.cal)
 
             # create non-existant integral
             if not self.integral:
@@ -547,11 +616,12 @@ class Fit(Drawable):
         """
         if self.spec is None:
             return
-        # repeat the fits
-        if self.dispPeakFunc:
+        # repeat the fits (the display functions do not exist in a
+        # headless session, so look at the fit results instead)
+        if self.dispPeakFunc or self.chi is not None:
             # this includes the background fit
             self.FitPeakFunc(self.spec)
-        elif self.dispBgFunc:
+        elif self.dispBgFunc or self.bgChi is not None:
             # maybe there was only a background fit
             self.FitBgFunc(self.spec)
         if not self.viewport:
@@ -587,6 +657,8 @@ class Fit(Drawable):
             self.dispPeakFunc = None
             self.peaks = []
             self.chi = None
+            self.covariance = None
+            self.InvalidateResults()
 
     def ShowAsWorkFit(self):
         if not self.viewport:
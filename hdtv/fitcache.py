@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+# ----------------------------------------------------------------------
+# Memoization of peak fits
+# ----------------------------------------------------------------------
+
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy
+import ROOT
+
+import hdtv.cal
+import hdtv.options
+import hdtv.ui
+from hdtv.rootext.dlmgr import cachepath
+from hdtv.util import AsArray, AtomicWrite
+
+# Increase whenever the layout of the cache entries changes
+CACHE_VERSION = 2
+
+
+class FitCache(object):
+    """
+    Cache of peak fit results
+
+    Entries are keyed by everything that determines the outcome of a fit:
+    the bins of the spectrum covered by the fit and background regions, the
+    binning, the calibration, the peak model and its parameter status, the
+    background degree, the marker positions and the options selecting the
+    fit algorithms (fit.background.minuit and fit.gradient). An entry is a
+    plain dict (see hdtv.fit.Fit.CacheEntry()), so that it can be stored as
+    JSON.
+
+    Up to maxentries entries are kept in memory, the least recently used
+    ones are dropped first. If a path is given, entries are also written
+    there and looked up when they are not in memory.
+    """
+
+    def __init__(self, maxentries=1000, path=None):
+        self.maxentries = maxentries
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def Key(self, hist, cal, fitter, region, peaks, backgrounds):
+        """
+        Return the cache key for a fit of hist with the given fitter
+        (hdtv.fitter.Fitter), region, peak positions and background regions
+        (all uncalibrated)
+        """
+        axis = hist.GetXaxis()
+        limits = list(region)
+        for bg in backgrounds:
+            limits.extend(bg)
+        b0 = max(axis.FindBin(min(limits)), 0)
+        b1 = min(axis.FindBin(max(limits)), hist.GetNbinsX() + 1)
+
+        setup = repr((CACHE_VERSION,
+                      hist.GetNbinsX(), axis.GetXmin(), axis.GetXmax(),
+                      hdtv.cal.GetCoeffs(cal),
+                      fitter.peakModel.name, fitter.bgdeg,
+                      sorted(fitter.peakModel.fParStatus.items()),
+                      hdtv.options.Get("fit.background.minuit"),
+                      hdtv.options.Get("fit.gradient"),
+                      list(region), list(peaks),
+                      [tuple(bg) for bg in backgrounds]))
+        sha = hashlib.sha1(setup.encode("utf-8"))
+        sha.update(self._Bins(hist, b0, b1).tobytes())
+        return sha.hexdigest()
+
+    @staticmethod
+    def _Bins(hist, b0, b1):
+        """
+        Return the contents and errors of bins b0 to b1 (inclusive)
+        """
+        if isinstance(hist, ROOT.TH1D):
+            nbins = hist.GetNbinsX() + 2
+            contents = AsArray(hist.GetArray(), nbins)[b0:b1 + 1]
+            if hist.GetSumw2N() > 0:
+                errors = AsArray(hist.GetSumw2().GetArray(), nbins)[b0:b1 + 1]
+            else:
+                errors = numpy.empty(0)
+            return numpy.concatenate((contents, errors))
+        return numpy.array([(hist.GetBinContent(b), hist.GetBinError(b))
+                            for b in range(b0, b1 + 1)])
+
+    def Get(self, key):
+        """
+        Return the entry for key, or None if there is none
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None and self.path:
+            entry = self._Load(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries[key] = entry
+        self.Trim()
+        self.hits += 1
+        return entry
+
+    def Put(self, key, entry):
+        """
+        Store entry under key
+        """
+        self.entries.pop(key, None)
+        self.entries[key] = entry
+        self.Trim()
+        if self.path:
+            self._Save(key, entry)
+
+    def Trim(self):
+        """
+        Drop the least recently used entries from memory until there are at
+        most maxentries
+        """
+        while len(self.entries) > max(self.maxentries, 0):
+            self.entries.popitem(last=False)
+
+    def Filename(self, key):
+        return os.path.join(self.path, key + ".json")
+
+    def _Load(self, key):
+        try:
+            with open(self.Filename(key)) as f:
+                return json.load(f)
+        except (OSError, IOError, ValueError):
+            return None
+
+    def _Save(self, key, entry):
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            with AtomicWrite(self.Filename(key)) as f:
+                json.dump(entry, f)
+        except (OSError, IOError, TypeError, ValueError) as err:
+            hdtv.ui.debug("Could not write fit cache entry: %s" % err)
+
+    def Clear(self):
+        """
+        Remove all entries (including those on disk) and reset the counters
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        if self.path and os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.path, name))
+
+    def __str__(self):
+        text = "Fit cache: %d entries in memory, %d hits, %d misses" % (
+            len(self.entries), self.hits, self.misses)
+        if self.path:
+            text += " (on disk: %s)" % self.path
+        return text
+
+
+cache = FitCache()
+
+
+def _SetMaxEntries(opt):
+    cache.maxentries = opt.Get()
+    cache.Trim()
+
+
+def _SetDisk(opt):
+    cache.path = os.path.join(cachepath, "fits") if opt.Get() else None
+
+
+opt = hdtv.options.Option(default=True, parse=hdtv.options.parse_bool)
+hdtv.options.RegisterOption("fit.cache", opt)
+opt = hdtv.options.Option(default=1000, parse=lambda x: int(x),
+                          changeCallback=_SetMaxEntries)
+hdtv.options.RegisterOption("fit.cache.max_entries", opt)
+opt = hdtv.options.Option(default=False, parse=hdtv.options.parse_bool,
+                          changeCallback=_SetDisk)
+hdtv.options.RegisterOption("fit.cache.disk", opt)
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+# ----------------------------------------------------------------------
+# Columnar storage of fit results (for fit lists, tables and exports)
+# ----------------------------------------------------------------------
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+import numpy
+from uncertainties import ufloat
+
+import hdtv.integral
+import hdtv.options
+import hdtv.util
+
+
+class Column(object):
+    """
+    A column of FitResults
+
+    Values with uncertainties are stored as arrays of the nominal values and
+    standard deviations, all other values (IDs, strings, ...) as a list of
+    objects. Where a row has no value, present is False (numeric columns)
+    or the object is None.
+    """
+
+    def __init__(self, values=None, errors=None, present=None, objects=None):
+        self.values = values
+        self.errors = errors
+        self.present = present
+        self.objects = objects
+        # Formatted values (see Strings()), by the uncertainties option
+        self._strings = dict()
+        # Where to take the formatted values from: the columns this one was
+        # concatenated from, or the column and rows it was taken from
+        self._parts = None
+        self._take = None
+
+    @classmethod
+    def FromValues(cls, items):
+        """
+        Create a column from a list of values (ufloats, other objects or None)
+        """
+        if not all(item is None or hasattr(item, "std_dev") for item in items):
+            return cls(objects=list(items))
+        present = numpy.array([item is not None for item in items], dtype=bool)
+        values = numpy.array([item.nominal_value if item is not None
+                              else numpy.nan for item in items], dtype=float)
+        errors = numpy.array([item.std_dev if item is not None
+                              else numpy.nan for item in items], dtype=float)
+        return cls(values, errors, present)
+
+    @classmethod
+    def Missing(cls, n):
+        """
+        Create a column of n rows without values
+        """
+        return cls(numpy.full(n, numpy.nan), numpy.full(n, numpy.nan),
+                   numpy.zeros(n, dtype=bool))
+
+    @classmethod
+    def Concat(cls, columns):
+        """
+        Concatenate columns
+        """
+        if all(column.numeric for column in columns):
+            column = cls(numpy.concatenate([c.values for c in columns]),
+                         numpy.concatenate([c.errors for c in columns]),
+                         numpy.concatenate([c.present for c in columns]))
+        else:
+            objects = list()
+            for c in columns:
+                objects.extend(c[i] for i in range(len(c)))
+            column = cls(objects=objects)
+        column._parts = columns
+        return column
+
+    @property
+    def numeric(self):
+        return self.objects is None
+
+    def __len__(self):
+        if self.numeric:
+            return len(self.values)
+        return len(self.objects)
+
+    def __getitem__(self, i):
+        """
+        Return the value of row i; for numeric columns, the ufloat is created
+        here.
+        """
+        if not self.numeric:
+            return self.objects[i]
+        if not self.present[i]:
+            return None
+        return ufloat(self.values[i], self.errors[i])
+
+    def SortKeys(self):
+        """
+        Return the keys to sort the rows by this column
+        """
+        if self.numeric:
+            return self.values.tolist()
+        return self.objects
+
+    def Take(self, rows):
+        """
+        Return a new column with the given rows (list of indices)
+        """
+        if self.numeric:
+            column = Column(self.values[rows], self.errors[rows],
+                            self.present[rows])
+        else:
+            column = Column(objects=[self.objects[i] for i in rows])
+        column._take = (self, rows)
+        return column
+
+    def Strings(self):
+        """
+        Return the values formatted for tables (with the current
+        uncertainties option); the result is cached
+        """
+        style = hdtv.options.Get("uncertainties")
+        try:
+            return self._strings[style]
+        except KeyError:
+            pass
+        if self._parts is not None:
+            strings = list()
+            for part in self._parts:
+                strings.extend(part.Strings())
+        elif self._take is not None:
+            (column, rows) = self._take
+            strings = column.Strings()
+            strings = [strings[i] for i in rows]
+        elif self.numeric:
+            strings = [hdtv.util.FormatValue(ufloat(value, error))
+                       if present else ""
+                       for (value, error, present) in
+                       zip(self.values, self.errors, self.present)]
+        else:
+            strings = [hdtv.util.FormatValue(obj) for obj in self.objects]
+        self._strings[style] = strings
+        return strings
+
+
+class Row(Mapping):
+    """
+    A row of FitResults, like a dict of parameter names and values. The
+    ufloats are created when accessed.
+    """
+
+    def __init__(self, results, index):
+        self._results = results
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._results.columns[key][self._index]
+
+    def __iter__(self):
+        return iter(self._results.params)
+
+    def __len__(self):
+        return len(self._results.params)
+
+
+class FitResults(object):
+    """
+    Results of fits as table: one row per peak (or integral), one Column per
+    parameter
+
+    Each fit caches its results (see hdtv.fit.Fit.PeakResults()) until it
+    changes, lists of many fits concatenate them. For each row, fits gives
+    the fit and peaks the index of the peak in the fit (None for
+    integrals).
+    """
+
+    def __init__(self, params, columns, nrows, fits=None, peaks=None):
+        self.params = params
+        self.columns = columns
+        self.nrows = nrows
+        self.fits = fits if fits is not None else [None] * nrows
+        self.peaks = peaks if peaks is not None else [None] * nrows
+
+    @classmethod
+    def FromColumns(cls, params, values, **kwargs):
+        """
+        Create the results from lists of values, one for each of params
+        """
+        columns = dict()
+        nrows = 0
+        for p in params:
+            columns[p] = Column.FromValues(values[p])
+            nrows = len(columns[p])
+        return cls(params, columns, nrows, **kwargs)
+
+    @classmethod
+    def Concat(cls, results):
+        """
+        Concatenate results, keeping the order of their parameters
+        """
+        results = [r for r in results if r.nrows > 0]
+        params = list()
+        for r in results:
+            # do not use set operations here to keep order of params
+            for p in r.params:
+                if p not in params:
+                    params.append(p)
+        columns = dict()
+        for p in params:
+            columns[p] = Column.Concat([
+                r.columns[p] if p in r.columns else Column.Missing(r.nrows)
+                for r in results])
+        fits = list()
+        peaks = list()
+        for r in results:
+            fits.extend(r.fits)
+            peaks.extend(r.peaks)
+        return cls(params, columns, len(fits), fits, peaks)
+
+    def __len__(self):
+        return self.nrows
+
+    def __contains__(self, param):
+        return param in self.columns
+
+    def Row(self, i):
+        return Row(self, i)
+
+    def Rows(self):
+        return [Row(self, i) for i in range(self.nrows)]
+
+    def Take(self, rows):
+        """
+        Return new results with the given rows (list of indices)
+        """
+        columns = dict((p, c.Take(rows)) for (p, c) in self.columns.items())
+        return FitResults(self.params, columns, len(rows),
+                          [self.fits[i] for i in rows],
+                          [self.peaks[i] for i in rows])
+
+    def Sort(self, sortBy, reverseSort=False):
+        """
+        Return the results sorted by the parameter sortBy (raises KeyError if
+        there is no such parameter)
+        """
+        keys = self.columns[sortBy].SortKeys()
+        rows = sorted(range(self.nrows), key=lambda i: keys[i],
+                      reverse=reverseSort)
+        return self.Take(rows)
+
+    def Select(self, func):
+        """
+        Return the results of the rows i with func(self.Row(i)) True
+        """
+        return self.Take([i for i in range(self.nrows) if func(self.Row(i))])
+
+    def StringRows(self, keys):
+        """
+        Return the formatted values of keys as list of dicts, e.g. for
+        hdtv.util.Table
+        """
+        columns = [self.columns[k].Strings() if k in self.columns
+                   else [None] * self.nrows for k in keys]
+        return [dict(zip(keys, values)) for values in zip(*columns)]
+
+    def Covariance(self, row1, param1, row2, param2):
+        """
+        Return the covariance of the uncalibrated values of param1 of row1
+        and param2 of row2 (from the covariance matrix of their fit, see
+        hdtv.fit.Fit.covariance): zero for peaks of different fits, NaN if
+        not known
+        """
+        fit = self.fits[row1]
+        if fit is None or self.fits[row2] is None:
+            return numpy.nan
+        if self.fits[row2] is not fit:
+            return 0.
+        covar = fit.covariance
+        if covar is None:
+            return numpy.nan
+        keys = fit.fitter.peakModel.OrderedParamKeys()
+        if param1 == "channel":
+            param1 = "pos"
+        if param2 == "channel":
+            param2 = "pos"
+        try:
+            i = self.peaks[row1] * len(keys) + keys.index(param1)
+            j = self.peaks[row2] * len(keys) + keys.index(param2)
+        except (TypeError, ValueError):
+            return numpy.nan
+        return covar[i, j]
+
+
+def PeakResults(fit):
+    """
+    Return the results of the peaks of fit, without id and status (which
+    may change without the fit changing)
+    """
+    params = ["chi"]
+    values = {"chi": list()}
+    keys = fit.fitter.peakModel.OrderedParamKeys()
+    for p in keys:
+        if p == "pos":
+            # Store channel additionally to position
+            params.append("channel")
+            values["channel"] = list()
+        params.append(p)
+        values[p] = list()
+    for peak in fit.peaks:
+        values["chi"].append("%d" % fit.chi)
+        for p in keys:
+            if p == "pos":
+                values["channel"].append(getattr(peak, "pos"))
+            # Use calibrated values of params if available
+            p_cal = p + "_cal"
+            values[p].append(getattr(peak, p_cal)
+                             if hasattr(peak, p_cal) else None)
+        # add extra params
+        for p in list(peak.extras.keys()):
+            if p not in params:
+                params.append(p)
+                values[p] = [None] * (len(values["chi"]) - 1)
+            values[p].append(peak.extras[p])
+        for p in params:
+            if len(values[p]) < len(values["chi"]):
+                values[p].append(None)
+    return FitResults.FromColumns(params, values, fits=[fit] * len(fit.peaks),
+                                  peaks=list(range(len(fit.peaks))))
+
+
+def IntegralResults(fit):
+    """
+    Return the results of the integrals (of all types) of the region of fit,
+    without id and status
+    """
+    params = ["type"]
+    values = {"type": list()}
+    integrals = fit.integral or dict()
+    for int_type in hdtv.integral.kinds:
+        integral = integrals.get(int_type)
+        if not integral:
+            continue
+        row = dict(integral["uncal"])
+        row["type"] = int_type
+        if fit.spec is not None and fit.spec.cal:
+            # rename pos to channel in uncal
+            row["channel"] = row.pop("pos")
+            # Make sure that calibration is up to date (without touching the
+            # integral of the fit)
+            cal = hdtv.integral.calibrate_integral(
+                {"uncal": integral["uncal"]}, fit.spec.cal)["cal"]
+            for (key, value) in cal.items():
+                if key == "vol":
+                    continue
+                row[key if (key == "pos") else key + "_cal"] = value
+        for p in list(integral["uncal"].keys()) + list(row.keys()):
+            if p not in params:
+                params.append(p)
+                values[p] = [None] * len(values["type"])
+        for p in params:
+            values[p].append(row.get(p))
+    return FitResults.FromColumns(params, values,
+                                  fits=[fit] * len(values["type"]))
+
+
+def WithStatus(fit, results, peaks=True):
+    """
+    Add the id and status columns of fit to its (cached) results
+    """
+    n = results.nrows
+    major = None if fit.ID is None else fit.ID.major
+    ids = [hdtv.util.ID(major, i if peaks else None) for i in range(n)]
+    stat = str()
+    if fit.active:
+        stat += "A"
+    if fit.ID is None or fit.ID in fit.spec.visible:  # ID of workFit is None
+        stat += "V"
+    columns = dict(results.columns)
+    columns["id"] = Column(objects=ids)
+    columns["stat"] = Column(objects=[stat] * n)
+    return FitResults(["id", "stat"] + results.params, columns, n,
+                      results.fits, results.peaks)
+
+
+def FromFits(fits):
+    """
+    Return the peak parameters of fits as FitResults
+    """
+    return FitResults.Concat([WithStatus(fit, fit.PeakResults())
+                              for fit in fits])
+
+
+def IntegralsFromFits(fits, integral_type="auto"):
+    """
+    Return the integrals of the regions of fits as FitResults; integral_type
+    is one of tot, bg, sub, all or auto (sub if available, otherwise tot)
+    """
+    results = list()
+    for fit in fits:
+        if integral_type == "all":
+            types = ["tot", "bg", "sub"]
+        elif integral_type == "auto":
+            types = ["sub"] if (fit.integral or {}).get("sub") else ["tot"]
+        else:
+            types = [integral_type]
+        r = WithStatus(fit, fit.IntegralResults(), peaks=False)
+        keys = r.columns["type"].objects
+        results.append(r.Take([i for i in range(r.nrows)
+                               if keys[i] in types]))
+    return FitResults.Concat(results)
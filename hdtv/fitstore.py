@@ -0,0 +1,656 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+# ----------------------------------------------------------------------
+# Binary, memory-mapped store of fits
+# ----------------------------------------------------------------------
+
+"""
+A fit store is a single binary file (little endian) holding the fits of
+one or more spectra:
+
+ header   HEADER: magic, format version, number of fits and the offsets
+          of the index and the string table
+ data     float64 values, one record per fit (see below)
+ index    one INDEX entry per fit: spectrum, fit ID, peak model, the
+          number of markers, peaks, ... and the offset of its record
+ strings  JSON list of strings (spectrum names, peak models, lists of
+          parameter names and the parameter status and extras of the
+          fits), referenced by their position in the list
+
+The record of a fit consists of (NaN where there is no value):
+ - the calibration coefficients of the spectrum (ncal)
+ - background, region (pairs) and peak markers, uncalibrated (2*nbg,
+   2*nregion, nmarkers)
+ - the background coefficients, value and error (2*ncoeffs)
+ - for each peak and each parameter (in the order of the parameter list):
+   uncalibrated value and error, calibrated value and error
+   (4*npeaks*nparams)
+ - the covariance matrix of the peak parameters (ncovar*ncovar)
+ - for each kind of integral (tot, bg, sub): 1 if present, value and error
+   of the uncalibrated INTEGRAL_KEYS and of the calibrated
+   INTEGRAL_CAL_KEYS (INTEGRAL_SIZE values)
+
+The file is memory-mapped when read, so the fits of a spectrum can be
+listed (see FitStore.Results()) without creating a single hdtv.fit.Fit;
+FitStore.Fit() creates the fit of a single record.
+"""
+
+import os
+import json
+import math
+from collections import namedtuple
+
+import numpy
+from uncertainties import ufloat
+
+import hdtv.cal
+import hdtv.fitxml
+import hdtv.integral
+import hdtv.ui
+import hdtv.util
+from hdtv.fitresults import Column, FitResults
+
+MAGIC = b"HDTVFITS"
+# Increase whenever the layout of the file changes
+STORE_VERSION = 1
+# Files with this extension are fit stores (see hdtv.plugins.fitlist)
+EXTENSION = "hfs"
+
+HEADER = numpy.dtype([("magic", "S8"), ("version", "<u4"), ("nfits", "<u4"),
+                      ("index", "<u8"), ("strings", "<u8"), ("size", "<u8")])
+
+INDEX = numpy.dtype([
+    ("spectrum", "<i4"),  # string: spectrum name
+    ("id", "<i4"),  # fit ID
+    ("model", "<i4"),  # string: peak model
+    ("params", "<i4"),  # string: JSON list of the parameter names
+    ("meta", "<i4"),  # string: JSON of parameter status and extras
+    ("bgdeg", "<i4"),
+    ("ncal", "<i4"),
+    ("nbg", "<i4"),
+    ("nregion", "<i4"),
+    ("nmarkers", "<i4"),
+    ("npeaks", "<i4"),
+    ("nparams", "<i4"),
+    ("ncoeffs", "<i4"),
+    ("ncovar", "<i4"),
+    ("chi", "<f8"),
+    ("bgchi", "<f8"),
+    ("offset", "<u8"),  # of the record in the data, in values
+])
+
+INTEGRAL_KEYS = ("pos", "width", "vol", "skew")
+INTEGRAL_CAL_KEYS = ("pos", "width", "vol")
+INTEGRAL_SIZE = 1 + 2 * (len(INTEGRAL_KEYS) + len(INTEGRAL_CAL_KEYS))
+
+# The spectrum for hdtv.fitxml.FitXml.Fit2Xml() when converting stores
+SpectrumInfo = namedtuple("SpectrumInfo", ["name", "cal"])
+
+
+def _Optional(value):
+    """
+    Convert None to NaN
+    """
+    return numpy.nan if value is None else value
+
+
+def _Pair(value):
+    """
+    Return value and error of a ufloat (or NaN, NaN for None)
+    """
+    if value is None:
+        return (numpy.nan, numpy.nan)
+    return (value.nominal_value, value.std_dev)
+
+
+def _Column(values, errors):
+    """
+    Create a numeric hdtv.fitresults.Column (NaN values are missing)
+    """
+    values = numpy.array(values)
+    return Column(values, numpy.array(errors), ~numpy.isnan(values))
+
+
+def _Float(value):
+    """
+    Convert a stored value to float, NaN (not available) to None
+    """
+    return None if numpy.isnan(value) else float(value)
+
+
+def _Integral(block):
+    """
+    Return the integral stored in block (as dict of the uncalibrated and
+    calibrated values, like hdtv.integral.get_integral_info()), or None
+    """
+    block = block.tolist()
+    if not block[0]:
+        return None
+    integral = {"uncal": dict()}
+    for (i, key) in enumerate(INTEGRAL_KEYS):
+        (value, error) = block[1 + 2 * i:3 + 2 * i]
+        if not math.isnan(value):
+            integral["uncal"][key] = ufloat(value, error)
+    cal = block[1 + 2 * len(INTEGRAL_KEYS):]
+    if not all(math.isnan(value) for value in cal):
+        integral["cal"] = dict(
+            (key, ufloat(cal[2 * i], cal[2 * i + 1]))
+            for (i, key) in enumerate(INTEGRAL_CAL_KEYS))
+    return integral
+
+
+class StoreWriter(object):
+    """
+    Write fits to a fit store: Add() the fits one after the other and
+    Close() the writer in the end.
+    """
+
+    def __init__(self, fname):
+        self.file = open(fname, "wb")
+        self.file.write(b"\0" * HEADER.itemsize)
+        self.index = list()
+        self.strings = list()
+        self._stringIds = dict()
+        self.nvalues = 0
+
+    def String(self, string):
+        """
+        Return the position of string in the string table (each string is
+        stored once)
+        """
+        try:
+            return self._stringIds[string]
+        except KeyError:
+            self.strings.append(string)
+            self._stringIds[string] = len(self.strings) - 1
+            return len(self.strings) - 1
+
+    def Add(self, fit, spectrum, ID=None, cal=None):
+        """
+        Add fit as fit ID (by default fit.ID) of the spectrum with name
+        spectrum; cal is the calibration of the spectrum (by default the
+        one of the fit)
+        """
+        if ID is None:
+            ID = fit.ID.major
+        if cal is None:
+            cal = fit.cal
+        coeffs = list(hdtv.cal.MakeCalibration(cal).GetCoeffs())
+        params = list(fit.fitter.peakModel.OrderedParamKeys())
+        status = dict()
+        for (name, stat) in fit.fitter.fParStatus.items():
+            if isinstance(stat, list):
+                status[name] = [str(s) for s in stat]
+            else:
+                status[name] = str(stat)
+        extras = list()
+        for peak in fit.peaks:
+            peakExtras = dict()
+            for (name, value) in peak.extras.items():
+                if hasattr(value, "std_dev"):
+                    peakExtras[name] = [value.nominal_value, value.std_dev]
+                else:
+                    peakExtras[name] = str(value)
+            extras.append(peakExtras)
+        meta = json.dumps({"status": status, "extras": extras},
+                          sort_keys=True)
+
+        record = list(coeffs)
+        bgMarkers = [m for m in fit.bgMarkers if m.p2 is not None]
+        for marker in bgMarkers:
+            record.extend([marker.p1.pos_uncal, marker.p2.pos_uncal])
+        regionMarkers = [m for m in fit.regionMarkers if m.p2 is not None]
+        for marker in regionMarkers:
+            record.extend([marker.p1.pos_uncal, marker.p2.pos_uncal])
+        for marker in fit.peakMarkers:
+            record.append(marker.p1.pos_uncal)
+        for coeff in fit.bgCoeffs:
+            record.extend(_Pair(coeff))
+        for peak in fit.peaks:
+            for name in params:
+                record.extend(_Pair(getattr(peak, name)))
+                record.extend(_Pair(getattr(peak, name + "_cal", None)))
+        ncovar = 0
+        if fit.covariance is not None:
+            ncovar = len(fit.covariance)
+            record.extend(numpy.ravel(fit.covariance))
+        integrals = fit.integral or dict()
+        for kind in hdtv.integral.kinds:
+            integral = integrals.get(kind)
+            if not integral:
+                record.extend([0.] + [numpy.nan] * (INTEGRAL_SIZE - 1))
+                continue
+            record.append(1.)
+            uncal = integral.get("uncal", dict())
+            for key in INTEGRAL_KEYS:
+                record.extend(_Pair(uncal.get(key)))
+            cal = integral.get("cal") or dict()
+            for key in INTEGRAL_CAL_KEYS:
+                record.extend(_Pair(cal.get(key)))
+
+        self.index.append((
+            self.String(spectrum), ID, self.String(fit.fitter.peakModel.name),
+            self.String(json.dumps(params)), self.String(meta),
+            fit.fitter.bgdeg, len(coeffs), len(bgMarkers),
+            len(regionMarkers), len(fit.peakMarkers), len(fit.peaks),
+            len(params), len(fit.bgCoeffs), ncovar,
+            _Optional(fit.chi), _Optional(fit.bgChi), self.nvalues))
+        data = numpy.array(record, dtype="<f8")
+        self.file.write(data.tobytes())
+        self.nvalues += len(data)
+
+    def Close(self):
+        """
+        Write the index and the string table and close the file
+        """
+        index = numpy.array(self.index, dtype=INDEX)
+        indexpos = HEADER.itemsize + 8 * self.nvalues
+        stringpos = indexpos + index.nbytes
+        strings = json.dumps(self.strings).encode("utf-8")
+        self.file.write(index.tobytes())
+        self.file.write(strings)
+        header = numpy.array([(MAGIC, STORE_VERSION, len(index), indexpos,
+                               stringpos, stringpos + len(strings))],
+                             dtype=HEADER)
+        self.file.seek(0)
+        self.file.write(header.tobytes())
+        self.file.close()
+
+    def Discard(self):
+        """
+        Close and remove the (incomplete) file
+        """
+        self.file.close()
+        os.remove(self.file.name)
+
+
+class FitStore(object):
+    """
+    Memory-mapped fit store
+
+    Raises ValueError if fname is not a (complete) fit store.
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        try:
+            buf = numpy.memmap(fname, dtype=numpy.uint8, mode="r")
+        except ValueError:
+            # numpy cannot map empty files
+            buf = numpy.zeros(0, dtype=numpy.uint8)
+        if len(buf) < HEADER.itemsize:
+            raise ValueError("%s is not a fit store" % fname)
+        header = buf[:HEADER.itemsize].view(HEADER)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError("%s is not a fit store" % fname)
+        if header["version"] != STORE_VERSION:
+            raise ValueError("%s: unsupported fit store version %d" %
+                             (fname, header["version"]))
+        if header["size"] != len(buf):
+            raise ValueError("%s is incomplete" % fname)
+        indexpos = int(header["index"])
+        stringpos = int(header["strings"])
+        self.data = buf[HEADER.itemsize:indexpos].view("<f8")
+        self.index = buf[indexpos:stringpos].view(INDEX)
+        self.strings = json.loads(buf[stringpos:].tobytes().decode("utf-8"))
+        # Parsed JSON strings, by position
+        self._json = dict()
+        self._rows = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def _Json(self, i):
+        try:
+            return self._json[i]
+        except KeyError:
+            self._json[i] = json.loads(self.strings[i])
+            return self._json[i]
+
+    def Spectra(self):
+        """
+        Return the names of the spectra, in the order of the file
+        """
+        (names, first) = numpy.unique(self.index["spectrum"],
+                                      return_index=True)
+        return [self.strings[names[i]] for i in numpy.argsort(first)]
+
+    def Spectrum(self, name=None, default=None):
+        """
+        Return the spectrum name if there are fits of it, otherwise the
+        name default (if there are fits of it) or the only spectrum of the
+        store; raises ValueError if there is no such spectrum
+        """
+        spectra = self.Spectra()
+        if name is not None:
+            if name not in spectra:
+                raise ValueError("%s contains no fits of spectrum %s" %
+                                 (self.fname, name))
+            return name
+        if default in spectra:
+            return default
+        if not spectra:
+            raise ValueError("%s contains no fits" % self.fname)
+        if len(spectra) == 1:
+            return spectra[0]
+        raise ValueError("%s contains fits of the spectra %s" %
+                         (self.fname, ", ".join(spectra)))
+
+    def Rows(self, spectrum):
+        """
+        Return the rows of the index of the fits of spectrum, ordered by
+        fit ID
+        """
+        if spectrum not in self.strings:
+            return list()
+        rows = numpy.flatnonzero(
+            self.index["spectrum"] == self.strings.index(spectrum))
+        order = numpy.argsort(self.index["id"][rows], kind="mergesort")
+        return rows[order].tolist()
+
+    def Find(self, spectrum, ID):
+        """
+        Return the row of the index of fit ID of spectrum (raises KeyError
+        if there is no such fit)
+        """
+        if self._rows is None:
+            keys = zip(self.index["spectrum"].tolist(),
+                       self.index["id"].tolist())
+            self._rows = dict((key, i) for (i, key) in enumerate(keys))
+        if spectrum not in self.strings:
+            raise KeyError(ID)
+        return self._rows[(self.strings.index(spectrum), ID)]
+
+    def Record(self, row):
+        """
+        Return the parts of the record of row as dict of arrays (views of
+        the file)
+        """
+        entry = self.index[row]
+        sizes = [("cal", entry["ncal"]),
+                 ("bgMarkers", 2 * entry["nbg"]),
+                 ("regionMarkers", 2 * entry["nregion"]),
+                 ("peakMarkers", entry["nmarkers"]),
+                 ("bgCoeffs", 2 * entry["ncoeffs"]),
+                 ("peaks", 4 * entry["npeaks"] * entry["nparams"]),
+                 ("covariance", entry["ncovar"] ** 2),
+                 ("integrals", INTEGRAL_SIZE * len(hdtv.integral.kinds))]
+        record = dict()
+        pos = int(entry["offset"])
+        for (name, size) in sizes:
+            record[name] = self.data[pos:pos + int(size)]
+            pos += int(size)
+        record["bgMarkers"] = record["bgMarkers"].reshape((-1, 2))
+        record["regionMarkers"] = record["regionMarkers"].reshape((-1, 2))
+        record["bgCoeffs"] = record["bgCoeffs"].reshape((-1, 2))
+        record["peaks"] = record["peaks"].reshape(
+            (entry["npeaks"], entry["nparams"], 4))
+        record["integrals"] = record["integrals"].reshape(
+            (len(hdtv.integral.kinds), INTEGRAL_SIZE))
+        return record
+
+    def PeakResults(self, row):
+        """
+        Return the results of the peaks of the fit in row, like
+        hdtv.fitresults.PeakResults()
+        """
+        entry = self.index[row]
+        record = self.Record(row)
+        npeaks = int(entry["npeaks"])
+        peaks = record["peaks"]
+        chi = None if numpy.isnan(entry["chi"]) else "%d" % entry["chi"]
+        params = ["chi"]
+        columns = {"chi": Column(objects=[chi] * npeaks)}
+        for (i, name) in enumerate(self._Json(entry["params"])):
+            if name == "pos":
+                params.append("channel")
+                columns["channel"] = _Column(peaks[:, i, 0], peaks[:, i, 1])
+            params.append(name)
+            columns[name] = _Column(peaks[:, i, 2], peaks[:, i, 3])
+        # add extra params
+        extras = dict()
+        for (i, peakExtras) in enumerate(
+                self._Json(entry["meta"])["extras"]):
+            for (name, value) in sorted(peakExtras.items()):
+                if name not in params:
+                    params.append(name)
+                    extras[name] = [None] * npeaks
+                if isinstance(value, list):
+                    value = ufloat(*value)
+                extras[name][i] = value
+        for (name, values) in extras.items():
+            columns[name] = Column.FromValues(values)
+        return FitResults(params, columns, npeaks,
+                          peaks=list(range(npeaks)))
+
+    def IntegralResults(self, row):
+        """
+        Return the results of the integrals of the region of the fit in
+        row, like hdtv.fitresults.IntegralResults()
+        """
+        record = self.Record(row)
+        params = ["type"]
+        values = {"type": list()}
+        for (kind, block) in zip(hdtv.integral.kinds, record["integrals"]):
+            integral = _Integral(block)
+            if integral is None:
+                continue
+            row = dict(integral["uncal"])
+            row["type"] = kind
+            if "cal" in integral:
+                # rename pos to channel in uncal
+                row["channel"] = row.pop("pos")
+                for (key, value) in integral["cal"].items():
+                    if key == "vol":
+                        continue
+                    row[key if (key == "pos") else key + "_cal"] = value
+            for p in list(integral["uncal"].keys()) + list(row.keys()):
+                if p not in params:
+                    params.append(p)
+                    values[p] = [None] * len(values["type"])
+            for p in params:
+                values[p].append(row.get(p))
+        return FitResults.FromColumns(params, values)
+
+    def _WithId(self, row, results, peaks=True):
+        """
+        Add the id and (empty) status columns to the results of row
+        """
+        n = results.nrows
+        major = int(self.index["id"][row])
+        columns = dict(results.columns)
+        columns["id"] = Column(objects=[
+            hdtv.util.ID(major, i if peaks else None) for i in range(n)])
+        columns["stat"] = Column(objects=[""] * n)
+        return FitResults(["id", "stat"] + results.params, columns, n,
+                          results.fits, results.peaks)
+
+    def Results(self, rows):
+        """
+        Return the peak parameters of the fits in rows as
+        hdtv.fitresults.FitResults (as hdtv.fitresults.FromFits())
+        """
+        return FitResults.Concat([self._WithId(row, self.PeakResults(row))
+                                  for row in rows])
+
+    def Integrals(self, rows, integral_type="auto"):
+        """
+        Return the integrals of the regions of the fits in rows as
+        hdtv.fitresults.FitResults (as hdtv.fitresults.IntegralsFromFits())
+        """
+        results = list()
+        for row in rows:
+            r = self._WithId(row, self.IntegralResults(row), peaks=False)
+            keys = r.columns["type"].objects
+            if integral_type == "all":
+                types = hdtv.integral.kinds
+            elif integral_type == "auto":
+                types = ["sub"] if "sub" in keys else ["tot"]
+            else:
+                types = [integral_type]
+            results.append(r.Take([i for i in range(r.nrows)
+                                   if keys[i] in types]))
+        return FitResults.Concat(results)
+
+    def Fit(self, row, cal=None):
+        """
+        Create the fit of row, with calibration cal (by default the stored
+        one of its spectrum). Returns (fit, success) like
+        hdtv.fitxml.MakeFit(); the fit still has to be restored
+        (hdtv.fit.Fit.Restore()) to a spectrum.
+        """
+        entry = self.index[row]
+        record = self.Record(row)
+        if cal is None:
+            cal = record["cal"].tolist()
+        # markers
+        markers = list()
+        for (mtype, pairs) in [("bg", record["bgMarkers"]),
+                               ("region", record["regionMarkers"])]:
+            for pair in pairs.tolist():
+                markers += [(mtype, pos, False) for pos in pair]
+        markers += [("peak", pos, False)
+                    for pos in record["peakMarkers"].tolist()]
+        # peaks
+        meta = self._Json(entry["meta"])
+        status = meta["status"]
+        params = self._Json(entry["params"])
+        peaks = list()
+        for (i, values) in enumerate(record["peaks"].tolist()):
+            parameter = dict()
+            for (k, name) in enumerate(params):
+                (value, error) = values[k][:2]
+                if math.isnan(value):
+                    parameter[name] = None
+                    continue
+                stat = status.get(name, "free")
+                if isinstance(stat, list):
+                    stat = stat[i] if i < len(stat) else "free"
+                parameter[name] = ufloat(
+                    value, error, tag=stat in ["free", "equal", "calculated"])
+            extras = dict()
+            if i < len(meta["extras"]):
+                for (name, value) in meta["extras"][i].items():
+                    extras[name] = ufloat(*value) if isinstance(
+                        value, list) else value
+            peaks.append((parameter, extras))
+        n = int(entry["ncovar"])
+        covariance = None
+        if n:
+            covariance = numpy.array(record["covariance"]).reshape((n, n))
+        # integrals
+        integrals = dict()
+        for (kind, block) in zip(hdtv.integral.kinds, record["integrals"]):
+            integral = _Integral(block)
+            if integral is not None:
+                integrals[kind] = integral
+        return hdtv.fitxml.MakeFit(
+            self.strings[entry["model"]], int(entry["bgdeg"]), cal=cal,
+            chi=_Float(entry["chi"]), markers=markers,
+            bgChi=_Float(entry["bgchi"]),
+            bgCoeffs=[ufloat(value, error)
+                      for (value, error) in record["bgCoeffs"].tolist()],
+            status=status, peaks=peaks, covariance=covariance,
+            integrals=integrals)
+
+    def IterFits(self, rows, cal=None):
+        """
+        Create the fits of rows one after the other (see Fit())
+        """
+        for row in rows:
+            yield self.Fit(row, cal)
+
+
+def Write(fname, fitlists):
+    """
+    Write the fits of several spectra to the fit store fname; fitlists is
+    an iterable of (name of the spectrum, its calibration, fits)
+    """
+    writer = StoreWriter(fname)
+    count = 0
+    try:
+        for (name, cal, fits) in fitlists:
+            for fit in fits:
+                writer.Add(fit, name, cal=cal)
+                count += 1
+    except BaseException:
+        writer.Discard()
+        raise
+    writer.Close()
+    return count
+
+
+def FromXml(xmlname, fname):
+    """
+    Convert the fitlist xml file xmlname (version 1.1 or newer) to the fit
+    store fname. The fits are stored with the spectrum name of their xml
+    element and numbered in the order of the file, like when reading the
+    file into an empty spectrum. Returns the number of fits.
+    """
+    xml = hdtv.fitxml.FitXml(None)
+    writer = StoreWriter(fname)
+    ids = dict()
+    try:
+        with hdtv.util.open_compressed(xmlname, mode="rb") as f:
+            (root, events) = hdtv.fitxml.IterParse(f)
+            if root.get("version") not in ["1.1", "1.2", "1.3",
+                                           hdtv.fitxml.VERSION]:
+                raise ValueError(
+                    "%s is not a fitlist of version 1.1 or newer "
+                    "(use 'fit read' and 'fit write' instead)" % xmlname)
+            for fitElement in hdtv.fitxml.IterFitElements(events, root):
+                specElement = fitElement.find("spectrum")
+                name = specElement.get("name")
+                cal = [float(c) for c in
+                       specElement.get("calibration", "").split()]
+                (fit, success) = xml.Xml2Fit_v1(
+                    fitElement, calibration=hdtv.cal.MakeCalibration(cal))
+                ID = ids.get(name, 0)
+                ids[name] = ID + 1
+                writer.Add(fit, name, ID, cal)
+    except BaseException:
+        writer.Discard()
+        raise
+    writer.Close()
+    return sum(ids.values())
+
+
+def ToXml(fname, xmlname, spectrum=None):
+    """
+    Convert the fits of spectrum (may be omitted if there is only one) in
+    the fit store fname to the fitlist xml file xmlname. Returns the number
+    of fits.
+    """
+    store = FitStore(fname)
+    spectrum = store.Spectrum(spectrum)
+    rows = store.Rows(spectrum)
+    fits = dict()
+    for row in rows:
+        (fit, success) = store.Fit(row)
+        fit.ID = hdtv.util.ID(int(store.index["id"][row]))
+        fits[fit.ID.major] = fit
+    cal = store.Record(rows[0])["cal"].tolist() if rows else []
+    info = SpectrumInfo(spectrum, hdtv.cal.MakeCalibration(cal))
+    with hdtv.util.open_compressed(xmlname, mode="wb") as f:
+        for chunk in hdtv.fitxml.FitXml(None).IterXml(fits, info):
+            f.write(chunk)
+    return len(fits)
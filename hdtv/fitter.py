@@ -19,9 +19,12 @@
 # along with HDTV; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
+import numpy
 import ROOT
 
+import hdtv.options
 import hdtv.peakmodels
+import hdtv.timing
 from hdtv.util import Pairs
 
 
@@ -57,15 +60,18 @@ class Fitter(object):
         bgfitter = ROOT.HDTV.Fit.PolyBg(self.bgdeg)
         for bg in backgrounds:
             bgfitter.AddRegion(bg[0], bg[1])
+        bgfitter.SetUseMinuit(hdtv.options.Get("fit.background.minuit"))
         self.bgFitter = bgfitter
         # do the background fit
         self.bgFitter.Fit(spec.hist.hist)
+        hdtv.timing.counters["fits"] += 1
 
     def RestoreBackground(self, backgrounds=Pairs(),
-                          coeffs=list(), chisquare=0.0):
+                          coeffs=list(), chisquare=0.0, covar=None):
         """
         Create Background Fitter object and
         restore the background polynom from coeffs
+        (and its covariance matrix, given row by row, if available)
         """
         # create fitter
         bgfitter = ROOT.HDTV.Fit.PolyBg(self.bgdeg)
@@ -78,7 +84,14 @@ class Fitter(object):
         for i, coeff in enumerate(coeffs):
             valueArray[i] = coeff.nominal_value
             errorArray[i] = coeff.std_dev
-        self.bgFitter.Restore(valueArray, errorArray, chisquare)
+        if covar is None:
+            self.bgFitter.Restore(valueArray, errorArray, chisquare)
+        else:
+            covarArray = ROOT.TArrayD(len(covar))
+            for i, c in enumerate(covar):
+                covarArray[i] = c
+            self.bgFitter.Restore(valueArray, errorArray, chisquare,
+                                  covarArray)
 
     def FitPeaks(self, spec, region=Pairs(), peaklist=list()):
         """
@@ -93,6 +106,44 @@ class Fitter(object):
         else:
             # internal background
             self.peakFitter.Fit(spec.hist.hist, self.bgdeg)
+        hdtv.timing.counters["fits"] += 1
+        hdtv.timing.counters["evals"] += self.peakFitter.GetNumEvals()
+
+    def PeakCovariance(self, order=None):
+        """
+        Return the covariance matrix of the peak parameters of the last peak
+        fit as numpy array, or None if it is not available (e.g. for restored
+        fits). There is one row and column for each parameter (in the order
+        of OrderedParamKeys() of the peak model, uncalibrated) of each peak
+        (in the given order of the peak indices, by default as in the
+        fitter); the rows and columns of parameters that were not free are
+        zero.
+        """
+        fitter = self.peakFitter
+        n = fitter.GetNumParams()
+        if n == 0:
+            return None
+        covar = numpy.empty(n * n)
+        if not fitter.GetCovarianceMatrix(covar):
+            return None
+        covar = covar.reshape((n, n))
+        if order is None:
+            order = range(fitter.GetNumPeaks())
+        ids = list()
+        scales = list()
+        for i in order:
+            (peakIds, peakScales) = self.peakModel.ParamIds(
+                fitter.GetPeak(i))
+            ids.extend(peakIds)
+            scales.extend(peakScales)
+        ids = numpy.array(ids, dtype=int)
+        scales = numpy.array(scales)
+        free = ids >= 0
+        result = numpy.zeros((len(ids), len(ids)))
+        result[numpy.ix_(free, free)] = (
+            covar[numpy.ix_(ids[free], ids[free])] *
+            numpy.outer(scales[free], scales[free]))
+        return result
 
     def RestorePeaks(self, cal=None, region=Pairs(),
                      peaks=list(), chisquare=0.0, coeffs=list()):
@@ -158,3 +209,14 @@ class Fitter(object):
         new = Fitter(self.peakModel.name, self.bgdeg)
         new.peakModel.fParStatus = self.peakModel.fParStatus.copy()
         return new
+
+
+# The background polynomial is fitted by a direct linear least-squares
+# solution, unless MINUIT is requested
+opt = hdtv.options.Option(default=False, parse=hdtv.options.parse_bool)
+hdtv.options.RegisterOption("fit.background.minuit", opt)
+
+# Peak fitters that support it (Theuerkauf) use the analytic gradient of the
+# fit function, instead of finite differences, unless switched off
+opt = hdtv.options.Option(default=True, parse=hdtv.options.parse_bool)
+hdtv.options.RegisterOption("fit.gradient", opt)
@@ -24,6 +24,7 @@ from __future__ import print_function
 import xml.etree.cElementTree as ET
 from uncertainties import ufloat
 
+import hdtv.cal
 import hdtv.ui
 from hdtv.util import Position
 from hdtv.fitter import Fitter
@@ -39,6 +40,84 @@ from hdtv.fit import Fit
 VERSION = "1.4"
 
 
+def IterParse(file_object):
+    """
+    Start parsing the fitlist xml file_object on the fly. Returns its root
+    element and the remaining events of ET.iterparse (see IterFitElements()).
+    Raises SyntaxError if file_object is not an hdtv file.
+    """
+    events = ET.iterparse(file_object, events=("start", "end"))
+    (event, root) = next(events)
+    if not root.tag == "hdtv" or root.get("version") is None:
+        raise SyntaxError("this is not a valid hdtv file")
+    return (root, events)
+
+
+def IterFitElements(events, root):
+    """
+    Yields the complete fit elements below root from the events returned
+    by IterParse(), and drops each one from the tree once it has been
+    processed
+    """
+    depth = 1
+    for (event, elem) in events:
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1 and elem.tag == "fit":
+            yield elem
+            root.remove(elem)
+
+
+def MakeFit(peakModel, bgdeg, cal=None, chi=None, markers=(), bgChi=None,
+            bgCoeffs=(), status=None, peaks=(), covariance=None,
+            integrals=None):
+    """
+    Creates a fit object from its stored properties (as read from a fitlist
+    or a fit store):
+      markers: (type, position, fixedInCal) of each marker
+      status: dict of the parameter status of the fitter (the same status
+              for all peaks, or a list with the status of each peak)
+      peaks: (parameters, extras) dicts of each peak
+      integrals: dict of the integrals of the fit region by kind
+    Returns (fit, success), success is False if a parameter status or a peak
+    could not be read. The fit still has to be restored
+    (hdtv.fit.Fit.Restore()) to a spectrum.
+    """
+    success = True
+    fitter = Fitter(peakModel, bgdeg)
+    fit = Fit(fitter, cal=cal)
+    fit.chi = chi
+    for (mtype, pos, fixedInCal) in markers:
+        fit.ChangeMarker(
+            mtype, Position(pos, fixedInCal=fixedInCal, cal=fit.cal), "set")
+    fit.bgChi = bgChi
+    fit.bgCoeffs = list(bgCoeffs)
+    for (name, stat) in (status or dict()).items():
+        try:
+            fitter.SetParameter(name, stat)
+        except ValueError as err:
+            hdtv.ui.error("Error reading parameter status: %s" % err)
+            success = False
+    for (parameter, extras) in peaks:
+        try:
+            peak = fitter.peakModel.Peak(cal=fit.cal, **parameter)
+        except TypeError:
+            hdtv.ui.error(
+                "Error reading peak with parameters: %s" % str(parameter))
+            success = False
+            continue
+        peak.extras = extras
+        fit.peaks.append(peak)
+    fit.covariance = covariance
+    if integrals:
+        for kind in ["sub", "bg"]:
+            integrals.setdefault(kind, None)
+    fit.integral = integrals or None
+    return (fit, success)
+
+
 class FitXml(object):
     """
     Class to save and read fit lists to and from xml file
@@ -62,10 +141,31 @@ class FitXml(object):
             fits = self.spectra.dict[sid].dict
         except KeyError:
             raise hdtv.cmdline.HDTVCommandError("No spectrum with id %s loaded." % sid)
-        root = self.CreateXml(fits)
-        # save to file
-        tree = ET.ElementTree(root)
-        tree.write(file_object)
+        # save to file, one fit at a time
+        for chunk in self.IterXml(fits):
+            file_object.write(chunk)
+
+    def IterXml(self, fits, spec=None):
+        """
+        Serializes the fits one by one and yields the resulting chunks of
+        the xml document (as bytes)
+
+        The output is identical to writing the tree from CreateXml, but only
+        the element of one fit is held in memory at a time. spec is passed
+        on to Fit2Xml.
+        """
+        fits = sorted(fits.values(), key=lambda fit: fit.ID)
+        if not fits:
+            yield ET.tostring(ET.Element("hdtv", version=VERSION))
+            return
+        yield ('<hdtv version="%s">\n  ' % VERSION).encode("ascii")
+        for (n, fit) in enumerate(fits, 1):
+            fitElement = self.Fit2Xml(fit, spec)
+            self._indent(fitElement, 1)
+            if n == len(fits):
+                fitElement.tail = "\n"
+            yield ET.tostring(fitElement)
+        yield b"</hdtv>\n"
 
     def CreateXml(self, fits):
         """
@@ -79,9 +179,12 @@ class FitXml(object):
         self._indent(root)
         return root
 
-    def Fit2Xml(self, fit):
+    def Fit2Xml(self, fit, spec=None):
         """
         Creates xml element for a fit
+
+        spec is the spectrum of the fit (by default fit.spec), or anything
+        with its name and calibration
         """
         # <fit>
         fitElement = ET.Element("fit")
@@ -89,7 +192,8 @@ class FitXml(object):
         fitElement.set("bgDegree", str(fit.fitter.bgdeg))
         fitElement.set("chi", str(fit.chi))
         # <spectrum>
-        spec = fit.spec
+        if spec is None:
+            spec = fit.spec
         specElement = ET.SubElement(fitElement, "spectrum")
         specElement.set("name", str(spec.name))
         polynom = str()
@@ -258,18 +362,16 @@ class FitXml(object):
 
 ##### Reading of xml #####################################################
 
-    def _getPosFromElement(self, markerElement, fit=None):
+    def _getPosFromElement(self, markerElement):
         """
-        Read position in energy domain from XML element.
+        Read position of a marker from XML element, returns (position,
+        fixedInCal)
         """
         try:
-            uncal = float(markerElement.find("uncal").text)
-            pos = Position(uncal, fixedInCal=False, cal=fit.cal)
+            return (float(markerElement.find("uncal").text), False)
         except AttributeError:
             # Try to read "cal" element if "uncal" element does not exist
-            cal = float(markerElement.find("cal").text)
-            pos = Position(cal, fixedInCal=True, cal=fit.cal)
-        return pos
+            return (float(markerElement.find("cal").text), True)
 
     def _readParamElement(self, paramElement):
         """
@@ -310,32 +412,27 @@ class FitXml(object):
         except AttributeError:
             fname = "fitlist"
         try:
-            tree = ET.parse(file_object)
-            root = tree.getroot()
-            if not root.tag == "hdtv" or root.get("version") is None:
-                e = "this is not a valid hdtv file"
-                raise SyntaxError(e)
+            (root, events) = IterParse(file_object)
             # current version
             if root.get("version") == self.version:
-                count = self.RestoreFromXml(root, sid, refit=refit)
+                count = self.RestoreFits_v1(
+                    IterFitElements(events, root), sid, refit=refit)
             else:
                 # old versions
                 oldversion = root.get("version")
                 hdtv.ui.warn(
                     "The XML version of this file (%s) is outdated." %
                     oldversion)
-                if oldversion == "1.3":
-                    hdtv.ui.msg(
-                        "But this version should be fully compatible with the new version.")
-                    count = self.RestoreFromXml_v1_3(root, sid, refit=refit)
-                if oldversion == "1.2":
-                    hdtv.ui.msg(
-                        "But this version should be fully compatible with the new version.")
-                    count = self.RestoreFromXml_v1_2(root, sid, refit=refit)
-                if oldversion == "1.1":
+                if oldversion in ["1.3", "1.2", "1.1"]:
                     hdtv.ui.msg(
                         "But this version should be fully compatible with the new version.")
-                    count = self.RestoreFromXml_v1_1(root, sid, refit=refit)
+                    # Versions 1.1 to 1.3 are read like the current one
+                    count = self.RestoreFits_v1(
+                        IterFitElements(events, root), sid, refit=refit)
+                else:
+                    # The older formats need the complete tree
+                    for (event, elem) in events:
+                        pass
                 if oldversion == "1.0":
                     hdtv.ui.msg(
                         "Restoring only fits belonging to spectrum %s" % sid)
@@ -374,12 +471,34 @@ class FitXml(object):
         Information about the integral over the fit region (and bg, if
         available) are supplied. No big change!
         """
+        return self.RestoreFits_v1(root.findall("fit"), sid, refit)
+
+    def RestoreFits_v1(self, fitElements, sid, refit=False):
+        """
+        Restores fits from an iterable of fit elements (version >= 1.1)
+
+        fitElements may be a generator that parses the file on the fly
+        (see RestoreFits()).
+        """
+        cal = self.spectra.dict[sid].cal
+        return self.RestoreFits(
+            (self.Xml2Fit_v1(fitElement, calibration=cal)
+             for fitElement in fitElements), sid, refit)
+
+    def RestoreFits(self, fits, sid, refit=False):
+        """
+        Restores fits to spectrum sid from an iterable of (fit, success),
+        as returned by Xml2Fit_v1, and adds them to the spectrum
+
+        All fits are read before the first one is restored, so nothing is
+        added to the spectrum if reading fails halfway (e.g. with a
+        SyntaxError for a truncated file).
+        """
         spec = self.spectra.dict[sid]
+        fits = list(fits)
         count = 0
         do_fit = ""
-        fits = list()
-        for fitElement in root.findall("fit"):
-            (fit, success) = self.Xml2Fit_v1(fitElement, calibration=spec.cal)
+        for (fit, success) in fits:
             # restore fit
             if success and not refit:
                 try:
@@ -401,11 +520,8 @@ class FitXml(object):
                         do_fit = input(question)
                     if do_fit in ["Y", "y", "", "A", "a"]:
                         fit.FitPeakFunc(spec)
-            # finish this fit
-            fits.append(fit)
-        # add fits to spectrum
-        for fit in fits:
-            ID = spec.Insert(fit)
+            # add fit to spectrum
+            spec.Insert(fit)
             count += 1
             if sid not in self.spectra.visible:
                 fit.Hide()
@@ -524,46 +640,28 @@ class FitXml(object):
         Creates a fit object from information found in a xml file
         """
         # <fit>
-        success = True
-        peakModel = fitElement.get("peakModel")
-        bgdeg = int(fitElement.get("bgDegree"))
-        fitter = Fitter(peakModel, bgdeg)
-        fit = Fit(fitter, cal=calibration)
         try:
-            fit.chi = float(fitElement.get("chi"))
+            chi = float(fitElement.get("chi"))
         except ValueError:
-            fit.chi = None
-        # <bgMarker>
-        for bgElement in fitElement.findall("bgMarker"):
-            # Read begin marker
-            beginElement = bgElement.find("begin")
-            begin = self._getPosFromElement(beginElement, fit)
-            fit.ChangeMarker("bg", begin, "set")
-            # Read end marker
-            endElement = bgElement.find("end")
-            end = self._getPosFromElement(endElement, fit)
-            fit.ChangeMarker("bg", end, "set")
-        # <regionMarker>
-        for regionElement in fitElement.findall("regionMarker"):
-            # Read begin marker
-            beginElement = regionElement.find("begin")
-            begin = self._getPosFromElement(beginElement, fit)
-            fit.ChangeMarker("region", begin, "set")
-            # Read end marker
-            endElement = regionElement.find("end")
-            end = self._getPosFromElement(endElement, fit)
-            fit.ChangeMarker("region", end, "set")
-            # <peakMarker>
+            chi = None
+        # <bgMarker>, <regionMarker>
+        markers = list()
+        for mtype in ["bg", "region"]:
+            for markerElement in fitElement.findall(mtype + "Marker"):
+                for tag in ["begin", "end"]:
+                    markers.append((mtype,) + self._getPosFromElement(
+                        markerElement.find(tag)))
+        # <peakMarker>
         for peakElement in fitElement.findall("peakMarker"):
-            # Read position marker
-            posElement = peakElement.find("position")
-            pos = self._getPosFromElement(posElement, fit)
-            fit.ChangeMarker("peak", pos, "set")
+            markers.append(("peak",) + self._getPosFromElement(
+                peakElement.find("position")))
         # <background>
+        bgChi = None
+        bgCoeffs = list()
         bgElement = fitElement.find("background")
         if bgElement:
             try:
-                fit.bgChi = float(bgElement.get("chisquare"))
+                bgChi = float(bgElement.get("chisquare"))
             except ValueError:
                 pass
             coeffs = list()
@@ -578,9 +676,10 @@ class FitXml(object):
                 coeff = ufloat(value, error)
                 coeffs.append([deg, coeff])
             coeffs.sort()
-            fit.bgCoeffs = [c[1] for c in coeffs]
+            bgCoeffs = [c[1] for c in coeffs]
         # <peak>
         statusdict = dict()
+        peaks = list()
         for peakElement in fitElement.findall("peak"):
             # <uncal>
             uncalElement = peakElement.find("uncal")
@@ -611,25 +710,12 @@ class FitXml(object):
                         errorElement = paramElement.find("error")
                         error = float(errorElement.text)
                         extras[name] = ufloat(value, error)
-            # create peak
-            try:
-                peak = fit.fitter.peakModel.Peak(cal=calibration, **parameter)
-            except TypeError:
-                hdtv.ui.error(
-                    "Error reading peak with parameters: %s" % str(parameter))
-                success = False
-                continue
-            peak.extras = extras
-            fit.peaks.append(peak)
-            # set parameter status of fitter
-            for name in list(statusdict.keys()):
-                # check if status is the same for all peaks
-                check = set(statusdict[name])
-                if len(check) == 1:
-                    status = statusdict[name][0]
-                else:
-                    status = statusdict[name]
-                fitter.SetParameter(name, status)
+            peaks.append((parameter, extras))
+        # parameter status of fitter, check if it is the same for all peaks
+        status = dict()
+        for (name, stats) in statusdict.items():
+            status[name] = stats[0] if len(set(stats)) == 1 else stats
+        # <integral>
         integrals = dict()
         for integral in fitElement.findall('integral'):
             integral_type = integral.get("integraltype")
@@ -646,13 +732,11 @@ class FitXml(object):
                     error = float(errorElement.text)
                     coeff = ufloat(value, error)
                     integrals[integral_type][cal_type][paramElement.tag] = coeff
-        if not integrals:
-            integrals = None
-        for integral_type in ['sub', 'bg']:
-            if integrals and not integral_type in integrals:
-                integrals[integral_type] = None
-        fit.integral = integrals
-        return (fit, success)
+        return MakeFit(fitElement.get("peakModel"),
+                       int(fitElement.get("bgDegree")), cal=calibration,
+                       chi=chi, markers=markers, bgChi=bgChi,
+                       bgCoeffs=bgCoeffs, status=status, peaks=peaks,
+                       integrals=integrals)
 
 ##### version 0.* ########################################################
 
@@ -699,6 +783,8 @@ class FitXml(object):
                     status = params[parname]
                     fitter.SetParameter(parname, status)
                 fit = Fit(fitter, cal=spec.cal)
+                # Marker positions (uncalibrated), converted all at once below
+                markers = list()
                 # <background>
                 for bgElement in fitElement.findall("background"):
                     # Read begin/p1 marker
@@ -706,13 +792,13 @@ class FitXml(object):
                     if beginElement is None:  # Maybe old Element (ver 0.1)
                         beginElement = bgElement.find("p1")
                     begin = float(beginElement.find("uncal").text)
-                    fit.ChangeMarker("bg", fit.cal.Ch2E(begin), "set")
+                    markers.append(("bg", begin))
                     # Read end/p2 marker
                     endElement = bgElement.find("end")
                     if endElement is None:  # Maybe old Element (ver 0.1)
                         endElement = bgElement.find("p2")
                     end = float(endElement.find("uncal").text)
-                    fit.ChangeMarker("bg", fit.cal.Ch2E(end), "set")
+                    markers.append(("bg", end))
                 # <region>
                 for regionElement in fitElement.findall("region"):
                     # Read begin/p1 marker
@@ -720,13 +806,13 @@ class FitXml(object):
                     if beginElement is None:  # Maybe old Element (ver 0.1)
                         beginElement = regionElement.find("p1")
                     begin = float(beginElement.find("uncal").text)
-                    fit.ChangeMarker("region", fit.cal.Ch2E(begin), "set")
+                    markers.append(("region", begin))
                     # Read end/p2 marker
                     endElement = regionElement.find("end")
                     if endElement is None:  # Maybe old Element (ver 0.1)
                         endElement = regionElement.find("p2")
                     end = float(endElement.find("uncal").text)
-                    fit.ChangeMarker("region", fit.cal.Ch2E(end), "set")
+                    markers.append(("region", end))
                 # <peak>
                 for peakElement in fitElement.findall("peak"):
                     # Read position/p1 marker
@@ -734,7 +820,10 @@ class FitXml(object):
                     if posElement is None:
                         posElement = peakElement.find("p1")
                     pos = float(posElement.find("uncal").text)
-                    fit.ChangeMarker("peak", fit.cal.Ch2E(pos), "set")
+                    markers.append(("peak", pos))
+                energies = hdtv.cal.Ch2E(fit.cal, [m[1] for m in markers])
+                for ((mtype, uncal), energy) in zip(markers, energies):
+                    fit.ChangeMarker(mtype, float(energy), "set")
                 if do_fit:
                     fit.FitPeakFunc(spec)
                 spec.Insert(fit)
@@ -21,16 +21,72 @@
 
 import os
 
+import numpy
 import ROOT
+import hdtv.cal
 import hdtv.color
+import hdtv.options
 import hdtv.rootext.mfile
+import hdtv.ui
 
 from hdtv.drawable import Drawable
 from hdtv.specreader import SpecReader, SpecReaderError
+from hdtv.util import AsArray
 
 # Don't add created spectra to the ROOT directory
 ROOT.TH1.AddDirectory(ROOT.kFALSE)
 
+# numpy types of the bin contents, by the array base class of the histogram
+_BIN_TYPES = (("TArrayD", numpy.float64), ("TArrayF", numpy.float32),
+              ("TArrayI", numpy.int32), ("TArrayS", numpy.int16),
+              ("TArrayC", numpy.int8))
+
+
+def _SharedArray(hist, buf, dtype, flow):
+    """
+    numpy array sharing memory with the buffer buf (holding one value for
+    each cell) of the ROOT histogram hist. The array keeps hist alive.
+    """
+    axes = [hist.GetXaxis(), hist.GetYaxis(), hist.GetZaxis()]
+    shape = tuple(axis.GetNbins() + 2
+                  for axis in reversed(axes[:hist.GetDimension()]))
+    n = int(numpy.prod(shape))
+    address = AsArray(buf, n, dtype).ctypes.data
+    carray = (numpy.ctypeslib.as_ctypes_type(dtype) * n).from_address(address)
+    carray.hist = hist
+    array = numpy.ctypeslib.as_array(carray).reshape(shape)
+    if not flow:
+        array = array[(slice(1, -1),) * len(shape)]
+    return array
+
+
+def BinContents(hist, flow=False):
+    """
+    Return the bin contents of the ROOT histogram hist as numpy array,
+    sharing memory with the histogram (writing to the array modifies the
+    histogram). The array has one dimension per axis, in reversed order
+    (i.e. [y, x] for 2d histograms), and includes the under- and overflow
+    bins if flow is set.
+
+    The array must not be used after the histogram was rebinned in place
+    (TH1::Rebin() without a new name), which reallocates the bins.
+    """
+    for (cls, dtype) in _BIN_TYPES:
+        if isinstance(hist, getattr(ROOT, cls)):
+            return _SharedArray(hist, hist.GetArray(), dtype, flow)
+    raise TypeError("Unsupported histogram class %s" % hist.ClassName())
+
+
+def BinVariances(hist, flow=False):
+    """
+    Return the sum of squares of weights (the squared bin errors) of the
+    ROOT histogram hist as numpy array like BinContents(), or None if
+    the histogram does not store them (see TH1::Sumw2()).
+    """
+    if hist.GetSumw2N() == 0:
+        return None
+    return _SharedArray(hist, hist.GetSumw2().GetArray(), numpy.float64, flow)
+
 
 class Histogram(Drawable):
     """
@@ -69,6 +125,67 @@ class Histogram(Drawable):
 
     hist = property(_get_hist, _set_hist)
 
+    # counts property
+    def _get_counts(self):
+        counts = BinContents(self._hist)
+        counts.flags.writeable = False
+        return counts
+
+    def _set_counts(self, counts):
+        BinContents(self._hist)[...] = counts
+        self._Modified()
+
+    counts = property(_get_counts, _set_counts, doc="""
+        Bin contents (without under- and overflow bin) as read-only numpy
+        array, sharing memory with the ROOT histogram. The array follows
+        all changes of the histogram, until it is replaced by a new one (see
+        Rebin(), Calbin()); arrays obtained before that keep the old bins.
+        Assigning to counts copies the values into the histogram.
+        """)
+
+    # errors property
+    def _get_errors(self):
+        variances = self.variances
+        if variances is None:
+            errors = numpy.sqrt(numpy.abs(self.counts))
+        else:
+            errors = numpy.sqrt(variances)
+        errors.flags.writeable = False
+        return errors
+
+    def _set_errors(self, errors):
+        if self._hist.GetSumw2N() == 0:
+            self._hist.Sumw2()
+        BinVariances(self._hist)[...] = numpy.square(errors)
+        self._Modified()
+
+    errors = property(_get_errors, _set_errors, doc="""
+        Bin errors (without under- and overflow bin) as read-only numpy
+        array. This is calculated from variances (or the bin contents, for
+        histograms without stored errors) and thus a copy. Assigning to errors
+        stores the squared values in the histogram.
+        """)
+
+    @property
+    def variances(self):
+        """
+        Squared bin errors (without under- and overflow bin) as read-only
+        numpy array sharing memory with the ROOT histogram (like counts), or
+        None if the histogram does not store errors.
+        """
+        variances = BinVariances(self._hist)
+        if variances is not None:
+            variances.flags.writeable = False
+        return variances
+
+    def _Modified(self):
+        """
+        Update statistics and display after the bins were changed directly
+        """
+        self._hist.ResetStats()
+        if self.displayObj:
+            self.displayObj.SetHist(self._hist)
+
     # name property
     def _get_name(self):
         if self._hist:
@@ -188,15 +305,18 @@ class Histogram(Drawable):
         Rebin spectrum by adding ngroup bins into one
         """
         bins = self._hist.GetNbinsX()
-        self._hist.RebinX(ngroup)
-        self._hist.GetXaxis().SetLimits(0, bins / ngroup)
+        # Rebin into a new histogram, as arrays from counts may still refer
+        # to the current one
+        hist = self._hist.RebinX(ngroup, self._hist.GetName())
+        ROOT.SetOwnership(hist, True)
+        hist.GetXaxis().SetLimits(0, bins / ngroup)
         # update display
-        if self.displayObj:
-            self.displayObj.SetHist(self._hist)
+        self.hist = hist
         # update calibration
         if self.cal:
             self.cal.Rebin(ngroup)
-            self.displayObj.SetCal(self.cal)
+            if self.displayObj:
+                self.displayObj.SetCal(self.cal)
             hdtv.ui.info("Calibration updated for rebinned spectrum")
             self.typeStr = "spectrum, modified (rebinned)"
 
@@ -230,7 +350,8 @@ class Histogram(Drawable):
             self.displayObj.SetHist(self._hist)
         # update calibration
         self.cal.SetCal(0, 1)
-        self.displayObj.SetCal(self.cal)
+        if self.displayObj:
+            self.displayObj.SetCal(self.cal)
         hdtv.ui.info("Rebinned to calibration unit")
 
     def Draw(self, viewport):
@@ -247,7 +368,8 @@ class Histogram(Drawable):
         # Lock updates
         self.viewport.LockUpdate()
         # Show spectrum
-        if self.displayObj is None and self._hist is not None:
+        if (self.displayObj is None and self._hist is not None and
+                not self.headless):
             if self.active:
                 color = self._activeColor
             else:
@@ -286,22 +408,28 @@ class FileHistogram(Histogram):
     A spectrum that comes from a file in any of the formats supported by hdtv.
     """
 
-    def __init__(self, fname, fmt=None, color=hdtv.color.default, cal=None):
+    def __init__(self, fname, fmt=None, color=hdtv.color.default, cal=None,
+                 hist=None):
         """
         Read a spectrum from file
+
+        If hist is given, it must be the ROOT histogram already read from
+        fname (e.g. from the data decoded by a worker process) and the file
+        is not read again.
         """
-        # check if file exists
-        try:
-            os.path.exists(fname)
-        except OSError:
-            hdtv.ui.error("File %s not found" % fname)
-            raise
-        # call to SpecReader to get the hist
-        try:
-            hist = SpecReader().GetSpectrum(fname, fmt)
-        except SpecReaderError as msg:
-            hdtv.ui.error(str(msg))
-            raise
+        if hist is None:
+            # check if file exists
+            try:
+                os.path.exists(fname)
+            except OSError:
+                hdtv.ui.error("File %s not found" % fname)
+                raise
+            # call to SpecReader to get the hist
+            try:
+                hist = SpecReader().GetSpectrum(fname, fmt)
+            except SpecReaderError as msg:
+                hdtv.ui.error(str(msg))
+                raise
         self.fmt = fmt
         self.filename = fname
         Histogram.__init__(self, hist, color, cal)
@@ -429,6 +557,14 @@ class Histo2D(object):
     def ExecuteCut(self, regionMarkers, bgMarkers, axis):
         return None
 
+    def ExecuteCuts(self, gates, axis):
+        """
+        Execute several cuts at once. gates is a list of
+        (regionMarkers, bgMarkers) tuples; returns a list of CutHistograms.
+        """
+        return [self.ExecuteCut(regionMarkers, bgMarkers, axis)
+                for (regionMarkers, bgMarkers) in gates]
+
 
 class RHisto2D(Histo2D):
     """
@@ -579,15 +715,10 @@ class MHisto2D(Histo2D):
     def yproj(self):
         return self._yproj
 
-    def ExecuteCut(self, regionMarkers, bgMarkers, axis):
-        # _axis_ is the axis the markers refer to, so we project on the *other*
-        # axis. We call _axis_ the cut axis and the other axis the projection
-        # axis. If the matrix is symmetric, this does not matter, so _axis_ is
-        # "0" and the implementation can choose.
-
-        if len(regionMarkers) < 1:
-            raise RuntimeError("Need at least one gate for cut")
-
+    def _GetCutMatrix(self, axis):
+        """
+        Return (axis, thiscal, othercal, matrix) for cutting on axis
+        """
         if axis == "0":
             axis = "x"
 
@@ -606,20 +737,34 @@ class MHisto2D(Histo2D):
             thiscal = self._yproj.cal
             othercal = self._xproj.cal
             matrix = self.tvmatrix
+        return (axis, thiscal, othercal, matrix)
 
-        matrix.ResetRegions()
+    def _AddCutRegions(self, matrix, thiscal, regionMarkers, bgMarkers):
+        if len(regionMarkers) < 1:
+            raise RuntimeError("Need at least one gate for cut")
 
-        for r in regionMarkers:
-            # FIXME: The region markers are not used correctly in many parts
-            # of the code. Workaround by explicitly using the cal here
-            b1 = matrix.FindCutBin(thiscal.E2Ch(r.p1.pos_cal))
-            b2 = matrix.FindCutBin(thiscal.E2Ch(r.p2.pos_cal))
-            matrix.AddCutRegion(b1, b2)
+        # FIXME: The region markers are not used correctly in many parts
+        # of the code. Workaround by explicitly using the cal here
+        markers = list(regionMarkers) + list(bgMarkers)
+        channels = hdtv.cal.E2Ch(
+            thiscal, [p.pos_cal for m in markers for p in (m.p1, m.p2)])
+        bins = [matrix.FindCutBin(ch) for ch in channels]
 
-        for b in bgMarkers:
-            b1 = matrix.FindCutBin(thiscal.E2Ch(b.p1.pos_cal))
-            b2 = matrix.FindCutBin(thiscal.E2Ch(b.p2.pos_cal))
-            matrix.AddBgRegion(b1, b2)
+        for i in range(len(regionMarkers)):
+            matrix.AddCutRegion(bins[2 * i], bins[2 * i + 1])
+
+        for i in range(len(regionMarkers), len(markers)):
+            matrix.AddBgRegion(bins[2 * i], bins[2 * i + 1])
+
+    def ExecuteCut(self, regionMarkers, bgMarkers, axis):
+        # _axis_ is the axis the markers refer to, so we project on the *other*
+        # axis. We call _axis_ the cut axis and the other axis the projection
+        # axis. If the matrix is symmetric, this does not matter, so _axis_ is
+        # "0" and the implementation can choose.
+        (axis, thiscal, othercal, matrix) = self._GetCutMatrix(axis)
+
+        matrix.ResetRegions()
+        self._AddCutRegions(matrix, thiscal, regionMarkers, bgMarkers)
 
         name = self.filename + "_cut"
         rhist = matrix.Cut(name, name)
@@ -631,12 +776,56 @@ class MHisto2D(Histo2D):
         hist._cal = othercal
         return hist
 
+    def ExecuteCuts(self, gates, axis):
+        """
+        Execute several cuts in a single pass over the matrix, see
+        Histo2D.ExecuteCuts
+        """
+        (axis, thiscal, othercal, matrix) = self._GetCutMatrix(axis)
+
+        matrix.ResetRegions()
+        matrix.ResetGates()
+        for (regionMarkers, bgMarkers) in gates:
+            self._AddCutRegions(matrix, thiscal, regionMarkers, bgMarkers)
+            matrix.StoreGate()
+
+        name = self.filename + "_cut"
+        rhists = matrix.MultiCut(name, name)
+        matrix.ResetGates()
+        if len(rhists) != len(gates):
+            raise RuntimeError("Failed to execute cuts")
+
+        hists = []
+        for (rhist, (regionMarkers, bgMarkers)) in zip(rhists, gates):
+            # Ensure proper garbage collection for ROOT histogram objects
+            ROOT.SetOwnership(rhist, True)
+            hist = CutHistogram(rhist, axis, regionMarkers)
+            hist.typeStr = "cut"
+            hist._cal = othercal
+            hists.append(hist)
+        return hists
+
     def GetBasename(self, fname):
         if fname.endswith(".mtx") or fname.endswith(".mtx"):
             return fname[:-4]
         else:
             return fname
 
+    @staticmethod
+    def _RunMatOp(op, text):
+        """
+        Run a MatProjector or MatTransposer to completion, reporting its
+        progress whenever another percent is done
+        """
+        reported = -1
+        while op.Step():
+            percent = int(100 * op.GetProgress())
+            if percent != reported:
+                hdtv.ui.progress(text, op.GetProgress())
+                reported = percent
+        if reported >= 0:
+            hdtv.ui.progress(text, 1.)
+
     def GenerateFiles(self, fname, sym):
         """
         Generate projection(s) and possibly transpose (for asymmetric matrices),
@@ -657,8 +846,11 @@ class MHisto2D(Histo2D):
                 hdtv.ui.info("Using %s for y projection" % pry_fname)
                 pry_fname = ""
 
+        nthreads = hdtv.options.Get("matrix.threads")
         if prx_fname or pry_fname:
-            errno = ROOT.MatOp.Project(fname, prx_fname, pry_fname)
+            projector = ROOT.MatProjector(fname, nthreads)
+            self._RunMatOp(projector, "Projecting %s" % fname)
+            errno = projector.Write(prx_fname, pry_fname)
             if errno != ROOT.MatOp.ERR_SUCCESS:
                 raise RuntimeError(
                     "Project: " + ROOT.MatOp.GetErrorString(errno))
@@ -674,8 +866,16 @@ class MHisto2D(Histo2D):
             if os.path.exists(trans_fname):
                 hdtv.ui.info("Using %s for transpose" % trans_fname)
             else:
-                errno = ROOT.MatOp.Transpose(fname, trans_fname)
+                transposer = ROOT.MatTransposer(fname, trans_fname, nthreads)
+                self._RunMatOp(transposer, "Transposing %s" % fname)
+                errno = transposer.Finish()
                 if errno != ROOT.MatOp.ERR_SUCCESS:
                     raise RuntimeError(
                         "Transpose: " + ROOT.MatOp.GetErrorString(errno))
                 hdtv.ui.info("Generated transpose: %s" % trans_fname)
+
+
+# Number of threads used to generate projections and transposes of matrices
+# (0: one per core). Compressed matrices are always read by a single thread.
+opt = hdtv.options.Option(default=0, parse=lambda x: int(x))
+hdtv.options.RegisterOption("matrix.threads", opt)
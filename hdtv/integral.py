@@ -21,32 +21,59 @@
 
 from __future__ import print_function
 
+import numpy
 from uncertainties import ufloat
 
 import ROOT
 
+# Kinds of integrals of each region, in the order of HDTV::Fit::IntegralBatch
+kinds = ("tot", "bg", "sub")
+
+
 def Integrate(spec, bg, region):
-    hist = spec.hist.hist
     region.sort()
- 
-    int_tot = ROOT.HDTV.Fit.TH1Integral(hist, region[0], region[1])
-    int_bac = ROOT.HDTV.Fit.BgIntegral(
-        bg, region[0], region[1], hist.GetXaxis()) if bg else None
-    int_sub = ROOT.HDTV.Fit.TH1BgsubIntegral(
-        hist, bg, region[0], region[1]) if bg else None
-
-    return {kind: get_integral_info(spec, integral) for (kind, integral) in
-            zip(("tot", "bg", "sub"), (int_tot, int_bac, int_sub))}
-
-def get_integral_info(spec, integral):
-    if not integral:
-        return None
-    pos = ufloat(integral.GetMean(), integral.GetMeanError())
-    width = ufloat(integral.GetWidth(), integral.GetWidthError())
-    vol = ufloat(integral.GetIntegral(), integral.GetIntegralError())
-    skew = ufloat(integral.GetRawSkewness(),
-                    integral.GetRawSkewnessError())
-    integral_info = {'uncal': {'pos': pos, 'width': width, 'vol': vol, 'skew': skew}}
+    return IntegrateRegions(spec, [region], [bg])[0]
+
+
+def IntegrateRegions(spec, regions, backgrounds):
+    """
+    Integrate spec in all regions (pairs of uncalibrated positions) at once,
+    each with the corresponding background (or None), and return the list of
+    the results (as from Integrate())
+    """
+    hist = spec.hist.hist
+    batch = ROOT.HDTV.Fit.IntegralBatch(hist)
+    for (region, bg) in zip(regions, backgrounds):
+        (r1, r2) = sorted(region)
+        if bg:
+            batch.Add(r1, r2, bg)
+        else:
+            batch.Add(r1, r2)
+
+    values = numpy.empty((len(regions), len(kinds),
+                          ROOT.HDTV.Fit.IntegralBatch.kNumValues))
+    if len(regions) > 0:
+        batch.GetValues(values)
+
+    results = []
+    for (bg, region_values) in zip(backgrounds, values):
+        results.append({
+            kind: get_integral_info(spec, kind_values)
+            if (kind == "tot" or bg) else None
+            for (kind, kind_values) in zip(kinds, region_values)})
+    return results
+
+
+def get_integral_info(spec, values):
+    """
+    Return the integral info from the values of an integral, as from
+    HDTV::Fit::IntegralBatch::GetValues()
+    """
+    (vol, vol_err, pos, pos_err, width, width_err, skew, skew_err) = values
+    integral_info = {'uncal': {'pos': ufloat(pos, pos_err),
+                               'width': ufloat(width, width_err),
+                               'vol': ufloat(vol, vol_err),
+                               'skew': ufloat(skew, skew_err)}}
 
     if spec.cal:
         return calibrate_integral(integral_info, spec.cal)
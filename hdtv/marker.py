@@ -115,6 +115,8 @@ class Marker(Drawable):
             raise RuntimeError(
                 "Marker cannot be realized on multiple viewports")
         self.viewport = viewport
+        if self.headless:
+            return
         # adjust the position values for the creation of the makers
         # on the C++ side all values must be uncalibrated
         p1 = self.p1.pos_uncal
@@ -223,15 +225,21 @@ class MarkerCollection(list):
         for marker in self:
             marker.Refresh()
 
+    @property
+    def positions(self):
+        """
+        All positions (hdtv.util.Position) of the markers
+        """
+        return [pos for marker in self for pos in (marker.p1, marker.p2)
+                if pos is not None]
+
     def FixInCal(self):
         self.fixedInCal = True
-        for marker in self:
-            marker.FixInCal()
+        Position.FixAllInCal(self.positions)
 
     def FixInUncal(self):
         self.fixedInCal = False
-        for marker in self:
-            marker.FixInUncal()
+        Position.FixAllInUncal(self.positions)
 
     def SetMarker(self, pos):
         """
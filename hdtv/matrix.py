@@ -84,21 +84,38 @@ class Matrix(DrawableManager):
         else:
             return getattr(self, "_%sproj" % axis)
 
-    def ExecuteCut(self, cut):
-        cutHisto = self.histo2D.ExecuteCut(cut.regionMarkers,
-                                           cut.bgMarkers, cut.axis)
-        if cut.axis == "x":
-            axis = "y"
-        elif cut.axis == "y":
-            axis = "x"
+    def _ProjectionAxis(self, axis):
+        if axis == "x":
+            return "y"
+        elif axis == "y":
+            return "x"
         elif self.sym:
-            axis = "0"
+            return "0"
         else:
             raise RuntimeError
-        cutSpec = CutSpectrum(cutHisto, self, axis)
+
+    def ExecuteCut(self, cut):
+        cutHisto = self.histo2D.ExecuteCut(cut.regionMarkers,
+                                           cut.bgMarkers, cut.axis)
+        cutSpec = CutSpectrum(cutHisto, self, self._ProjectionAxis(cut.axis))
         cutSpec.color = self.color
         return cutSpec
 
+    def ExecuteCuts(self, cuts, axis):
+        """
+        Execute several cuts on axis at once (in a single pass over the
+        matrix, if the underlying matrix supports it). Returns a list with
+        the CutSpectrum for each cut.
+        """
+        gates = [(cut.regionMarkers, cut.bgMarkers) for cut in cuts]
+        cutHistos = self.histo2D.ExecuteCuts(gates, axis)
+        cutSpecs = []
+        for cutHisto in cutHistos:
+            cutSpec = CutSpectrum(cutHisto, self, self._ProjectionAxis(axis))
+            cutSpec.color = self.color
+            cutSpecs.append(cutSpec)
+        return cutSpecs
+
     # overwrite some functions from Drawable
     def Insert(self, obj, ID=None):
         """
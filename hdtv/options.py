@@ -89,35 +89,71 @@ def RegisterOption(varname, variable):
         raise RuntimeError(
             "Refusing to overwrite existing configuration variable")
     variables[varname] = variable
+    lazy.pop(varname, None)
+
+
+def RegisterLazyOption(varname, load):
+    """
+    Announces a configuration variable that is added by calling load()
+    (e.g. by importing the plugin that defines it) on first use
+    """
+    global lazy
+    if varname not in variables:
+        lazy[varname] = load
+
+
+def _Variable(varname):
+    """
+    Returns the variable varname. Raises a KeyError if it does not exist.
+    """
+    global variables
+    if varname not in variables and varname in lazy:
+        lazy.pop(varname)()
+    return variables[varname]
+
+
+def _LoadAll():
+    """
+    Adds all variables announced by RegisterLazyOption()
+    """
+    global lazy
+    while lazy:
+        (varname, load) = lazy.popitem()
+        load()
+
+
+def Names():
+    """
+    Returns the names of all variables
+    """
+    return sorted(set(variables.keys()) | set(lazy.keys()))
 
 
 def Set(varname, rawValue):
     """
     Sets the variable specified by varname. Raises a KeyError if it does not exist.
     """
-    global variables
-    variables[varname].ParseAndSet(rawValue)
+    _Variable(varname).ParseAndSet(rawValue)
 
 
 def Get(varname):
     """
     Gets the value of the variable varname. Raises a KeyError if it does not exist.
     """
-    global variables
-    return variables[varname].Get()
+    return _Variable(varname).Get()
 
 
 def Reset(varname):
     """
     Resets value of variable varname to default. Raises KeyError if it does not exist.
     """
-    global variables
-    return variables[varname].Reset()
+    return _Variable(varname).Reset()
 
 
 def ResetAll():
     """
-    Resets value of all variables to default.
+    Resets value of all variables to default. (Variables that have not been
+    added yet still have their default value.)
     """
     global variables
     for (k, v) in variables.items():
@@ -128,8 +164,7 @@ def Show(varname):
     """
     Shows the value of the variable varname
     """
-    global variables
-    return "%s: %s" % (tcolors.bold(varname), str(variables[varname]))
+    return "%s: %s" % (tcolors.bold(varname), str(_Variable(varname)))
 
 
 def Str():
@@ -137,6 +172,7 @@ def Str():
     Returns all options as a string
     """
     global variables
+    _LoadAll()
     string = ""
     ordered_options = OrderedDict(sorted(variables.items()))
     for (k, v) in ordered_options.items():
@@ -166,3 +202,5 @@ def parse_choices(choices):
 
 
 variables = dict()
+# Variables that are added on first use (see RegisterLazyOption())
+lazy = dict()
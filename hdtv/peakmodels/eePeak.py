@@ -28,11 +28,10 @@ from uncertainties import ufloat
 
 import ROOT
 
-from .peak import PeakModel
-from hdtv.drawable import Drawable
+from .peak import PeakModel, Peak
 
 
-class EEPeak(Drawable):
+class EEPeak(Peak):
     """
     Peak object for the ee fitter
     """
@@ -48,8 +47,6 @@ class EEPeak(Drawable):
         self.gamma = gamma
         # vol is not a fit parameter, but rather the result of the fit
         self.vol = vol
-        # dictionary for storing additional user supplied values
-        self.extras = dict()
 
     def __getattr__(self, name):
         """
@@ -185,9 +182,10 @@ class PeakModelEE(PeakModel):
         self.name = "ee"
         self.Peak = EEPeak
 
-    def CopyPeak(self, cpeak, color=None, cal=None):
+    def CopyPeak(self, cpeak, color=None, cal=None, headless=False):
         """
-        Copies peak data from a C++ peak class to a Python class
+        Copies peak data from a C++ peak class to a Python class (without
+        display object for a headless session)
         """
         pos = ufloat(cpeak.GetPos(), cpeak.GetPosError())
         amp = ufloat(cpeak.GetAmp(), cpeak.GetAmpError())
@@ -198,11 +196,20 @@ class PeakModelEE(PeakModel):
         vol = ufloat(cpeak.GetVol(), cpeak.GetVolError())
         # create the peak object
         peak = self.Peak(pos, amp, sigma1, sigma2, eta, gamma, vol)
-        func = cpeak.GetPeakFunc()
-        peak.displayObj = ROOT.HDTV.Display.DisplayFunc(func, color)
-        peak.displayObj.SetCal(cal)
+        if not headless:
+            func = cpeak.GetPeakFunc()
+            peak.displayObj = ROOT.HDTV.Display.DisplayFunc(func, color)
+            peak.displayObj.SetCal(cal)
         return peak
 
+    def ParamIds(self, cpeak):
+        """
+        Return the indices of the parameters of cpeak in the fit function
+        (see PeakModel.ParamIds())
+        """
+        # the volume is calculated from the other parameters
+        return (list(cpeak.GetParamIds()) + [-1], [1.] * 7)
+
     def RestoreParams(self, peak, cpeak):
         """
         Restore the params of a C++ peak object using a python peak object
@@ -23,8 +23,89 @@
 # For each model implemented on the C++ side, we have a corresponding Python
 # class to handle fitter setup and data transfer to the Python side
 #-------------------------------------------------------------------------
+import weakref
+
 import ROOT
 import hdtv.rootext.display
+from hdtv.drawable import Drawable
+
+
+class PeakExtras(dict):
+    """
+    Dictionary for storing additional user supplied values of a peak. If the
+    results of a fit including the peak are cached (see
+    hdtv.fit.Fit.PeakResults()), changing it invalidates them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(PeakExtras, self).__init__(*args, **kwargs)
+        self.fit = None
+
+    def Changed(self):
+        fit = self.fit() if self.fit is not None else None
+        if fit is not None:
+            fit.InvalidateResults()
+
+    def SetFit(self, fit):
+        """
+        Set the fit whose cached results must be invalidated on changes
+        """
+        self.fit = weakref.ref(fit) if fit is not None else None
+
+    def __setitem__(self, key, value):
+        super(PeakExtras, self).__setitem__(key, value)
+        self.Changed()
+
+    def __delitem__(self, key):
+        super(PeakExtras, self).__delitem__(key)
+        self.Changed()
+
+    def clear(self):
+        super(PeakExtras, self).clear()
+        self.Changed()
+
+    def pop(self, *args):
+        value = super(PeakExtras, self).pop(*args)
+        self.Changed()
+        return value
+
+    def popitem(self):
+        item = super(PeakExtras, self).popitem()
+        self.Changed()
+        return item
+
+    def setdefault(self, key, default=None):
+        value = super(PeakExtras, self).setdefault(key, default)
+        self.Changed()
+        return value
+
+    def update(self, *args, **kwargs):
+        super(PeakExtras, self).update(*args, **kwargs)
+        self.Changed()
+
+
+# Base class for all python peak objects
+class Peak(Drawable):
+    """
+    A peak (as a result of a fit) with its parameters and extras, i.e.
+    additional user supplied values
+    """
+
+    def __init__(self, color=None, cal=None):
+        super(Peak, self).__init__(color, cal)
+        self._extras = PeakExtras()
+
+    # extras property
+    def _set_extras(self, extras):
+        fit = self._extras.fit
+        self._extras = PeakExtras(extras)
+        self._extras.fit = fit
+        self._extras.Changed()
+
+    def _get_extras(self):
+        return self._extras
+
+    extras = property(_get_extras, _set_extras)
 
 # Base class for all peak models
 class PeakModel(object):
@@ -165,6 +246,16 @@ class PeakModel(object):
             self.fParStatus[parname] = [
                 self.ParseParamStatus(parname, s) for s in status]
 
+    def ParamIds(self, cpeak):
+        """
+        Return the indices of the parameters (in the order of
+        OrderedParamKeys()) of the C++ peak object cpeak in the fit function
+        (-1 if not free), and the factors converting the fit function
+        parameters to the values of the python peak object
+        """
+        keys = self.OrderedParamKeys()
+        return ([-1] * len(keys), [1.] * len(keys))
+
     def GetParam(self, name, peak_id, pos_uncal, cal, ival=None):
         """
         Return an appropriate HDTV.Fit.Param object for the specified parameter
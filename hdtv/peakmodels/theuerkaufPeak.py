@@ -24,13 +24,12 @@ from functools import total_ordering
 from uncertainties import ufloat
 
 import ROOT
-from .peak import PeakModel
-from hdtv.drawable import Drawable
+from .peak import PeakModel, Peak
 import hdtv.options
 
 
 @total_ordering
-class TheuerkaufPeak(Drawable):
+class TheuerkaufPeak(Peak):
     """
     Peak object for the Theuerkauf (classic TV) fitter
     """
@@ -46,8 +45,6 @@ class TheuerkaufPeak(Drawable):
         self.tr = tr
         self.sh = sh
         self.sw = sw
-        # dictionary for storing additional user supplied values
-        self.extras = dict()
 
     def __getattr__(self, name):
         """
@@ -184,9 +181,10 @@ class PeakModelTheuerkauf(PeakModel):
         self.Peak = TheuerkaufPeak
         self.name = "theuerkauf"
 
-    def CopyPeak(self, cpeak, color=None, cal=None):
+    def CopyPeak(self, cpeak, color=None, cal=None, headless=False):
         """
-        create a python peak object from C++ peak object
+        create a python peak object from C++ peak object (without display
+        object for a headless session)
         """
         # get values from C++ object (uncalibrated)
         pos_uncal = cpeak.GetPos()
@@ -218,11 +216,21 @@ class PeakModelTheuerkauf(PeakModel):
             sh = sw = None
         # create peak object
         peak = self.Peak(pos, vol, width, tl, tr, sh, sw, color, cal)
-        func = cpeak.GetPeakFunc()
-        peak.displayObj = ROOT.HDTV.Display.DisplayFunc(func, color)
-        peak.displayObj.SetCal(cal)
+        if not headless:
+            func = cpeak.GetPeakFunc()
+            peak.displayObj = ROOT.HDTV.Display.DisplayFunc(func, color)
+            peak.displayObj.SetCal(cal)
         return peak
 
+    def ParamIds(self, cpeak):
+        """
+        Return the indices of the parameters of cpeak in the fit function
+        (see PeakModel.ParamIds())
+        """
+        # width==fwhm (internally the C++ fitter uses sigma)
+        fwhm = 2. * math.sqrt(2. * math.log(2.))
+        return (list(cpeak.GetParamIds()), [1., 1., fwhm, 1., 1., 1., 1.])
+
     def RestoreParams(self, peak, cpeak):
         """
         Restore the params of a C++ peak object using a python peak object
@@ -281,6 +289,7 @@ class PeakModelTheuerkauf(PeakModel):
         #debug_show_inipar = hdtv.options.Get("__debug__.fit.show_inipar")
         #self.fFitter = ROOT.HDTV.Fit.TheuerkaufFitter(region[0],region[1],debug_show_inipar)
         self.fFitter = ROOT.HDTV.Fit.TheuerkaufFitter(region[0], region[1])
+        self.fFitter.SetUseGradient(hdtv.options.Get("fit.gradient"))
         self.ResetGlobalParams()
         # Check if enough values are provided in case of per-peak parameters
         #  (the function raises a RuntimeError if the check fails)
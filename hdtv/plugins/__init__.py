@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+# ----------------------------------------------------------------------
+# Loading of the core plugins
+# ----------------------------------------------------------------------
+
+import os
+import sys
+import glob
+import json
+import time
+import importlib
+from collections import OrderedDict
+
+import hdtv.cmdline
+import hdtv.options
+import hdtv.ui
+import hdtv.util
+import hdtv.version
+from hdtv.rootext.dlmgr import cachepath
+
+# Core plugins, in the order in which they are loaded
+core = ["textInterface", "ls", "run", "specInterface", "fitInterface",
+        "calInterface", "matInterface", "rootInterface", "config",
+        "profiling", "fitlist", "fittex", "fitmap", "dblookup", "peakfinder",
+        "printing"]
+
+# Core plugins that are always loaded at once (they do not register
+# commands, but change the user interface)
+eager = ["textInterface"]
+
+# Increase whenever the layout of the manifest changes
+MANIFEST_VERSION = 1
+
+# Time it took to import each plugin, in seconds
+loadtimes = OrderedDict()
+
+
+def Load(name):
+    """
+    Import the core plugin name, if it is not loaded yet
+    """
+    module = "hdtv.plugins." + name
+    if module not in sys.modules:
+        start = time.time()
+        importlib.import_module(module)
+        loadtimes[name] = time.time() - start
+    return sys.modules[module]
+
+
+def LoadAll():
+    """
+    Import all core plugins that are not loaded yet
+    """
+    for name in core:
+        Load(name)
+
+
+def _Record(name):
+    """
+    Import the core plugin name and return the commands and configuration
+    variables it registers
+    """
+    tree = hdtv.cmdline.command_tree
+    varnames = set(hdtv.options.variables.keys())
+    tree.record = []
+    try:
+        Load(name)
+        commands = tree.record
+    finally:
+        tree.record = None
+    options = sorted(set(hdtv.options.variables.keys()) - varnames)
+    return {"commands": commands, "options": options}
+
+
+def _ManifestKey():
+    """
+    Return the key of the manifest: it changes whenever hdtv is updated or
+    a plugin is modified
+    """
+    srcdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    files = []
+    for fname in sorted(glob.glob(os.path.join(srcdir, "*.py")) +
+                        glob.glob(os.path.join(srcdir, "*", "*.py"))):
+        st = os.stat(fname)
+        files.append([fname, st.st_size, st.st_mtime])
+    return [MANIFEST_VERSION, hdtv.version.VERSION,
+            list(sys.version_info[:2]), files]
+
+
+def _ReadManifest(fname, key):
+    try:
+        with open(fname) as f:
+            manifest = json.load(f)
+    except (OSError, IOError, ValueError):
+        return None
+    if manifest.get("key") != key:
+        return None
+    return manifest["plugins"]
+
+
+def _WriteManifest(fname, key, plugins):
+    try:
+        if not os.path.isdir(os.path.dirname(fname)):
+            os.makedirs(os.path.dirname(fname))
+        with hdtv.util.AtomicWrite(fname) as f:
+            json.dump({"key": key, "plugins": plugins}, f)
+    except (OSError, IOError) as err:
+        hdtv.ui.debug("Could not write plugin manifest: %s" % err)
+
+
+def LoadCore(lazy=False):
+    """
+    Load the core plugins.
+
+    With lazy=True, only placeholders for the commands and configuration
+    variables of the plugins are registered, and each plugin is imported
+    on first use of one of them. The names of the commands and variables
+    are taken from a manifest, which is written to the user cache
+    directory the first time (after importing all plugins).
+    """
+    fname = os.path.join(cachepath, "plugins.json")
+    key = _ManifestKey() if lazy else None
+    plugins = _ReadManifest(fname, key) if lazy else None
+
+    if plugins is None:
+        plugins = dict()
+        for name in core:
+            plugins[name] = _Record(name)
+        if lazy:
+            _WriteManifest(fname, key, plugins)
+        return
+
+    for name in core:
+        if name in eager or name not in plugins:
+            Load(name)
+            continue
+        if "hdtv.plugins." + name in sys.modules:
+            continue
+
+        def load(name=name):
+            Load(name)
+        for (title, level) in plugins[name]["commands"]:
+            hdtv.cmdline.AddLazyCommand(title, load, level=level)
+        for varname in plugins[name]["options"]:
+            hdtv.options.RegisterLazyOption(varname, load)
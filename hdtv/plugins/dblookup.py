@@ -126,8 +126,20 @@ class Database(object):
         Hook for hdtv.fit.Fit.FitPeakFunc function to automatically list matching
         database entries
         """
-        for p in fitclass.peaks:
-            self.Lookup(["energy=" + str(p.pos_cal.value)], defaults=True)
+        if not fitclass.peaks:
+            return
+        self.assureOpen()
+        energies = [p.pos_cal.nominal_value for p in fitclass.peaks]
+        try:
+            allresults = self.database.findmany(
+                energies,
+                fuzziness=hdtv.options.Get("database.fuzziness"),
+                sort_key=hdtv.options.Get("database.sort_key"),
+                sort_reverse=hdtv.options.Get("database.sort_reverse"))
+        except AttributeError:
+            return
+        for results in allresults:
+            self.ShowResults(results)
 
     def SetAutoLookup(self, autolookup_opt):
         """
@@ -270,6 +282,12 @@ class Database(object):
         except AttributeError:
             return False
 
+        self.ShowResults(results)
+
+    def ShowResults(self, results):
+        """
+        Print a table of database entries
+        """
         if len(results) > 0:
             table = hdtv.util.Table(
                 results,
@@ -24,6 +24,8 @@ import hdtv.options
 import hdtv.util
 import hdtv.ui
 import hdtv.fit
+import hdtv.fitcache
+import hdtv.fitresults
 
 import copy
 import sys
@@ -170,36 +172,51 @@ class FitInterface(object):
             spec = self.spectra.dict[specID]
         except KeyError:
             raise KeyError("invalid spectrum ID")
+        if fitID not in spec.dict:
+            raise KeyError("invalid fit ID")
+        self.ExecuteReintegrateMany(specID, [fitID], print_result)
+
+    def ExecuteReintegrateMany(self, specID, fitIDs, print_result=True):
+        """
+        Re-Execute the integrals of several stored fits of a spectrum
+
+        The background fits are done fit by fit, the integrals of all fit
+        regions are computed in one pass over the spectrum.
+        """
         try:
-            fit = spec.dict[fitID]
+            spec = self.spectra.dict[specID]
         except KeyError:
-            raise KeyError("invalid fit ID")
-#        if peaks:
-#            fit.FitPeakFunc(spec)
-#        else:
-#            if fit.fitter.bgdeg == -1:
-#                raise RuntimeError("background degree of -1")
-#            fit.FitBgFunc(spec)
-        if not fit.regionMarkers.IsFull():
-            hdtv.ui.error("Region not set.")
-            return
+            raise KeyError("invalid spectrum ID")
+        fits = []
+        for fitID in fitIDs:
+            try:
+                fit = spec.dict[fitID]
+            except KeyError:
+                hdtv.ui.warn("invalid fit ID %s" % fitID)
+                continue
+            if not fit.regionMarkers.IsFull():
+                hdtv.ui.error("Region not set.")
+                continue
 
-        if len(fit.bgMarkers) > 0:
-            if fit.fitter.bgdeg == -1:
-                hdtv.ui.error(
-                    "Background degree of -1 contradicts background fit.")
-                return
-            # pure background fit
-            fit.FitBgFunc(spec)
+            if len(fit.bgMarkers) > 0:
+                if fit.fitter.bgdeg == -1:
+                    hdtv.ui.error(
+                        "Background degree of -1 contradicts background fit.")
+                    continue
+                # pure background fit
+                fit.FitBgFunc(spec)
+            fits.append(fit)
 
-        region = [fit.regionMarkers[0].p1.pos_uncal,
-                  fit.regionMarkers[0].p2.pos_uncal]
-        bg = fit.fitter.bgFitter
+        regions = [[fit.regionMarkers[0].p1.pos_uncal,
+                    fit.regionMarkers[0].p2.pos_uncal] for fit in fits]
+        bgs = [fit.fitter.bgFitter for fit in fits]
+        integrals = hdtv.integral.IntegrateRegions(spec, regions, bgs)
 
-        fit.integral = hdtv.integral.Integrate(spec, bg, region)
-        if print_result:
-            hdtv.ui.msg(fit.print_integral())
-        fit.Draw(self.window.viewport)
+        for (fit, integral) in zip(fits, integrals):
+            fit.integral = integral
+            if print_result:
+                hdtv.ui.msg(fit.print_integral())
+            fit.Draw(self.window.viewport)
 
     def QuickFit(self, pos=None):
         """
@@ -237,20 +254,24 @@ class FitInterface(object):
             ids = spec.ids
         fits = [spec.dict[ID] for ID in ids]
         count_fits = len(fits)
-        (objects, params) = self.ExtractFits(fits)
+        results = hdtv.fitresults.FromFits(fits)
+        params = results.params
 
         # create result footer
-        result_footer = "\n" + str(len(objects)) + \
+        result_footer = "\n" + str(len(results)) + \
             " peaks in " + str(count_fits) + " fits."
         # create the table
         try:
+            if sortBy is not None:
+                results = results.Sort(sortBy, reverseSort)
             table = hdtv.util.Table(
-                objects,
+                results.StringRows(params),
                 params,
                 sortBy=sortBy,
                 reverseSort=reverseSort,
                 extra_header=result_header,
-                extra_footer=result_footer)
+                extra_footer=result_footer,
+                presorted=True)
             hdtv.ui.msg(str(table), newline=False)
         except KeyError as e:
             raise hdtv.cmdline.HDTVCommandError(
@@ -279,16 +300,20 @@ class FitInterface(object):
             ids = spec.ids
         fits = [spec.dict[ID] for ID in ids]
         count_fits = len(fits)
-        (objects, params) = self.ExtractIntegrals(fits, integral_type)
+        results = hdtv.fitresults.IntegralsFromFits(fits, integral_type)
+        params = results.params
         
         # create the table
         try:
+            if sortBy is not None:
+                results = results.Sort(sortBy, reverseSort)
             table = hdtv.util.Table(
-                objects,
+                results.StringRows(params),
                 params,
                 sortBy=sortBy,
                 reverseSort=reverseSort,
-                extra_header=result_header)
+                extra_header=result_header,
+                presorted=True)
             hdtv.ui.msg(str(table), newline=False)
         except KeyError as e:
             raise hdtv.cmdline.HDTVCommandError(
@@ -320,22 +345,8 @@ class FitInterface(object):
             fitlist    : a list of dicts for each peak in the fits
             params     : a ordered list of valid parameter names
         """
-        fitlist = list()
-        params = list()
-        # loop through fits
-        for fit in fits:
-            # Get peaks
-            (peaklist, fitparams) = fit.ExtractParams()
-            if len(peaklist) == 0:
-                continue
-            # update list of valid params
-            for p in fitparams:
-                # do not use set operations here to keep order of params
-                if p not in params:
-                    params.append(p)
-            # add peaks to the list
-            fitlist.extend(peaklist)
-        return (fitlist, params)
+        results = hdtv.fitresults.FromFits(fits)
+        return (results.Rows(), results.params)
 
     def ExtractIntegrals(self, fits, integral_type='auto'):
         """
@@ -345,20 +356,8 @@ class FitInterface(object):
             integrallist : a list of dicts for each integral in the fits
             params       : a ordered list of valid parameter names
         """
-        integrallist = list()
-        params = list()
-        # loop through fits
-        for fit in fits:
-            (integrals, integralparams) = fit.ExtractIntegralParams(integral_type)
-
-            # update list of valid params
-            for p in integralparams:
-                # do not use set operations here to keep order of params
-                if p not in params:
-                    params.append(p)
-            # add peaks to the list
-            integrallist.extend(integrals)
-        return (integrallist, params)
+        results = hdtv.fitresults.IntegralsFromFits(fits, integral_type)
+        return (results.Rows(), results.params)
 
     def ShowFitterStatus(self, ids=None):
         """
@@ -821,6 +820,18 @@ class TvFitInterface(object):
                                 completer=self.PeakModelCompleter,
                                 parser=parser)
 
+        prog = "fit cache"
+        description = "show statistics of the cache of fit results"
+        parser = hdtv.cmdline.HDTVOptionParser(
+            prog=prog, description=description)
+        parser.add_argument(
+            "-c",
+            "--clear",
+            action="store_true",
+            default=False,
+            help="remove all cached fit results")
+        hdtv.cmdline.AddCommand(prog, self.FitCache, parser=parser)
+
     def FitMarkerChange(self, args):
         """
         Set or delete a marker from command line
@@ -927,12 +938,13 @@ class TvFitInterface(object):
                     self.spectra.StoreFit()  # Store current fit
 
             for fitID in fitIDs:
+                hdtv.ui.msg(
+                    "Executing integral for region of fit %s in spectrum %s" %
+                            (fitID, specID))
+            if len(fitIDs) > 0:
                 try:
-                    hdtv.ui.msg(
-                        "Executing integral for region of fit %s in spectrum %s" %
-                                (fitID, specID))
-                    self.fitIf.ExecuteReintegrate(
-                        specID=specID, fitID=fitID)
+                    self.fitIf.ExecuteReintegrateMany(
+                        specID=specID, fitIDs=fitIDs)
                 except (KeyError, RuntimeError) as e:
                     hdtv.ui.warn(e)
                     continue
@@ -1150,6 +1162,14 @@ class TvFitInterface(object):
                 ids = hdtv.util.ID.ParseIds(args.fit, spec)
             self.fitIf.SetPeakModel(name, ids)
 
+    def FitCache(self, args):
+        """
+        Show (or clear) the cache of fit results
+        """
+        if args.clear:
+            hdtv.fitcache.cache.Clear()
+        hdtv.ui.msg(str(hdtv.fitcache.cache))
+
     def PeakModelCompleter(self, text, args=None):
         """
         Helper function for FitSetPeakModel
@@ -20,18 +20,28 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
 #-------------------------------------------------------------------------
-# Write and Read Fitlist saved in xml format
+# Write and Read Fitlist saved in xml format (or as binary fit store)
 #
 #-------------------------------------------------------------------------
 import os
 import glob
+from collections import OrderedDict
+
 import hdtv.cmdline
 import hdtv.options
+import hdtv.fitstore
 import hdtv.fitxml
 import hdtv.ui
 import hdtv.util
 
 
+def IsStore(fname):
+    """
+    Check if fname is the name of a fit store (see hdtv.fitstore)
+    """
+    return fname.endswith("." + hdtv.fitstore.EXTENSION)
+
+
 class FitlistManager(object):
     def __init__(self, spectra):
         hdtv.ui.debug("Loaded fitlist plugin")
@@ -58,6 +68,69 @@ class FitlistManager(object):
         with hdtv.util.open_compressed(fname, mode='rb') as f:
             self.xml.ReadFitlist(f, sid, refit, interactive, fname=fname)
 
+    def WriteStore(self, sids, fname):
+        """
+        Write the fits of the spectra sids to the fit store fname
+        """
+        fname = os.path.abspath(fname)
+        fitlists = list()
+        for sid in sids:
+            spec = self.spectra.dict[sid]
+            self.list[spec.name] = fname
+            fits = sorted(spec.dict.values(), key=lambda fit: fit.ID)
+            fitlists.append((spec.name, spec.cal, fits))
+        return hdtv.fitstore.Write(fname, fitlists)
+
+    def OpenStore(self, fname):
+        """
+        Open the fit store fname
+        """
+        try:
+            return hdtv.fitstore.FitStore(fname)
+        except (OSError, IOError, ValueError) as err:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Could not read fit store: %s" % err)
+
+    def StoreSpectrum(self, store, name=None, default=None):
+        """
+        Return the name of the spectrum in store whose fits are used (see
+        hdtv.fitstore.FitStore.Spectrum())
+        """
+        try:
+            return store.Spectrum(name, default)
+        except ValueError as err:
+            raise hdtv.cmdline.HDTVCommandError(str(err))
+
+    def ReadStore(self, sid, fname, refit=False, name=None):
+        """
+        Restore the fits of spectrum name (by default the one with the same
+        name as spectrum sid) from the fit store fname to spectrum sid
+        """
+        spec = self.spectra.dict[sid]
+        fname = os.path.abspath(fname)
+        store = self.OpenStore(fname)
+        name = self.StoreSpectrum(store, name, spec.name)
+        self.list[spec.name] = fname
+        self.spectra.viewport.LockUpdate()
+        try:
+            count = self.xml.RestoreFits(
+                store.IterFits(store.Rows(name), spec.cal), sid, refit)
+        finally:
+            self.spectra.viewport.UnlockUpdate()
+        if count == 1:
+            hdtv.ui.msg("'%s' loaded: 1 fit restored." % fname)
+        else:
+            hdtv.ui.msg("'%s' loaded: %d fits restored." % (fname, count))
+
+    def Read(self, sid, fname, refit=False, interactive=True):
+        """
+        Read the fits of spectrum sid from a fitlist or a fit store
+        """
+        if IsStore(fname):
+            self.ReadStore(sid, fname, refit)
+        else:
+            self.ReadXML(sid, fname, refit, interactive)
+
     def WriteList(self, fname):
         lines = list()
         listpath = os.path.abspath(fname)
@@ -94,7 +167,7 @@ class FitlistManager(object):
                             sid = ID
                             break
                     if sid is not None:
-                        self.ReadXML(sid, xmlfile)
+                        self.Read(sid, xmlfile)
                     else:
                         hdtv.ui.warn("Spectrum %s is not loaded. " % name)
                 except ValueError:
@@ -109,7 +182,8 @@ class FitlistHDTVInterface(object):
         self.spectra = FitlistIf.spectra
 
         prog = "fit write"
-        description = "write fits to xml file"
+        description = ("write fits to xml file (or to a binary fit store if "
+                       "the filename ends with .%s)" % hdtv.fitstore.EXTENSION)
         parser = hdtv.cmdline.HDTVOptionParser(
             prog=prog, description=description)
         parser.add_argument(
@@ -120,17 +194,22 @@ class FitlistHDTVInterface(object):
             help="for which the fits should be saved (default=active)")
         parser.add_argument("-F", "--force", action="store_true", default=False,
             help="overwrite existing files without asking")
+        parser.add_argument("-z", "--gzip", action="store_true", default=False,
+            help="write gzip compressed file (appends .gz to the filename)")
         parser.add_argument(
             "filename",
             nargs='?',
             default=None,
             help='''may contain %%s, %%d, %%02d (or other python
-            format specifier) as placeholder for spectrum id''')
+            format specifier) as placeholder for spectrum id; the fits
+            of all spectra are written to a single fit store (.hfs)''')
         hdtv.cmdline.AddCommand(prog, self.FitWrite,
                                 fileargs=True, parser=parser)
 
         prog = "fit read"
-        description = "read fits from xml file"
+        description = ("read fits from xml file (or from a binary fit store "
+                       "if the filename ends with .%s)" %
+                       hdtv.fitstore.EXTENSION)
         parser = hdtv.cmdline.HDTVOptionParser(
             prog=prog, description=description)
         parser.add_argument(
@@ -172,6 +251,73 @@ class FitlistHDTVInterface(object):
         hdtv.cmdline.AddCommand(prog, self.FitSavelists,
                                 fileargs=True, parser=parser)
 
+        prog = "fit store list"
+        description = ("list the fits of a spectrum in a fit store, without "
+                       "restoring them")
+        parser = hdtv.cmdline.HDTVOptionParser(
+            prog=prog, description=description)
+        parser.add_argument("-n", "--name", default=None,
+            help="name of the spectrum in the fit store (default: the "
+            "active spectrum or the only one in the store)")
+        parser.add_argument("-k", "--key-sort", default=None,
+            help="sort by key")
+        parser.add_argument("-r", "--reverse-sort", action="store_true",
+            default=False, help="reverse the sort")
+        parser.add_argument("filename", help="fit store")
+        hdtv.cmdline.AddCommand(prog, self.FitStoreList,
+                                fileargs=True, parser=parser)
+
+        prog = "fit store integral list"
+        description = ("list the integrals of the fit regions of a spectrum "
+                       "in a fit store, without restoring the fits")
+        parser = hdtv.cmdline.HDTVOptionParser(
+            prog=prog, description=description)
+        parser.add_argument("-n", "--name", default=None,
+            help="name of the spectrum in the fit store (default: the "
+            "active spectrum or the only one in the store)")
+        parser.add_argument("-k", "--key-sort", default=None,
+            help="sort by key")
+        parser.add_argument("-r", "--reverse-sort", action="store_true",
+            default=False, help="reverse the sort")
+        parser.add_argument("-i", "--integral-type", default="auto",
+            choices=["auto", "tot", "bg", "sub", "all"],
+            help="type of integral (default: %(default)s)")
+        parser.add_argument("filename", help="fit store")
+        hdtv.cmdline.AddCommand(prog, self.FitStoreIntegralList,
+                                fileargs=True, parser=parser)
+
+        prog = "fit store activate"
+        description = ("restore a fit from a fit store to a spectrum and "
+                       "activate it")
+        parser = hdtv.cmdline.HDTVOptionParser(
+            prog=prog, description=description)
+        parser.add_argument("-s", "--spectrum", action="store",
+            default="active",
+            help="spectrum to which the fit is added (default=active)")
+        parser.add_argument("-n", "--name", default=None,
+            help="name of the spectrum in the fit store (default: the "
+            "name of the spectrum or the only one in the store)")
+        parser.add_argument("filename", help="fit store")
+        parser.add_argument("fitid", type=int, help="id of the stored fit")
+        hdtv.cmdline.AddCommand(prog, self.FitStoreActivate,
+                                fileargs=True, parser=parser)
+
+        prog = "fit convert"
+        description = ("convert a fitlist (xml) to a fit store (.%s) or vice "
+                       "versa, without loading the spectrum" %
+                       hdtv.fitstore.EXTENSION)
+        parser = hdtv.cmdline.HDTVOptionParser(
+            prog=prog, description=description)
+        parser.add_argument("-n", "--name", default=None,
+            help="spectrum whose fits are converted (for fit stores with "
+            "fits of several spectra)")
+        parser.add_argument("-F", "--force", action="store_true", default=False,
+            help="overwrite existing files without asking")
+        parser.add_argument("input", help="file to convert")
+        parser.add_argument("output", help="file to write")
+        hdtv.cmdline.AddCommand(prog, self.FitConvert,
+                                fileargs=True, parser=parser)
+
     def FitWrite(self, args):
         """
         Saving a fitlist as xml
@@ -187,6 +333,7 @@ class FitlistHDTVInterface(object):
             # warn if not
             pass
 #            raise hdtv.cmdline.HDTVCommandError("Can only save fitlist of one spectrum")
+        stores = OrderedDict()
         for sid in sids:
             #            sid = sids[0]
             # get filename
@@ -206,11 +353,23 @@ class FitlistHDTVInterface(object):
                     # TODO: do something sensible here... Luckily hdtv will not
                     # overwrite spectra without asking...
                     pass
+            if IsStore(fname):
+                # one fit store for all spectra
+                stores.setdefault(fname, list()).append(sid)
+                continue
+            if args.gzip and not fname.endswith(".gz"):
+                fname += ".gz"
             hdtv.ui.msg("Saving fits of spectrum %d to %s" % (sid, fname))
         
             if hdtv.util.user_save_file(fname, args.force):
                 self.FitlistIf.WriteXML(sid, fname)
 
+        for (fname, sids) in stores.items():
+            hdtv.ui.msg("Saving fits of spectra %s to %s" %
+                        (", ".join(str(sid) for sid in sids), fname))
+            if hdtv.util.user_save_file(fname, args.force):
+                self.FitlistIf.WriteStore(sids, fname)
+
     def FitRead(self, args):
         """
         reading a fitlist from xml
@@ -241,7 +400,119 @@ class FitlistHDTVInterface(object):
         for sid in sids:
             for fname in fnames[sid]:
                 hdtv.ui.msg("Reading fitlist %s to spectrum %s" % (fname, sid))
-                self.FitlistIf.ReadXML(sid, fname, refit=args.refit)
+                self.FitlistIf.Read(sid, fname, refit=args.refit)
+
+    def _StoreTable(self, results, sortBy, reverseSort, header, footer=None):
+        """
+        Print the results from a fit store as table (like fit list)
+        """
+        params = results.params
+        if sortBy is None:
+            sortBy = hdtv.options.Get("fit.list.sort_key")
+        sortBy = sortBy.lower()
+        try:
+            results = results.Sort(sortBy, reverseSort)
+        except KeyError as e:
+            raise hdtv.cmdline.HDTVCommandError(
+                "No such attribute: " + str(e) + "\n"
+                "Valid attributes are: " + str(params))
+        table = hdtv.util.Table(
+            results.StringRows(params),
+            params,
+            sortBy=sortBy,
+            reverseSort=reverseSort,
+            extra_header=header,
+            extra_footer=footer,
+            presorted=True)
+        hdtv.ui.msg(str(table), newline=False)
+
+    def _StoreRows(self, store, name):
+        """
+        Return the name of the spectrum and the rows of its fits in store
+        """
+        default = None
+        if self.spectra.activeID is not None:
+            default = self.spectra.dict[self.spectra.activeID].name
+        name = self.FitlistIf.StoreSpectrum(store, name, default)
+        return (name, store.Rows(name))
+
+    def FitStoreList(self, args):
+        """
+        List the fits of a fit store
+        """
+        fname = os.path.expanduser(args.filename)
+        store = self.FitlistIf.OpenStore(fname)
+        (name, rows) = self._StoreRows(store, args.name)
+        if not rows:
+            hdtv.ui.msg("%s (%s): No fits" % (fname, name))
+            return
+        results = store.Results(rows)
+        header = "Fits of %s in %s\n" % (name, fname)
+        footer = "\n%d peaks in %d fits." % (len(results), len(rows))
+        self._StoreTable(results, args.key_sort, args.reverse_sort,
+                         header, footer)
+
+    def FitStoreIntegralList(self, args):
+        """
+        List the integrals of the fit regions of a fit store
+        """
+        fname = os.path.expanduser(args.filename)
+        store = self.FitlistIf.OpenStore(fname)
+        (name, rows) = self._StoreRows(store, args.name)
+        if not rows:
+            hdtv.ui.msg("%s (%s): No fits" % (fname, name))
+            return
+        results = store.Integrals(rows, args.integral_type)
+        header = "Integrals of fit regions of %s in %s\n" % (name, fname)
+        self._StoreTable(results, args.key_sort, args.reverse_sort, header)
+
+    def FitStoreActivate(self, args):
+        """
+        Restore a single fit of a fit store and activate it
+        """
+        sids = hdtv.util.ID.ParseIds(args.spectrum, __main__.spectra)
+        if len(sids) != 1:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Please select a single spectrum")
+        sid = sids[0]
+        spec = self.spectra.dict[sid]
+        fname = os.path.expanduser(args.filename)
+        store = self.FitlistIf.OpenStore(fname)
+        name = self.FitlistIf.StoreSpectrum(store, args.name, spec.name)
+        try:
+            row = store.Find(name, args.fitid)
+        except KeyError:
+            raise hdtv.cmdline.HDTVCommandError(
+                "%s contains no fit %d of %s" % (fname, args.fitid, name))
+        (fit, success) = store.Fit(row, spec.cal)
+        self.FitlistIf.xml.RestoreFits([(fit, success)], sid)
+        hdtv.ui.msg("Restored fit %d of %s as fit %s" %
+                    (args.fitid, name, fit.ID))
+        self.spectra.ActivateFit(fit.ID, sid)
+
+    def FitConvert(self, args):
+        """
+        Convert between fitlists and fit stores
+        """
+        src = os.path.expanduser(args.input)
+        dst = os.path.expanduser(args.output)
+        if IsStore(src) == IsStore(dst):
+            raise hdtv.cmdline.HDTVCommandError(
+                "Can only convert a fitlist to a fit store (.%s) or a fit "
+                "store to a fitlist" % hdtv.fitstore.EXTENSION)
+        if not os.path.exists(src):
+            raise hdtv.cmdline.HDTVCommandError("No such file %s" % src)
+        if not hdtv.util.user_save_file(dst, args.force):
+            return
+        try:
+            if IsStore(src):
+                count = hdtv.fitstore.ToXml(src, dst, args.name)
+            else:
+                count = hdtv.fitstore.FromXml(src, dst)
+        except (OSError, IOError, SyntaxError, ValueError) as err:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Could not convert %s: %s" % (src, err))
+        hdtv.ui.msg("Converted %d fits from %s to %s" % (count, src, dst))
 
     def FitSavelists(self, args):
         if hdtv.util.user_save_file(args.filename, args.force):
@@ -245,6 +245,6 @@ class FitMap(object):
 # plugin initialisation
 import __main__
 if not hasattr(__main__, 'ecal'):
+    # Sets __main__.ecal
     from . import calInterface
-    __main__.ecal = calInterface.EnergyCalIf(__main__.spectra)
 __main__.fitmap = FitMap(__main__.spectra, __main__.ecal)
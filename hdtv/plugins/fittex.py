@@ -22,6 +22,7 @@ import os
 import hdtv.ui
 import hdtv.util
 import hdtv.cmdline
+import hdtv.fitresults
 
 preamble = """\makeatletter
 \@ifundefined{standalonetrue}{\\newif\ifstandalone}{\let\ifbackup=\ifstandalone}
@@ -61,7 +62,7 @@ enddok = """\end{longtable}
 
 class TexTable(hdtv.util.Table):
     def __init__(self, data, keys, header=None,
-                 sortBy=None, reverseSort=False, ha="c"):
+                 sortBy=None, reverseSort=False, ha="c", presorted=False):
         hdtv.util.Table.__init__(
             self,
             data,
@@ -71,7 +72,8 @@ class TexTable(hdtv.util.Table):
             sortBy=sortBy,
             reverseSort=reverseSort,
             extra_header=preamble,
-            extra_footer=enddok)
+            extra_footer=enddok,
+            presorted=presorted)
         self.col_sep_char = "&"
         self.empty_field = " "
         self.ha = ha
@@ -189,13 +191,13 @@ class fitTex:
             spec = self.spectra.dict[sid]
             ids = hdtv.util.ID.ParseIds(args.fit, spec)
             fits.extend([spec.dict[ID] for ID in ids])
-        (peaklist, params) = self.f.ExtractFits(fits)
+        results = hdtv.fitresults.FromFits(fits)
 
         # keys
         if args.columns is not None:
             keys = args.columns.split(",")
         else:
-            keys = params
+            keys = results.params
 
         # header
         if args.header is not None:
@@ -219,15 +221,21 @@ class fitTex:
             ha = "c"
 
         # do the work
-        table = TexTable(peaklist, keys, header, sortBy,
-                         args.reverse_sort, ha)
+        try:
+            results = results.Sort(sortBy, args.reverse_sort)
+        except KeyError as e:
+            raise hdtv.cmdline.HDTVCommandError(
+                "No such attribute: " + str(e) + '\n'
+                "Valid attributes are: " + str(results.params))
+        table = TexTable(results.StringRows(keys), keys, header, sortBy,
+                         args.reverse_sort, ha, presorted=True)
         with open(filename, "w") as out:
             out.write(str(table))
 
 
 # plugin initialisation
 import __main__
-if not __main__.f:
+if not hasattr(__main__, 'f'):
+    # Sets __main__.f
     from . import fitInterface
-    __main__.f = fitInterface.FitInterface(__main__.spectra)
 __main__.fittex = fitTex(__main__.spectra, __main__.f)
@@ -34,6 +34,7 @@ import hdtv.cmdline
 from hdtv.specreader import SpecReader, SpecReaderError
 
 from hdtv.matrix import Matrix
+from hdtv.cut import Cut
 from hdtv.histogram import MHisto2D
 from hdtv.specreader import SpecReaderError
 
@@ -170,6 +171,65 @@ class MatInterface(object):
             proj = matrix.yproj
             self.spectra.Insert(proj, ID=hdtv.util.ID(ID.major, 1001))
 
+    def ReadGateList(self, fname):
+        """
+        Read a list of cuts from a text file. Each line defines one cut: the
+        limits of the gate region, optionally followed by pairs of limits of
+        background regions (all in calibrated units), e.g.
+          1170 1176  1150 1160  1185 1195
+        Text following a '#' is ignored.
+        """
+        cuts = []
+        try:
+            f = open(os.path.expanduser(fname))
+        except IOError as err:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Could not read gate list: %s" % err)
+        with f:
+            for (linenum, line) in enumerate(f, 1):
+                values = line.split('#', 1)[0].split()
+                if not values:
+                    continue
+                try:
+                    pos = [float(v) for v in values]
+                except ValueError:
+                    raise hdtv.cmdline.HDTVCommandError(
+                        "%s: %d: Failed to parse gate" % (fname, linenum))
+                if len(pos) < 2 or len(pos) % 2 != 0:
+                    raise hdtv.cmdline.HDTVCommandError(
+                        "%s: %d: Expected gate limits, followed by pairs of "
+                        "background limits" % (fname, linenum))
+                cut = Cut()
+                for p in pos[:2]:
+                    cut.SetMarker("region", p)
+                for p in pos[2:]:
+                    cut.SetMarker("bg", p)
+                cuts.append(cut)
+        return cuts
+
+    def WriteCuts(self, cuts, template, fmt):
+        """
+        Execute cuts on the matrix of the active spectrum in a single pass
+        and write the cut spectra to files, without loading them. The
+        filename of the i-th cut is template % i.
+        """
+        spec = self.spectra.GetActiveObject()
+        if spec is None:
+            raise hdtv.cmdline.HDTVCommandError("There is no active spectrum")
+        if not hasattr(spec, "matrix") or spec.matrix is None:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Active spectrum does not belong to a matrix")
+        try:
+            fnames = [template % i for i in range(len(cuts))]
+        except TypeError:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Filename template must contain a %d placeholder")
+
+        cutSpecs = spec.matrix.ExecuteCuts(cuts, spec.axis)
+        for (fname, cutSpec) in zip(fnames, cutSpecs):
+            if cutSpec.hist.WriteSpectrum(fname, fmt):
+                hdtv.ui.msg("Wrote cut spectrum to %s" % fname)
+
     def ListMatrix(self, matrix):
         params = ["ID", "stat", "axis", "gates", "bg", "specID"]
         cuts = list()
@@ -315,8 +375,18 @@ class TvMatInterface(object):
         description = "execute cut"
         parser = hdtv.cmdline.HDTVOptionParser(
             prog=prog, description=description)
+        parser.add_argument("-l", "--list", action="store", default=None,
+            help="execute all cuts from a gate list file in a single pass "
+            "over the matrix (one cut per line: gate limits, followed by "
+            "pairs of background limits)")
+        parser.add_argument("-w", "--write", action="store", default=None,
+            metavar="TEMPLATE",
+            help="write the cut spectra of --list to files instead of "
+            "loading them (TEMPLATE %%d is replaced by the cut number)")
+        parser.add_argument("-F", "--format", action="store", default="lc",
+            help="file format for --write (default: %(default)s)")
         hdtv.cmdline.AddCommand(prog, self.CutExecute,
-            level=0, parser=parser)
+            level=0, fileargs=True, parser=parser)
 
         prog = "cut clear"
         description = "clear cut marker and remove last cut if it was not stored"
@@ -365,6 +435,9 @@ class TvMatInterface(object):
         """
         Load a matrix from file, then display it in 2d
         """
+        if self.spectra.window.headless:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Matrix views are not available in a headless session")
         hist = SpecReader().GetMatrix(args.filename, args.format)
 
         title = hist.GetTitle()
@@ -442,7 +515,19 @@ class TvMatInterface(object):
             return hdtv.util.GetCompleteOptions(text, actions)
 
     def CutExecute(self, args):
-        return self.spectra.ExecuteCut()
+        if args.list is None:
+            if args.write is not None:
+                raise hdtv.cmdline.HDTVCommandError("--write requires --list")
+            return self.spectra.ExecuteCut()
+        cuts = self.matIf.ReadGateList(args.list)
+        if len(cuts) == 0:
+            hdtv.ui.warn("Nothing to do")
+            return
+        if args.write is not None:
+            self.matIf.WriteCuts(cuts, args.write, args.format)
+        else:
+            ids = self.spectra.ExecuteCuts(cuts)
+            hdtv.ui.msg("Executed %d cuts" % len(ids))
 
     def CutClear(self, args):
         return self.spectra.ClearCut()
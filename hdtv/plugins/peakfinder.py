@@ -23,8 +23,12 @@
 # Peak finding and fitting plugin for HDTV
 #-------------------------------------------------------------------------
 import copy
+import multiprocessing
+import traceback
 
+import hdtv.cal
 import hdtv.cmdline
+import hdtv.fit
 import hdtv.options
 import hdtv.ui
 
@@ -42,11 +46,11 @@ class PeakFinder(object):
         hdtv.ui.debug("Loaded PeakFinder plugin")
 
     def __call__(self, sid, sigma, threshold, start=None,
-                 end=None, autofit=False, reject=False):
+                 end=None, autofit=False, reject=False, jobs=1):
         self.spec = self.spectra.dict[sid]
         self.sigma_E = sigma
         peaks = self.PeakSearch(sigma, threshold, start, end)
-        num = self.StoreFits(peaks, autofit, reject)
+        num = self.StoreFits(peaks, autofit, reject, jobs)
         hdtv.ui.msg("Found " + str(num) + " peaks")
         # remove reference to spec otherwise we get trouble with garbage
         # collection
@@ -101,35 +105,23 @@ class PeakFinder(object):
 
         return foundpeaks
 
-    def StoreFits(self, foundpeaks, autofit=False, reject=False):
+    def StoreFits(self, foundpeaks, autofit=False, reject=False, jobs=1):
         """
         Create fit objects from peak positions and add them to the fitlist
         If autofit is set to True fitting is done,
         if reject is set to True all badFits will be remove.
+        If jobs > 1, the fits are done concurrently by jobs worker processes;
+        they are still added to the fitlist in the order of their positions.
         """
-        peak_count = 0
-        while len(foundpeaks) > 0:
-            p = foundpeaks.pop(0)
-            fitter = copy.copy(self.spectra.workFit.fitter)
-            fit = hdtv.fit.Fit(fitter, cal=self.spec.cal)
-            pos_E = self.spec.cal.Ch2E(p)
-            fit.ChangeMarker("peak", pos_E, action="set")
+        fits = self.GroupPeaks(foundpeaks, autofit)
+        results = [None] * len(fits)
+        if autofit and jobs > 1 and len(fits) > 1:
+            results = self._FitParallel(fits, jobs)
+
+        kept = list()
+        for (fit, entry) in zip(fits, results):
             if autofit:
-                region_width = self.sigma_E * 5.  # TODO: something sensible here
-                # left region marker
-                fit.ChangeMarker("region", pos_E -
-                                 region_width / 2., action="set")
-                limit = pos_E + region_width
-                # collect multipletts
-                while len(foundpeaks) > 0 and self.spec.cal.Ch2E(
-                        foundpeaks[0]) <= limit:
-                    next = foundpeaks.pop(0)
-                    pos_E = self.spec.cal.Ch2E(next)
-                    limit = pos_E + region_width
-                    fit.ChangeMarker("peak", pos_E, "set")
-                # right region marker
-                fit.ChangeMarker("region", pos_E + region_width / 2., "set")
-                fit.FitPeakFunc(self.spec)  # , silent = True
+                fit.FitPeakFunc(self.spec, result=entry)  # , silent = True
                 # check fits
                 result = self.BadFit(fit)
                 if reject:
@@ -141,12 +133,20 @@ class PeakFinder(object):
                     if result:
                         text = "Warning: adding invalid fit:" + result
                         hdtv.ui.msg(text)
-            # Integrate. TODO: Might use this for additional checks
-            if fit.regionMarkers.IsFull():
-                region = [fit.regionMarkers[0].p1.pos_uncal,
-                          fit.regionMarkers[0].p2.pos_uncal]
-                fit.integral = hdtv.integral.Integrate(
-                    self.spec, fit.fitter.bgFitter, region)
+            kept.append(fit)
+
+        # Integrate, all regions at once. TODO: Might use this for additional
+        # checks
+        integrated = [fit for fit in kept if fit.regionMarkers.IsFull()]
+        regions = [[fit.regionMarkers[0].p1.pos_uncal,
+                    fit.regionMarkers[0].p2.pos_uncal] for fit in integrated]
+        integrals = hdtv.integral.IntegrateRegions(
+            self.spec, regions, [fit.fitter.bgFitter for fit in integrated])
+        for (fit, integral) in zip(integrated, integrals):
+            fit.integral = integral
+
+        peak_count = 0
+        for fit in kept:
             # add fits to spectrum
             ID = self.spec.Insert(fit)
             # FIXME: no fit title
@@ -159,6 +159,82 @@ class PeakFinder(object):
 
         return peak_count
 
+    def GroupPeaks(self, foundpeaks, autofit=False):
+        """
+        Create (unfitted) fit objects from peak positions. If autofit is set,
+        peaks that are closer than the region width are grouped into a
+        multiplet and a fit region is set, otherwise there is one fit per peak.
+        """
+        fits = list()
+        energies = [float(e) for e in hdtv.cal.Ch2E(self.spec.cal, foundpeaks)]
+        while len(energies) > 0:
+            pos_E = energies.pop(0)
+            fitter = copy.copy(self.spectra.workFit.fitter)
+            fit = hdtv.fit.Fit(fitter, cal=self.spec.cal)
+            fit.ChangeMarker("peak", pos_E, action="set")
+            if autofit:
+                region_width = self.sigma_E * 5.  # TODO: something sensible here
+                # left region marker
+                fit.ChangeMarker("region", pos_E -
+                                 region_width / 2., action="set")
+                limit = pos_E + region_width
+                # collect multipletts
+                while len(energies) > 0 and energies[0] <= limit:
+                    pos_E = energies.pop(0)
+                    limit = pos_E + region_width
+                    fit.ChangeMarker("peak", pos_E, "set")
+                # right region marker
+                fit.ChangeMarker("region", pos_E + region_width / 2., "set")
+            fits.append(fit)
+        return fits
+
+    def _FitParallel(self, fits, jobs):
+        """
+        Do the fits in a pool of jobs worker processes. The workers are forked
+        from this process, so they share the spectrum and the prepared fits,
+        and only the results (see hdtv.fit.Fit.CacheEntry()) are sent back.
+        Returns one result per fit, or None for fits that failed in the
+        worker (and are thus repeated in this process).
+
+        Forking a process with a live ROOT GUI (and its threads) is not
+        safe, so this is only done in headless or ROOT batch sessions;
+        otherwise, all fits are done in this process.
+        """
+        if not (self.spectra.window.headless or ROOT.gROOT.IsBatch()):
+            hdtv.ui.warn("Parallel fitting needs a headless session "
+                         "(hdtv --headless), fitting in a single process")
+            return [None] * len(fits)
+        try:
+            context = multiprocessing.get_context("fork")
+        except AttributeError:
+            # Python 2 always forks
+            context = multiprocessing
+        except ValueError:
+            hdtv.ui.warn("Parallel fitting is not supported on this platform")
+            return [None] * len(fits)
+
+        # With fork, the initializer arguments are inherited, not pickled
+        pool = context.Pool(min(jobs, len(fits)), initializer=_InitWorker,
+                            initargs=(self.spec, fits))
+        try:
+            results = pool.map(_AutoFit, range(len(fits)), chunksize=1)
+            pool.close()
+        finally:
+            # Also stops the workers if the fits are interrupted
+            pool.terminate()
+            pool.join()
+
+        entries = list()
+        for (fit, (entry, error)) in zip(fits, results):
+            if error is not None:
+                hdtv.ui.error("Fit of the peak(s) at %s failed in a worker "
+                              "process, repeating it:\n%s" % (
+                                  ", ".join("%.2f" % m.p1.pos_cal
+                                            for m in fit.peakMarkers),
+                                  error.rstrip()))
+            entries.append(entry)
+        return entries
+
     def BadFit(self, fit):
         """
         Check if the fit is sensible
@@ -189,6 +265,33 @@ class PeakFinder(object):
         if bad:
             return text
 
+# Spectrum and fits of a parallel autofit (only set in worker processes)
+_worker = None
+
+
+def _InitWorker(spec, fits):
+    """
+    Initializer of the worker processes of PeakFinder._FitParallel
+    """
+    global _worker
+    _worker = (spec, fits)
+    # Hooks are called when the result is restored in the main process
+    hdtv.fit.Fit.FitPeakPreHooks = list()
+    hdtv.fit.Fit.FitPeakPostHooks = list()
+
+
+def _AutoFit(index):
+    """
+    Worker of PeakFinder._FitParallel: fit the index-th fit and return
+    (result, None), or (None, formatted exception) if the fit failed
+    """
+    (spec, fits) = _worker
+    try:
+        fits[index].FitPeakFunc(spec)
+        return (fits[index].CacheEntry(), None)
+    except Exception:
+        return (None, traceback.format_exc())
+
 # FIXME or remove
 #    def BGFit(self):
 #        """
@@ -236,9 +339,14 @@ def PeakSearch(args):
         args.threshold = hdtv.options.Get("fit.peakfind.threshold")
     if args.autofit is None:
         args.autofit = hdtv.options.Get("fit.peakfind.auto_fit")
+    if args.jobs is None:
+        args.jobs = hdtv.options.Get("fit.peakfind.jobs")
+    if args.jobs < 1:
+        raise hdtv.cmdline.HDTVCommandError(
+            "Invalid number of jobs: %d" % args.jobs)
 
     __main__.peakfinder(sid, args.sigma, args.threshold,
-        args.start, args.end, args.autofit, args.reject)
+        args.start, args.end, args.autofit, args.reject, args.jobs)
 
 
 # Register configuration variables for "fit peakfind"
@@ -248,6 +356,8 @@ opt = hdtv.options.Option(default=0.05, parse=lambda x: float(x))
 hdtv.options.RegisterOption("fit.peakfind.threshold", opt)
 opt = hdtv.options.Option(default=False, parse=hdtv.options.parse_bool)
 hdtv.options.RegisterOption("fit.peakfind.auto_fit", opt)
+opt = hdtv.options.Option(default=1, parse=lambda x: int(x))
+hdtv.options.RegisterOption("fit.peakfind.jobs", opt)
 
 # Register command "fit peakfind"
 prog = "fit peakfind"
@@ -276,6 +386,9 @@ parser.add_argument(
     help="automatically fit found peaks")
 parser.add_argument("-r", "--reject", action="store_true", default=False,
     help="reject fits with unreasonable values")
+parser.add_argument("-j", "--jobs", action="store", default=None, type=int,
+    help="number of processes fitting in parallel (with --autofit, "
+         "only in headless sessions)")
 parser.add_argument(
     "start",
     nargs='?',
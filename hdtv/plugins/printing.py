@@ -32,6 +32,7 @@ import hdtv.ui
 import hdtv.cmdline
 import hdtv.cal
 import hdtv.color
+import hdtv.histogram
 
 
 # TODO: add cut marker
@@ -90,10 +91,10 @@ class PrintOut(object):
         en = en - 0.5
         # calibrate
         en = self.ApplyCalibration(en, spec.cal)
-        # extract bin contents to numpy array
-        data = numpy.zeros(nbins)
-        for i in range(nbins):
-            data[i] = spec.hist.hist.GetBinContent(i)
+        # bin contents (starting with the underflow bin, as pylab.step()
+        # draws each value left of its x value)
+        data = numpy.array(
+            hdtv.histogram.BinContents(spec.hist.hist, flow=True)[:nbins])
         # create spectrum plot
         (r, g, b) = hdtv.color.GetRGB(spec.color)
         pylab.step(en, data, color=(r, g, b), label=spec.name)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+# ----------------------------------------------------------------------
+# Timing and profiling of hdtv commands
+# ----------------------------------------------------------------------
+
+import io
+import os
+import pstats
+
+import hdtv.cmdline
+import hdtv.timing
+import hdtv.ui
+import hdtv.util
+
+from hdtv.timing import timer
+
+
+def ProfileOn(args):
+    timer.Start()
+    hdtv.ui.msg("Profiling commands")
+
+
+def ProfileOff(args):
+    timer.Stop()
+    hdtv.ui.msg("Stopped profiling")
+
+
+def ProfileReport(args):
+    rows = timer.Report()
+    if not rows:
+        hdtv.ui.msg("No commands timed yet")
+        return
+    for row in rows:
+        row["wall"] = "%.3f" % row["wall"]
+        row["cpu"] = "%.3f" % row["cpu"]
+    keys = ["command", "calls", "wall", "cpu", "fits", "evals"]
+    header = ["command", "calls", "wall/s", "cpu/s", "fits", "evals"]
+    hdtv.ui.msg(str(hdtv.util.Table(rows, keys, header=header,
+                                    ignoreEmptyCols=False)))
+
+    stats = timer.ProfileStats()
+    if stats is None or args.functions <= 0:
+        return
+    out = io.StringIO() if str is not bytes else io.BytesIO()
+    stats.stream = out
+    stats.sort_stats(args.sort).print_stats(args.functions)
+    hdtv.ui.msg(out.getvalue().strip("\n"))
+
+
+def ProfileDump(args):
+    stats = timer.ProfileStats()
+    if stats is None:
+        raise hdtv.cmdline.HDTVCommandError(
+            "No profile data (use 'profile on' first)")
+    fname = os.path.expanduser(args.filename)
+    try:
+        if args.format == "stacks":
+            with open(fname, "w") as f:
+                for line in hdtv.timing.Stacks(stats):
+                    f.write(line + "\n")
+        else:
+            stats.dump_stats(fname)
+    except (OSError, IOError) as err:
+        raise hdtv.cmdline.HDTVCommandError(
+            "Could not write %s: %s" % (fname, err))
+    hdtv.ui.msg("Wrote profile data to %s" % fname)
+
+
+def ProfileClear(args):
+    timer.Clear()
+
+
+prog = "profile on"
+description = "Run all following commands under the python profiler"
+parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+hdtv.cmdline.AddCommand(prog, ProfileOn, level=2, parser=parser)
+
+prog = "profile off"
+description = "Stop profiling (the profile data is kept)"
+parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+hdtv.cmdline.AddCommand(prog, ProfileOff, level=2, parser=parser)
+
+prog = "profile report"
+description = ("Show the number of calls, the wall and CPU time, the number "
+               "of fits and fit function evaluations of all commands executed "
+               "so far, and the most expensive functions if commands were "
+               "profiled")
+parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+parser.add_argument(
+    "-n", "--functions", type=int, default=20,
+    help="number of functions to show (default: %(default)s)")
+parser.add_argument(
+    "-s", "--sort", choices=["cumulative", "tottime", "calls"],
+    default="cumulative",
+    help="sort functions by (default: %(default)s)")
+hdtv.cmdline.AddCommand(prog, ProfileReport, level=2, parser=parser)
+
+prog = "profile dump"
+description = ("Write the profile data to a file, either for the python pstats "
+               "module (e.g. for snakeviz) or as collapsed stacks for flame "
+               "graph tools")
+parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+parser.add_argument("filename", help="file to write")
+parser.add_argument(
+    "-f", "--format", choices=["pstats", "stacks"], default="pstats",
+    help="file format (default: %(default)s)")
+hdtv.cmdline.AddCommand(prog, ProfileDump, level=2, parser=parser,
+                        fileargs=True)
+
+prog = "profile clear"
+description = "Discard the timing and profile data"
+parser = hdtv.cmdline.HDTVOptionParser(prog=prog, description=description)
+hdtv.cmdline.AddCommand(prog, ProfileClear, level=2, parser=parser)
+
+hdtv.ui.debug("Loaded user interface for profiling")
@@ -339,6 +339,9 @@ class RootFileInterface(object):
         """
         Load a 2D histogram (``matrix'') from a ROOT file and display it.
         """
+        if self.spectra.window.headless:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Matrix views are not available in a headless session")
         for path in args.matname:
             hist = self.GetTH2(path)
             if hist:
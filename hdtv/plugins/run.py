@@ -35,6 +35,7 @@ def run(args):
     Executes a python script from the hdtv command line (via execfile)
     """
     fname = os.path.expanduser(args[0])
+    hdtv.cmdline.command_line.PreparePython()
     try:
         with open(fname) as f:
             hdtv.ui.msg("Running script %s" % fname)
@@ -23,6 +23,7 @@ import ROOT
 import os
 import glob
 import copy
+import multiprocessing
 
 import hdtv.cmdline
 import hdtv.color
@@ -32,7 +33,8 @@ import hdtv.ui
 
 from hdtv.spectrum import Spectrum
 from hdtv.histogram import FileHistogram
-from hdtv.specreader import SpecReaderError
+from hdtv.specreader import SpecReader, SpecReaderError
+from hdtv.speccache import HistToArray, ArrayToHist
 
 
 class SpecInterface(object):
@@ -108,25 +110,27 @@ class SpecInterface(object):
         except ValueError:
             self.window.viewport.SetStatusText("Invalid id: %s" % arg)
 
-    def LoadSpectra(self, patterns, ID=None):
+    def LoadSpectra(self, patterns, ID=None, jobs=1):
         """
         Load spectra from files matching patterns.
 
         If ID is specified, the spectrum is stored with id ID, possibly
         replacing a spectrum that was there before.
+
+        If jobs > 1, the files are read and decoded concurrently by jobs
+        worker processes. The spectra are still created and inserted in this
+        process, in the same order as for a sequential load.
         """
-        # Avoid multiple updates
-        self.window.viewport.LockUpdate()
         # only one filename is given
         if isinstance(patterns, str) or isinstance(patterns, str):
             patterns = [patterns]
 
         if ID is not None and len(patterns) > 1:
-            self.window.viewport.UnlockUpdate()
             raise hdtv.cmdline.HDTVCommandError(
                 "If you specify an ID, you can only give one pattern")
 
-        loaded = []
+        # Expand patterns into a list of (fname, fmt) in loading order
+        todo = []
         for p in patterns:
             # put fmt if available
             p = p.rsplit("'", 1)
@@ -145,33 +149,86 @@ class SpecInterface(object):
                 break
 
             files.sort()
+            todo.extend((fname, fmt) for fname in files)
+
+        if jobs > 1 and len(todo) > 1:
+            results = self._ReadParallel(todo, jobs)
+        else:
+            results = [(None, None)] * len(todo)
 
-            for fname in files:
+        # Avoid multiple updates
+        self.window.viewport.LockUpdate()
+        try:
+            loaded = []
+            for ((fname, fmt), (data, error)) in zip(todo, results):
                 try:
+                    if error is not None:
+                        hdtv.ui.error(error)
+                        raise SpecReaderError(error)
+                    hist = None
+                    if data is not None:
+                        name = os.path.basename(fname)
+                        hist = ArrayToHist(data, name, name)
                     # Create spectrum object
-                    spec = Spectrum(FileHistogram(fname, fmt))
-                except (OSError, SpecReaderError):
+                    spec = Spectrum(FileHistogram(fname, fmt, hist=hist))
+                except (OSError, IOError, SpecReaderError):
                     hdtv.ui.warn("Could not load %s'%s" % (fname, fmt))
+                    continue
+                sid = self.spectra.Insert(spec, ID)
+                spec.color = hdtv.color.ColorForID(sid.major)
+                if spec.name in list(self.spectra.caldict.keys()):
+                    spec.cal = self.spectra.caldict[spec.name]
+                loaded.append(sid)
+                if fmt is None:
+                    hdtv.ui.msg("Loaded %s into %s" % (fname, sid))
                 else:
-                    sid = self.spectra.Insert(spec, ID)
-                    spec.color = hdtv.color.ColorForID(sid.major)
-                    if spec.name in list(self.spectra.caldict.keys()):
-                        spec.cal = self.spectra.caldict[spec.name]
-                    loaded.append(sid)
-                    if fmt is None:
-                        hdtv.ui.msg("Loaded %s into %s" % (fname, sid))
-                    else:
-                        hdtv.ui.msg("Loaded %s'%s into %s" % (fname, fmt, sid))
-
-        if len(loaded) > 0:
-            # activate last loaded spectrum
-            self.spectra.ActivateObject(loaded[-1])
-        # Expand window if it is the only spectrum
-        if len(self.spectra) == 1:
-            self.window.Expand()
-        self.window.viewport.UnlockUpdate()
+                    hdtv.ui.msg("Loaded %s'%s into %s" % (fname, fmt, sid))
+
+            if len(loaded) > 0:
+                # activate last loaded spectrum
+                self.spectra.ActivateObject(loaded[-1])
+            # Expand window if it is the only spectrum
+            if len(self.spectra) == 1:
+                self.window.Expand()
+        finally:
+            self.window.viewport.UnlockUpdate()
         return loaded
 
+    def _ReadParallel(self, todo, jobs):
+        """
+        Read the files in todo, a list of (fname, fmt), in a pool of jobs
+        worker processes. Only the decoded data (see
+        hdtv.speccache.HistToArray()) is sent back, so no ROOT objects cross
+        process boundaries. Returns one (data, error) per file, in the order
+        of todo; data is None if the file is to be read in this process.
+
+        Like PeakFinder._FitParallel, this forks, which is not safe with a
+        live ROOT GUI; otherwise, all files are read in this process.
+        """
+        sequential = [(None, None)] * len(todo)
+        if not (self.window.headless or ROOT.gROOT.IsBatch()):
+            hdtv.ui.warn("Parallel reading needs a headless session "
+                         "(hdtv --headless), reading in a single process")
+            return sequential
+        try:
+            context = multiprocessing.get_context("fork")
+        except AttributeError:
+            # Python 2 always forks
+            context = multiprocessing
+        except ValueError:
+            hdtv.ui.warn("Parallel reading is not supported on this platform")
+            return sequential
+
+        pool = context.Pool(min(jobs, len(todo)))
+        try:
+            results = pool.map(_ReadSpectrum, todo, chunksize=1)
+            pool.close()
+        finally:
+            # Also stops the workers if reading is interrupted
+            pool.terminate()
+            pool.join()
+        return results
+
     def ListSpectra(self, visible=False):
         """
         Create a list of all spectra (for printing)
@@ -223,6 +280,23 @@ class SpecInterface(object):
         hdtv.ui.msg("Copied spectrum " + str(ID) + " to " + str(sid))
 
 
+def _ReadSpectrum(item):
+    """
+    Worker of SpecInterface._ReadParallel: read the file of item, a tuple
+    (fname, fmt), and return (data, None), or (None, error message) if the
+    file could not be read
+    """
+    (fname, fmt) = item
+    try:
+        hist = SpecReader().GetSpectrum(fname, fmt)
+    except (OSError, IOError, SpecReaderError) as err:
+        return (None, str(err))
+    if hist.GetNbinsX() < 1:
+        # Not representable as an array, read again in the main process
+        return (None, None)
+    return (HistToArray(hist), None)
+
+
 class TvSpecInterface(object):
     """
     TV style commands for the spectrum interface.
@@ -237,6 +311,8 @@ class TvSpecInterface(object):
         parser = hdtv.cmdline.HDTVOptionParser(prog=prog)
         parser.add_argument("-s", "--spectrum", action="store", default=None,
             help="id for loaded spectrum")
+        parser.add_argument("-j", "--jobs", action="store", default=1,
+            type=int, help="number of processes reading files in parallel")
         parser.add_argument(
             "pattern",
             nargs='+')
@@ -468,7 +544,10 @@ class TvSpecInterface(object):
                 raise hdtv.cmdline.HDTVCommandError("Invalid ID: %s" % msg)
         else:
             ID = None
-        self.specIf.LoadSpectra(patterns=args.pattern, ID=ID)
+        if args.jobs < 1:
+            raise hdtv.cmdline.HDTVCommandError(
+                "Invalid number of jobs: %d" % args.jobs)
+        self.specIf.LoadSpectra(patterns=args.pattern, ID=ID, jobs=args.jobs)
 
     def SpectrumDelete(self, args):
         """
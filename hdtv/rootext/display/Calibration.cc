@@ -78,19 +78,93 @@ void Calibration::SetCal(double cal0, double cal1, double cal2, double cal3) {
   UpdateDerivative();
 }
 
+constexpr double Calibration::kInvTableRange;
+constexpr int Calibration::kInvTableSize;
+
 void Calibration::UpdateDerivative() {
   // Update the coefficients of the derivative polynomial.
   // (Internal use only.)
 
   fCalDeriv.clear();
+  if (!fCal.empty()) {
+    double a = 1.0;
+
+    std::transform(fCal.begin() + 1, fCal.end(), std::back_inserter(fCalDeriv),
+                   [&](double coeff) { return coeff * a++; });
+  }
+
+  UpdateInverse();
+}
+
+void Calibration::UpdateInverse() {
+  // Tabulate the inverse of the calibration. (Internal use only.)
+
+  fInvTable.clear();
   if (fCal.empty()) {
     return;
   }
 
-  double a = 1.0;
+  // Find the range of channels, starting at 0, where the calibration is
+  // strictly monotonic
+  double slope0 = dEdCh(0.0);
+  if (!(slope0 != 0.0)) {
+    return;
+  }
+  double sign = (slope0 > 0.0) ? 1.0 : -1.0;
+  double chStep = kInvTableRange / (kInvTableSize - 1);
+  double chMax = 0.0;
+  for (int i = 1; i < kInvTableSize; ++i) {
+    if (!(dEdCh(i * chStep) * sign > 0.0)) {
+      break;
+    }
+    chMax = i * chStep;
+  }
+  if (chMax == 0.0) {
+    return;
+  }
+
+  fInvEMin = Ch2E(0.0);
+  fInvEStep = (Ch2E(chMax) - fInvEMin) / (kInvTableSize - 1);
+  fInvTable.reserve(kInvTableSize);
+  double ch = 0.0;
+  for (int i = 0; i < kInvTableSize; ++i) {
+    // Start from the previous node, which is close
+    E2ChNewton(fInvEMin + i * fInvEStep, ch);
+    fInvTable.push_back(ch);
+  }
+}
+
+double Calibration::E2ChStart(double e) const {
+  // Starting value for the Newton iteration in E2Ch(): linear interpolation
+  // in the table of the inverse function, if e is covered by it.
+  // (Internal use only.)
+
+  if (fInvTable.empty()) {
+    return 1.0;
+  }
+
+  double pos = (e - fInvEMin) / fInvEStep;
+  if (!(pos >= 0.0 && pos <= kInvTableSize - 1)) {
+    return 1.0;
+  }
+  int i = std::min(static_cast<int>(pos), kInvTableSize - 2);
+  return fInvTable[i] + (pos - i) * (fInvTable[i + 1] - fInvTable[i]);
+}
+
+bool Calibration::E2ChNewton(double e, double &ch) const {
+  // Solve Ch2E(ch) = e by Newton's method, starting from the given ch.
+  // Returns false if the solver failed to converge. (Internal use only.)
+  // TODO: deal with slope == 0.0
+
+  double de = Ch2E(ch) - e;
+  double _e = std::max(std::abs(e), 1.0);
+
+  for (int i = 0; i < 10 && std::abs(de / _e) > 1e-10; i++) {
+    ch -= de / dEdCh(ch);
+    de = Ch2E(ch) - e;
+  }
 
-  std::transform(fCal.begin() + 1, fCal.end(), std::back_inserter(fCalDeriv),
-                 [&](double coeff) { return coeff * a++; });
+  return std::abs(de / _e) <= 1e-10;
 }
 
 //! Convert a channel to an energy, using the chosen energy
@@ -121,34 +195,14 @@ double Calibration::dEdCh(double ch) const {
 double Calibration::E2Ch(double e) const {
   //! Convert an energy to a channel, using the chosen energy
   //! calibration.
-  //! TODO: deal with slope == 0.0
 
   // Catch special case of a trivial calibration
   if (fCal.empty()) {
     return e;
   }
 
-  double ch = 1.0;
-  double de = Ch2E(ch) - e;
-  double slope;
-  double _e = std::abs(e);
-  std::vector<double>::const_reverse_iterator c;
-
-  if (_e < 1.0) {
-    _e = 1.0;
-  }
-
-  for (int i = 0; i < 10 && std::abs(de / _e) > 1e-10; i++) {
-    // Calculate slope
-    slope = std::accumulate(
-        fCalDeriv.rbegin(), fCalDeriv.rend(), 0.0,
-        [ch](double slope, double coeff) { return slope * ch + coeff; });
-
-    ch -= de / slope;
-    de = Ch2E(ch) - e;
-  }
-
-  if (std::abs(de / _e) > 1e-10) {
+  double ch = E2ChStart(e);
+  if (!E2ChNewton(e, ch)) {
     std::cout << "Warning: Solver failed to converge in Calibration::E2Ch()."
               << std::endl;
   }
@@ -156,6 +210,21 @@ double Calibration::E2Ch(double e) const {
   return ch;
 }
 
+//! Convert the n channels ch to energies e
+void Calibration::Ch2E(const double *ch, double *e, std::size_t n) const {
+  std::transform(ch, ch + n, e, [this](double c) { return Ch2E(c); });
+}
+
+//! Calculate the slope of the calibration function at the n channels ch
+void Calibration::dEdCh(const double *ch, double *slope, std::size_t n) const {
+  std::transform(ch, ch + n, slope, [this](double c) { return dEdCh(c); });
+}
+
+//! Convert the n energies e to channels ch
+void Calibration::E2Ch(const double *e, double *ch, std::size_t n) const {
+  std::transform(e, e + n, ch, [this](double _e) { return E2Ch(_e); });
+}
+
 void Calibration::Apply(TAxis *axis, int nbins) {
   auto centers = Util::make_unique<double[]>(nbins);
 
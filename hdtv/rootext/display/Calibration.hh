@@ -23,6 +23,7 @@
 #ifndef __Calibration_h__
 #define __Calibration_h__
 
+#include <cstddef>
 #include <vector>
 
 class TAxis;
@@ -42,6 +43,10 @@ namespace HDTV {
  *  the center of the first visible bin (bin number 1 in ROOT) at channel 0.0.
  *  This then corresponds to an energy E = cal0. However, this needs not be
  *  true for spectra read e.g. from ROOT files.
+ *
+ *  E2Ch() starts its Newton iteration from a table of the inverse function,
+ *  which is set up along with the calibration. All conversions are also
+ *  available for whole arrays of values.
  */
 class Calibration {
 public:
@@ -82,6 +87,10 @@ public:
   double dEdCh(double ch) const;
   double E2Ch(double e) const;
 
+  void Ch2E(const double *ch, double *e, std::size_t n) const;
+  void dEdCh(const double *ch, double *slope, std::size_t n) const;
+  void E2Ch(const double *e, double *ch, std::size_t n) const;
+
   void Rebin(const unsigned int nBins);
   void Apply(TAxis *axis, int nbins);
 
@@ -89,6 +98,19 @@ private:
   std::vector<double> fCal;
   std::vector<double> fCalDeriv;
   void UpdateDerivative();
+
+  // Inverse of the calibration: channels at kInvTableSize equidistant
+  // energies fInvEMin, fInvEMin + fInvEStep, ..., covering the channels from
+  // 0 up to where the calibration stops being strictly monotonic (but at most
+  // kInvTableRange)
+  static constexpr double kInvTableRange = 65536.0;
+  static constexpr int kInvTableSize = 1025;
+  std::vector<double> fInvTable;
+  double fInvEMin = 0.0;
+  double fInvEStep = 0.0;
+  void UpdateInverse();
+  double E2ChStart(double e) const;
+  bool E2ChNewton(double e, double &ch) const;
 };
 
 } // end namespace HDTV
@@ -22,6 +22,7 @@
 
 #include "DisplaySpec.hh"
 
+#include <algorithm>
 #include <utility>
 
 #include <TH1.h>
@@ -34,50 +35,131 @@ namespace Display {
 
 //! Constructor
 DisplaySpec::DisplaySpec(const TH1 *hist, int col)
-    : DisplayBlock(col), fCachedMaxBin{0}, fCachedMax{0.0},
-      fDrawUnderflowBin(false), fDrawOverflowBin(false) {
+    : DisplayBlock(col), fDrawUnderflowBin(false), fDrawOverflowBin(false) {
 
   fHist.reset(dynamic_cast<TH1 *>(hist->Clone()));
 
   // cout << "GSDisplaySpec constructor" << endl;
-
-  /* Set invalid values to ensure cache is flushed at the
-         first call to GetMax_Cached() */
-  fCachedB1 = 1;
-  fCachedB2 = 0;
 }
 
 void DisplaySpec::SetHist(const TH1 *hist) {
   //! Set the histogram owned by this object to a copy of hist
 
   fHist.reset(dynamic_cast<TH1 *>(hist->Clone()));
+  fPyramid.clear();
   Update();
 }
 
+void DisplaySpec::Combine(RegionSummary &acc, const RegionSummary &block) {
+  //! Merge the summary of a block of bins into acc. For equal maxima, the
+  //! lower bin wins, so the result does not depend on the order in which
+  //! the blocks are combined.
+
+  if (block.max > acc.max ||
+      (block.max == acc.max && block.maxBin < acc.maxBin)) {
+    acc.max = block.max;
+    acc.maxBin = block.maxBin;
+  }
+  acc.min = std::min(acc.min, block.min);
+  acc.sum += block.sum;
+}
+
+void DisplaySpec::BuildPyramid() {
+  //! Compute the min/max/sum pyramid of the histogram
+
+  fPyramid.clear();
+
+  // Only complete blocks are summarized; the bins after the last one are
+  // always read directly
+  int nBlocks = (GetNbinsX() + 2) / kPyramidBlock;
+  if (nBlocks == 0) {
+    return;
+  }
+
+  std::vector<RegionSummary> level;
+  level.reserve(nBlocks);
+  for (int block = 0; block < nBlocks; block++) {
+    int bin = block * kPyramidBlock;
+    RegionSummary summary = BinSummary(bin);
+    for (int i = 1; i < kPyramidBlock; i++) {
+      Combine(summary, BinSummary(bin + i));
+    }
+    level.push_back(summary);
+  }
+  fPyramid.push_back(std::move(level));
+
+  while (fPyramid.back().size() > 1) {
+    const std::vector<RegionSummary> &lower = fPyramid.back();
+    std::vector<RegionSummary> upper;
+    upper.reserve((lower.size() + 1) / 2);
+    for (std::size_t i = 0; i < lower.size(); i += 2) {
+      RegionSummary summary = lower[i];
+      if (i + 1 < lower.size()) {
+        Combine(summary, lower[i + 1]);
+      }
+      upper.push_back(summary);
+    }
+    fPyramid.push_back(std::move(upper));
+  }
+}
+
+DisplaySpec::RegionSummary DisplaySpec::GetRegionSummary(int b1, int b2) {
+  //! Summarize the bins between b1 and b2 (inclusive, b1 <= b2 are valid
+  //! raw bin numbers). The bins before the first and after the last
+  //! complete block of the pyramid in the region are read directly, the
+  //! blocks in between are taken from the highest possible pyramid levels,
+  //! so this needs O(kPyramidBlock + log(b2 - b1)) operations. The pyramid
+  //! is only built once a region contains a complete block.
+
+  RegionSummary summary = BinSummary(b1);
+
+  int bin = b1 + 1;
+  while (bin <= b2 && bin % kPyramidBlock != 0) {
+    Combine(summary, BinSummary(bin++));
+  }
+
+  // End of the complete blocks
+  int end = (b2 + 1) - (b2 + 1) % kPyramidBlock;
+  if (bin < end) {
+    if (fPyramid.empty()) {
+      BuildPyramid();
+    }
+
+    std::size_t lo = bin / kPyramidBlock;
+    std::size_t hi = end / kPyramidBlock;
+    for (std::size_t level = 0; lo < hi; level++, lo /= 2, hi /= 2) {
+      if (lo % 2) {
+        Combine(summary, fPyramid[level][lo++]);
+      }
+      if (hi % 2) {
+        Combine(summary, fPyramid[level][--hi]);
+      }
+    }
+    bin = end;
+  }
+
+  while (bin <= b2) {
+    Combine(summary, BinSummary(bin++));
+  }
+
+  return summary;
+}
+
 int DisplaySpec::GetRegionMaxBin(int b1, int b2) {
   //! Find the bin number of the bin between b1 and b2 (inclusive) which
   //! contains the most events
   //! b1 and b2 are raw bin numbers
   //! The region is clipped according to fDrawUnderflowBin and fDrawOverflowBin
-
-  int bin, max_bin;
-  double y, max_y;
+  //! If several bins contain the maximum, the first one is returned
 
   b1 = ClipBin(b1);
   b2 = ClipBin(b2);
 
-  max_y = fHist->GetBinContent(b1);
-  max_bin = b1;
-
-  for (bin = b1; bin <= b2; bin++) {
-    y = fHist->GetBinContent(bin);
-    if (y > max_y) {
-      max_y = y;
-      max_bin = bin;
-    }
+  if (b2 < b1) {
+    return b1;
   }
 
-  return max_bin;
+  return GetRegionSummary(b1, b2).maxBin;
 }
 
 double DisplaySpec::GetRegionMax(int b1, int b2) {
@@ -90,72 +172,50 @@ double DisplaySpec::GetRegionMax(int b1, int b2) {
   return fHist->GetBinContent(max_bin);
 }
 
-double DisplaySpec::GetMax_Cached(int b1, int b2) {
-  //! Gets the maximum count between bin b1 and bin b2, inclusive.
-  //! Employes caching to save time during scrolling operations.
-  //!
-  //! NOTE: For the caching to be effective, use this function ONLY for
-  //! scrolling operations.
-
-  int bin = 0;
-  int newBin = 0;
-  double max, newMax = -1.0;
+double DisplaySpec::GetRegionMin(int b1, int b2) {
+  //! Get the minimum counts in the region between bin b1 and bin b2 (inclusive)
+  //! b1 and b2 are raw bin numbers, clipped like for GetRegionMaxBin()
 
-  b1 = std::max(b1, 0);
-  b2 = std::min(b2, GetNbinsX() + 1);
+  b1 = ClipBin(b1);
+  b2 = ClipBin(b2);
 
   if (b2 < b1) {
-    std::swap(b1, b2);
+    return fHist->GetBinContent(b1);
   }
 
-  if (fCachedB2 < b1 || fCachedB1 > b2 || fCachedB1 > fCachedB2) {
-    fCachedB1 = b1;
-    fCachedB2 = b2;
-    fCachedMaxBin = GetRegionMaxBin(b1, b2);
-    fCachedMax = GetBinContent(fCachedMaxBin);
-  } else {
-    if (b1 < fCachedB1) {
-      newBin = GetRegionMaxBin(b1, fCachedB1);
-      newMax = GetBinContent(newBin);
-
-      fCachedB1 = b1;
-    }
+  return GetRegionSummary(b1, b2).min;
+}
 
-    if (b2 > fCachedB2) {
-      bin = GetRegionMaxBin(fCachedB2, b2);
-      max = GetBinContent(bin);
+double DisplaySpec::GetRegionSum(int b1, int b2) {
+  //! Get the sum of the counts in the region between bin b1 and bin b2
+  //! (inclusive)
+  //! b1 and b2 are raw bin numbers, clipped like for GetRegionMaxBin()
 
-      if (max > newMax) {
-        newMax = max;
-        newBin = bin;
-      }
+  b1 = ClipBin(b1);
+  b2 = ClipBin(b2);
 
-      fCachedB2 = b2;
-    }
+  if (b2 < b1) {
+    return 0.0;
+  }
 
-    if (newMax >= fCachedMax) {
-      fCachedMaxBin = newBin;
-      fCachedMax = newMax;
-    } else if (fCachedMaxBin < b1 || fCachedMaxBin > b2) {
-      bin = GetRegionMaxBin(b1 > fCachedB1 ? b1 : fCachedB1,
-                            b2 < fCachedB2 ? b2 : fCachedB2);
-
-      max = GetBinContent(bin);
-
-      if (max > newMax) {
-        fCachedMax = max;
-        fCachedMaxBin = bin;
-      } else {
-        fCachedMax = newMax;
-        fCachedMaxBin = newBin;
-      }
+  return GetRegionSummary(b1, b2).sum;
+}
 
-      fCachedB1 = b1;
-      fCachedB2 = b2;
-    }
+double DisplaySpec::GetMax_Cached(int b1, int b2) {
+  //! Gets the maximum count between bin b1 and bin b2, inclusive.
+  //!
+  //! This used to cache the maximum of the last region for scrolling
+  //! operations; the min/max pyramid makes each call cheap at any zoom
+  //! level, so it is now equivalent to GetRegionMax().
+
+  b1 = std::max(b1, 0);
+  b2 = std::min(b2, GetNbinsX() + 1);
+
+  if (b2 < b1) {
+    std::swap(b1, b2);
   }
 
-  return fCachedMax;
+  return GetRegionMax(b1, b2);
 }
 
 } // end namespace Display
@@ -25,6 +25,7 @@
 
 #include <memory>
 #include <sstream>
+#include <vector>
 
 #include <TH1.h>
 
@@ -40,10 +41,14 @@ public:
 
   void SetHist(const TH1 *hist);
 
-  TH1 *GetHist() { return fHist.get(); }
+  //! The histogram is read-only: the region summaries are only discarded
+  //! by SetHist(), so any change must go through a new histogram
+  const TH1 *GetHist() const { return fHist.get(); }
 
   int GetRegionMaxBin(int b1, int b2);
   double GetRegionMax(int b1, int b2);
+  double GetRegionMin(int b1, int b2);
+  double GetRegionSum(int b1, int b2);
 
   void SetID(int ID) {
     fID = std::to_string(ID);
@@ -109,8 +114,28 @@ public:
 private:
   std::unique_ptr<TH1> fHist;
 
-  int fCachedB1, fCachedB2, fCachedMaxBin;
-  double fCachedMax;
+  // Maximum (with the first bin containing it), minimum and sum of the
+  // counts of a block of bins
+  struct RegionSummary {
+    double max, min, sum;
+    int maxBin;
+  };
+
+  RegionSummary BinSummary(int bin) {
+    double y = fHist->GetBinContent(bin);
+    return {y, y, y, bin};
+  }
+  static void Combine(RegionSummary &acc, const RegionSummary &block);
+  RegionSummary GetRegionSummary(int b1, int b2);
+  void BuildPyramid();
+
+  // Min/max/sum pyramid of the histogram, computed on demand and discarded
+  // whenever the histogram changes: level 0 summarizes blocks of
+  // kPyramidBlock raw bins (starting with the underflow bin), level n + 1
+  // pairs of blocks of level n
+  static constexpr int kPyramidBlock = 16;
+  std::vector<std::vector<RegionSummary>> fPyramid;
+
   bool fDrawUnderflowBin, fDrawOverflowBin;
   std::string fID; // ID for use by higher-level structures
 };
@@ -25,8 +25,10 @@
 
 import os
 import sys
+import time
 import shutil
 import subprocess
+from collections import OrderedDict
 import ROOT
 import hdtv.ui
 import hdtv.version
@@ -39,6 +41,9 @@ usrlibdir = os.path.join(cachepath, 'lib',
         hdtv.version.VERSION))
 syslibdir = os.path.join(os.path.dirname(__file__), str(ROOT.gROOT.GetVersionInt()))
 
+# Time it took to load (and possibly build) each library, in seconds
+loadtimes = OrderedDict()
+
 
 def FindLibrary(name, libname):
     """
@@ -57,6 +62,7 @@ def LoadLibrary(name):
     """
     Load a dynamic library. Try to find and load it, or rebuild it on fail
     """
+    start = time.time()
     loaded = False
     libname = libfmt % name
     fname = FindLibrary(name, libname)
@@ -70,6 +76,7 @@ def LoadLibrary(name):
     if not loaded:
         hdtv.ui.error("Failed to load library %s" % libname)
         sys.exit(1)
+    loadtimes[name] = time.time() - start
 
 
 def _LoadLibrary(fname):
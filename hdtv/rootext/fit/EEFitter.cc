@@ -269,6 +269,7 @@ void EEFitter::AddPeak(const EEPeak &peak) {
 
 double EEFitter::Eval(const double *x, const double *p) const {
   // Private: evaluation function for fit
+  ++fNumEvals;
   return std::accumulate(
       fPeaks.begin(), fPeaks.end(), EvalBg(x, p),
       [x, p](double sum, const EEPeak &peak) { return sum + peak.Eval(x, p); });
@@ -380,6 +381,7 @@ void EEFitter::_Fit(TH1 &hist) {
 
   // Do the fit
   hist.Fit(fSumFunc.get(), "RQNM");
+  StoreCovariance();
 
   // Calculate the peak volumes while the covariance matrix is still available
   for (auto &peak : fPeaks) {
@@ -105,6 +105,13 @@ public:
 
   TF1 *GetPeakFunc();
 
+  //! Indices of the parameters pos, amp, sigma1, sigma2, eta and gamma in the
+  //! fit function (-1 if the parameter is not free)
+  std::vector<int> GetParamIds() const {
+    return {fPos._Id(),    fAmp._Id(), fSigma1._Id(),
+            fSigma2._Id(), fEta._Id(), fGamma._Id()};
+  }
+
 private:
   void StoreIntegral();
 
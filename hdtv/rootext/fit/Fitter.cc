@@ -22,9 +22,13 @@
 
 #include "Fitter.hh"
 
+#include <algorithm>
 #include <cmath>
+#include <limits>
 
+#include <TError.h>
 #include <TF1.h>
+#include <TVirtualFitter.h>
 
 namespace HDTV {
 namespace Fit {
@@ -66,5 +70,37 @@ double Fitter::GetIntBgCoeffError(int i) const {
   }
 }
 
+double Fitter::GetCovariance(int i, int j) const {
+  if (fCovar.empty() || i < 0 || i >= fNumParams || j < 0 ||
+      j >= fNumParams) {
+    return std::numeric_limits<double>::quiet_NaN();
+  } else {
+    return fCovar[i * fNumParams + j];
+  }
+}
+
+bool Fitter::GetCovarianceMatrix(double *covar) const {
+  if (fCovar.empty()) {
+    return false;
+  }
+  std::copy(fCovar.begin(), fCovar.end(), covar);
+  return true;
+}
+
+void Fitter::StoreCovariance() {
+  TVirtualFitter *fitter = TVirtualFitter::GetFitter();
+  if (fitter == nullptr) {
+    Error("Fitter::StoreCovariance", "No existing fitter after fit");
+    fCovar.clear();
+    return;
+  }
+  fCovar.resize(fNumParams * fNumParams);
+  for (int i = 0; i < fNumParams; i++) {
+    for (int j = 0; j < fNumParams; j++) {
+      fCovar[i * fNumParams + j] = fitter->GetCovarianceMatrixElement(i, j);
+    }
+  }
+}
+
 } // end namespace Fit
 } // end namespace HDTV
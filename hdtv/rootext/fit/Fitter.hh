@@ -24,6 +24,7 @@
 #define __Fitter_h__
 
 #include <memory>
+#include <vector>
 
 #include "Background.hh"
 #include "Param.hh"
@@ -46,6 +47,22 @@ public:
   int GetIntBgDegree() const { return fIntBgDeg; }
   double GetChisquare() const { return fChisquare; }
 
+  //! Number of evaluations of the fit function so far (including those for
+  //! display)
+  unsigned long GetNumEvals() const { return fNumEvals; }
+
+  //! Number of parameters of the fit function
+  int GetNumParams() const { return fNumParams; }
+
+  //! Element (i, j) of the covariance matrix of the fit function parameters,
+  //! or NaN if not available (e.g. for restored fits)
+  double GetCovariance(int i, int j) const;
+
+  //! Copy the covariance matrix of the fit function parameters to covar
+  //! (GetNumParams() x GetNumParams() values, row-major). Returns false (and
+  //! leaves covar untouched) if it is not available.
+  bool GetCovarianceMatrix(double *covar) const;
+
 protected:
   int fNumParams;
   bool fFinal;
@@ -57,8 +74,14 @@ protected:
   std::unique_ptr<TF1> fSumFunc;
   std::unique_ptr<TF1> fBgFunc;
   double fChisquare;
+  mutable unsigned long fNumEvals{0};
+
+  std::vector<double> fCovar;
 
   void SetParameter(TF1 &func, Param &param, double ival = 0.0);
+
+  //! Copy the covariance matrix from the fitter of the last fit
+  void StoreCovariance();
 };
 
 } // end namespace Fit
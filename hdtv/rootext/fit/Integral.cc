@@ -22,29 +22,31 @@
 
 #include "Integral.hh"
 
+#include <algorithm>
 #include <cmath>
+#include <limits>
 
 // ClassImp(HDTV::Fit::Integral)
 
 namespace HDTV {
 namespace Fit {
 
-double Integral::GetStdDev() {
+double Moments::GetStdDev() const {
   //! Returns the standard deviation
   //! \f[ \sigma = \sqrt{\sigma^{2}} \f]
 
-  return std::sqrt(GetVariance());
+  return std::sqrt(variance);
 }
 
-double Integral::GetStdDevError() {
+double Moments::GetStdDevError() const {
   //! Returns the error of the standard deviation,
   //! \f[ \Delta \sigma = \frac{\Delta \sigma^{2}}{2 \sigma} \f]
-  //! calculated from the error of the variance (see CalcVarianceError())
+  //! calculated from the error of the variance
 
-  return GetVarianceError() / (2. * GetStdDev());
+  return varianceError / (2. * GetStdDev());
 }
 
-double Integral::GetWidth() {
+double Moments::GetWidth() const {
   //! Returns the width,
   //! \f[ w = 2 \sqrt{2 \ln(2)} \sigma \f]
   //! For a Gaussian distribution, this corresponds to the full width at half
@@ -53,166 +55,113 @@ double Integral::GetWidth() {
   return 2. * std::sqrt(2. * std::log(2.)) * GetStdDev();
 }
 
-double Integral::GetWidthError() {
+double Moments::GetWidthError() const {
   //! Returns the error of the width,
   //! \f[ \Delta w = 2 \sqrt{2 \ln(2)} \Delta \sigma \f]
 
   return 2. * std::sqrt(2. * std::log(2.)) * GetStdDevError();
 }
 
-// Worker functions
-double Integral::CalcIntegral() {
-  //! Returns the integral
-  //! \f[  N = \sum_{i=b_{1}}^{b_{2}} n_{i} \f]
-
-  double sum = 0.0;
-  for (int b = fB1; b <= fB2; b++) {
-    sum += GetBinContent(b);
-  }
-  return sum;
-}
-
-double Integral::CalcIntegralError() {
-  //! Returns the error of the integral,
-  //! \f[ \Delta N = \sqrt{\sum_{i=b_{1}}^{b_{2}} (\Delta n_{i})^{2}} \f]
-  //! calculated from the bin errors by Gaussian error propagation
-
-  double sum = 0.0;
-  for (int b = fB1; b <= fB2; b++) {
-    sum += GetBinError2(b);
-  }
-  return sqrt(sum);
-}
-
-double Integral::CalcMean() {
-  //! Returns the mean
-  //! \f[ \bar{x} = \frac{1}{N} \sum_{i=b_{1}}^{b_{2}} x_{i} n_{i} \f]
-
-  double sum = 0.0;
-  for (int b = fB1; b <= fB2; b++) {
-    double x = GetBinCenter(b);
-    sum += x * GetBinContent(b);
-  }
-  return sum / GetIntegral();
+void Moments::Invalidate() {
+  integral = integralError = std::numeric_limits<double>::quiet_NaN();
+  mean = meanError = integral;
+  variance = varianceError = integral;
+  rawSkewness = rawSkewnessError = integral;
+  skewness = skewnessError = integral;
 }
 
-double Integral::CalcMeanError() {
-  //! Returns the error of the mean,
-  //! \f[ \Delta \bar{x} = \frac{1}{N}   \sqrt{\sum_{i=b_{1}}^{b_{2}} (x_{i} -
+void Moments::Calc(const double *x, const double *y, const double *e2,
+                   int n) {
+  //! Calculates all moments in three passes over the bins (the central
+  //! moments need the mean, their errors need the central moments). With the
+  //! bin centers \f$x_{i}\f$, contents \f$n_{i}\f$ and errors
+  //! \f$\Delta n_{i}\f$, the moments are
+  //!  - the integral \f[ N = \sum_{i} n_{i} \f]
+  //!  - the mean \f[ \bar{x} = \frac{1}{N} \sum_{i} x_{i} n_{i} \f]
+  //!  - the variance
+  //!    \f[ \sigma^{2} = \frac{1}{N} \sum_{i} (x_{i} - \bar{x})^{2} n_{i} \f]
+  //!  - the "raw" skewness (i.e. the (non-standardized) third central moment)
+  //!    \f[ \mu_{3} = \frac{1}{N} \sum_{i} (x_{i} - \bar{x})^{3} n_{i} \f]
+  //!  - the skewness (i.e. the third standardized moment)
+  //!    \f[ \gamma = \frac{\mu_{3}}{\sigma^{3}} \f]
+  //!
+  //! Their errors are calculated from the bin errors by Gaussian error
+  //! propagation:
+  //! \f[ \Delta N = \sqrt{\sum_{i} (\Delta n_{i})^{2}} \f]
+  //! \f[ \Delta \bar{x} = \frac{1}{N} \sqrt{\sum_{i} (x_{i} -
   //! \bar{x})^{2} (\Delta n_{i})^{2}} \f]
-  //! calculated from the bin errors by Gaussian error propagation
-
-  double mean = GetMean();
-  double sum = 0.0;
-  for (int b = fB1; b <= fB2; b++) {
-    double x = GetBinCenter(b);
-    sum += (x - mean) * (x - mean) * GetBinError2(b);
-  }
-  return sqrt(sum) / GetIntegral();
-}
-
-double Integral::CalcVariance() {
-  //! Returns the variance
-  //! \f[ \sigma^{2} = \frac{1}{N} \sum_{i=b_{1}}^{b_{2}} (x_{i} - \bar{x})^{2}
-  //! n_{i} \f]
-
-  double mean = GetMean();
-
-  double sum = 0.0;
-  for (int b = fB1; b <= fB2; b++) {
-    double x = GetBinCenter(b);
-    sum += (x - mean) * (x - mean) * GetBinContent(b);
-  }
-  return sum / GetIntegral();
-}
-
-double Integral::CalcVarianceError() {
-  //! Returns the error of the variance,
-  //! \f[  \Delta \sigma^{2} = \frac{1}{N}   \sqrt{\sum_{i=b_{1}}^{b_{2}}
-  //! [(x_{i} - \bar{x})^{2} - \sigma^{2}]^{2} (\Delta n_{i})^{2} } \f]
-  //! calculated from the bin errors by Gaussian error propagation
-
-  double mean = GetMean();
-  double variance = GetVariance();
-
-  double sum = 0.0;
-  for (int b = fB1; b <= fB2; b++) {
-    double xm = GetBinCenter(b) - mean;
-    double s = xm * xm - variance;
-    sum += s * s * GetBinError2(b);
-  }
-  return sqrt(sum) / GetIntegral();
-}
-
-double Integral::CalcRawSkewness() {
-  //! Returns the "raw" skewness (i.e. the (non-standardized) third central
-  //! moment)
-  //! \f[ \mu_{3} = \frac{1}{N} \sum_{i=b_{1}}^{b_{2}} (x_{i} - \bar{x})^{3}
-  //! n_{i} \f]
-
-  double mean = GetMean();
-
-  double sum = 0.0;
-  for (int b = fB1; b <= fB2; b++) {
-    double xm = GetBinCenter(b) - mean;
-    sum += xm * xm * xm * GetBinContent(b);
-  }
-  return sum / GetIntegral();
-}
-
-double Integral::CalcRawSkewnessError() {
-  //! Returns the error of the "raw" skewness,
-  //! \f[ \Delta \mu_{3} = \frac{1}{N}   \sqrt{\sum_{i=b_{1}}^{b_{2}} [(x_{i} -
+  //! \f[ \Delta \sigma^{2} = \frac{1}{N} \sqrt{\sum_{i} [(x_{i} -
+  //! \bar{x})^{2} - \sigma^{2}]^{2} (\Delta n_{i})^{2} } \f]
+  //! \f[ \Delta \mu_{3} = \frac{1}{N} \sqrt{\sum_{i} [(x_{i} -
   //! \bar{x})^{3} - 3 \sigma^{2} (x_{i} - \bar{x}) - \mu_{3}]^{2} (\Delta
   //! n_{i})^{2}} \f]
-  //! calculated from the bin errors by Gaussian error propagation
-
-  double mean = GetMean();
-  double variance = GetVariance();
-  double rawSkewness = GetRawSkewness();
-
-  double sum = 0.0;
-  for (int b = fB1; b <= fB2; b++) {
-    double xm = GetBinCenter(b) - mean;
-    double s = xm * xm * xm - 3. * variance * xm - rawSkewness;
-    sum += s * s * GetBinError2(b);
-  }
-  return sqrt(sum) / GetIntegral();
-}
-
-double Integral::CalcSkewness() {
-  //! Returns the skewness (i.e. the third standardized moment)
-  //! \f[ \gamma = \frac{\mu_{3}}{\sigma^{3}} \f]
-
-  return GetRawSkewness() / pow(GetVariance(), 1.5);
-}
-
-double Integral::CalcSkewnessError() {
-  //! Returns the error of the skewness,
-  //! \f[ \Delta \gamma = \frac{1}{N}   \sqrt{ \sum_{i=b_{1}}^{b_{2}} \left[
+  //! \f[ \Delta \gamma = \frac{1}{N} \sqrt{ \sum_{i} \left[
   //! \frac{(x_{i} - \bar{x})^{3}}{\sigma^{3}} - 3 \frac{x_{i} -
   //! \bar{x}}{\sigma} - \frac{3}{2} \gamma \frac{(x_{i} -
   //! \bar{x})^{2}}{\sigma^{2}} - \frac{1}{2} \gamma \right]^{2} (\Delta
   //! n_{i})^{2} } \f]
-  //! calculated from the bin errors by Gaussian error propagation
 
-  double mean = GetMean();
-  double skewness = GetSkewness();
-  double sigma = GetStdDev();
+  // Integral and mean
+  double sum = 0.0, sumE2 = 0.0, sumX = 0.0;
+  for (int i = 0; i < n; i++) {
+    sum += y[i];
+    sumE2 += e2[i];
+    sumX += x[i] * y[i];
+  }
+  integral = sum;
+  integralError = std::sqrt(sumE2);
+  mean = sumX / integral;
+
+  // Central moments and error of the mean
+  double sumMeanE2 = 0.0, sumVar = 0.0, sumSkew = 0.0;
+  for (int i = 0; i < n; i++) {
+    double xm = x[i] - mean;
+    sumMeanE2 += xm * xm * e2[i];
+    sumVar += xm * xm * y[i];
+    sumSkew += xm * xm * xm * y[i];
+  }
+  meanError = std::sqrt(sumMeanE2) / integral;
+  variance = sumVar / integral;
+  rawSkewness = sumSkew / integral;
+  skewness = rawSkewness / std::pow(variance, 1.5);
+
+  // Errors of the central moments
+  double sigma = std::sqrt(variance);
   double sigma2 = sigma * sigma;
   double sigma3 = sigma2 * sigma;
-
-  double sum = 0.0;
-  for (int b = fB1; b <= fB2; b++) {
-    double xm = GetBinCenter(b) - mean;
-    double s;
+  double sumVarE2 = 0.0, sumRawSkewE2 = 0.0, sumSkewE2 = 0.0;
+  for (int i = 0; i < n; i++) {
+    double xm = x[i] - mean;
+    double s = xm * xm - variance;
+    sumVarE2 += s * s * e2[i];
+    s = xm * xm * xm - 3. * variance * xm - rawSkewness;
+    sumRawSkewE2 += s * s * e2[i];
     s = xm * xm * xm / sigma3;
     s -= 3. * xm / sigma;
     s -= 1.5 * skewness * xm * xm / sigma2;
     s -= 0.5 * skewness;
-    sum += s * s * GetBinError2(b);
+    sumSkewE2 += s * s * e2[i];
   }
-  return sqrt(sum) / GetIntegral();
+  varianceError = std::sqrt(sumVarE2) / integral;
+  rawSkewnessError = std::sqrt(sumRawSkewE2) / integral;
+  skewnessError = std::sqrt(sumSkewE2) / integral;
+}
+
+Moments Integral::CalcMoments() {
+  //! Reads the bins fB1 ... fB2 (inclusive) once into scratch buffers and
+  //! calculates all moments from them
+
+  int n = std::max(fB2 - fB1 + 1, 0);
+  std::vector<double> x(n), y(n), e2(n);
+  for (int i = 0; i < n; i++) {
+    x[i] = GetBinCenter(fB1 + i);
+    y[i] = GetBinContent(fB1 + i);
+    e2[i] = GetBinError2(fB1 + i);
+  }
+
+  Moments moments;
+  moments.Calc(x.data(), y.data(), e2.data(), n);
+  return moments;
 }
 
 TH1Integral::TH1Integral(TH1 *hist, double r1, double r2)
@@ -256,5 +205,63 @@ double TH1BgsubIntegral::GetBinError2(int bin) {
   return eh * eh + eb * eb;
 }
 
+int IntegralBatch::Add(double r1, double r2, const Background *bg) {
+  //! The bins from the one containing r1 to the one containing r2 are
+  //! included, as for TH1Integral.
+
+  int b1 = fHist->FindBin(r1);
+  int n = std::max(fHist->FindBin(r2) - b1 + 1, 0);
+  fX.resize(n);
+  fY.resize(n);
+  fE2.resize(n);
+  for (int i = 0; i < n; i++) {
+    double e = fHist->GetBinError(b1 + i);
+    fX[i] = fHist->GetBinCenter(b1 + i);
+    fY[i] = fHist->GetBinContent(b1 + i);
+    fE2[i] = e * e;
+  }
+
+  fMoments.resize(fMoments.size() + kNumKinds);
+  Moments *moments = &fMoments[fMoments.size() - kNumKinds];
+  moments[kTotal].Calc(fX.data(), fY.data(), fE2.data(), n);
+
+  if (!bg) {
+    moments[kBackground].Invalidate();
+    moments[kBgsub].Invalidate();
+    return GetNumRegions() - 1;
+  }
+
+  fBgY.resize(n);
+  fBgE2.resize(n);
+  for (int i = 0; i < n; i++) {
+    double e = bg->EvalError(fX[i]);
+    fBgY[i] = bg->Eval(fX[i]);
+    fBgE2[i] = e * e;
+  }
+  moments[kBackground].Calc(fX.data(), fBgY.data(), fBgE2.data(), n);
+
+  // Reuse the buffers of the histogram for the background-subtracted one
+  for (int i = 0; i < n; i++) {
+    fY[i] -= fBgY[i];
+    fE2[i] += fBgE2[i];
+  }
+  moments[kBgsub].Calc(fX.data(), fY.data(), fE2.data(), n);
+
+  return GetNumRegions() - 1;
+}
+
+void IntegralBatch::GetValues(double *values) const {
+  for (const auto &moments : fMoments) {
+    *values++ = moments.integral;
+    *values++ = moments.integralError;
+    *values++ = moments.mean;
+    *values++ = moments.meanError;
+    *values++ = moments.GetWidth();
+    *values++ = moments.GetWidthError();
+    *values++ = moments.rawSkewness;
+    *values++ = moments.rawSkewnessError;
+  }
+}
+
 } // end namespace Fit
 } // end namespace HDTV
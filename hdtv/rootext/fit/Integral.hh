@@ -23,6 +23,8 @@
 #ifndef __Integral_h__
 #define __Integral_h__
 
+#include <vector>
+
 #include <TH1.h>
 
 #include "Background.hh"
@@ -76,8 +78,34 @@ public:
   }
 };
 
+//! Statistical moments (integral, mean, variance, skewness) of a binned
+//! distribution and their errors, see Integral for the definitions
+struct Moments {
+  double integral, integralError;
+  double mean, meanError;
+  double variance, varianceError;
+  double rawSkewness, rawSkewnessError;
+  double skewness, skewnessError;
+
+  //! Calculate all moments of the n bins with centers x, contents y and
+  //! squared errors e2
+  void Calc(const double *x, const double *y, const double *e2, int n);
+  //! Set all moments to NaN
+  void Invalidate();
+
+  double GetStdDev() const;
+  double GetStdDevError() const;
+  double GetWidth() const;
+  double GetWidthError() const;
+};
+
 //! Helper class to calculate various statistical moments (integral, mean, ...)
 //! of a histogram
+/*!
+ * All moments are calculated on first use of any of them: the bins are read
+ * once into scratch buffers (see CalcMoments()), so that e.g. a background
+ * function is evaluated only once per bin.
+ */
 class Integral {
 public:
   /*! Constructor
@@ -87,73 +115,29 @@ public:
   Integral(int b1, int b2) : fB1(b1), fB2(b2) {}
   virtual ~Integral() = default;
 
-  //! Cached version of CalcIntegral()
-  double GetIntegral() {
-    return fCIntegral.get_or_eval([&]() { return CalcIntegral(); });
-  }
-
-  //! Cached version of CalcIntegralError()
-  double GetIntegralError() {
-    return fCIntegralError.get_or_eval([&]() { return CalcIntegralError(); });
-  }
-
-  //! Cached version of CalcMean()
-  double GetMean() {
-    return fCMean.get_or_eval([&]() { return CalcMean(); });
-  }
-
-  //! Cached version of CalcMeanError()
-  double GetMeanError() {
-    return fCMeanError.get_or_eval([&]() { return CalcMeanError(); });
-  }
-
-  //! Cached version of CalcVariance()
-  double GetVariance() {
-    return fCVariance.get_or_eval([&]() { return CalcVariance(); });
-  }
-
-  //! Cached version of CalcVarianceError()
-  double GetVarianceError() {
-    return fCVarianceError.get_or_eval([&]() { return CalcVarianceError(); });
-  }
-
-  //! Cached version of CalcRawSkewness()
-  double GetRawSkewness() {
-    return fCRawSkewness.get_or_eval([&]() { return CalcRawSkewness(); });
+  //! All moments (cached)
+  const Moments &GetMoments() {
+    return fMoments.get_or_eval([&]() { return CalcMoments(); });
   }
 
-  //! Cached version of CalcRawSkewnessError()
-  double GetRawSkewnessError() {
-    return fCRawSkewnessError.get_or_eval(
-        [&]() { return CalcRawSkewnessError(); });
-  }
-
-  //! Cached version of CalcSkewness()
-  double GetSkewness() {
-    return fCSkewness.get_or_eval([&]() { return CalcSkewness(); });
-  }
-
-  //! Cached version of CalcSkewnessError()
-  double GetSkewnessError() {
-    return fCSkewnessError.get_or_eval([&]() { return CalcSkewnessError(); });
-  }
+  double GetIntegral() { return GetMoments().integral; }
+  double GetIntegralError() { return GetMoments().integralError; }
+  double GetMean() { return GetMoments().mean; }
+  double GetMeanError() { return GetMoments().meanError; }
+  double GetVariance() { return GetMoments().variance; }
+  double GetVarianceError() { return GetMoments().varianceError; }
+  double GetRawSkewness() { return GetMoments().rawSkewness; }
+  double GetRawSkewnessError() { return GetMoments().rawSkewnessError; }
+  double GetSkewness() { return GetMoments().skewness; }
+  double GetSkewnessError() { return GetMoments().skewnessError; }
 
-  double GetStdDev();
-  double GetStdDevError();
-  double GetWidth();
-  double GetWidthError();
+  double GetStdDev() { return GetMoments().GetStdDev(); }
+  double GetStdDevError() { return GetMoments().GetStdDevError(); }
+  double GetWidth() { return GetMoments().GetWidth(); }
+  double GetWidthError() { return GetMoments().GetWidthError(); }
 
 protected:
-  double CalcIntegral();
-  double CalcIntegralError();
-  double CalcMean();
-  double CalcMeanError();
-  double CalcVariance();
-  double CalcVarianceError();
-  double CalcRawSkewness();
-  double CalcRawSkewnessError();
-  double CalcSkewness();
-  double CalcSkewnessError();
+  Moments CalcMoments();
 
   //! Get content of bin
   virtual double GetBinContent(int bin) = 0;
@@ -164,11 +148,7 @@ protected:
 
   int fB1, fB2;
 
-  CachedValue<double> fCIntegral, fCIntegralError;
-  CachedValue<double> fCMean, fCMeanError;
-  CachedValue<double> fCVariance, fCVarianceError;
-  CachedValue<double> fCRawSkewness, fCRawSkewnessError;
-  CachedValue<double> fCSkewness, fCSkewnessError;
+  CachedValue<Moments> fMoments;
 
   // ClassDef(HDTV::Fit::Integral, 0)
 };
@@ -227,6 +207,46 @@ protected:
   const Background *fBackground;
 };
 
+//! Integrate a histogram in many regions at once
+/*!
+ * For each region added, the moments of the histogram, of the background and
+ * of the background-subtracted histogram are calculated at once (like with
+ * TH1Integral, BgIntegral and TH1BgsubIntegral), reading every bin of the
+ * histogram and evaluating the background only once. The scratch buffers are
+ * shared by all regions.
+ */
+class IntegralBatch {
+public:
+  //! Kinds of integrals of each region
+  enum Kind { kTotal = 0, kBackground = 1, kBgsub = 2, kNumKinds = 3 };
+  //! Number of values per integral in GetValues()
+  static const int kNumValues = 8;
+
+  explicit IntegralBatch(TH1 *hist) : fHist(hist) {}
+
+  //! Integrate the region [r1, r2] with background bg (may be null, then the
+  //! moments of the background and of the background-subtracted histogram
+  //! are NaN). Returns the index of the region.
+  int Add(double r1, double r2, const Background *bg = nullptr);
+
+  int GetNumRegions() const { return fMoments.size() / kNumKinds; }
+  const Moments &GetMoments(int region, int kind) const {
+    return fMoments.at(region * kNumKinds + kind);
+  }
+
+  //! Copy the integral, mean, width and raw skewness (each followed by its
+  //! error) of all integrals to values, which must hold
+  //! GetNumRegions() * kNumKinds * kNumValues doubles
+  void GetValues(double *values) const;
+
+  void Clear() { fMoments.clear(); }
+
+private:
+  TH1 *fHist;
+  std::vector<Moments> fMoments;
+  std::vector<double> fX, fY, fE2, fBgY, fBgE2;
+};
+
 } // end namespace Fit
 } // end namespace HDTV
 
@@ -10,6 +10,8 @@
 #pragma link C++ class HDTV::Fit::TH1Integral+;
 #pragma link C++ class HDTV::Fit::BgIntegral+;
 #pragma link C++ class HDTV::Fit::TH1BgsubIntegral+;
+#pragma link C++ class HDTV::Fit::Moments+;
+#pragma link C++ class HDTV::Fit::IntegralBatch+;
 #pragma link C++ class HDTV::Fit::Background+;
 #pragma link C++ class HDTV::Fit::PolyBg+;
 #pragma link C++ class HDTV::Fit::Param+;
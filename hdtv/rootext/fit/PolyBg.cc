@@ -22,6 +22,7 @@
 
 #include "PolyBg.hh"
 
+#include <algorithm>
 #include <cmath>
 
 #include <iostream>
@@ -41,12 +42,13 @@ PolyBg::PolyBg(int bgdeg) {
   //! Constructor
 
   fBgDeg = bgdeg;
+  fUseMinuit = false;
   fChisquare = std::numeric_limits<double>::quiet_NaN();
 }
 
 PolyBg::PolyBg(const PolyBg &src)
     : fBgRegions(src.fBgRegions), fBgDeg(src.fBgDeg),
-      fChisquare(src.fChisquare), fCovar(src.fCovar) {
+      fUseMinuit(src.fUseMinuit), fChisquare(src.fChisquare), fCovar(src.fCovar) {
   //! Copy constructor
 
   if (src.fFunc != nullptr) {
@@ -72,6 +74,7 @@ PolyBg &PolyBg::operator=(const PolyBg &src) {
 
   fBgRegions = src.fBgRegions;
   fBgDeg = src.fBgDeg;
+  fUseMinuit = src.fUseMinuit;
   fChisquare = src.fChisquare;
   fCovar = src.fCovar;
 
@@ -95,6 +98,193 @@ void PolyBg::Fit(TH1 &hist) {
     return;
   }
 
+  // Fall back to MINUIT if the linear problem cannot be solved directly
+  // (e.g. less non-empty bins than parameters)
+  if (fUseMinuit || !_FitLinear(hist)) {
+    _FitMinuit(hist);
+  }
+}
+
+bool PolyBg::_FitLinear(TH1 &hist) {
+  //! Private: weighted linear least-squares fit of the background polynomial.
+  //! Uses the same data as a chisquare fit with TH1::Fit(): the bins (between
+  //! the first and last bin of the axis range) whose center lies inside a
+  //! background region, skipping bins with zero error. Returns false if the
+  //! problem is singular.
+
+  const int nPar = fBgDeg + 1;
+  TAxis *axis = hist.GetXaxis();
+
+  std::vector<double> xs, ys, errs;
+  for (int bin = axis->GetFirst(); bin <= axis->GetLast(); ++bin) {
+    double x = axis->GetBinCenter(bin);
+    double err = hist.GetBinError(bin);
+    if (err > 0.0 && _InRegion(x)) {
+      xs.push_back(x);
+      ys.push_back(hist.GetBinContent(bin));
+      errs.push_back(err);
+    }
+  }
+
+  const int nPoints = xs.size();
+  if (nPoints < nPar) {
+    return false;
+  }
+
+  // Solve in terms of t = (x - center) / scale, which keeps the design
+  // matrix well conditioned
+  auto minmax = std::minmax_element(xs.begin(), xs.end());
+  double center = (*minmax.first + *minmax.second) / 2.0;
+  double scale = (*minmax.second - *minmax.first) / 2.0;
+  if (scale <= 0.0) {
+    scale = 1.0;
+  }
+
+  // Weighted design matrix (column major) and right hand side
+  std::vector<std::vector<double>> a(nPar, std::vector<double>(nPoints));
+  std::vector<double> b(nPoints);
+  for (int i = 0; i < nPoints; ++i) {
+    double t = (xs[i] - center) / scale;
+    double tPow = 1.0 / errs[i];
+    for (int k = 0; k < nPar; ++k) {
+      a[k][i] = tPow;
+      tPow *= t;
+    }
+    b[i] = ys[i] / errs[i];
+  }
+
+  // Householder QR decomposition; R ends up in the upper triangle of a, and
+  // Q^T is applied to b
+  for (int k = 0; k < nPar; ++k) {
+    double norm = 0.0;
+    for (int i = k; i < nPoints; ++i) {
+      norm = std::hypot(norm, a[k][i]);
+    }
+    if (norm == 0.0) {
+      return false;
+    }
+    if (a[k][k] > 0.0) {
+      norm = -norm;
+    }
+    // v = a[k][k..] - norm * e_k, stored in place; R_kk = norm
+    a[k][k] -= norm;
+    double vv = -norm * a[k][k];
+    auto reflect = [&](std::vector<double> &col) {
+      double s = 0.0;
+      for (int i = k; i < nPoints; ++i) {
+        s += a[k][i] * col[i];
+      }
+      s /= vv;
+      for (int i = k; i < nPoints; ++i) {
+        col[i] -= s * a[k][i];
+      }
+    };
+    for (int j = k + 1; j < nPar; ++j) {
+      reflect(a[j]);
+    }
+    reflect(b);
+    a[k][k] = norm;
+  }
+
+  // Check the condition of R
+  double rMax = 0.0;
+  for (int k = 0; k < nPar; ++k) {
+    rMax = std::max(rMax, std::fabs(a[k][k]));
+  }
+  for (int k = 0; k < nPar; ++k) {
+    if (std::fabs(a[k][k]) <= rMax * 1e-12) {
+      return false;
+    }
+  }
+
+  // Coefficients in t: R c = (Q^T b)[0..nPar-1]
+  std::vector<double> c(nPar);
+  for (int k = nPar - 1; k >= 0; --k) {
+    double s = b[k];
+    for (int j = k + 1; j < nPar; ++j) {
+      s -= a[j][k] * c[j];
+    }
+    c[k] = s / a[k][k];
+  }
+
+  // Covariance matrix in t: (R^T R)^-1 = R^-1 R^-T
+  std::vector<std::vector<double>> rInv(nPar, std::vector<double>(nPar, 0.0));
+  for (int k = 0; k < nPar; ++k) {
+    rInv[k][k] = 1.0 / a[k][k];
+    for (int i = k - 1; i >= 0; --i) {
+      double s = 0.0;
+      for (int j = i + 1; j <= k; ++j) {
+        s += a[j][i] * rInv[j][k];
+      }
+      rInv[i][k] = -s / a[i][i];
+    }
+  }
+
+  // Transformation to the coefficients in x:
+  // ((x - center) / scale)^k = scale^-k sum_j binom(k, j) x^j (-center)^(k-j)
+  std::vector<std::vector<double>> trans(nPar, std::vector<double>(nPar, 0.0));
+  for (int k = 0; k < nPar; ++k) {
+    double binom = 1.0;
+    for (int j = 0; j <= k; ++j) {
+      trans[j][k] =
+          binom * std::pow(-center, k - j) / std::pow(scale, k);
+      binom = binom * (k - j) / (j + 1);
+    }
+  }
+
+  // T R^-1, so that the covariance is (T R^-1) (T R^-1)^T
+  std::vector<std::vector<double>> tr(nPar, std::vector<double>(nPar, 0.0));
+  for (int i = 0; i < nPar; ++i) {
+    for (int k = 0; k < nPar; ++k) {
+      for (int j = 0; j <= k; ++j) {
+        tr[i][k] += trans[i][j] * rInv[j][k];
+      }
+    }
+  }
+
+  fCovar = std::vector<std::vector<double>>(nPar, std::vector<double>(nPar));
+  for (int i = 0; i < nPar; ++i) {
+    for (int j = 0; j < nPar; ++j) {
+      double s = 0.0;
+      for (int k = 0; k < nPar; ++k) {
+        s += tr[i][k] * tr[j][k];
+      }
+      fCovar[i][j] = s;
+    }
+  }
+
+  // Chisquare, evaluated in t
+  fChisquare = 0.0;
+  for (int i = 0; i < nPoints; ++i) {
+    double t = (xs[i] - center) / scale;
+    double bg = c[fBgDeg];
+    for (int k = fBgDeg - 1; k >= 0; --k) {
+      bg = bg * t + c[k];
+    }
+    double res = (ys[i] - bg) / errs[i];
+    fChisquare += res * res;
+  }
+
+  // Copy parameters to new function
+  fFunc = Util::make_unique<TF1>(GetFuncUniqueName("b", this).c_str(), this,
+                                 &PolyBg::_Eval, GetMin(), GetMax(), fBgDeg + 1,
+                                 "PolyBg", "_Eval");
+
+  for (int i = 0; i <= fBgDeg; i++) {
+    double value = 0.0;
+    for (int k = i; k <= fBgDeg; k++) {
+      value += trans[i][k] * c[k];
+    }
+    fFunc->SetParameter(i, value);
+    fFunc->SetParError(i, std::sqrt(fCovar[i][i]));
+  }
+
+  return true;
+}
+
+void PolyBg::_FitMinuit(TH1 &hist) {
+  //! Private: fit the background function with MINUIT
+
   // Create function to be used for fitting
   // Note that a polynomial of degree N has N+1 parameters
   TF1 fitFunc(GetFuncUniqueName("b_fit", this).c_str(), this,
@@ -168,6 +358,32 @@ bool PolyBg::Restore(const TArrayD &values, const TArrayD &errors,
   return true;
 }
 
+bool PolyBg::Restore(const TArrayD &values, const TArrayD &errors,
+                     double ChiSquare, const TArrayD &covar) {
+  //! Restore state of a PolyBg object from saved values, including the
+  //! covariance matrix (given row by row), so that EvalError() works.
+
+  if (covar.GetSize() != (fBgDeg + 1) * (fBgDeg + 1)) {
+    Warning("HDTV::PolyBg::Restore",
+            "size of covariance matrix does not match degree of background.");
+    return false;
+  }
+
+  if (!Restore(values, errors, ChiSquare)) {
+    return false;
+  }
+
+  fCovar = std::vector<std::vector<double>>(fBgDeg + 1,
+                                            std::vector<double>(fBgDeg + 1));
+  for (int i = 0; i <= fBgDeg; i++) {
+    for (int j = 0; j <= fBgDeg; j++) {
+      fCovar[i][j] = covar[i * (fBgDeg + 1) + j];
+    }
+  }
+
+  return true;
+}
+
 void PolyBg::AddRegion(double p1, double p2) {
   //! Adds a histogram region to be considered while fitting the
   //! background. If regions overlap, the values covered by two or
@@ -204,19 +420,25 @@ void PolyBg::AddRegion(double p1, double p2) {
   }
 }
 
-double PolyBg::_EvalRegion(double *x, double *p) {
-  //! Evaluate background function at position x, calling TH1::RejectPoint()
-  //! if x lies outside the defined background region
+bool PolyBg::_InRegion(double x) const {
+  //! Check whether x lies inside the defined background region
 
-  std::list<double>::iterator iter;
+  std::list<double>::const_iterator iter;
 
-  bool reject = true;
-  for (iter = fBgRegions.begin(); iter != fBgRegions.end() && *iter < x[0];
+  bool inside = false;
+  for (iter = fBgRegions.begin(); iter != fBgRegions.end() && *iter < x;
        iter++) {
-    reject = !reject;
+    inside = !inside;
   }
 
-  if (reject) {
+  return inside;
+}
+
+double PolyBg::_EvalRegion(double *x, double *p) {
+  //! Evaluate background function at position x, calling TH1::RejectPoint()
+  //! if x lies outside the defined background region
+
+  if (!_InRegion(x[0])) {
     TF1::RejectPoint();
     return 0.0;
   } else {
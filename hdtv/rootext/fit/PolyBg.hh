@@ -39,7 +39,10 @@ namespace HDTV {
 namespace Fit {
 
 //! Polynomial background fitter
-/** Supports fitting the background in several non-connected regions. */
+/** Supports fitting the background in several non-connected regions.
+ *  As the problem is linear in the coefficients, the fit is done by a direct
+ *  weighted linear least-squares solution (QR decomposition). Fitting with
+ *  MINUIT instead is still possible (SetUseMinuit()). */
 
 class PolyBg : public Background {
 public:
@@ -57,6 +60,17 @@ public:
                  : std::numeric_limits<double>::quiet_NaN();
   }
 
+  //! Element (i, j) of the covariance matrix of the coefficients, or NaN if
+  //! it is not available
+  double GetCovariance(int i, int j) {
+    return fCovar.empty() ? std::numeric_limits<double>::quiet_NaN()
+                          : fCovar[i][j];
+  }
+
+  //! Whether to fit with MINUIT instead of the linear least-squares solver
+  void SetUseMinuit(bool useMinuit) { fUseMinuit = useMinuit; }
+  bool GetUseMinuit() const { return fUseMinuit; }
+
   int GetDegree() { return fBgDeg; }
   double GetChisquare() { return fChisquare; }
   double GetMin() const override {
@@ -70,6 +84,8 @@ public:
 
   void Fit(TH1 &hist);
   bool Restore(const TArrayD &values, const TArrayD &errors, double ChiSquare);
+  bool Restore(const TArrayD &values, const TArrayD &errors, double ChiSquare,
+               const TArrayD &covar);
   void AddRegion(double p1, double p2);
 
   PolyBg *Clone() const override { return new PolyBg(*this); }
@@ -82,11 +98,15 @@ public:
   double EvalError(double x) const override;
 
 private:
+  bool _FitLinear(TH1 &hist);
+  void _FitMinuit(TH1 &hist);
+  bool _InRegion(double x) const;
   double _EvalRegion(double *x, double *p);
   double _Eval(double *x, double *p);
 
   std::list<double> fBgRegions;
   int fBgDeg;
+  bool fUseMinuit;
 
   std::unique_ptr<TF1> fFunc;
   double fChisquare;
@@ -25,6 +25,7 @@
 #include <cmath>
 
 #include <algorithm>
+#include <limits>
 #include <numeric>
 
 #include <TError.h>
@@ -55,7 +56,10 @@ TheuerkaufPeak::TheuerkaufPeak(const Param &pos, const Param &vol,
       fCachedNorm{std::numeric_limits<double>::quiet_NaN()},
       fCachedSigma{std::numeric_limits<double>::quiet_NaN()},
       fCachedTL{std::numeric_limits<double>::quiet_NaN()},
-      fCachedTR{std::numeric_limits<double>::quiet_NaN()} {}
+      fCachedTR{std::numeric_limits<double>::quiet_NaN()},
+      fCachedDLnNormDSigma{std::numeric_limits<double>::quiet_NaN()},
+      fCachedDLnNormDTL{std::numeric_limits<double>::quiet_NaN()},
+      fCachedDLnNormDTR{std::numeric_limits<double>::quiet_NaN()} {}
 
 //! Copy constructor
 //! Does not copy the fPeakFunc pointer, it will be re-generated when needed.
@@ -65,7 +69,10 @@ TheuerkaufPeak::TheuerkaufPeak(const TheuerkaufPeak &src)
       fHasRightTail{src.fHasRightTail}, fHasStep{src.fHasStep},
       fFunc{src.fFunc}, fCachedNorm{src.fCachedNorm},
       fCachedSigma{src.fCachedSigma}, fCachedTL{src.fCachedTL},
-      fCachedTR{src.fCachedTR} {}
+      fCachedTR{src.fCachedTR},
+      fCachedDLnNormDSigma{src.fCachedDLnNormDSigma},
+      fCachedDLnNormDTL{src.fCachedDLnNormDTL},
+      fCachedDLnNormDTR{src.fCachedDLnNormDTR} {}
 
 //! Assignment operator (handles self-assignment implicitly)
 TheuerkaufPeak &TheuerkaufPeak::operator=(const TheuerkaufPeak &src) {
@@ -84,6 +91,9 @@ TheuerkaufPeak &TheuerkaufPeak::operator=(const TheuerkaufPeak &src) {
   fCachedSigma = src.fCachedSigma;
   fCachedTL = src.fCachedTL;
   fCachedTR = src.fCachedTR;
+  fCachedDLnNormDSigma = src.fCachedDLnNormDSigma;
+  fCachedDLnNormDTL = src.fCachedDLnNormDTL;
+  fCachedDLnNormDTR = src.fCachedDLnNormDTR;
 
   // Do not copy the fPeakFunc pointer, it will be generated when needed.
   fPeakFunc.reset(nullptr);
@@ -178,40 +188,157 @@ double TheuerkaufPeak::EvalStep(const double *x, const double *p) const {
   }
 }
 
+//! Partial derivatives of Eval() with respect to the free parameters of this
+//! peak are added to grad (indexed like the parameter array p).
+void TheuerkaufPeak::EvalGradient(const double *x, const double *p,
+                                  double *grad) const {
+  auto addDerivative = [grad](const Param &param, double value) {
+    if (param.IsFree()) {
+      grad[param._Id()] += value;
+    }
+  };
+
+  double dx = *x - fPos.Value(p);
+  double vol = fVol.Value(p);
+  double sigma = fSigma.Value(p);
+  double tl = fTL.Value(p);
+  double tr = fTR.Value(p);
+  double norm = GetNorm(sigma, tl, tr);
+  double sigma2 = sigma * sigma;
+
+  // Exponent of the peak function, and its derivatives with respect to the
+  // position and the tail parameters (d/dsigma is -2 * _x / sigma in all
+  // three cases)
+  double _x, dXdPos, dXdTL = 0.0, dXdTR = 0.0;
+  if (dx < -tl && fHasLeftTail) {
+    _x = tl / sigma2 * (dx + tl / 2.0);
+    dXdPos = -tl / sigma2;
+    dXdTL = (dx + tl) / sigma2;
+  } else if (dx < tr || !fHasRightTail) {
+    _x = -dx * dx / (2.0 * sigma2);
+    dXdPos = dx / sigma2;
+  } else {
+    _x = -tr / sigma2 * (dx - tr / 2.0);
+    dXdPos = tr / sigma2;
+    dXdTR = -(dx - tr) / sigma2;
+  }
+
+  // Peak function
+  double peak = norm * std::exp(_x);
+  addDerivative(fVol, peak);
+  peak *= vol;
+  addDerivative(fPos, peak * dXdPos);
+  addDerivative(fSigma, peak * (fCachedDLnNormDSigma - 2.0 * _x / sigma));
+  if (fHasLeftTail) {
+    addDerivative(fTL, peak * (fCachedDLnNormDTL + dXdTL));
+  }
+  if (fHasRightTail) {
+    addDerivative(fTR, peak * (fCachedDLnNormDTR + dXdTR));
+  }
+
+  // Step function
+  if (fHasStep) {
+    double sh = fSH.Value(p);
+    double sw = fSW.Value(p);
+    double w = sw * dx / (std::sqrt(2.) * sigma);
+    double atanTerm = M_PI / 2. + std::atan(w);
+    double dAtanTerm = 1.0 / (1.0 + w * w);
+
+    double step = norm * sh * atanTerm;
+    addDerivative(fVol, step);
+    step *= vol;
+    double dStepDW = vol * norm * sh * dAtanTerm;
+
+    addDerivative(fPos, -dStepDW * sw / (std::sqrt(2.) * sigma));
+    addDerivative(fSigma, step * fCachedDLnNormDSigma - dStepDW * w / sigma);
+    if (fHasLeftTail) {
+      addDerivative(fTL, step * fCachedDLnNormDTL);
+    }
+    if (fHasRightTail) {
+      addDerivative(fTR, step * fCachedDLnNormDTR);
+    }
+    addDerivative(fSH, vol * norm * atanTerm);
+    addDerivative(fSW, dStepDW * dx / (std::sqrt(2.) * sigma));
+  }
+}
+
 double TheuerkaufPeak::GetNorm(double sigma, double tl, double tr) const {
-  if (fCachedSigma == sigma && fCachedTL == tl && fCachedTR == tr) {
-    return fCachedNorm;
+  if (fCachedSigma != sigma || fCachedTL != tl || fCachedTR != tr) {
+    UpdateNorm(sigma, tl, tr);
   }
 
-  double vol;
+  return fCachedNorm;
+}
+
+//! Calculate the norm and the derivatives of its logarithm (needed for the
+//! gradient), and cache them
+void TheuerkaufPeak::UpdateNorm(double sigma, double tl, double tr) const {
+  double vol, dVolDSigma, dVolDTL = 0.0, dVolDTR = 0.0;
 
   // Contribution from left tail + left half of truncated gaussian
   if (fHasLeftTail) {
-    vol = (sigma * sigma) / tl * std::exp(-(tl * tl) / (2.0 * sigma * sigma));
-    vol +=
-        std::sqrt(M_PI / 2.0) * sigma * std::erf(tl / (std::sqrt(2.0) * sigma));
+    double e = std::exp(-(tl * tl) / (2.0 * sigma * sigma));
+    double erf = std::erf(tl / (std::sqrt(2.0) * sigma));
+    vol = (sigma * sigma) / tl * e;
+    vol += std::sqrt(M_PI / 2.0) * sigma * erf;
+    dVolDSigma = 2.0 * sigma / tl * e + std::sqrt(M_PI / 2.0) * erf;
+    dVolDTL = -(sigma * sigma) / (tl * tl) * e;
   } else {
     vol = std::sqrt(M_PI / 2.0) * sigma;
+    dVolDSigma = std::sqrt(M_PI / 2.0);
   }
 
   // Contribution from right tail + right half of truncated gaussian
   if (fHasRightTail) {
-    vol += (sigma * sigma) / tr * std::exp(-(tr * tr) / (2.0 * sigma * sigma));
-    vol +=
-        std::sqrt(M_PI / 2.0) * sigma * std::erf(tr / (std::sqrt(2.0) * sigma));
+    double e = std::exp(-(tr * tr) / (2.0 * sigma * sigma));
+    double erf = std::erf(tr / (std::sqrt(2.0) * sigma));
+    vol += (sigma * sigma) / tr * e;
+    vol += std::sqrt(M_PI / 2.0) * sigma * erf;
+    dVolDSigma += 2.0 * sigma / tr * e + std::sqrt(M_PI / 2.0) * erf;
+    dVolDTR = -(sigma * sigma) / (tr * tr) * e;
   } else {
     vol += std::sqrt(M_PI / 2.0) * sigma;
+    dVolDSigma += std::sqrt(M_PI / 2.0);
   }
 
   fCachedSigma = sigma;
   fCachedTL = tl;
   fCachedTR = tr;
   fCachedNorm = 1. / vol;
-
-  return fCachedNorm;
+  fCachedDLnNormDSigma = -dVolDSigma / vol;
+  fCachedDLnNormDTL = -dVolDTL / vol;
+  fCachedDLnNormDTR = -dVolDTR / vol;
 }
 
 // *** TheuerkaufFitter ***
+
+//! Sum function handed to the minimizer: a TF1 that provides the analytic
+//! gradient with respect to the parameters (used with fit option "G"),
+//! instead of the finite differences of TF1::GradientPar.
+class TheuerkaufFitter::SumFunc : public TF1 {
+public:
+  SumFunc(const char *name, TheuerkaufFitter *fitter, double min, double max,
+          int numParams)
+      : TF1(name, fitter, &TheuerkaufFitter::Eval, min, max, numParams,
+            "TheuerkaufFitter", "Eval"),
+        fFitter(fitter), fGrad(numParams) {}
+
+  double GradientPar(int ipar, const double *x, double eps = 0.01) override {
+    GradientPar(x, fGrad.data(), eps);
+    return fGrad[ipar];
+  }
+
+  void GradientPar(const double *x, double *grad,
+                   double /* eps */ = 0.01) override {
+    std::fill(grad, grad + GetNpar(), 0.0);
+    fFitter->EvalGradient(x, GetParameters(), grad);
+  }
+
+private:
+  const TheuerkaufFitter *fFitter;
+  std::vector<double> fGrad;
+};
+
 void TheuerkaufFitter::AddPeak(const TheuerkaufPeak &peak) {
   //! Adds a peak to the peak list
 
@@ -226,6 +353,8 @@ void TheuerkaufFitter::AddPeak(const TheuerkaufPeak &peak) {
 double TheuerkaufFitter::Eval(const double *x, const double *p) const {
   //! Private: evaluation function for fit
 
+  ++fNumEvals;
+
   // Evaluate background function, if it has been given
   double sum = fBackground ? fBackground->Eval(*x) : 0.0;
 
@@ -242,6 +371,23 @@ double TheuerkaufFitter::Eval(const double *x, const double *p) const {
                          });
 }
 
+void TheuerkaufFitter::EvalGradient(const double *x, const double *p,
+                                    double *grad) const {
+  //! Private: partial derivatives of Eval() with respect to all parameters
+
+  // Internal background
+  double xPow = 1.0;
+  for (int i = fNumParams - fIntBgDeg - 1; i < fNumParams; ++i) {
+    grad[i] += xPow;
+    xPow *= *x;
+  }
+
+  // Peaks
+  for (const auto &peak : fPeaks) {
+    peak.EvalGradient(x, p, grad);
+  }
+}
+
 double TheuerkaufFitter::EvalBg(const double *x, const double *p) const {
   //! Private: evaluation function for background
 
@@ -331,9 +477,14 @@ void TheuerkaufFitter::_Fit(TH1 &hist) {
   }
 
   // Create fit function
-  fSumFunc = Util::make_unique<TF1>(GetFuncUniqueName("f", this).c_str(), this,
-                                    &TheuerkaufFitter::Eval, fMin, fMax,
-                                    fNumParams, "TheuerkaufFitter", "Eval");
+  if (fUseGradient) {
+    fSumFunc = Util::make_unique<SumFunc>(GetFuncUniqueName("f", this).c_str(),
+                                          this, fMin, fMax, fNumParams);
+  } else {
+    fSumFunc = Util::make_unique<TF1>(GetFuncUniqueName("f", this).c_str(),
+                                      this, &TheuerkaufFitter::Eval, fMin, fMax,
+                                      fNumParams, "TheuerkaufFitter", "Eval");
+  }
 
   PeakVector_t::const_iterator citer;
 
@@ -548,10 +699,11 @@ void TheuerkaufFitter::_Fit(TH1 &hist) {
 
   if (!fDebugShowInipar) {
     // Now, do the fit
-    hist.Fit(fSumFunc.get(), "RQNM");
+    hist.Fit(fSumFunc.get(), fUseGradient ? "RQNMG" : "RQNM");
 
-    // Store Chi^2
+    // Store Chi^2 and the covariance matrix
     fChisquare = fSumFunc->GetChisquare();
+    StoreCovariance();
   }
 
   // Finalize fitter
@@ -62,6 +62,7 @@ public:
   double Eval(const double *x, const double *p) const;
   double EvalNoStep(const double *x, const double *p) const;
   double EvalStep(const double *x, const double *p) const;
+  void EvalGradient(const double *x, const double *p, double *grad) const;
 
   double GetPos() const { return fPos.Value(fFunc); }
   double GetPosError() const { return fPos.Error(fFunc); }
@@ -156,8 +157,16 @@ public:
 
   TF1 *GetPeakFunc();
 
+  //! Indices of the parameters pos, vol, sigma, tl, tr, sh and sw in the fit
+  //! function (-1 if the parameter is not free)
+  std::vector<int> GetParamIds() const {
+    return {fPos._Id(), fVol._Id(), fSigma._Id(), fTL._Id(),
+            fTR._Id(),  fSH._Id(),  fSW._Id()};
+  }
+
 private:
   double GetNorm(double sigma, double tl, double tr) const;
+  void UpdateNorm(double sigma, double tl, double tr) const;
 
   Param fPos, fVol, fSigma, fTL, fTR, fSH, fSW;
   bool fHasLeftTail, fHasRightTail, fHasStep;
@@ -165,6 +174,8 @@ private:
   std::unique_ptr<TF1> fPeakFunc;
 
   mutable double fCachedNorm, fCachedSigma, fCachedTL, fCachedTR;
+  // Derivatives of log(norm) with respect to sigma, tl and tr
+  mutable double fCachedDLnNormDSigma, fCachedDLnNormDTL, fCachedDLnNormDTR;
 
   void RestoreParam(const Param &param, double value, double error);
 
@@ -175,7 +186,8 @@ private:
 class TheuerkaufFitter : public Fitter {
 public:
   TheuerkaufFitter(double r1, double r2, bool debugShowInipar = false)
-      : Fitter(r1, r2), fDebugShowInipar(debugShowInipar) {}
+      : Fitter(r1, r2), fDebugShowInipar(debugShowInipar),
+        fUseGradient(true) {}
 
   // Copying the fitter is not supported
   TheuerkaufFitter(const TheuerkaufFitter &) = delete;
@@ -189,6 +201,11 @@ public:
   const TheuerkaufPeak &GetPeak(int i) { return fPeaks[i]; }
   TF1 *GetSumFunc() { return fSumFunc.get(); }
 
+  //! Whether the minimizer is given the analytic gradient of the fit function
+  //! (default), or has to estimate it from finite differences
+  void SetUseGradient(bool useGradient) { fUseGradient = useGradient; }
+  bool GetUseGradient() const { return fUseGradient; }
+
   TF1 *GetBgFunc();
   bool Restore(const Background &bg, double ChiSquare);
   bool Restore(const TArrayD &bgPolValues, const TArrayD &bgPolErrors,
@@ -198,13 +215,17 @@ private:
   using PeakVector_t = std::vector<TheuerkaufPeak>;
   using PeakID_t = PeakVector_t::size_type;
 
+  class SumFunc;
+
   double Eval(const double *x, const double *p) const;
+  void EvalGradient(const double *x, const double *p, double *grad) const;
   double EvalBg(const double *x, const double *p) const;
   void _Fit(TH1 &hist);
   void _Restore(double ChiSquare);
 
   std::vector<TheuerkaufPeak> fPeaks;
   bool fDebugShowInipar;
+  bool fUseGradient;
 };
 
 } // end namespace Fit
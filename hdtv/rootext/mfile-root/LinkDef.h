@@ -8,6 +8,9 @@
 #pragma link C++ class VMatrix+;
 #pragma link C++ class MFMatrix+;
 #pragma link C++ class RMatrix+;
+#pragma link C++ class MMapMatrix+;
 #pragma link C++ class MatOp+;
+#pragma link C++ class MatProjector+;
+#pragma link C++ class MatTransposer+;
 
 #endif
@@ -0,0 +1,316 @@
+/*
+ * HDTV - A ROOT-based spectrum analysis software
+ *  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+ *
+ * This file is part of HDTV.
+ *
+ * HDTV is free software; you can redistribute it and/or modify it
+ * under the terms of the GNU General Public License as published by the
+ * Free Software Foundation; either version 2 of the License, or (at your
+ * option) any later version.
+ *
+ * HDTV is distributed in the hope that it will be useful, but WITHOUT
+ * ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+ * FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+ * for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with HDTV; if not, write to the Free Software Foundation,
+ * Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+ *
+ */
+
+#include "MMapMatrix.hh"
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <mfile.h>
+
+namespace {
+
+// Maximum number of lines (spread over the matrix) searched for values with
+// the sign bit set in MMapMatrix::Verify()
+const int kSignSampleLines = 64;
+
+bool HostIsBigEndian() {
+  const uint16_t one = 1;
+  return *reinterpret_cast<const uint8_t *>(&one) == 0;
+}
+
+inline uint16_t Swap(uint16_t x) { return __builtin_bswap16(x); }
+inline uint32_t Swap(uint32_t x) { return __builtin_bswap32(x); }
+inline uint64_t Swap(uint64_t x) { return __builtin_bswap64(x); }
+
+// Decode a single value of type T (stored as the unsigned integer type U of
+// the same size) from unaligned memory
+template <class T, class U, bool swap> inline double Decode(const char *p) {
+  U raw;
+  std::memcpy(&raw, p, sizeof(U));
+  if (swap) {
+    raw = Swap(raw);
+  }
+  T value;
+  std::memcpy(&value, &raw, sizeof(T));
+  return static_cast<double>(value);
+}
+
+template <class T, class U, bool swap>
+void AddLinesT(const std::vector<double *> &dsts, const char *src, int n,
+               int cols) {
+  if (dsts.size() == 1) {
+    double *dst = dsts.front();
+    for (int i = 0; i < n; ++i) {
+      const char *line = src + static_cast<size_t>(i) * cols * sizeof(T);
+      for (int c = 0; c < cols; ++c) {
+        dst[c] += Decode<T, U, swap>(line + c * sizeof(T));
+      }
+    }
+    return;
+  }
+
+  // Decode every line only once, no matter how many targets it belongs to
+  std::vector<double> buf(cols);
+  for (int i = 0; i < n; ++i) {
+    const char *line = src + static_cast<size_t>(i) * cols * sizeof(T);
+    for (int c = 0; c < cols; ++c) {
+      buf[c] = Decode<T, U, swap>(line + c * sizeof(T));
+    }
+    for (double *dst : dsts) {
+      for (int c = 0; c < cols; ++c) {
+        dst[c] += buf[c];
+      }
+    }
+  }
+}
+
+template <class T, class U>
+void AddLinesT(const std::vector<double *> &dsts, const char *src, int n,
+               int cols, bool swap) {
+  if (swap) {
+    AddLinesT<T, U, true>(dsts, src, n, cols);
+  } else {
+    AddLinesT<T, U, false>(dsts, src, n, cols);
+  }
+}
+
+template <class T, class U>
+void GetLineT(double *buf, const char *src, int cols, bool swap) {
+  for (int c = 0; c < cols; ++c) {
+    buf[c] = swap ? Decode<T, U, true>(src + c * sizeof(T))
+                  : Decode<T, U, false>(src + c * sizeof(T));
+  }
+}
+
+// Check whether any value of the line has its most significant bit set.
+// msb is the offset of the byte holding that bit inside each value.
+bool HasSignBit(const char *src, int cols, int size, int msb) {
+  for (int c = 0; c < cols; ++c) {
+    if (src[c * size + msb] & 0x80) {
+      return true;
+    }
+  }
+  return false;
+}
+
+} // end anonymous namespace
+
+MMapMatrix::MMapMatrix(const char *fname, MFileHist *mat, unsigned int level)
+    : VMatrix(), fMap(nullptr), fMapSize(0), fData(nullptr), fType(VT_INT32),
+      fValueSize(0), fSwap(false), fLines(mat->GetNLines()),
+      fColumns(mat->GetNColumns()) {
+  bool bigEndian = false;
+  switch (mat->GetFileType()) {
+  case MAT_HE2:
+    bigEndian = true;
+    /* FALLTHROUGH */
+  case MAT_LE2:
+    fType = VT_INT16;
+    fValueSize = 2;
+    break;
+  case MAT_HE4:
+    bigEndian = true;
+    /* FALLTHROUGH */
+  case MAT_LE4:
+    fType = VT_INT32;
+    fValueSize = 4;
+    break;
+  case MAT_HF4:
+    bigEndian = true;
+    /* FALLTHROUGH */
+  case MAT_LF4:
+    fType = VT_FLOAT;
+    fValueSize = 4;
+    break;
+  case MAT_HF8:
+    bigEndian = true;
+    /* FALLTHROUGH */
+  case MAT_LF8:
+    fType = VT_DOUBLE;
+    fValueSize = 8;
+    break;
+  default:
+    fFail = true;
+    return;
+  }
+  fSwap = (bigEndian != HostIsBigEndian());
+
+  if (level >= mat->GetNLevels() || fLines == 0 || fColumns == 0) {
+    fFail = true;
+    return;
+  }
+
+  int fd = open(fname, O_RDONLY);
+  if (fd < 0) {
+    fFail = true;
+    return;
+  }
+
+  // Raw formats have no header, so the file must contain exactly
+  // levels * lines * columns values
+  struct stat st;
+  size_t levelSize = static_cast<size_t>(fLines) * fColumns * fValueSize;
+  if (fstat(fd, &st) != 0 ||
+      static_cast<size_t>(st.st_size) != levelSize * mat->GetNLevels()) {
+    close(fd);
+    fFail = true;
+    return;
+  }
+
+  fMapSize = st.st_size;
+  fMap = mmap(nullptr, fMapSize, PROT_READ, MAP_SHARED, fd, 0);
+  close(fd);
+  if (fMap == MAP_FAILED) {
+    fMap = nullptr;
+    fFail = true;
+    return;
+  }
+  fData = static_cast<const char *>(fMap) + level * levelSize;
+
+  if (!Verify(mat, level)) {
+    fFail = true;
+  }
+}
+
+MMapMatrix::~MMapMatrix() {
+  if (fMap) {
+    munmap(fMap, fMapSize);
+  }
+}
+
+bool MMapMatrix::Verify(MFileHist *mat, unsigned int level) {
+  // Compare the first and the last line with what libmfile reads, to make
+  // sure the layout of the file has been understood correctly (the size of
+  // the file has already been checked)
+  std::vector<int> lines = {0, fLines - 1};
+
+  // Integer values are decoded as signed by default. Whether libmfile reads
+  // them as signed or unsigned is decided on the first of a sample of lines
+  // holding a value with the sign bit set; without such a value, both
+  // readings agree. Only the sample is read, so that opening the matrix
+  // stays cheap.
+  std::vector<double> ref(fColumns), buf(fColumns);
+  if (fType == VT_INT16 || fType == VT_INT32) {
+    bool bigEndian = (fSwap != HostIsBigEndian());
+    int msb = bigEndian ? 0 : fValueSize - 1;
+    const int samples = std::min(fLines, kSignSampleLines);
+    for (int i = 0; i < samples; ++i) {
+      int l = (samples > 1)
+                  ? static_cast<int>(static_cast<long>(fLines - 1) * i /
+                                     (samples - 1))
+                  : 0;
+      auto line = static_cast<const char *>(GetLineData(l));
+      if (!HasSignBit(line, fColumns, fValueSize, msb)) {
+        continue;
+      }
+      if (!mat->FillBuf1D(ref.data(), level, l) || !GetLine(buf.data(), l)) {
+        return false;
+      }
+      if (ref != buf) {
+        fType = (fType == VT_INT16) ? VT_UINT16 : VT_UINT32;
+      }
+      lines.push_back(l);
+      break;
+    }
+  }
+
+  for (int l : lines) {
+    if (!mat->FillBuf1D(ref.data(), level, l) || !GetLine(buf.data(), l) ||
+        ref != buf) {
+      return false;
+    }
+  }
+  return true;
+}
+
+const void *MMapMatrix::GetLineData(int l) const {
+  if (!fData || l < 0 || l >= fLines) {
+    return nullptr;
+  }
+  return fData + static_cast<size_t>(l) * fColumns * fValueSize;
+}
+
+bool MMapMatrix::GetLine(double *buf, int l) {
+  auto src = static_cast<const char *>(GetLineData(l));
+  if (!src) {
+    return false;
+  }
+  switch (fType) {
+  case VT_INT16:
+    GetLineT<int16_t, uint16_t>(buf, src, fColumns, fSwap);
+    break;
+  case VT_UINT16:
+    GetLineT<uint16_t, uint16_t>(buf, src, fColumns, fSwap);
+    break;
+  case VT_INT32:
+    GetLineT<int32_t, uint32_t>(buf, src, fColumns, fSwap);
+    break;
+  case VT_UINT32:
+    GetLineT<uint32_t, uint32_t>(buf, src, fColumns, fSwap);
+    break;
+  case VT_FLOAT:
+    GetLineT<float, uint32_t>(buf, src, fColumns, fSwap);
+    break;
+  case VT_DOUBLE:
+    GetLineT<double, uint64_t>(buf, src, fColumns, fSwap);
+    break;
+  }
+  return true;
+}
+
+bool MMapMatrix::AddLines(const std::vector<double *> &dsts, int l, int n) {
+  if (l < 0 || n < 0 || l + n > fLines) {
+    return false;
+  }
+  auto src = static_cast<const char *>(GetLineData(l));
+  if (!src) {
+    return false;
+  }
+  switch (fType) {
+  case VT_INT16:
+    AddLinesT<int16_t, uint16_t>(dsts, src, n, fColumns, fSwap);
+    break;
+  case VT_UINT16:
+    AddLinesT<uint16_t, uint16_t>(dsts, src, n, fColumns, fSwap);
+    break;
+  case VT_INT32:
+    AddLinesT<int32_t, uint32_t>(dsts, src, n, fColumns, fSwap);
+    break;
+  case VT_UINT32:
+    AddLinesT<uint32_t, uint32_t>(dsts, src, n, fColumns, fSwap);
+    break;
+  case VT_FLOAT:
+    AddLinesT<float, uint32_t>(dsts, src, n, fColumns, fSwap);
+    break;
+  case VT_DOUBLE:
+    AddLinesT<double, uint64_t>(dsts, src, n, fColumns, fSwap);
+    break;
+  }
+  return true;
+}
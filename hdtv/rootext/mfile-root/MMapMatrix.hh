@@ -0,0 +1,87 @@
+/*
+ * HDTV - A ROOT-based spectrum analysis software
+ *  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+ *
+ * This file is part of HDTV.
+ *
+ * HDTV is free software; you can redistribute it and/or modify it
+ * under the terms of the GNU General Public License as published by the
+ * Free Software Foundation; either version 2 of the License, or (at your
+ * option) any later version.
+ *
+ * HDTV is distributed in the hope that it will be useful, but WITHOUT
+ * ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+ * FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+ * for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with HDTV; if not, write to the Free Software Foundation,
+ * Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+ *
+ */
+
+#ifndef __MMapMatrix_h__
+#define __MMapMatrix_h__
+
+#include <cmath>
+#include <cstddef>
+
+#include "VMatrix.hh"
+
+//! Memory-mapped VMatrix for uncompressed mfile matrices
+/*!
+ * Supports the raw formats le2, le4, he2, he4, lf4, hf4, lf8 and hf8. The
+ * file is mapped read-only, so lines are summed straight from the page cache
+ * and several processes working on the same matrix share the same physical
+ * pages. Whether integer values are signed is taken from libmfile, by
+ * comparing a line holding a value with the sign bit set, out of a sample of
+ * at most 64 lines (values are read as signed if there is none). If the
+ * matrix is not in one of these formats (or its layout cannot be verified
+ * against libmfile), Failed() returns true and MFMatrix should be used
+ * instead.
+ */
+class MMapMatrix : public VMatrix {
+public:
+  MMapMatrix(const char *fname, MFileHist *mat, unsigned int level);
+  ~MMapMatrix() override;
+
+  int FindCutBin(double x) override // convert channel to bin number
+  {
+    return std::ceil(x - 0.5);
+  }
+
+  int GetCutLowBin() override { return 0; }
+  int GetCutHighBin() override { return fLines - 1; }
+
+  double GetProjXmin() override { return -0.5; }
+  double GetProjXmax() override { return fColumns - .5; }
+  int GetProjXbins() override { return fColumns; }
+
+  bool GetLine(double *buf, int l) override;
+  bool AddLines(const std::vector<double *> &dsts, int l, int n) override;
+
+  //! Pointer to the raw (undecoded) data of line l inside the mapping
+  const void *GetLineData(int l) const;
+
+private:
+  enum ValueType {
+    VT_INT16,
+    VT_UINT16,
+    VT_INT32,
+    VT_UINT32,
+    VT_FLOAT,
+    VT_DOUBLE
+  };
+
+  bool Verify(MFileHist *mat, unsigned int level);
+
+  void *fMap;
+  size_t fMapSize;
+  const char *fData; // start of the selected level
+  ValueType fType;
+  int fValueSize;
+  bool fSwap; // byte order of file differs from host
+  int fLines, fColumns;
+};
+
+#endif
@@ -22,12 +22,10 @@
 
 #include "MatOp.hh"
 
-#include <iostream>
+#include <algorithm>
+#include <thread>
 
-#include "MFileRoot.hh"
 #include "matop/matop_adjust.h"
-#include "matop/matop_conv.h"
-#include "matop/matop_project.h"
 
 const int MatOp::ERR_SUCCESS = 0;
 const int MatOp::ERR_UNKNOWN = 1;
@@ -40,7 +38,8 @@ const int MatOp::ERR_PROJ_FAIL = 7;
 const int MatOp::ERR_TRANS_OPEN = 8;
 const int MatOp::ERR_TRANS_FMT = 9;
 const int MatOp::ERR_TRANS_FAIL = 10;
-const int MatOp::MAX_ERR = 10;
+const int MatOp::ERR_NO_OUTPUT = 11;
+const int MatOp::MAX_ERR = 11;
 
 const char *MatOp::ErrDesc[] = {
     "Success",                                      // ERR_SUCCESS
@@ -53,94 +52,377 @@ const char *MatOp::ErrDesc[] = {
     "Projection failed",                            // ERR_PROJ_FAIL
     "Failed to open output file for transposition", // ERR_TRANS_OPEN
     "Incompatible formats in transposition",        // ERR_TRANS_FMT
-    "Transposition failed"                          // ERR_TRANS_FAIL
+    "Transposition failed",                         // ERR_TRANS_FAIL
+    "No output file given"                          // ERR_NO_OUTPUT
 };
 
 int MatOp::Project(const char *src_fname, const char *prx_fname,
-                   const char *pry_fname) {
+                   const char *pry_fname, int nthreads) {
+  MatProjector projector(src_fname, nthreads);
+  return projector.Write(prx_fname, pry_fname);
+}
+
+int MatOp::Transpose(const char *src_fname, const char *dst_fname,
+                     int nthreads) {
+  MatTransposer transposer(src_fname, dst_fname, nthreads);
+  return transposer.Finish();
+}
+
+const char *MatOp::GetErrorString(int error_nr) {
+  if (error_nr < 0 || error_nr > MAX_ERR) {
+    error_nr = ERR_UNKNOWN;
+  }
+
+  return ErrDesc[error_nr];
+}
+
+namespace {
+
+int NumThreads(int nthreads) {
+  if (nthreads <= 0) {
+    nthreads = static_cast<int>(std::thread::hardware_concurrency());
+  }
+  return std::max(nthreads, 1);
+}
+
+// libmfile makes no promises about thread safety. Several threads (each with
+// its own handle) are only used for the raw formats, whose accessors merely
+// seek and read on the handle they are given. Other formats may keep global
+// state (e.g. decompression buffers) and are read by a single thread.
+bool ParallelSafe(MFILE *mat) {
+  minfo info;
+  if (mgetinfo(mat, &info) != 0) {
+    return false;
+  }
+  switch (info.filetype) {
+  case MAT_LE2:
+  case MAT_HE2:
+  case MAT_LE4:
+  case MAT_HE4:
+  case MAT_LF4:
+  case MAT_HF4:
+  case MAT_LF8:
+  case MAT_HF8:
+    return true;
+  default:
+    return false;
+  }
+}
+
+// Open one handle of the source matrix per thread: an MFILE keeps its own
+// read state and must not be shared between threads. Falls back to a single
+// handle if the format is not known to be safe for parallel reading.
+bool OpenSources(std::vector<std::unique_ptr<MFile>> &src, const char *fname,
+                 int nthreads) {
+  for (int t = 0; t < nthreads; ++t) {
+    src.emplace_back(new MFile(fname, "r"));
+    if (src.back()->IsZombie() || src.back()->IsNull()) {
+      return false;
+    }
+    if (t == 0 && !ParallelSafe(src.back()->File())) {
+      break;
+    }
+  }
+  return true;
+}
+
+// Split [begin, end) into (at most) nthreads stripes of consecutive lines and
+// call func(thread, first, last) for each of them in parallel. Returns false
+// if any call failed.
+template <class Func>
+bool ForEachStripe(int nthreads, int begin, int end, Func func) {
+  const long n = end - begin;
+  nthreads = static_cast<int>(std::min<long>(nthreads, n));
+  if (nthreads <= 1) {
+    return n <= 0 || func(0, begin, end);
+  }
+
+  std::vector<char> ok(nthreads, 0);
+  std::vector<std::thread> threads;
+  for (int t = 0; t < nthreads; ++t) {
+    int first = begin + static_cast<int>(n * t / nthreads);
+    int last = begin + static_cast<int>(n * (t + 1) / nthreads);
+    threads.emplace_back(
+        [&func, &ok, t, first, last]() { ok[t] = func(t, first, last); });
+  }
+  for (auto &thread : threads) {
+    thread.join();
+  }
+  return std::all_of(ok.begin(), ok.end(), [](char c) { return c != 0; });
+}
+
+// Number of lines read at once by a thread in MatTransposer::Step()
+const int kTransposeBlock = 64;
+
+} // end anonymous namespace
+
+MatProjector::MatProjector(const char *src_fname, int nthreads)
+    : fError(MatOp::ERR_SUCCESS), fLevels(0), fLines(0), fColumns(0),
+      fLevel(0), fLine(0) {
+  if (!OpenSources(fSrc, src_fname, NumThreads(nthreads))) {
+    fError = MatOp::ERR_SRC_OPEN;
+    return;
+  }
+
+  minfo info;
+  mgetinfo(fSrc[0]->File(), &info);
+  if (info.levels > 2) {
+    // Only matrices with one or two levels can be projected
+    fError = MatOp::ERR_PROJ_FAIL;
+    return;
+  }
+
+  fLevels = info.levels;
+  fLines = info.lines;
+  fColumns = info.columns;
+  fPartial.assign(fSrc.size(), std::vector<double>(fColumns, 0.0));
+  fPrx.assign(static_cast<size_t>(fLevels) * fColumns, 0.0);
+  fPry.assign(static_cast<size_t>(fLevels) * fLines, 0.0);
+}
+
+MatProjector::~MatProjector() = default;
+
+//! Project the next nlines lines. Returns true if there is more work to do.
+bool MatProjector::Step(int nlines) {
+  if (Done()) {
+    return false;
+  }
+
+  const int level = fLevel;
+  const int first = fLine;
+  const int last = std::min(fLines, first + std::max(nlines, 1));
+  const int columns = fColumns;
+  double *pry = fPry.data() + static_cast<size_t>(level) * fLines;
+
+  bool ok = ForEachStripe(
+      fSrc.size(), first, last, [&](int t, int l0, int l1) {
+        MFILE *src = fSrc[t]->File();
+        double *__restrict prx = fPartial[t].data();
+        std::vector<double> buf(columns);
+        const double *__restrict line = buf.data();
+
+        for (int l = l0; l < l1; ++l) {
+          if (mgetdbl(src, buf.data(), level, l, 0, columns) != columns) {
+            return false;
+          }
+          double sum = 0.0;
+          for (int c = 0; c < columns; ++c) {
+            prx[c] += line[c];
+            sum += line[c];
+          }
+          pry[l] = sum;
+        }
+        return true;
+      });
+
+  if (!ok) {
+    fError = MatOp::ERR_PROJ_FAIL;
+    return false;
+  }
+
+  fLine = last;
+  if (fLine >= fLines) {
+    FinishLevel();
+  }
+  return !Done();
+}
+
+//! Reduce the partial x projections of all threads
+void MatProjector::FinishLevel() {
+  double *prx = fPrx.data() + static_cast<size_t>(fLevel) * fColumns;
+  for (auto &partial : fPartial) {
+    for (int c = 0; c < fColumns; ++c) {
+      prx[c] += partial[c];
+    }
+    std::fill(partial.begin(), partial.end(), 0.0);
+  }
+  ++fLevel;
+  fLine = 0;
+}
+
+double MatProjector::GetProgress() {
+  double total = static_cast<double>(fLevels) * fLines;
+  if (Done() || total <= 0.0) {
+    return 1.0;
+  }
+  return (static_cast<double>(fLevel) * fLines + fLine) / total;
+}
+
+//! Finish the projection (if necessary) and write it. Empty or null file
+//! names skip the respective projection, but at least one must be given.
+int MatProjector::Write(const char *prx_fname, const char *pry_fname) {
+  if (fError != MatOp::ERR_SUCCESS) {
+    return fError;
+  }
   if (prx_fname && !(*prx_fname)) {
     prx_fname = nullptr;
   }
   if (pry_fname && !(*pry_fname)) {
     pry_fname = nullptr;
   }
-
-  MFile in_matrix(src_fname, "r");
-  if (in_matrix.IsZombie()) {
-    return ERR_SRC_OPEN;
+  if (!prx_fname && !pry_fname) {
+    return MatOp::ERR_NO_OUTPUT;
   }
 
-  // std::cout << "Info: input format is " << mgetfmt(in_matrix, NULL) <<
-  // std::endl;
+  MFILE *in_matrix = fSrc[0]->File();
 
   MFile out_prx(prx_fname, "w");
   if (out_prx.IsZombie()) {
-    return ERR_PRX_OPEN;
+    return MatOp::ERR_PRX_OPEN;
   }
-
-  if (!out_prx.IsNull()) {
-    if (matop_adjustfmts_prx(static_cast<MFILE *>(out_prx),
-                             static_cast<MFILE *>(in_matrix)) != 0) {
-      return ERR_PRX_FMT;
-    }
+  if (!out_prx.IsNull() &&
+      matop_adjustfmts_prx(out_prx.File(), in_matrix) != 0) {
+    return MatOp::ERR_PRX_FMT;
   }
 
   MFile out_pry(pry_fname, "w");
   if (out_pry.IsZombie()) {
-    return ERR_PRY_OPEN;
+    return MatOp::ERR_PRY_OPEN;
+  }
+  if (!out_pry.IsNull() &&
+      matop_adjustfmts_pry(out_pry.File(), in_matrix) != 0) {
+    return MatOp::ERR_PRY_FMT;
   }
 
-  if (!out_pry.IsNull()) {
-    if (matop_adjustfmts_pry(static_cast<MFILE *>(out_pry),
-                             static_cast<MFILE *>(in_matrix)) != 0) {
-      return ERR_PRY_FMT;
-    }
+  while (Step()) {
+  }
+  if (fError != MatOp::ERR_SUCCESS) {
+    return fError;
   }
 
-  if (matop_proj(static_cast<MFILE *>(out_prx), static_cast<MFILE *>(out_pry),
-                 static_cast<MFILE *>(in_matrix)) != 0) {
-    return ERR_PROJ_FAIL;
+  for (int level = 0; level < fLevels; ++level) {
+    double *prx = fPrx.data() + static_cast<size_t>(level) * fColumns;
+    double *pry = fPry.data() + static_cast<size_t>(level) * fLines;
+    if (!out_prx.IsNull() &&
+        mputdbl(out_prx.File(), prx, level, 0, 0, fColumns) != fColumns) {
+      return MatOp::ERR_PROJ_FAIL;
+    }
+    if (!out_pry.IsNull() &&
+        mputdbl(out_pry.File(), pry, level, 0, 0, fLines) != fLines) {
+      return MatOp::ERR_PROJ_FAIL;
+    }
   }
 
-  return ERR_SUCCESS;
+  return MatOp::ERR_SUCCESS;
 }
 
-int MatOp::Transpose(const char *src_fname, const char *dst_fname) {
-  MFile in_matrix(src_fname, "r");
-  if (in_matrix.IsZombie()) {
-    return ERR_SRC_OPEN;
+MatTransposer::MatTransposer(const char *src_fname, const char *dst_fname,
+                             int nthreads, int tile_mb)
+    : fError(MatOp::ERR_SUCCESS), fLevels(0), fLines(0), fColumns(0),
+      fLevel(0), fColumn(0), fTileColumns(1) {
+  if (!OpenSources(fSrc, src_fname, NumThreads(nthreads))) {
+    fError = MatOp::ERR_SRC_OPEN;
+    return;
   }
 
-  // std::cout << "Info: input format is " << mgetfmt(in_matrix, NULL) <<
-  // std::endl;
+  fDst.reset(new MFile(dst_fname, "w"));
+  if (fDst->IsZombie() || fDst->IsNull()) {
+    fError = MatOp::ERR_TRANS_OPEN;
+    return;
+  }
 
-  MFile out_matrix(dst_fname, "w");
-  if (out_matrix.IsZombie()) {
-    return ERR_TRANS_OPEN;
+  if (matop_adjustfmts_trans(fDst->File(), fSrc[0]->File()) != 0) {
+    fError = MatOp::ERR_TRANS_FMT;
+    return;
   }
 
-  if (matop_adjustfmts_trans(static_cast<MFILE *>(out_matrix),
-                             static_cast<MFILE *>(in_matrix)) != 0) {
-    return ERR_TRANS_FMT;
+  // matop_adjustfmts_trans() may have changed the shape of the source
+  minfo info;
+  mgetinfo(fSrc[0]->File(), &info);
+  for (size_t t = 1; t < fSrc.size(); ++t) {
+    if (msetinfo(fSrc[t]->File(), &info) != 0) {
+      fError = MatOp::ERR_TRANS_FMT;
+      return;
+    }
   }
 
-  // std::cout << "Info: output format is " << mgetfmt(out_matrix, NULL) <<
-  // std::endl;
+  fLevels = info.levels;
+  fLines = info.lines;
+  fColumns = info.columns;
+
+  // Number of columns that fit into a tile of tile_mb megabytes
+  size_t tileValues = static_cast<size_t>(std::max(tile_mb, 1)) << 17;
+  size_t cols = tileValues / std::max<size_t>(fLines, 1);
+  fTileColumns = static_cast<int>(
+      std::max<size_t>(1, std::min<size_t>(cols, std::max(fColumns, 1))));
+  fTile.resize(static_cast<size_t>(fTileColumns) * fLines);
+}
 
-  if (matop_conv(static_cast<MFILE *>(out_matrix),
-                 static_cast<MFILE *>(in_matrix), MAT_TRANS) != 0) {
-    return ERR_TRANS_FAIL;
+MatTransposer::~MatTransposer() = default;
+
+//! Transpose the next tile of columns. Returns true if there is more work to
+//! do.
+bool MatTransposer::Step() {
+  if (Done()) {
+    return false;
   }
 
-  matop_conv_free_cache();
+  const int level = fLevel;
+  const int c0 = fColumn;
+  const int n = std::min(fTileColumns, fColumns - c0);
+  const size_t lines = fLines;
+  double *tile = fTile.data();
+
+  // Line l of the source ends up in column l of the tile, i.e. the tile holds
+  // n complete lines of the transpose. Lines are read in small blocks, which
+  // are then transposed into the tile, so that the writes are not all strided.
+  bool ok = ForEachStripe(
+      fSrc.size(), 0, fLines, [&](int t, int l0, int l1) {
+        MFILE *src = fSrc[t]->File();
+        std::vector<double> block(static_cast<size_t>(kTransposeBlock) * n);
+
+        for (int b0 = l0; b0 < l1; b0 += kTransposeBlock) {
+          const int nb = std::min(kTransposeBlock, l1 - b0);
+          for (int b = 0; b < nb; ++b) {
+            if (mgetdbl(src, block.data() + static_cast<size_t>(b) * n, level,
+                        b0 + b, c0, n) != n) {
+              return false;
+            }
+          }
+          for (int k = 0; k < n; ++k) {
+            double *__restrict dst = tile + k * lines + b0;
+            const double *__restrict s = block.data() + k;
+            for (int b = 0; b < nb; ++b) {
+              dst[b] = s[static_cast<size_t>(b) * n];
+            }
+          }
+        }
+        return true;
+      });
+
+  if (!ok) {
+    fError = MatOp::ERR_TRANS_FAIL;
+    return false;
+  }
 
-  return ERR_SUCCESS;
+  MFILE *dst = fDst->File();
+  for (int k = 0; k < n; ++k) {
+    if (mputdbl(dst, tile + k * lines, level, c0 + k, 0, fLines) != fLines) {
+      fError = MatOp::ERR_TRANS_FAIL;
+      return false;
+    }
+  }
+
+  fColumn += n;
+  if (fColumn >= fColumns) {
+    fColumn = 0;
+    ++fLevel;
+  }
+  return !Done();
 }
 
-const char *MatOp::GetErrorString(int error_nr) {
-  if (error_nr < 0 || error_nr > MAX_ERR) {
-    error_nr = ERR_UNKNOWN;
+double MatTransposer::GetProgress() {
+  double total = static_cast<double>(fLevels) * fColumns;
+  if (Done() || total <= 0.0) {
+    return 1.0;
   }
+  return (static_cast<double>(fLevel) * fColumns + fColumn) / total;
+}
 
-  return ErrDesc[error_nr];
+//! Finish the transposition (if necessary) and close the output file
+int MatTransposer::Finish() {
+  while (Step()) {
+  }
+  fDst.reset();
+  return fError;
 }
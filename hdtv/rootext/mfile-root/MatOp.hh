@@ -23,11 +23,18 @@
 #ifndef __MatOp_h__
 #define __MatOp_h__
 
+#include <memory>
+#include <vector>
+
+#include "MFileRoot.hh"
+
 class MatOp {
 public:
+  // nthreads = 0 uses all available cores
   static int Project(const char *src_fname, const char *prx_fname,
-                     const char *pry_fname = nullptr);
-  static int Transpose(const char *src_fname, const char *dst_fname);
+                     const char *pry_fname = nullptr, int nthreads = 0);
+  static int Transpose(const char *src_fname, const char *dst_fname,
+                       int nthreads = 0);
 
   static const char *GetErrorString(int error_nr);
 
@@ -42,9 +49,76 @@ public:
   const static int ERR_TRANS_OPEN;
   const static int ERR_TRANS_FMT;
   const static int ERR_TRANS_FAIL;
+  const static int ERR_NO_OUTPUT;
   const static int MAX_ERR;
 
   const static char *ErrDesc[];
 };
 
+//! Projection of a matrix onto both axes
+/*!
+ * The lines of the matrix are processed in steps (see Step()), so that the
+ * caller can report progress. Each step is split into stripes of lines, one
+ * per thread, and every thread reads its stripe through its own handle of the
+ * source file. The per-thread partial x projections are summed up once each
+ * level is complete. Only raw (uncompressed) matrices are read by several
+ * threads, as libmfile is not known to be thread-safe for the other formats.
+ * Matrices with more than two levels are rejected (ERR_PROJ_FAIL).
+ */
+class MatProjector {
+public:
+  explicit MatProjector(const char *src_fname, int nthreads = 0);
+  ~MatProjector();
+
+  bool Step(int nlines = 256);
+  bool Done() { return fError != MatOp::ERR_SUCCESS || fLevel >= fLevels; }
+  double GetProgress();
+  int Write(const char *prx_fname, const char *pry_fname = nullptr);
+  int GetError() { return fError; }
+
+private:
+  void FinishLevel();
+
+  std::vector<std::unique_ptr<MFile>> fSrc;
+  int fError;
+  int fLevels, fLines, fColumns;
+  int fLevel, fLine;
+  std::vector<std::vector<double>> fPartial;
+  std::vector<double> fPrx, fPry;
+};
+
+//! Transposition of a matrix
+/*!
+ * The matrix is transposed in tiles of complete columns, so that the output
+ * is written line by line and the source is read line by line, instead of
+ * fetching single columns. Each step (see Step()) handles one tile, reading
+ * stripes of lines of the source in parallel (for raw matrices only, see
+ * MatProjector).
+ *
+ * Every tile reads all lines of the source again, but only the columns
+ * belonging to the tile. For raw matrices, the whole source is thus read
+ * once in total; compressed lines, however, are decoded once per tile. A
+ * matrix of up to tile_mb megabytes (as doubles) is done in a single tile.
+ */
+class MatTransposer {
+public:
+  MatTransposer(const char *src_fname, const char *dst_fname,
+                int nthreads = 0, int tile_mb = 256);
+  ~MatTransposer();
+
+  bool Step();
+  bool Done() { return fError != MatOp::ERR_SUCCESS || fLevel >= fLevels; }
+  double GetProgress();
+  int Finish();
+  int GetError() { return fError; }
+
+private:
+  std::vector<std::unique_ptr<MFile>> fSrc;
+  std::unique_ptr<MFile> fDst;
+  int fError;
+  int fLevels, fLines, fColumns;
+  int fLevel, fColumn, fTileColumns;
+  std::vector<double> fTile;
+};
+
 #endif
@@ -22,9 +22,9 @@
 
 #include "VMatrix.hh"
 
+#include <algorithm>
 #include <cmath>
-
-#include <TArrayD.h>
+#include <string>
 
 void VMatrix::AddRegion(std::list<int> &reglist, int l1, int l2) {
   std::list<int>::iterator iter, next;
@@ -63,107 +63,223 @@ void VMatrix::AddRegion(std::list<int> &reglist, int l1, int l2) {
   }
 }
 
-class ReadException {};
+bool VMatrix::RegionsContain(const std::list<int> &reglist, int l) {
+  auto iter = reglist.begin();
+  while (iter != reglist.end()) {
+    int l1 = *iter++;
+    int l2 = *iter++;
+    if (l >= l1 && l <= l2) {
+      return true;
+    }
+  }
+  return false;
+}
 
-TH1 *VMatrix::Cut(const char *histname, const char *histtitle) {
-  int l, l1, l2; // lines
-  std::list<int>::iterator iter;
-  int nCut = 0, nBg = 0; // total number of cut and background lines
-  int pbins = GetProjXbins();
+std::vector<VMatrix::ReadRun>
+VMatrix::GetReadPlan(const TargetList &targets) {
+  // Collect the boundaries of all regions; between two neighbouring
+  // boundaries, a line is either in a region of a target or not
+  std::vector<int> bounds;
+  for (auto reglist : targets) {
+    auto iter = reglist->begin();
+    while (iter != reglist->end()) {
+      bounds.push_back(*iter++);
+      bounds.push_back(*iter++ + 1);
+    }
+  }
+  std::sort(bounds.begin(), bounds.end());
+  bounds.erase(std::unique(bounds.begin(), bounds.end()), bounds.end());
 
-  if (Failed()) {
-    return nullptr;
+  std::vector<ReadRun> plan;
+  for (size_t i = 0; i + 1 < bounds.size(); ++i) {
+    ReadRun run{bounds[i], bounds[i + 1] - 1, {}};
+    for (size_t t = 0; t < targets.size(); ++t) {
+      if (RegionsContain(*targets[t], run.first)) {
+        run.targets.push_back(t);
+      }
+    }
+    if (run.targets.empty()) {
+      continue;
+    }
+    if (!plan.empty() && plan.back().last + 1 == run.first &&
+        plan.back().targets == run.targets) {
+      plan.back().last = run.last;
+    } else {
+      plan.push_back(run);
+    }
   }
+  return plan;
+}
 
-  if (fCutRegions.empty()) {
-    return nullptr;
+bool VMatrix::GetLines(double *buf, int l, int n) {
+  int pbins = GetProjXbins();
+  for (int i = 0; i < n; ++i) {
+    if (!GetLine(buf + static_cast<size_t>(i) * pbins, l + i)) {
+      return false;
+    }
   }
+  return true;
+}
 
-  // Sum of cut lines
-  TArrayD sum(pbins);
-  sum.Reset(0.0);
+namespace {
+// Maximum number of values read in one block (8 MB)
+constexpr size_t kBlockValues = 1 << 20;
 
-  // Sum of background lines
-  TArrayD bg(pbins);
-  bg.Reset(0.0);
+inline void AddTo(double *__restrict dst, const double *__restrict src,
+                  int n) {
+  for (int i = 0; i < n; ++i) {
+    dst[i] += src[i];
+  }
+}
+} // end anonymous namespace
 
-  try {
-    // Add up all cut lines
-    iter = fCutRegions.begin();
-    while (iter != fCutRegions.end()) {
-      l1 = *iter++;
-      l2 = *iter++;
-      for (l = l1; l <= l2; l++) {
-        AddLine(sum, l);
-        nCut++;
-      }
+bool VMatrix::AddLines(const std::vector<double *> &dsts, int l, int n) {
+  int pbins = GetProjXbins();
+  fBlock.resize(static_cast<size_t>(n) * pbins);
+  if (!GetLines(fBlock.data(), l, n)) {
+    return false;
+  }
+  for (int i = 0; i < n; ++i) {
+    const double *line = fBlock.data() + static_cast<size_t>(i) * pbins;
+    for (double *dst : dsts) {
+      AddTo(dst, line, pbins);
     }
+  }
+  return true;
+}
+
+bool VMatrix::SumLines(const TargetList &targets,
+                       std::vector<std::vector<double>> &sums,
+                       std::vector<int> &nLines) {
+  int pbins = GetProjXbins();
+  sums.assign(targets.size(), std::vector<double>(pbins, 0.0));
+  nLines.assign(targets.size(), 0);
 
-    // Add up all background lines
-    iter = fBgRegions.begin();
-    while (iter != fBgRegions.end()) {
-      l1 = *iter++;
-      l2 = *iter++;
-      for (l = l1; l <= l2; l++) {
-        AddLine(bg, l);
-        nBg++;
+  // Each line that is part of any target is read exactly once, in ascending
+  // order and in blocks of consecutive lines.
+  int blockLines = std::max(1, static_cast<int>(kBlockValues / pbins));
+  std::vector<double *> dsts;
+  for (const auto &run : GetReadPlan(targets)) {
+    dsts.clear();
+    for (int t : run.targets) {
+      dsts.push_back(sums[t].data());
+      nLines[t] += run.last - run.first + 1;
+    }
+    for (int l = run.first; l <= run.last; l += blockLines) {
+      int n = std::min(blockLines, run.last - l + 1);
+      if (!AddLines(dsts, l, n)) {
+        return false;
       }
     }
-  } catch (ReadException &) {
-    return nullptr;
   }
+  fBlock.clear();
+  fBlock.shrink_to_fit();
+  return true;
+}
 
+TH1 *VMatrix::MakeCutHist(const char *histname, const char *histtitle,
+                          const std::vector<double> &sum,
+                          const std::vector<double> &bg, int nCut, int nBg) {
+  int pbins = GetProjXbins();
   double bgFac = (nBg == 0) ? 0.0 : static_cast<double>(nCut) / nBg;
   auto hist = new TH1D(histname, histtitle, GetProjXbins(), GetProjXmin(),
                         GetProjXmax());
   // cols, -0.5, (double) cols - 0.5);
+  double *content = hist->GetArray();
   for (int c = 0; c < pbins; c++) {
-    hist->SetBinContent(c + 1, sum[c] - bg[c] * bgFac);
+    content[c + 1] = sum[c] - bg[c] * bgFac;
   }
+  hist->SetEntries(pbins);
 
   return hist;
 }
 
+TH1 *VMatrix::Cut(const char *histname, const char *histtitle) {
+  if (Failed()) {
+    return nullptr;
+  }
+
+  if (fCutRegions.empty()) {
+    return nullptr;
+  }
+
+  std::vector<std::vector<double>> sums;
+  std::vector<int> nLines;
+  if (!SumLines({&fCutRegions, &fBgRegions}, sums, nLines)) {
+    return nullptr;
+  }
+
+  return MakeCutHist(histname, histtitle, sums[0], sums[1], nLines[0],
+                     nLines[1]);
+}
+
+int VMatrix::StoreGate() {
+  fGates.emplace_back(fCutRegions, fBgRegions);
+  ResetRegions();
+  return fGates.size() - 1;
+}
+
+std::vector<TH1 *> VMatrix::MultiCut(const char *histname,
+                                     const char *histtitle) {
+  std::vector<TH1 *> hists;
+
+  if (Failed()) {
+    return hists;
+  }
+
+  // Cut and background regions of gate i are targets 2*i and 2*i+1
+  TargetList targets;
+  for (const auto &gate : fGates) {
+    if (gate.first.empty()) {
+      return hists;
+    }
+    targets.push_back(&gate.first);
+    targets.push_back(&gate.second);
+  }
+
+  std::vector<std::vector<double>> sums;
+  std::vector<int> nLines;
+  if (!SumLines(targets, sums, nLines)) {
+    return hists;
+  }
+
+  for (size_t i = 0; i < fGates.size(); ++i) {
+    std::string name = std::string(histname) + "_" + std::to_string(i);
+    hists.push_back(MakeCutHist(name.c_str(), histtitle, sums[2 * i],
+                                sums[2 * i + 1], nLines[2 * i],
+                                nLines[2 * i + 1]));
+  }
+  return hists;
+}
+
 RMatrix::RMatrix(TH2 *hist, ProjAxis_t paxis)
     : VMatrix(), fHist(hist), fProjAxis(paxis) {}
 
-void RMatrix::AddLine(TArrayD &dst, int l) {
+bool RMatrix::GetLine(double *buf, int l) {
   if (fProjAxis == PROJ_X) {
     int cols = fHist->GetNbinsX();
 
     for (int c = 1; c <= cols; ++c) {
-      // Bad for speed; overloaded operator[] checks array bounds
-      dst[c - 1] += fHist->GetBinContent(c, l);
+      buf[c - 1] = fHist->GetBinContent(c, l);
     }
   } else {
     int cols = fHist->GetNbinsY();
 
     for (int c = 1; c <= cols; ++c) {
-      // Bad for speed; overloaded operator[] checks array bounds
-      dst[c - 1] += fHist->GetBinContent(l, c);
+      buf[c - 1] = fHist->GetBinContent(l, c);
     }
   }
+  return true;
 }
 
 MFMatrix::MFMatrix(MFileHist *mat, unsigned int level)
-    : VMatrix(), fMatrix(mat), fLevel(level), fBuf() {
+    : VMatrix(), fMatrix(mat), fLevel(level) {
   // Sanity checks
   if (fLevel >= fMatrix->GetNLevels()) {
     fFail = true;
-  } else {
-    fBuf.Set(fMatrix->GetNColumns());
   }
 }
 
-void MFMatrix::AddLine(TArrayD &dst, int l) {
-  if (!fMatrix->FillBuf1D(fBuf.GetArray(), fLevel, l)) {
-    throw ReadException();
-  }
-
-  int cols = fMatrix->GetNColumns();
-
-  for (int c = 0; c < cols; ++c) {
-    // Bad for speed; overloaded operator[] checks array bounds
-    dst[c] += fBuf[c];
-  }
+bool MFMatrix::GetLine(double *buf, int l) {
+  return fMatrix->FillBuf1D(buf, fLevel, l) != nullptr;
 }
@@ -24,6 +24,8 @@
 #define __VMatrix_h__
 
 #include <list>
+#include <utility>
+#include <vector>
 
 #include <TH1.h>
 #include <TH2.h>
@@ -62,6 +64,17 @@ public:
 
   TH1 *Cut(const char *histname, const char *histtitle);
 
+  //! Store the current cut and background regions as a gate for MultiCut,
+  //! and reset them. Returns the index of the gate.
+  int StoreGate();
+  void ResetGates() { fGates.clear(); }
+  int GetNGates() { return fGates.size(); }
+
+  //! Execute all stored gates in a single pass over the matrix. The result
+  //! contains one histogram per gate (named histname_<index>), or is empty
+  //! on failure.
+  std::vector<TH1 *> MultiCut(const char *histname, const char *histtitle);
+
   // Cut axis info
   virtual int FindCutBin(double x) = 0;
   virtual int GetCutLowBin() = 0;
@@ -72,13 +85,41 @@ public:
   virtual double GetProjXmax() = 0;
   virtual int GetProjXbins() = 0;
 
-  virtual void AddLine(TArrayD &dst, int l) = 0;
+  //! Read line l into buf, which must hold GetProjXbins() values
+  virtual bool GetLine(double *buf, int l) = 0;
+  //! Read the n consecutive lines l, ..., l+n-1 into buf, which must hold
+  //! n*GetProjXbins() values
+  virtual bool GetLines(double *buf, int l, int n);
+  //! Add the n consecutive lines l, ..., l+n-1 to each of the arrays in dsts
+  //! (of GetProjXbins() values each)
+  virtual bool AddLines(const std::vector<double *> &dsts, int l, int n);
 
   bool Failed() { return fFail; }
 
+protected:
+  //! A run of consecutive lines, which all belong to the same targets
+  struct ReadRun {
+    int first, last;          // inclusive
+    std::vector<int> targets; // indices of targets containing these lines
+  };
+  typedef std::vector<const std::list<int> *> TargetList;
+
+  //! Merge the regions of all targets into sorted, disjoint runs of lines
+  static std::vector<ReadRun> GetReadPlan(const TargetList &targets);
+  //! Sum up the lines of each target, reading every line only once
+  bool SumLines(const TargetList &targets,
+                std::vector<std::vector<double>> &sums,
+                std::vector<int> &nLines);
+  TH1 *MakeCutHist(const char *histname, const char *histtitle,
+                   const std::vector<double> &sum,
+                   const std::vector<double> &bg, int nCut, int nBg);
+
 private:
   void AddRegion(std::list<int> &reglist, int c1, int c2);
+  static bool RegionsContain(const std::list<int> &reglist, int l);
   std::list<int> fCutRegions, fBgRegions;
+  std::vector<std::pair<std::list<int>, std::list<int>>> fGates;
+  std::vector<double> fBlock; // read buffer of AddLines
 
 protected:
   bool fFail;
@@ -116,7 +157,7 @@ public:
     return (fProjAxis == PROJ_X) ? fHist->GetNbinsX() : fHist->GetNbinsY();
   }
 
-  void AddLine(TArrayD &dst, int l) override;
+  bool GetLine(double *buf, int l) override;
 
 private:
   TH2 *fHist;
@@ -141,12 +182,11 @@ public:
   double GetProjXmax() override { return fMatrix->GetNColumns() - .5; }
   int GetProjXbins() override { return fMatrix->GetNColumns(); }
 
-  void AddLine(TArrayD &dst, int l) override;
+  bool GetLine(double *buf, int l) override;
 
 private:
   MFileHist *fMatrix;
   unsigned int fLevel;
-  TArrayD fBuf;
 };
 
 #endif
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+# ----------------------------------------------------------------------
+# Running hdtv jobs in a persistent server process (hdtv --serve and
+# hdtv --client)
+# ----------------------------------------------------------------------
+
+# Do not import ROOT (or modules that do) at module level: the client
+# must start fast.
+import io
+import os
+import sys
+import json
+import signal
+import socket
+import tempfile
+import traceback
+from array import array
+
+
+def DefaultSocket():
+    """
+    Return the path of the server socket: $HDTV_SOCKET if set, otherwise
+    hdtv.sock in the user runtime directory
+    """
+    path = os.getenv("HDTV_SOCKET")
+    if path:
+        return path
+    rundir = os.getenv("XDG_RUNTIME_DIR")
+    if rundir:
+        return os.path.join(rundir, "hdtv.sock")
+    return os.path.join(tempfile.gettempdir(), "hdtv-%d.sock" % os.getuid())
+
+
+def _CheckSupport():
+    if not hasattr(socket, "AF_UNIX") or \
+       not hasattr(socket.socket, "sendmsg"):
+        raise RuntimeError(
+            "The hdtv server requires Python 3 on a Unix system")
+
+
+def _Send(sock, message, fds=()):
+    """
+    Send message (a dict) as a line of JSON, along with the file
+    descriptors fds
+    """
+    data = (json.dumps(message) + "\n").encode("utf-8")
+    ancdata = []
+    if fds:
+        ancdata = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array("i", fds))]
+    sent = sock.sendmsg([data], ancdata)
+    if sent < len(data):
+        sock.sendall(data[sent:])
+
+
+def _Receive(sock, maxfds=0):
+    """
+    Receive a message sent with _Send. Returns (message, fds); message is
+    None if the connection was closed before a complete message arrived.
+    """
+    fds = array("i")
+    (data, ancdata, flags, addr) = sock.recvmsg(
+        4096, socket.CMSG_LEN(maxfds * fds.itemsize) if maxfds else 0)
+    for (level, kind, cdata) in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cdata[:len(cdata) - len(cdata) % fds.itemsize])
+    while data and not data.endswith(b"\n"):
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    if not data.endswith(b"\n"):
+        return (None, list(fds))
+    return (json.loads(data.decode("utf-8")), list(fds))
+
+
+class Server(object):
+    """
+    Server running hdtv jobs sent by clients over a Unix domain socket
+
+    The server is an hdtv process that has done its (expensive) startup
+    once: ROOT, the hdtv libraries, the plugins and the database are
+    loaded. Each job runs in a worker process forked from the server,
+    i.e. in a private copy of the warm session: jobs cannot see or change
+    each other's spectra, fits or options. At most `workers` jobs run at
+    the same time, further clients wait until a worker is done.
+
+    A job consists of a batch file and/or a line of commands (like hdtv -b
+    and hdtv -e), the working directory of the client and its standard
+    input, output and error (passed as file descriptors), so the job
+    behaves as if hdtv had been started by the client.
+    """
+
+    # Interval (in seconds) in which finished workers are collected while
+    # no client connects
+    reapInterval = 1.0
+
+    def __init__(self, path=None, workers=None):
+        self.path = path or DefaultSocket()
+        self.workers = max(workers or os.cpu_count() or 1, 1)
+        self.sock = None
+        self.children = set()
+
+    def Bind(self):
+        """
+        Create the server socket
+        """
+        _CheckSupport()
+        if os.path.exists(self.path):
+            # Remove stale sockets, but do not take over the socket of a
+            # running server
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except (OSError, IOError):
+                os.remove(self.path)
+            else:
+                raise RuntimeError(
+                    "An hdtv server is already running on %s" % self.path)
+            finally:
+                probe.close()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only the user may connect
+        umask = os.umask(0o177)
+        try:
+            self.sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.sock.listen(max(self.workers, 16))
+
+    def Serve(self):
+        """
+        Run jobs until a client asks the server to stop (or until it is
+        interrupted or terminated)
+        """
+        import hdtv.ui
+        if self.sock is None:
+            self.Bind()
+        signal.signal(signal.SIGTERM, _Terminate)
+        # Wake up regularly to collect finished workers, so that they do
+        # not remain as zombies until the next client connects (accepted
+        # connections are blocking nevertheless)
+        self.sock.settimeout(self.reapInterval)
+        hdtv.ui.msg("hdtv server listening on %s (%d workers)" %
+                    (self.path, self.workers))
+        try:
+            while True:
+                try:
+                    (conn, addr) = self.sock.accept()
+                except socket.timeout:
+                    self.Reap()
+                    continue
+                self.Reap()
+                while len(self.children) >= self.workers:
+                    self.Reap(block=True)
+                if not self.Dispatch(conn):
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        hdtv.ui.msg("hdtv server stopped")
+
+    def Reap(self, block=False):
+        """
+        Collect finished workers (waiting for one if block is True)
+        """
+        while self.children:
+            try:
+                (pid, status) = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except OSError:
+                self.children.clear()
+                break
+            if pid == 0:
+                break
+            self.children.discard(pid)
+            if block:
+                break
+
+    def Dispatch(self, conn):
+        """
+        Handle a client connection. Returns False if the server shall stop.
+        """
+        fds = []
+        try:
+            try:
+                (request, fds) = _Receive(conn, maxfds=3)
+            except (OSError, IOError, ValueError):
+                return True
+            if request is None:
+                return True
+            if request.get("stop"):
+                _Send(conn, {"status": 0})
+                return False
+            pid = os.fork()
+            if pid == 0:
+                self._Work(conn, request, fds)
+            self.children.add(pid)
+            return True
+        finally:
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+
+    def _Work(self, conn, request, fds):
+        """
+        Run a job in the worker process (never returns)
+        """
+        status = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self.sock.close()
+            status = RunJob(request, fds)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                _Send(conn, {"status": status})
+            except BaseException:
+                pass
+            os._exit(status)
+
+
+def _Terminate(signum, frame):
+    raise KeyboardInterrupt
+
+
+def RunJob(request, fds):
+    """
+    Run the job described by request, with the standard input, output and
+    error given by fds. Returns the exit status (1 if there were errors).
+    """
+    import hdtv.cmdline
+    import hdtv.ui
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for (target, fd) in zip((0, 1, 2), fds):
+        os.dup2(fd, target)
+    # Python may have replaced the standard streams by something else than
+    # the file descriptors (e.g. to capture output)
+    if len(fds) > 1:
+        sys.stdout = io.open(1, "w", buffering=1, closefd=False)
+        hdtv.ui.ui.stdout = sys.stdout
+    if len(fds) > 2:
+        sys.stderr = io.open(2, "w", buffering=1, closefd=False)
+        hdtv.ui.ui.stderr = sys.stderr
+        hdtv.ui.ui.debugout = sys.stderr
+
+    if request.get("cwd"):
+        os.chdir(request["cwd"])
+    hdtv.ui.ui.errors = 0
+    command_line = hdtv.cmdline.command_line
+    if request.get("batchfile"):
+        command_line.ExecCmdfile(request["batchfile"])
+    if request.get("commands") and command_line.fKeepRunning:
+        command_line.DoLine(request["commands"])
+    return 1 if hdtv.ui.ui.errors else 0
+
+
+def Client(path=None, commands=None, batchfile=None, stop=False):
+    """
+    Run a job (a batch file and/or a line of commands) on the server at
+    path, with the standard input, output and error of this process, or ask
+    the server to stop. Returns the exit status of the job.
+    """
+    _CheckSupport()
+    path = path or DefaultSocket()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except (OSError, IOError) as err:
+            sys.stderr.write("ERROR: Could not connect to hdtv server on "
+                             "%s: %s\n" % (path, err))
+            return 2
+        if stop:
+            _Send(sock, {"stop": True})
+        else:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            _Send(sock, {"cwd": os.getcwd(), "batchfile": batchfile,
+                         "commands": commands}, fds=(0, 1, 2))
+        (reply, fds) = _Receive(sock)
+    finally:
+        sock.close()
+    if reply is None:
+        sys.stderr.write("ERROR: hdtv server closed the connection\n")
+        return 1
+    return reply["status"]
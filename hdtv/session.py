@@ -20,8 +20,11 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
 # main session of hdtv
+import os
 import copy
 
+import ROOT
+
 import hdtv.cal
 import hdtv.rootext.display
 import hdtv.rootext.fit
@@ -31,6 +34,7 @@ from hdtv.drawable import DrawableManager
 from hdtv.fitter import Fitter
 from hdtv.fit import Fit
 from hdtv.cut import Cut
+from hdtv.weakref import weakref
 from hdtv.integral import Integrate
 
 
@@ -43,8 +47,17 @@ class Session(DrawableManager):
     and of a list of calibrations.
     """
 
-    def __init__(self):
-        self.window = Window()
+    def __init__(self, headless=None):
+        """
+        With headless=True, the session runs without ROOT GUI: spectra and
+        fits are not displayed at all (see hdtv.window.NullViewport). By
+        default, this is selected by the HDTV_HEADLESS environment variable.
+        """
+        if headless is None:
+            headless = os.getenv("HDTV_HEADLESS", "") not in ("", "0")
+        if headless:
+            ROOT.gROOT.SetBatch(True)
+        self.window = Window(headless=headless)
         super(Session, self).__init__(viewport=self.window.viewport)
         # TODO: make peakModel and bgdeg configurable
         self.workFit = Fit(Fitter(peakModel="theuerkauf", bgdeg=1))
@@ -262,6 +275,37 @@ class Session(DrawableManager):
             ID = spec.matrix.ID
             self.Insert(cutSpec, ID=hdtv.util.ID(ID.major, 1010))
 
+    def ExecuteCuts(self, cuts):
+        """
+        Execute a list of cuts on the matrix of the active spectrum in a
+        single pass and store them, together with their cut spectra (as
+        StoreCut does for the workCut). Returns the IDs of the stored cuts.
+        """
+        spec = self.GetActiveObject()
+        if spec is None:
+            hdtv.ui.error("There is no active spectrum")
+            return []
+        if not hasattr(spec, "matrix") or spec.matrix is None:
+            hdtv.ui.error("Active spectrum does not belong to a matrix")
+            return []
+        mat = spec.matrix
+        axis = spec.axis
+        cutSpecs = mat.ExecuteCuts(cuts, axis)
+
+        ids = []
+        self.window.viewport.LockUpdate()
+        try:
+            # store the cuts with new IDs
+            mat.ActivateObject(None)
+            for (cut, cutSpec) in zip(cuts, cutSpecs):
+                cut.matrix = mat
+                cut.axis = axis
+                cut.spec = weakref(cutSpec)
+                ids.append(self._StoreCut(mat, cut, cutSpec))
+        finally:
+            self.window.viewport.UnlockUpdate()
+        return ids
+
     def ClearCut(self):
         self.workCut.regionMarkers.Clear()
         self.workCut.bgMarkers.Clear()
@@ -297,20 +341,29 @@ class Session(DrawableManager):
         if not hasattr(spec, "matrix") or spec.matrix is None:
             hdtv.ui.error("Active spectrum does not belong to a matrix")
             return
-        mat = spec.matrix
-        ID = mat.Insert(self.workCut, ID)
-        mat.dict[ID].active = False
-        mat.ActivateObject(None)
+        cutSpec = None
         if self.workCut.spec is not None:
-            spec = self.Pop(self.Index(self.workCut.spec))
-            # give it a new color
-            spec.color = hdtv.color.ColorForID(ID.major)
-            self.Insert(spec, ID=hdtv.util.ID(mat.ID.major, ID.major))
+            cutSpec = self.Pop(self.Index(self.workCut.spec))
+        ID = self._StoreCut(spec.matrix, self.workCut, cutSpec, ID)
         hdtv.ui.msg("Storing workCut with ID %s" % ID)
         self.workCut = copy.copy(self.workCut)
         self.workCut.active = True
         self.workCut.Draw(self.window.viewport)
 
+    def _StoreCut(self, mat, cut, cutSpec=None, ID=None):
+        """
+        Store cut in the matrix mat and insert its cut spectrum (if any) with
+        the ID belonging to the stored cut. Returns the ID of the cut.
+        """
+        ID = mat.Insert(cut, ID)
+        mat.dict[ID].active = False
+        mat.ActivateObject(None)
+        if cutSpec is not None:
+            # give it a new color
+            cutSpec.color = hdtv.color.ColorForID(ID.major)
+            self.Insert(cutSpec, ID=hdtv.util.ID(mat.ID.major, ID.major))
+        return ID
+
     # Overwrite some functions of DrawableManager to do some extra work
     def ActivateObject(self, ID):
         """
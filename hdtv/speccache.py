@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+# ----------------------------------------------------------------------
+# Persistent on-disk cache of decoded spectra
+# ----------------------------------------------------------------------
+
+import os
+import hashlib
+
+import numpy
+import ROOT
+
+import hdtv.options
+import hdtv.ui
+from hdtv.rootext.dlmgr import cachepath
+from hdtv.util import AsArray, AtomicWrite
+
+# Increase whenever the layout of the cache entries changes
+CACHE_VERSION = 1
+
+
+def HistToArray(hist):
+    """
+    Return the 1d histogram hist as a (3, nbins+2) float64 array:
+     row 0: bin edges (nbins+1 values), followed by 1.0 for a variable bin
+            width axis and 0.0 for a fixed bin width axis
+     row 1: bin contents, including underflow and overflow bin
+     row 2: bin errors, including underflow and overflow bin, or NaN if the
+            histogram does not store errors (sqrt(N) errors)
+    """
+    nbins = hist.GetNbinsX()
+    data = numpy.empty((3, nbins + 2))
+
+    axis = hist.GetXaxis()
+    if axis.IsVariableBinSize():
+        data[0, :nbins + 1] = AsArray(axis.GetXbins().GetArray(), nbins + 1)
+        data[0, nbins + 1] = 1.
+    else:
+        data[0, :nbins + 1] = numpy.linspace(
+            axis.GetXmin(), axis.GetXmax(), nbins + 1)
+        data[0, nbins + 1] = 0.
+    data[1] = AsArray(hist.GetArray(), nbins + 2)
+    if hist.GetSumw2N() > 0:
+        data[2] = numpy.sqrt(AsArray(hist.GetSumw2().GetArray(), nbins + 2))
+    else:
+        data[2] = numpy.nan
+    return data
+
+
+def ArrayToHist(data, histname, histtitle):
+    """
+    Return a new TH1D from an array in the layout of HistToArray()
+    """
+    nbins = data.shape[1] - 2
+    if data[0, nbins + 1]:
+        edges = numpy.ascontiguousarray(data[0, :nbins + 1])
+        hist = ROOT.TH1D(histname, histtitle, nbins, edges)
+    else:
+        hist = ROOT.TH1D(histname, histtitle, nbins,
+                         data[0, 0], data[0, nbins])
+    hist.SetContent(numpy.ascontiguousarray(data[1]))
+    if not numpy.isnan(data[2, 0]):
+        hist.SetError(numpy.ascontiguousarray(data[2]))
+    return hist
+
+
+class SpectrumCache(object):
+    """
+    Cache of decoded 1d spectra
+
+    Each entry is a single .npy file holding the array of HistToArray(),
+    so that it can be memory-mapped when read back.
+
+    Entries are keyed by the absolute path, size, modification time and
+    format of the source file, so a modified file simply yields a new entry.
+    The least recently used entries are removed when the total size exceeds
+    maxsize (in MB). The total size is determined from the directory once
+    and then tracked while entries are added; the directory is scanned again
+    only when the size exceeds the limit.
+    """
+
+    def __init__(self, path, maxsize=512):
+        self.path = path
+        self.maxsize = maxsize
+        # Total size of the entries in bytes, None if not determined yet
+        self.size = None
+
+    def Key(self, fname, fmt):
+        """
+        Return the cache key for file fname read with format fmt
+        """
+        st = os.stat(fname)
+        mtime = getattr(st, "st_mtime_ns", st.st_mtime)
+        ident = repr((CACHE_VERSION, os.path.abspath(fname),
+                      st.st_size, mtime, fmt.lower()))
+        return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+    def Filename(self, key):
+        return os.path.join(self.path, key + ".npy")
+
+    def Get(self, fname, fmt, histname, histtitle):
+        """
+        Return a new TH1D for fname read with format fmt, or None if it is
+        not in the cache.
+        """
+        try:
+            entry = self.Filename(self.Key(fname, fmt))
+            data = numpy.load(entry, mmap_mode="r")
+            # Mark as recently used
+            os.utime(entry, None)
+        except (OSError, IOError, ValueError):
+            return None
+
+        return ArrayToHist(data, histname, histtitle)
+
+    def Put(self, fname, fmt, hist):
+        """
+        Store the 1d histogram hist read from file fname with format fmt
+        """
+        if hist.GetNbinsX() < 1:
+            return
+        data = HistToArray(hist)
+
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            entry = self.Filename(self.Key(fname, fmt))
+            with AtomicWrite(entry, "wb") as f:
+                numpy.save(f, data)
+            size = os.path.getsize(entry)
+        except (OSError, IOError) as err:
+            hdtv.ui.debug("Could not write spectrum cache entry: %s" % err)
+            return
+
+        # A replaced entry (or entries of other processes) make this an
+        # estimate, which Evict() corrects
+        if self.size is not None:
+            self.size += size
+        if self.size is None or self.size > self.maxsize * 1024 * 1024:
+            self.Evict()
+
+    def Evict(self):
+        """
+        Remove the least recently used entries until the cache is smaller
+        than maxsize
+        """
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".npy"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+
+        total = sum(e[1] for e in entries)
+        limit = self.maxsize * 1024 * 1024
+        for (mtime, size, name) in sorted(entries):
+            if total <= limit:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+        self.size = total
+
+    def Clear(self):
+        """
+        Remove all entries
+        """
+        self.size = None
+        if not os.path.isdir(self.path):
+            return
+        for name in os.listdir(self.path):
+            if name.endswith(".npy"):
+                os.remove(os.path.join(self.path, name))
+
+
+cache = SpectrumCache(os.path.join(cachepath, "spectra"))
+
+
+def _SetMaxSize(opt):
+    cache.maxsize = opt.Get()
+
+
+opt = hdtv.options.Option(default=True, parse=hdtv.options.parse_bool)
+hdtv.options.RegisterOption("spectrum.cache", opt)
+opt = hdtv.options.Option(default=512, parse=lambda x: int(x),
+                          changeCallback=_SetMaxSize)
+hdtv.options.RegisterOption("spectrum.cache.max_size", opt)
@@ -21,9 +21,13 @@
 
 from __future__ import print_function
 
-import array
 import os
+import warnings
+
+import numpy
 import ROOT
+import hdtv.options
+import hdtv.speccache
 import hdtv.rootext.mfile
 
 
@@ -86,8 +90,8 @@ class TextSpecReader(object):
     def GetBinLowEdges(self, centers):
         """
         Generate an array of (n+1) bin lower edges from an array of n bin
-        centers. The result is returned as an array object so that is can be
-        passed directly to the ROOT.TH1 constructor.
+        centers. The result is returned as a contiguous numpy array so that
+        it can be passed directly to the ROOT.TH1 constructor.
         """
         # This function generates n+1 lower bin edges l_0,...,l_n from n bin
         # centers c_0,...,c_{n-1}, such that the n equations
@@ -95,14 +99,19 @@ class TextSpecReader(object):
         # are fulfilled. Note that the problem is underdefined (n equations for
         # n+1 unknowns), so that there is a somewhat arbitrary choice being
         # made.
-        xbins = array.array('d')
-        w = (centers[1] - centers[0]) / 2.
-        xbins.append(centers[0] - w)
-        for i in range(1, len(centers)):
-            w = (centers[i] - centers[i - 1] - w)
-            xbins.append(centers[i] - w)
-        xbins.append(centers[-1] + w)
-
+        # The half widths follow the recursion w_i = (c_i - c_{i-1}) - w_{i-1},
+        # starting at w_0 = (c_1 - c_0)/2, which unrolls into an alternating
+        # cumulative sum.
+        centers = numpy.asarray(centers, dtype=numpy.float64)
+        sign = numpy.ones(len(centers))
+        sign[1::2] = -1.
+        diffs = numpy.zeros(len(centers))
+        diffs[1:] = numpy.diff(centers)
+        w = sign * (numpy.cumsum(sign * diffs) + (centers[1] - centers[0]) / 2.)
+
+        xbins = numpy.empty(len(centers) + 1)
+        xbins[:-1] = centers - w
+        xbins[-1] = centers[-1] + w[-1]
         return xbins
 
     def StripComments(self, line):
@@ -116,15 +125,57 @@ class TextSpecReader(object):
 
         return line[:end]
 
-    def GetSpectrum(self, fname, histname, histtitle):
+    def SetAutoFormat(self, ncols):
         """
-        Process a text file into a ROOT histogram object, using the format
-        specified in the constructor.
+        Infer the column meaning from the number of columns. Returns False if
+        the number of columns is not supported.
+        """
+        if ncols == 1:
+            self.xcol, self.ycol, self.ecol = None, 0, None
+        elif ncols == 2:
+            self.xcol, self.ycol, self.ecol = 0, 1, None
+        elif ncols == 3:
+            self.xcol, self.ycol, self.ecol = 0, 1, 2
+        else:
+            return False
+        self.ncols = ncols
+        return True
+
+    def LoadColumns(self, fname):
+        """
+        Parse the whole file in one go using numpy. Returns an array of shape
+        (nlines, ncols), or None if the file could not be parsed this way
+        (parse error, inconsistent number of columns, unknown format, empty
+        file). In that case, ReadLines is used, which either succeeds or
+        reports the offending line.
+        """
+        comments = list(self.cmts) if self.cmts else None
+        with warnings.catch_warnings():
+            # numpy warns about empty input; handled below
+            warnings.simplefilter("ignore")
+            try:
+                data = numpy.loadtxt(fname, comments=comments, ndmin=2)
+            except ValueError:
+                return None
+
+        if data.size == 0:
+            return None
+        if self.ncols is None:
+            if not self.SetAutoFormat(data.shape[1]):
+                return None
+        elif data.shape[1] != self.ncols:
+            return None
+        return data
+
+    def ReadLines(self, fname):
+        """
+        Line by line parser, which is slow, but gives a detailed error
+        message pointing to the offending line. Returns an array of shape
+        (nlines, ncols); columns not used by the format are set to zero.
         """
         data = []
         f = open(fname, "r")
         linenum = 1
-        x = y = e = None
 
         try:
             for line in f:
@@ -143,23 +194,10 @@ class TextSpecReader(object):
                 # of columns in the first non-empty line to determine the
                 # format.
                 if self.ncols is None:
-                    self.ncols = len(cols)
-                    if self.ncols == 1:
-                        self.xcol = None
-                        self.ycol = 0
-                        self.ecol = None
-                    elif self.ncols == 2:
-                        self.xcol = 0
-                        self.ycol = 1
-                        self.ecol = None
-                    elif self.ncols == 3:
-                        self.xcol = 0
-                        self.ycol = 1
-                        self.ecol = 2
-                    else:
+                    if not self.SetAutoFormat(len(cols)):
                         raise SpecReaderError(
                             "%s: %d: Failed to autodetect file format: found %d columns" %
-                            (fname, linenum, self.ncols))
+                            (fname, linenum, len(cols)))
 
                 # Check if number of columns is consistent
                 elif len(cols) != self.ncols:
@@ -168,17 +206,15 @@ class TextSpecReader(object):
                         (fname, linenum, len(cols), self.ncols))
 
                 # Parse specified columns into float values
-                linedata = []
+                linedata = [0.] * self.ncols
                 for col in (self.xcol, self.ycol, self.ecol):
                     if col is not None:
                         try:
-                            linedata.append(float(cols[col]))
+                            linedata[col] = float(cols[col])
                         except ValueError:
                             raise SpecReaderError(
                                 "%s: %d: Failed to parse value \"%s\" into float" %
                                 (fname, linenum, cols[col]))
-                    else:
-                        linedata.append(None)
 
                 data.append(linedata)
 
@@ -187,22 +223,40 @@ class TextSpecReader(object):
         finally:
             f.close()
 
+        if not data:
+            return numpy.zeros((0, self.ncols or 0))
+        return numpy.array(data, dtype=numpy.float64)
+
+    def GetSpectrum(self, fname, histname, histtitle):
+        """
+        Process a text file into a ROOT histogram object, using the format
+        specified in the constructor.
+        """
+        data = self.LoadColumns(fname)
+        if data is None:
+            data = self.ReadLines(fname)
+
         nbins = len(data)
 
         if self.xcol is not None:
-            # Sort by increasing x value
-            data.sort(key=lambda a: a[0])
+            # Sort by increasing x value (stable, as list.sort)
+            data = data[numpy.argsort(data[:, self.xcol], kind='mergesort')]
 
-            xbins = self.GetBinLowEdges([d[0] for d in data])
+            xbins = self.GetBinLowEdges(data[:, self.xcol])
             hist = ROOT.TH1D(histname, histtitle, nbins, xbins)
         else:
             hist = ROOT.TH1D(histname, histtitle, nbins, -0.5, nbins - 0.5)
 
-        # Fill ROOT histogram object
-        for b in range(0, nbins):
-            hist.SetBinContent(b + 1, data[b][1])
-            if(self.ecol is not None):
-                hist.SetBinError(b + 1, data[b][2])
+        # Fill ROOT histogram object in one go; SetContent and SetError
+        # expect arrays including the underflow and overflow bins
+        if nbins > 0:
+            content = numpy.zeros(nbins + 2)
+            content[1:-1] = data[:, self.ycol]
+            hist.SetContent(content)
+            if self.ecol is not None:
+                error = numpy.zeros(nbins + 2)
+                error[1:-1] = data[:, self.ecol]
+                hist.SetError(error)
 
         return hist
 
@@ -218,6 +272,9 @@ class SpecReader(object):
           * cracow  (Cracow from GSI)
           * mfile   (use libmfile and attempt autodetection)
           * any format specifier understood by libmfile
+
+        Decoded spectra are kept in a persistent cache (see hdtv.speccache),
+        unless the option spectrum.cache is switched off.
         """
         if not fmt:
             fmt = self.fDefaultFormat
@@ -226,6 +283,18 @@ class SpecReader(object):
         if histtitle is None:
             histtitle = os.path.basename(fname)
 
+        if hdtv.options.Get("spectrum.cache"):
+            hist = hdtv.speccache.cache.Get(fname, fmt, histname, histtitle)
+            if hist is None:
+                hist = self._GetSpectrum(fname, fmt, histname, histtitle)
+                hdtv.speccache.cache.Put(fname, fmt, hist)
+            return hist
+        return self._GetSpectrum(fname, fmt, histname, histtitle)
+
+    def _GetSpectrum(self, fname, fmt, histname, histtitle):
+        """
+        Decode a histogram from a non-ROOT file, bypassing the cache
+        """
         if fmt.lower() == 'cracow':
             # hdtv.dlmgr.LoadLibrary("cracowio")
             # cio = ROOT.CracowIO()
@@ -308,6 +377,12 @@ class SpecReader(object):
         else:
             mhist.Open(fname, fmt)
 
+        # Uncompressed matrices are memory-mapped, everything else is read
+        # line by line through libmfile
+        mmatrix = ROOT.MMapMatrix(fname, mhist, 0)
+        if not mmatrix.Failed():
+            return mmatrix
+
         # FIXME: this ignores possibly specified bin errors
         return ROOT.MFMatrix(mhist, 0)
 
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+# ----------------------------------------------------------------------
+# Timing and profiling of hdtv commands
+# ----------------------------------------------------------------------
+
+import os
+import json
+import time
+import pstats
+import cProfile
+import contextlib
+from collections import OrderedDict
+
+import hdtv.options
+import hdtv.ui
+
+try:  # Python 3.3+
+    _walltime = time.perf_counter
+    _cputime = time.process_time
+except AttributeError:
+    _walltime = time.time
+    _cputime = time.clock
+
+# Number of peak and background fits and of evaluations of the peak fit
+# functions (counted by hdtv.fitter)
+counters = {"fits": 0, "evals": 0}
+
+
+class Timer(object):
+    """
+    Timing of the executed commands
+
+    For each command (e.g. "fit execute"), the number of calls, the wall
+    and CPU time and the number of fits and fit function evaluations are
+    summed up. Between Start() and Stop(), the commands are also run under
+    a cProfile profiler; its data is kept until Clear().
+    """
+
+    keys = ["wall", "cpu", "fits", "evals"]
+
+    def __init__(self):
+        self.stats = OrderedDict()
+        self.profiler = None
+        self.profiling = False
+        self._depth = 0
+
+    @staticmethod
+    def Snapshot():
+        return (_walltime(), _cputime(), counters["fits"], counters["evals"])
+
+    @classmethod
+    def Since(cls, start):
+        """
+        Return what was spent since the snapshot start as dict
+        """
+        return dict(zip(cls.keys, [
+            now - then for (now, then) in zip(cls.Snapshot(), start)]))
+
+    @contextlib.contextmanager
+    def Measure(self, title):
+        """
+        Context manager measuring the execution of the command title
+        """
+        start = self.Snapshot()
+        # Commands may execute other commands: only the outermost one
+        # controls the profiler
+        profiler = None
+        if self.profiling and self._depth == 0:
+            profiler = self.profiler
+        self._depth += 1
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            self._depth -= 1
+            self.Add(title, self.Since(start))
+
+    def Add(self, title, spent):
+        try:
+            entry = self.stats[title]
+        except KeyError:
+            entry = self.stats[title] = dict.fromkeys(["calls"] + self.keys, 0)
+        entry["calls"] += 1
+        for key in self.keys:
+            entry[key] += spent[key]
+
+    def Start(self):
+        """
+        Start profiling (adding to the data collected so far)
+        """
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+        self.profiling = True
+
+    def Stop(self):
+        self.profiling = False
+
+    def Clear(self):
+        """
+        Discard the statistics and the profile data
+        """
+        self.stats.clear()
+        self.profiler = cProfile.Profile() if self.profiling else None
+
+    def Report(self):
+        """
+        Return the statistics of all commands, most time consuming first
+        """
+        rows = [dict(command=title, **entry)
+                for (title, entry) in self.stats.items()]
+        rows.sort(key=lambda row: row["wall"], reverse=True)
+        return rows
+
+    def ProfileStats(self):
+        """
+        Return the pstats.Stats of the profiler, or None if nothing has
+        been profiled
+        """
+        if self.profiler is None or not self.profiler.getstats():
+            return None
+        return pstats.Stats(self.profiler)
+
+
+def Stacks(stats, mintime=1e-6):
+    """
+    Convert the profile stats (pstats.Stats) to the ``collapsed stacks''
+    format of flame graph tools: one line "frame;frame;...;frame time" per
+    call stack, time in microseconds.
+
+    cProfile only records pairs of callers and callees, so the time of a
+    function with several callers is split among them in proportion to the
+    time spent in the calls from each one.
+    """
+    callees = dict()
+    for (func, (cc, nc, tt, ct, callers)) in stats.stats.items():
+        for (caller, edge) in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for (func, entry) in stats.stats.items()
+             if not set(entry[4]) - set([func])]
+
+    def label(func):
+        (fname, line, name) = func
+        if fname == "~":
+            return name
+        return "%s:%d(%s)" % (os.path.basename(fname), line, name)
+
+    lines = []
+
+    def walk(func, path, weight):
+        path = path + [func]
+        (cc, nc, tt, ct, callers) = stats.stats[func]
+        if tt * weight >= mintime:
+            lines.append("%s %d" % (";".join(label(f) for f in path),
+                                    round(tt * weight * 1e6)))
+        for (callee, edge) in callees.get(func, []):
+            total = stats.stats[callee][3]
+            if callee in path or total <= 0. or edge * weight < mintime:
+                continue
+            walk(callee, path, weight * min(edge / total, 1.))
+
+    for root in roots:
+        walk(root, [], 1.)
+    return lines
+
+
+class TimingLog(object):
+    """
+    Machine-readable log of the execution times of the lines of a batch
+    file: one JSON object per line, with the index of the line (counting
+    from 0, without comments and continuation lines), the line itself and
+    the wall and CPU time, fits and fit function evaluations it took
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.file = open(fname, "w")
+
+    def Write(self, index, line, spent):
+        entry = OrderedDict([("index", index), ("line", line)])
+        for key in Timer.keys:
+            entry[key] = spent[key]
+        self.file.write(json.dumps(entry) + "\n")
+
+    def Close(self):
+        self.file.close()
+
+
+def OpenLog(cmdfile):
+    """
+    Return a TimingLog for the batch file cmdfile (written next to it), or
+    None if batch files are not logged
+    """
+    if not hdtv.options.Get("cmdfile.timing_log"):
+        return None
+    fname = cmdfile + ".timing"
+    try:
+        return TimingLog(fname)
+    except (OSError, IOError) as err:
+        hdtv.ui.warn("Could not write timing log %s: %s" % (fname, err))
+        return None
+
+
+timer = Timer()
+
+opt = hdtv.options.Option(default=False, parse=hdtv.options.parse_bool)
+hdtv.options.RegisterOption("cmdfile.timing_log", opt)
@@ -43,6 +43,9 @@ class SimpleUI(object):
         self.debugout = self.stderr
 
         self.linesep = os.linesep
+        # Number of error messages so far (e.g. for the exit status of a
+        # batch job)
+        self.errors = 0
 
     def msg(self, text, newline=True):
         self.stdout.write(text)
@@ -73,6 +76,7 @@ class SimpleUI(object):
         """
         Print error message
         """
+        self.errors += 1
         self.stderr.write(tcolors.FAIL + "ERROR: " + text + tcolors.ENDC)
 
         if newline:
@@ -91,6 +95,17 @@ class SimpleUI(object):
     def newline(self):
         self.msg("", newline=True)
 
+    def progress(self, text, fraction):
+        """
+        Report the progress of a long-running operation (fraction between
+        0 and 1). The line is overwritten by the next call and terminated
+        once the operation is complete.
+        """
+        self.stdout.write("\rINFO: %s: %3d%%" % (text, int(100 * fraction)))
+        if fraction >= 1.:
+            self.stdout.write(self.linesep)
+        self.stdout.flush()
+
 
 # Initialization
 ui = SimpleUI()
@@ -123,6 +138,10 @@ def newline():
     ui.newline()
 
 
+def progress(text, fraction):
+    ui.progress(text, fraction)
+
+
 opt = hdtv.options.Option(
     default=0,
     parse=lambda x: int(x))
@@ -23,6 +23,12 @@ from __future__ import print_function
 
 import re
 import os
+import collections
+import contextlib
+import tempfile
+
+import numpy
+
 import hdtv.options
 import hdtv.ui
 from hdtv.color import tcolors
@@ -176,11 +182,39 @@ opt_uncertainties = hdtv.options.Option(
     parse=hdtv.options.parse_choices(["short", "pretty", "long"]))
 hdtv.options.RegisterOption("uncertainties", opt_uncertainties)
 
+def FormatValue(value):
+    """
+    Format a value (e.g. a ufloat) for a table, according to the
+    uncertainties option
+    """
+    if isinstance(value, str):
+        return value
+    # deal with ufloats
+    try:
+        if value.value is None:
+            return ""
+    except BaseException:
+        pass
+    if value is None:
+        return ""
+    try:
+        if hdtv.options.Get("uncertainties") == "short":
+            return "{:S}".format(value)
+        elif hdtv.options.Get("uncertainties") == "pretty":
+            return "{:P}".format(value)
+        else:
+            return "{:.4u}".format(value).replace("+/-", " ")
+    except BaseException:
+        return str(value)
+
+
 class Table(object):
     """
     Class to store tables
 
     data: iterable that contains 'keys' as attributes or dict entries
+    presorted: data is already sorted by sortBy (e.g. by FitResults.Sort),
+               the column is only marked
     """
 
     def __init__(
@@ -192,7 +226,8 @@ class Table(object):
             sortBy=None,
             reverseSort=False,
             extra_header=None,
-            extra_footer=None):
+            extra_footer=None,
+            presorted=False):
         self.extra_header = extra_header
         self.extra_footer = extra_footer
         self.sortBy = sortBy
@@ -234,7 +269,7 @@ class Table(object):
         self._ignore_col = [ignoreEmptyCols for i in range(0, len(keys) + 1)]
 
         self.read_data(data, keys, header)
-        if sortBy is not None:
+        if sortBy is not None and not presorted:
             self.sort_data(sortBy, reverseSort)
 
     @property
@@ -276,25 +311,7 @@ class Table(object):
             line = list()
             for i, key in enumerate(self.keys):
                 try:
-                    value = d[key]
-                    # deal with ufloats
-                    try:
-                        if value.value is None:
-                            value = ""
-                    except BaseException:
-                        pass
-                    if value is None:
-                        value = ""
-                    else:
-                        try:
-                            if hdtv.options.Get("uncertainties") == "short":
-                                value = "{:S}".format(value)
-                            elif hdtv.options.Get("uncertainties") == "pretty":
-                                value = "{:P}".format(value)
-                            else:
-                                value = "{:.4u}".format(value).replace("+/-", " ")
-                        except BaseException:
-                            value = str(value)
+                    value = FormatValue(d[key])
                     if not value is "":  # We have values in this columns -> don't ignore it
                         self._ignore_col[i] = False
 
@@ -473,6 +490,50 @@ class Position(object):
             self._fixedInCal = False
             self.pos_uncal = self._E2Ch(self._pos_cal)
 
+    @staticmethod
+    def FixAllInCal(positions):
+        """
+        Fix all positions in calibrated space, with a single conversion per
+        calibration
+        """
+        Position._FixAll(positions, True)
+
+    @staticmethod
+    def FixAllInUncal(positions):
+        """
+        Fix all positions in uncalibrated space, with a single conversion per
+        calibration
+        """
+        Position._FixAll(positions, False)
+
+    @staticmethod
+    def _FixAll(positions, fixedInCal):
+        groups = collections.OrderedDict()
+        for pos in positions:
+            if pos._fixedInCal != fixedInCal:
+                groups.setdefault(id(pos.cal), []).append(pos)
+        for group in groups.values():
+            cal = group[0].cal
+            if fixedInCal:
+                values = [pos._pos_uncal for pos in group]
+            else:
+                values = [pos._pos_cal for pos in group]
+            if cal is not None:
+                # Array versions of HDTV::Calibration::Ch2E()/E2Ch()
+                src = numpy.array(values, dtype=numpy.float64)
+                values = numpy.empty_like(src)
+                convert = cal.Ch2E if fixedInCal else cal.E2Ch
+                convert(src, values, len(src))
+                values = [float(v) for v in values]
+            for (pos, value) in zip(group, values):
+                pos._fixedInCal = fixedInCal
+                if fixedInCal:
+                    pos._pos_cal = value
+                    pos._pos_uncal = None
+                else:
+                    pos._pos_uncal = value
+                    pos._pos_cal = None
+
 
 class ID(object):
     def __init__(self, major=None, minor=None):
@@ -750,3 +811,37 @@ def open_compressed(fname, mode='rb', **kwargs):
         raise NotImplementedError(
             "{} files are not supported. Manually use '{}' instead.".format(
                 ext, 'bzip2' if 'bz2' else ext))
+
+
+@contextlib.contextmanager
+def AtomicWrite(fname, mode='w'):
+    """
+    Open a temporary file next to fname for writing, which replaces fname
+    only once the with block has completed. Concurrent readers thus never
+    see an incomplete file. On errors, the temporary file is removed.
+    """
+    (fd, tmpname) = tempfile.mkstemp(
+        dir=os.path.dirname(fname) or os.curdir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.rename(tmpname, fname)
+    except BaseException:
+        try:
+            os.remove(tmpname)
+        except OSError:
+            pass
+        raise
+
+
+def AsArray(buf, n, dtype=numpy.float64):
+    """
+    View a ROOT buffer (e.g. the Double_t* from TH1D.GetArray()) of n values
+    of type dtype as numpy array, without copying.
+    """
+    if hasattr(buf, "SetSize"):
+        # PyROOT before ROOT 6.22
+        buf.SetSize(n)
+    else:
+        buf.reshape((n,))
+    return numpy.frombuffer(buf, dtype=dtype, count=n)
@@ -99,6 +99,9 @@ class KeyHandler(HotkeyList):
         super(KeyHandler, self).__init__()
 
         self.fEditMode = False   # Status bar currently used as text entry
+        # Called once before the first key is handled (e.g. to load the
+        # plugins that register the hotkeys)
+        self.fKeyPrepare = None
         # Modifier keys
         self.MODIFIER_KEYS = (ROOT.kKey_Shift,
                               ROOT.kKey_Control,
@@ -153,6 +156,10 @@ class KeyHandler(HotkeyList):
            self.viewer.fKeySym == ROOT.kKey_Unknown:
             return
 
+        if self.fKeyPrepare:
+            (prepare, self.fKeyPrepare) = (self.fKeyPrepare, None)
+            prepare()
+
         # ESC aborts
         if self.viewer.fKeySym == ROOT.kKey_Escape:
             self.ResetHotkeyState()
@@ -193,25 +200,129 @@ class KeyHandler(HotkeyList):
         return handled
 
 
+class NullViewport(object):
+    """
+    Stand-in for the View1D viewport of a window in a headless session
+
+    It has the interface of View1D used by hdtv, but does not display
+    anything. Drawable objects are drawn on it as usual (so that their
+    visible and active states are kept), but no display objects are created
+    for them (see hdtv.drawable.Drawable.headless).
+    """
+    headless = True
+
+    def __init__(self):
+        self.fXOffset = 0.0
+        self.fXVisibleRegion = 1000.0
+        self.fYOffset = 0.0
+        self.fYMinVisibleRegion = 20.0
+        self.fYVisibleRegion = self.fYMinVisibleRegion
+
+    def LockUpdate(self):
+        pass
+
+    def UnlockUpdate(self):
+        pass
+
+    def Update(self, force=False):
+        pass
+
+    def SetStatusText(self, text):
+        pass
+
+    def ShowAll(self):
+        pass
+
+    def YAutoScaleOnce(self):
+        pass
+
+    def ToggleLogScale(self):
+        pass
+
+    def ToggleYAutoScale(self):
+        pass
+
+    def ToggleUseNorm(self):
+        pass
+
+    def XZoomAroundCursor(self, f):
+        pass
+
+    def YZoomAroundCursor(self, f):
+        pass
+
+    def GetCursorX(self):
+        return 0.0
+
+    def GetCursorY(self):
+        return 0.0
+
+    def ShiftXOffset(self, f):
+        self.fXOffset += f * self.fXVisibleRegion
+
+    def ShiftYOffset(self, f):
+        self.fYOffset += f * self.fYVisibleRegion
+
+    def SetXOffset(self, offset):
+        self.fXOffset = offset
+
+    def GetXOffset(self):
+        return self.fXOffset
+
+    def SetXCenter(self, center):
+        self.fXOffset = center - self.fXVisibleRegion / 2.
+
+    def SetXVisibleRegion(self, region):
+        self.fXVisibleRegion = region
+
+    def GetXVisibleRegion(self):
+        return self.fXVisibleRegion
+
+    def SetYOffset(self, offset):
+        self.fYOffset = offset
+
+    def GetYOffset(self):
+        return self.fYOffset
+
+    def SetYVisibleRegion(self, region):
+        self.fYVisibleRegion = region
+
+    def GetYVisibleRegion(self):
+        return self.fYVisibleRegion
+
+    def SetYMinVisibleRegion(self, region):
+        self.fYMinVisibleRegion = region
+
+    def GetYMinVisibleRegion(self):
+        return self.fYMinVisibleRegion
+
+
 class Window(KeyHandler):
     """
     Base class of a window object
 
     This class provides basic key handling for zooming and scrolling.
+    With headless=True, no ROOT GUI is created and the window only has a
+    NullViewport (e.g. for batch jobs on machines without X server).
     """
 
-    def __init__(self):
+    def __init__(self, headless=False):
         super(Window, self).__init__()
 
-        self.viewer = ROOT.HDTV.Display.Viewer()
-        self.viewport = self.viewer.GetViewport()
+        self.headless = headless
         self._dispatchers = list()
+        if headless:
+            self.viewer = None
+            self.viewport = NullViewport()
+        else:
+            self.viewer = ROOT.HDTV.Display.Viewer()
+            self.viewport = self.viewer.GetViewport()
 
-        # Handle closing of the main window (with an application exit)
-        disp = ROOT.TPyDispatcher(hdtv.cmdline.AsyncExit)
-        self.viewer.Connect(
-            "CloseWindow()", "TPyDispatcher", disp, "Dispatch()")
-        self._dispatchers.append(disp)
+            # Handle closing of the main window (with an application exit)
+            disp = ROOT.TPyDispatcher(hdtv.cmdline.AsyncExit)
+            self.viewer.Connect(
+                "CloseWindow()", "TPyDispatcher", disp, "Dispatch()")
+            self._dispatchers.append(disp)
 
         self.XZoomMarkers = MarkerCollection("X", paired=True, maxnum=1,
                                              color=hdtv.color.zoom)
@@ -221,10 +332,11 @@ class Window(KeyHandler):
         self.YZoomMarkers.Draw(self.viewport)
 
         # Key Handling
-        disp = ROOT.TPyDispatcher(self.KeyHandler)
-        self.viewer.Connect(
-            "KeyPressed()", "TPyDispatcher", disp, "Dispatch()")
-        self._dispatchers.append(disp)
+        if not headless:
+            disp = ROOT.TPyDispatcher(self.KeyHandler)
+            self.viewer.Connect(
+                "KeyPressed()", "TPyDispatcher", disp, "Dispatch()")
+            self._dispatchers.append(disp)
 
         self.keyString = ""
         self.AddHotkey(ROOT.kKey_u, lambda: self.viewport.Update())
@@ -0,0 +1,680 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+#-------------------------------------------------------------------------
+# Benchmarks of the performance critical parts of hdtv
+#
+# Spectra and matrices are synthesized (see ../peak/peakgen.py) in a
+# temporary directory. Each benchmark case is run several times, the
+# minimum and the median time are reported and can be saved as JSON:
+#
+#   python test/bench/bench.py -o results.json
+#
+# and compared against an earlier run (on the same machine!):
+#
+#   python test/bench/bench.py --baseline results.json
+#
+# The exit status is 1 if any case got slower than the baseline by more
+# than the threshold. By default, small sizes are used; --full runs the
+# realistic sizes (spectra of up to 1M channels, matrices of up to 16k x
+# 16k channels, which need several GB of disk space and memory).
+#-------------------------------------------------------------------------
+
+from __future__ import division, print_function
+
+import os
+import io
+import gc
+import sys
+import json
+import time
+import shutil
+import fnmatch
+import argparse
+import platform
+import tempfile
+import contextlib
+import itertools
+from collections import OrderedDict
+
+import numpy
+import ROOT
+from uncertainties import ufloat
+
+import hdtv.rootext.mfile
+import hdtv.rootext.fit
+import hdtv.ui
+import hdtv.util
+import hdtv.version
+import hdtv.speccache
+from hdtv.specreader import SpecReader
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, "peak"))
+import peakgen
+
+# Increase whenever the layout of the results changes
+RESULTS_VERSION = 1
+
+ROOT.gROOT.SetBatch(True)
+# Do not register the (many) histograms in the current directory
+ROOT.TH1.AddDirectory(False)
+
+
+@contextlib.contextmanager
+def Quiet():
+    """
+    Suppress the output of hdtv (e.g. the fit results)
+    """
+    devnull = open(os.devnull, "w")
+    saved = (sys.stdout, hdtv.ui.ui.stdout, hdtv.ui.ui.stderr)
+    sys.stdout = hdtv.ui.ui.stdout = hdtv.ui.ui.stderr = devnull
+    try:
+        yield
+    finally:
+        (sys.stdout, hdtv.ui.ui.stdout, hdtv.ui.ui.stderr) = saved
+        devnull.close()
+
+
+#-------------------------------------------------------------------------
+# Synthetic data
+#-------------------------------------------------------------------------
+
+class Data(object):
+    """
+    Synthetic spectra and matrices, created on first use and shared by all
+    benchmarks
+    """
+
+    def __init__(self, workdir, seed=4711):
+        self.workdir = workdir
+        self.seed = seed
+        self._items = dict()
+
+    def Get(self, key, create):
+        if key not in self._items:
+            self._items[key] = create()
+        return self._items[key]
+
+    def Path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def Random(self):
+        return numpy.random.RandomState(self.seed)
+
+    @staticmethod
+    def Values(nbins, peaks, background, reach=100.):
+        """
+        Return the values of the peakgen background plus peaks at the
+        channels 0 ... nbins-1. Peaks are only evaluated up to reach
+        channels from their position (evaluating the python functions
+        everywhere takes far too long for large spectra), so they must not
+        have a step.
+        """
+        x = numpy.arange(nbins, dtype=numpy.float64)
+        y = numpy.polyval(background.coeff[::-1], x)
+        for peak in peaks:
+            lo = max(int(peak.pos - reach), 0)
+            hi = min(int(peak.pos + reach) + 1, nbins)
+            y[lo:hi] += [peak.value(c) for c in x[lo:hi]]
+        return y
+
+    @staticmethod
+    def Hist(name, counts):
+        """
+        Return a TH1D (channels -0.5 ... nbins-0.5) holding counts
+        """
+        nbins = len(counts)
+        hist = ROOT.TH1D(name, name, nbins, -0.5, nbins - 0.5)
+        content = numpy.zeros(nbins + 2)
+        content[1:nbins + 1] = counts
+        hist.SetContent(content)
+        hist.Sumw2()
+        return hist
+
+    def SpectrumValues(self, nbins, npeaks=None):
+        """
+        A spectrum with a falling background and npeaks (default: one per
+        256 channels, at most 200) well separated Theuerkauf peaks
+        """
+        if npeaks is None:
+            npeaks = min(max(nbins // 256, 1), 200)
+        peaks = []
+        for i in range(npeaks):
+            pos = (i + 0.5) * nbins / npeaks
+            peaks.append(peakgen.TheuerkaufPeak(
+                pos, 2e4 + 1e3 * (i % 10), 3. + 5. * pos / nbins, tl=5.))
+        bg = peakgen.PolyBg([200., -150. / nbins])
+        return (self.Values(nbins, peaks, bg), peaks)
+
+    def Spectrum(self, nbins, npeaks=None):
+        """
+        Return (hist, peaks) of a sampled spectrum (see SpectrumValues)
+        """
+        def create():
+            (values, peaks) = self.SpectrumValues(nbins, npeaks)
+            counts = self.Random().poisson(values)
+            name = "spec_%d_%s" % (nbins, npeaks)
+            return (self.Hist(name, counts), peaks)
+        return self.Get(("spectrum", nbins, npeaks), create)
+
+    def SpectrumFile(self, nbins, fmt):
+        """
+        Return the name of a file holding Spectrum(nbins) in format fmt
+        """
+        def create():
+            fname = self.Path("spec_%d.%s" % (nbins, fmt))
+            SpecReader().WriteSpectrum(self.Spectrum(nbins)[0], fname, fmt)
+            return fname
+        return self.Get(("specfile", nbins, fmt), create)
+
+    def Multiplet(self, npeaks, model):
+        """
+        Return (hist, positions, region) of a multiplet of npeaks
+        overlapping peaks (model "theuerkauf" or "ee") on a linear
+        background
+        """
+        def create():
+            positions = [500. + 14. * i for i in range(npeaks)]
+            if model == "ee":
+                peaks = [peakgen.EEPeak(pos, 1500. + 100. * (i % 5),
+                                        4.5, 6.0, 1.5, 0.7)
+                         for (i, pos) in enumerate(positions)]
+            else:
+                peaks = [peakgen.TheuerkaufPeak(pos, 2e4 + 3e3 * (i % 5), 8.)
+                         for (i, pos) in enumerate(positions)]
+            nbins = int(positions[-1]) + 500
+            values = self.Values(
+                nbins, peaks, peakgen.PolyBg([40.0, -0.005]))
+            hist = self.Hist("multiplet_%s_%d" % (model, npeaks),
+                             self.Random().poisson(values))
+            return (hist, positions, (positions[0] - 30., positions[-1] + 30.))
+        return self.Get(("multiplet", npeaks, model), create)
+
+    def Matrix(self, n, fmt):
+        """
+        Return the name of a file holding a symmetric n x n matrix (like a
+        gamma-gamma coincidence matrix) in format fmt. The matrix is written
+        with libmfile from a TH2I, which is filled in blocks of lines.
+        """
+        def create():
+            fname = self.Path("mat_%d.%s" % (n, fmt))
+            values = self.SpectrumValues(n)[0]
+            # about 2 counts per channel on average
+            scale = numpy.sqrt(2. * n * n) / values.sum()
+            values *= scale
+            hist = ROOT.TH2I("mat_%d" % n, "mat_%d" % n,
+                             n, -0.5, n - 0.5, n, -0.5, n - 0.5)
+            data = hdtv.util.AsArray(
+                hist.GetArray(), (n + 2) * (n + 2), numpy.int32)
+            data = data.reshape((n + 2, n + 2))
+            rng = self.Random()
+            block = max(1, (1 << 22) // n)
+            for l in range(0, n, block):
+                lines = values[l:l + block]
+                data[l + 1:l + 1 + len(lines), 1:n + 1] = rng.poisson(
+                    numpy.outer(lines, values))
+            result = ROOT.MFileHist.WriteTH2(hist, fname, fmt)
+            del hist
+            if result != ROOT.MFileHist.ERR_SUCCESS:
+                raise RuntimeError(ROOT.MFileHist.GetErrorMsg(result))
+            return fname
+        return self.Get(("matrix", n, fmt), create)
+
+    def Session(self):
+        """
+        The (headless) hdtv session for the fitlist benchmarks
+        """
+        def create():
+            import hdtv.session
+            return hdtv.session.Session(headless=True)
+        return self.Get("session", create)
+
+
+#-------------------------------------------------------------------------
+# Benchmarks
+#
+# A benchmark is a function, which is called with the Data object and the
+# parameters of the case, does all preparations and returns a function
+# that runs the code to be timed.
+#-------------------------------------------------------------------------
+
+benchmarks = []
+
+
+def benchmark(name, quick, full=None):
+    """
+    Register a benchmark. name is formatted with the parameters of each
+    case; quick and full are the lists of parameters (tuples) for the
+    default and the --full runs.
+    """
+    def register(func):
+        benchmarks.append((name, func, quick, full or quick))
+        return func
+    return register
+
+
+def product(*lists):
+    return list(itertools.product(*lists))
+
+
+@benchmark("load.%s.%d",
+           product(["lc", "le4", "txt"], [4096, 65536]),
+           product(["lc", "le4", "txt"], [4096, 65536, 1048576]))
+def bench_load(data, fmt, nbins):
+    fname = data.SpectrumFile(nbins, fmt)
+    reader = SpecReader()
+    return lambda: reader._GetSpectrum(fname, fmt, "spec", "spec")
+
+
+@benchmark("load.cached.%d", product([4096, 65536]),
+           product([4096, 65536, 1048576]))
+def bench_load_cached(data, nbins):
+    fname = data.SpectrumFile(nbins, "lc")
+    cache = hdtv.speccache.SpectrumCache(data.Path("cache"))
+    cache.Put(fname, "lc", data.Spectrum(nbins)[0])
+    return lambda: cache.Get(fname, "lc", "spec", "spec")
+
+
+@benchmark("fit.theuerkauf.%d", product([1, 10]), product([1, 5, 10, 20, 50]))
+def bench_fit_theuerkauf(data, npeaks):
+    (hist, positions, region) = data.Multiplet(npeaks, "theuerkauf")
+
+    def run():
+        fitter = ROOT.HDTV.Fit.TheuerkaufFitter(*region)
+        sigma = fitter.AllocParam(3.4)
+        for pos in positions:
+            fitter.AddPeak(ROOT.HDTV.Fit.TheuerkaufPeak(
+                fitter.AllocParam(pos), fitter.AllocParam(), sigma))
+        fitter.Fit(hist, 1)
+    return run
+
+
+@benchmark("fit.ee.%d", product([1, 10]), product([1, 5, 10, 20, 50]))
+def bench_fit_ee(data, npeaks):
+    (hist, positions, region) = data.Multiplet(npeaks, "ee")
+
+    def run():
+        fitter = ROOT.HDTV.Fit.EEFitter(*region)
+        shared = [fitter.AllocParam(ival) for ival in (4.5, 6.0, 1.5, 0.7)]
+        for pos in positions:
+            fitter.AddPeak(ROOT.HDTV.Fit.EEPeak(
+                fitter.AllocParam(pos), fitter.AllocParam(), *shared))
+        fitter.Fit(hist, 1)
+    return run
+
+
+@benchmark("fit.polybg.%d", product([1, 3]), product([0, 1, 2, 3, 5]))
+def bench_fit_polybg(data, degree):
+    (hist, peaks) = data.Spectrum(16384)
+    # Background regions between the peaks
+    edges = [p.pos for p in peaks]
+    regions = [(a + 20., b - 20.) for (a, b) in zip(edges, edges[1:])]
+
+    def run():
+        bg = ROOT.HDTV.Fit.PolyBg(degree)
+        for region in regions:
+            bg.AddRegion(*region)
+        bg.Fit(hist)
+    return run
+
+
+def _Cut(vmatrix, n, ngates):
+    """
+    Set up ngates gates (each with a background region) spread over the
+    n lines of the matrix
+    """
+    for i in range(ngates):
+        pos = int((i + 0.5) * n / ngates)
+        vmatrix.AddCutRegion(pos - 4, pos + 4)
+        vmatrix.AddBgRegion(pos + 12, pos + 20)
+        if ngates > 1:
+            vmatrix.StoreGate()
+
+
+def _VMatrix(fname, n):
+    vmatrix = SpecReader().GetVMatrix(fname)
+    if vmatrix.GetProjXbins() != n:
+        raise RuntimeError("Failed to open %s" % fname)
+    return vmatrix
+
+
+@benchmark("cut.%s.%d", product(["lc", "le4"], [1024, 4096]),
+           product(["lc", "le4"], [4096, 8192, 16384]))
+def bench_cut(data, fmt, n):
+    vmatrix = _VMatrix(data.Matrix(n, fmt), n)
+
+    def run():
+        vmatrix.ResetRegions()
+        _Cut(vmatrix, n, 1)
+        vmatrix.Cut("cut", "cut")
+    return run
+
+
+@benchmark("cut.multi.%d", product([1024, 4096]),
+           product([4096, 8192, 16384]))
+def bench_multicut(data, n):
+    vmatrix = _VMatrix(data.Matrix(n, "le4"), n)
+
+    def run():
+        vmatrix.ResetGates()
+        _Cut(vmatrix, n, 16)
+        vmatrix.MultiCut("cut", "cut")
+    return run
+
+
+def _CheckMatOp(errno):
+    if errno != ROOT.MatOp.ERR_SUCCESS:
+        raise RuntimeError(ROOT.MatOp.GetErrorString(errno))
+
+
+@benchmark("matop.project.%d", product([1024, 4096]),
+           product([4096, 8192, 16384]))
+def bench_project(data, n):
+    fname = data.Matrix(n, "lc")
+    (prx, pry) = (data.Path("mat.prx"), data.Path("mat.pry"))
+    return lambda: _CheckMatOp(ROOT.MatOp.Project(fname, prx, pry))
+
+
+@benchmark("matop.transpose.%d", product([1024, 4096]),
+           product([4096, 8192, 16384]))
+def bench_transpose(data, n):
+    fname = data.Matrix(n, "lc")
+    dst = data.Path("mat.tr")
+
+    def run():
+        if os.path.exists(dst):
+            os.remove(dst)
+        _CheckMatOp(ROOT.MatOp.Transpose(fname, dst))
+    return run
+
+
+@benchmark("cal.fit.%d", product([10, 100]), product([10, 100, 1000]))
+def bench_cal(data, npairs):
+    import hdtv.cal
+    rng = data.Random()
+    channels = numpy.linspace(100., 16000., npairs)
+    energies = 2. + 0.5 * channels + 1e-7 * channels**2
+    pairs = [(ufloat(ch + rng.normal(0., 0.05), 0.05), ufloat(e, 0.01))
+             for (ch, e) in zip(channels, energies)]
+
+    def run():
+        fitter = hdtv.cal.CalibrationFitter()
+        for (ch, e) in pairs:
+            fitter.AddPair(ch, e)
+        with Quiet():
+            fitter.FitCal(2)
+    return run
+
+
+@benchmark("gammalib.find.%d", product([100]), product([100, 1000]))
+def bench_gammalib(data, nlookups):
+    import hdtv.database
+
+    def create():
+        lib = hdtv.database.databases["pgaalib_iki2000"]()
+        lib.open()
+        return lib
+    lib = data.Get("gammalib", create)
+    energies = numpy.linspace(50., 10000., nlookups)
+
+    def run():
+        for energy in energies:
+            lib.find(energy=energy, fuzziness=1.)
+    return run
+
+
+def _Fitlist(data, nfits):
+    """
+    Return (session, spectrum ID) of a spectrum with nfits stored fits
+    """
+    def create():
+        from hdtv.histogram import Histogram
+        from hdtv.spectrum import Spectrum
+        session = data.Session()
+        (hist, peaks) = data.Spectrum(max(4096, 64 * nfits), nfits)
+        sid = session.Insert(Spectrum(Histogram(hist)))
+        session.ActivateObject(sid)
+        with Quiet():
+            for peak in peaks:
+                session.SetMarker("region", peak.pos - 20.)
+                session.SetMarker("region", peak.pos + 20.)
+                session.SetMarker("peak", peak.pos)
+                session.ExecuteFit()
+                session.StoreFit()
+                session.ClearFit()
+        return (session, sid)
+    return data.Get(("fitlist", nfits), create)
+
+
+@benchmark("fitxml.write.%d", product([10, 100]), product([10, 100, 1000]))
+def bench_fitxml_write(data, nfits):
+    import hdtv.fitxml
+    (session, sid) = _Fitlist(data, nfits)
+    fitxml = hdtv.fitxml.FitXml(session)
+    return lambda: fitxml.WriteFitlist(io.BytesIO(), sid)
+
+
+@benchmark("fitxml.read.%d", product([10, 100]), product([10, 100, 1000]))
+def bench_fitxml_read(data, nfits):
+    import hdtv.fitxml
+    (session, sid) = _Fitlist(data, nfits)
+    fitxml = hdtv.fitxml.FitXml(session)
+    buf = io.BytesIO()
+    fitxml.WriteFitlist(buf, sid)
+    xml = buf.getvalue()
+    spec = session.dict[sid]
+
+    def run():
+        # Reading adds to the fits of the spectrum, so remove them first
+        # (this leaves the spectrum with the same fits as before)
+        spec.Clear()
+        with Quiet():
+            fitxml.ReadFitlist(io.BytesIO(xml), sid, interactive=False)
+    return run
+
+
+#-------------------------------------------------------------------------
+# Running and comparing
+#-------------------------------------------------------------------------
+
+def Cases(full=False, patterns=None):
+    """
+    Return the list of (name, func, params) of all cases that match any of
+    the (fnmatch) patterns
+    """
+    cases = []
+    for (name, func, quick, large) in benchmarks:
+        for params in (large if full else quick):
+            case = name % params
+            if patterns and not any(fnmatch.fnmatch(case, p)
+                                    for p in patterns):
+                continue
+            cases.append((case, func, params))
+    return cases
+
+
+def Measure(run, repeat, maxtime):
+    """
+    Time run() repeat times (or less, if this takes longer than maxtime
+    seconds). Returns the list of times.
+    """
+    times = []
+    total = 0.
+    while len(times) < repeat and (not times or total < maxtime):
+        gc.collect()
+        gcold = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.time()
+            run()
+            times.append(time.time() - start)
+        finally:
+            if gcold:
+                gc.enable()
+        total += times[-1]
+    return times
+
+
+def FormatTime(t):
+    if t is None:
+        return "-"
+    for (unit, scale) in (("s", 1.), ("ms", 1e-3), ("us", 1e-6)):
+        if t >= scale:
+            break
+    return "%.3g %s" % (t / scale, unit)
+
+
+def Run(cases, data, repeat, maxtime):
+    """
+    Run the cases, print and return the results
+    """
+    results = OrderedDict()
+    for (case, func, params) in cases:
+        sys.stdout.write("%-28s " % case)
+        sys.stdout.flush()
+        try:
+            run = func(data, *params)
+            times = Measure(run, repeat, maxtime)
+        except Exception as err:
+            print("FAILED: %s" % err)
+            results[case] = {"error": str(err)}
+            continue
+        times.sort()
+        results[case] = OrderedDict([
+            ("min", times[0]),
+            ("median", times[len(times) // 2]),
+            ("runs", len(times))])
+        print("%10s  (median %s, %d runs)" % (
+            FormatTime(times[0]), FormatTime(times[len(times) // 2]),
+            len(times)))
+    return results
+
+
+def Compare(results, baseline, threshold):
+    """
+    Print the comparison of results (the minimum times) to baseline.
+    Returns the number of cases that are slower than the baseline by more
+    than the threshold (a fraction, e.g. 0.2 for 20 %).
+    """
+    print("")
+    print("%-28s %10s %10s %8s" % ("case", "baseline", "current", "ratio"))
+    print("-" * 60)
+    regressions = 0
+    for (case, result) in results.items():
+        base = baseline.get(case, {})
+        (old, new) = (base.get("min"), result.get("min"))
+        if old and new:
+            ratio = new / old
+            note = ""
+            if ratio > 1. + threshold:
+                note = "SLOWER"
+                regressions += 1
+            elif ratio < 1. / (1. + threshold):
+                note = "faster"
+            print("%-28s %10s %10s %8.2f %s" % (
+                case, FormatTime(old), FormatTime(new), ratio, note))
+        else:
+            print("%-28s %10s %10s %8s" % (
+                case, FormatTime(old), FormatTime(new), "-"))
+    print("")
+    print("%d of %d cases slower than the baseline by more than %d %%" % (
+        regressions, len(results), round(threshold * 100)))
+    return regressions
+
+
+def Environment(full):
+    return OrderedDict([
+        ("version", RESULTS_VERSION),
+        ("date", time.strftime("%Y-%m-%dT%H:%M:%S")),
+        ("hdtv", hdtv.version.VERSION),
+        ("root", ROOT.gROOT.GetVersion()),
+        ("python", platform.python_version()),
+        ("host", platform.node()),
+        ("platform", platform.platform()),
+        ("full", full)])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the performance critical parts of hdtv")
+    parser.add_argument(
+        "-k", "--case", action="append", dest="patterns", metavar="PATTERN",
+        help="only run the cases matching PATTERN (e.g. 'fit.*', "
+        "may be given several times)")
+    parser.add_argument(
+        "--full", action="store_true",
+        help="use realistic (large) spectra and matrices")
+    parser.add_argument(
+        "-l", "--list", action="store_true", help="list the cases and exit")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5,
+        help="number of runs of each case (default: %(default)s)")
+    parser.add_argument(
+        "--max-time", type=float, default=20.,
+        help="stop repeating a case after this many seconds "
+        "(default: %(default)s)")
+    parser.add_argument(
+        "-o", "--output", help="write the results to this JSON file")
+    parser.add_argument(
+        "-b", "--baseline", help="compare with the results in this JSON file")
+    parser.add_argument(
+        "-t", "--threshold", type=float, default=0.2,
+        help="fraction by which a case may be slower than the baseline "
+        "(default: %(default)s)")
+    parser.add_argument(
+        "--tmpdir", help="directory for the synthetic spectra and matrices")
+    args = parser.parse_args()
+
+    cases = Cases(args.full, args.patterns)
+    if args.list:
+        for (case, func, params) in cases:
+            print(case)
+        return 0
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("version") != RESULTS_VERSION:
+            print("Unsupported baseline file %s" % args.baseline)
+            return 2
+
+    workdir = tempfile.mkdtemp(prefix="hdtv-bench-", dir=args.tmpdir)
+    try:
+        results = Run(cases, Data(workdir), args.repeat, args.max_time)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        report = Environment(args.full)
+        report["results"] = results
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if baseline is not None:
+        return 1 if Compare(results, baseline["results"], args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -24,6 +24,8 @@ import os
 import tempfile
 import shutil
 
+import pytest
+
 sys.path.append(os.path.join(os.path.dirname(__file__), 'helpers'))
 
 def pytest_configure():
@@ -35,6 +37,24 @@ def pytest_configure():
     import hdtv.rootext.dlmgr
     hdtv.rootext.dlmgr.RebuildLibraries(hdtv.rootext.dlmgr.usrlibdir)
 
+@pytest.fixture(autouse=True, scope="session")
+def cache_dir(tmpdir_factory):
+    """
+    Keep the persistent caches of the tests out of the user's cache
+    directory (even if hdtv.rootext.dlmgr was imported before
+    pytest_configure changed XDG_CACHE_HOME)
+    """
+    import hdtv.speccache
+    import hdtv.fitcache
+    import hdtv.database.common
+    path = tmpdir_factory.mktemp("cache")
+    hdtv.speccache.cache.path = str(path.join("spectra"))
+    hdtv.speccache.cache.size = None
+    # Used once fit.cache.disk is switched on
+    hdtv.fitcache.cachepath = str(path)
+    hdtv.database.common.cachedir = str(path.join("database"))
+    yield path
+
 def pytest_sessionfinish(session, exitstatus):
     tmpdir = os.getenv("XDG_CACHE_HOME")
     if tmpdir != "" and os.path.exists(tmpdir):
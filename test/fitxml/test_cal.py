@@ -25,6 +25,7 @@ This script tests the interplay of fitting and restoring fits with calibration
 
 import os
 
+import numpy
 import pytest
 
 from test.helpers.utils import setup_io, redirect_stdout, isclose
@@ -32,6 +33,7 @@ from test.helpers.fixtures import temp_file
 
 import __main__
 
+import hdtv.cal
 import hdtv.session
 try:
     __main__.spectra = hdtv.session.Session()
@@ -408,3 +410,21 @@ def test_reimport_calibrate_write_read(temp_file, region1, region2, peak,
         assert isclose(
             integral_initial[key].nominal_value,
             integral_final[key].nominal_value/calfactor3*calfactor2)
+
+
+@pytest.mark.parametrize("coeffs", [
+    [0., 2.], [1.5, 0.5, 1e-5], [1000., -0.5], [3., 0.7, -2e-6, 1e-10]])
+def test_cal_arrays(coeffs):
+    """
+    Array conversions agree with the scalar ones and invert each other
+    """
+    cal = hdtv.cal.MakeCalibration(coeffs)
+    channels = numpy.linspace(-100., 16000., 1001)
+    energies = hdtv.cal.Ch2E(cal, channels)
+    slopes = hdtv.cal.dEdCh(cal, channels)
+    for (ch, e, slope) in zip(channels, energies, slopes):
+        assert e == cal.Ch2E(ch)
+        assert slope == cal.dEdCh(ch)
+    back = hdtv.cal.E2Ch(cal, energies)
+    assert numpy.allclose(back, channels, rtol=0., atol=1e-6)
+    assert all(x == cal.E2Ch(e) for (x, e) in zip(back, energies))
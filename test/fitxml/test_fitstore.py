@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+"""
+Test cases for the binary fit store (writing, reading, listing without
+restoring the fits and conversion from and to xml fitlists)
+"""
+
+from __future__ import print_function
+
+import os
+
+import pytest
+
+from test.helpers.utils import setup_io, redirect_stdout, hdtvcmd
+
+import __main__
+
+import hdtv.session
+try:
+    __main__.spectra = hdtv.session.Session()
+except RuntimeError:
+    pass
+spectra = __main__.spectra
+
+import hdtv.plugins.specInterface
+import hdtv.plugins.fitInterface
+import hdtv.plugins.fitlist
+import hdtv.fitresults
+import hdtv.fitstore
+
+testspectrum = os.path.join(
+    os.path.curdir, "test", "share", "osiris_bg.spc")
+testXML = os.path.join(
+    os.path.curdir, "test", "share", "osiris_bg_v1.4.xml")
+
+
+@pytest.fixture(autouse=True)
+def prepare():
+    __main__.f.ResetFitterParameters()
+    hdtv.options.Set("table", "classic")
+    hdtv.options.Set("uncertainties", "short")
+    __main__.s.LoadSpectra(testspectrum)
+    yield
+    spectra.Clear()
+
+
+def list_fit():
+    f, ferr = setup_io(2)
+    with redirect_stdout(f, ferr):
+        __main__.f.ListFits()
+        __main__.f.ListIntegrals()
+    assert ferr.getvalue().strip() == ''
+    return f.getvalue().strip()
+
+
+def test_fitstore_write_and_read(tmpdir):
+    fname = str(tmpdir.join("fits.hfs"))
+    __main__.fitxml.ReadXML(spectra.Get("0").ID, testXML)
+    out_original = list_fit()
+
+    f, ferr = hdtvcmd("fit write " + fname)
+    assert ferr == ""
+    store = hdtv.fitstore.FitStore(fname)
+    assert len(store) == 6
+    assert store.Spectra() == [spectra.Get("0").name]
+
+    spectra.Get("0").Clear()
+    f, ferr = hdtvcmd("fit read " + fname)
+    assert ferr == ""
+    assert "6 fits restored" in f
+    assert out_original == list_fit()
+
+
+def test_fitstore_list(tmpdir):
+    fname = str(tmpdir.join("fits.hfs"))
+    spec = spectra.Get("0")
+    __main__.fitxml.ReadXML(spec.ID, testXML)
+    fits = [spec.dict[ID] for ID in spec.ids]
+    peaks = hdtv.fitresults.FromFits(fits)
+    integrals = hdtv.fitresults.IntegralsFromFits(fits, "all")
+    hdtvcmd("fit write " + fname)
+    spec.Clear()
+
+    store = hdtv.fitstore.FitStore(fname)
+    rows = store.Rows(spec.name)
+    # the stored fits have no status
+    keys = [key for key in peaks.params if key != "stat"]
+    assert store.Results(rows).StringRows(keys) == peaks.StringRows(keys)
+    keys = [key for key in integrals.params if key != "stat"]
+    assert (store.Integrals(rows, "all").StringRows(keys) ==
+            integrals.StringRows(keys))
+
+    f, ferr = hdtvcmd("fit store list " + fname,
+                      "fit store integral list -i all " + fname)
+    assert ferr == ""
+    assert "in 6 fits" in f
+    assert not spec.dict
+
+
+def test_fitstore_activate(tmpdir):
+    fname = str(tmpdir.join("fits.hfs"))
+    __main__.fitxml.ReadXML(spectra.Get("0").ID, testXML)
+    hdtvcmd("fit write " + fname)
+    spectra.Get("0").Clear()
+
+    f, ferr = hdtvcmd("fit store activate %s 3" % fname)
+    assert ferr == ""
+    spec = spectra.Get("0")
+    assert len(spec.dict) == 1
+    assert spec.activeID is not None
+    f, ferr = hdtvcmd("fit store activate %s 17" % fname)
+    assert "no fit 17" in ferr
+
+
+def test_fitstore_convert(tmpdir):
+    fname = str(tmpdir.join("fits.hfs"))
+    xmlname = str(tmpdir.join("fits.xml"))
+    f, ferr = hdtvcmd("fit convert %s %s" % (testXML, fname),
+                      "fit convert %s %s" % (fname, xmlname))
+    assert ferr == ""
+
+    __main__.fitxml.ReadXML(spectra.Get("0").ID, testXML)
+    out_original = list_fit()
+    spectra.Get("0").Clear()
+    __main__.fitxml.ReadXML(spectra.Get("0").ID, xmlname)
+    assert out_original == list_fit()
+
+
+def test_fitstore_convert_invalid(tmpdir):
+    xmlname = tmpdir.join("invalid.xml")
+    xmlname.write("<fitlist version='1.4'/>\n")
+    fname = tmpdir.join("fits.hfs")
+    f, ferr = hdtvcmd("fit convert %s %s" % (xmlname, fname))
+    assert "not a valid hdtv file" in ferr
+    assert not fname.check()
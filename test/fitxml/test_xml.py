@@ -168,3 +168,54 @@ def test_fitxml_eepeak(temp_file_compressed):
     spectra.SetMarker("region", 1125)
     spectra.SetMarker("peak", 1120)
     fit_write_and_save(temp_file_compressed)
+
+
+def test_fitxml_streaming(temp_file_compressed):
+    """
+    several fits: the streamed output matches the serialized tree, and the
+    fits are restored in order
+    """
+    for (region, peak) in [((500, 520), 511), ((960, 975), 965),
+                           ((1450, 1470), 1460)]:
+        spectra.SetMarker("region", region[0])
+        spectra.SetMarker("region", region[1])
+        spectra.SetMarker("peak", peak)
+        spectra.ExecuteFit()
+        spectra.StoreFit()
+    spectra.ClearFit()
+    fits = spectra.Get("0").dict
+    xml = __main__.fitxml.xml
+    tree = hdtv.fitxml.ET.tostring(xml.CreateXml(fits))
+    assert b"".join(xml.IterXml(fits)) == tree
+
+    out_original = list_fit()
+    __main__.fitxml.WriteXML(spectra.Get("0").ID, temp_file_compressed)
+    spectra.Get("0").Clear()
+    __main__.fitxml.ReadXML(spectra.Get("0").ID, temp_file_compressed)
+    assert out_original == list_fit()
+
+
+def test_fitxml_truncated(tmpdir):
+    """
+    A fitlist that cannot be parsed completely restores no fit at all
+    """
+    for (region, peak) in [((500, 520), 511), ((960, 975), 965)]:
+        spectra.SetMarker("region", region[0])
+        spectra.SetMarker("region", region[1])
+        spectra.SetMarker("peak", peak)
+        spectra.ExecuteFit()
+        spectra.StoreFit()
+    spectra.ClearFit()
+    filename = str(tmpdir.join("fits.xml"))
+    __main__.fitxml.WriteXML(spectra.Get("0").ID, filename)
+    with open(filename, "rb") as f:
+        data = f.read()
+    with open(filename, "wb") as f:
+        # the first fit is complete, the second one is not
+        f.write(data[:data.index(b"</fit>") + 20])
+    spectra.Get("0").Clear()
+    out, err = setup_io(2)
+    with redirect_stdout(out, err):
+        __main__.fitxml.ReadXML(spectra.Get("0").ID, filename)
+    assert "Error reading" in out.getvalue()
+    assert len(spectra.Get("0").dict) == 0
@@ -22,6 +22,7 @@
 import sys
 import os
 import contextlib
+import subprocess
 try: # Python2
     from StringIO import StringIO
 except ImportError: # Python3
@@ -74,3 +75,33 @@ def hdtvcmd(*commands):
         for command in commands:
             hdtv.cmdline.command_line.DoLine(command)
     return f.getvalue().strip(), ferr.getvalue().strip()
+
+def hdtvpopen(tmpdir, args, **kwargs):
+    """
+    Start hdtv in a subprocess with the given command line args (and
+    further keyword args for subprocess.Popen). Returns the Popen object.
+    """
+    env = dict(os.environ)
+    env.pop("HDTV_USER_PATH", None)
+    # Keep the user configuration out of the tests
+    env["XDG_CONFIG_HOME"] = str(tmpdir.join("config"))
+    env["XDG_DATA_HOME"] = str(tmpdir.join("data"))
+    hdtv = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                        "bin", "hdtv")
+    return subprocess.Popen([sys.executable, hdtv] + list(args), env=env,
+                            universal_newlines=True, **kwargs)
+
+def hdtvrun(tmpdir, commands, args=()):
+    """
+    Run hdtv in a headless subprocess with a batchfile of the given
+    commands (and further command line args). Returns the exit status,
+    stdout and stderr output.
+    """
+    batchfile = str(tmpdir.join("batch.hdtv"))
+    with open(batchfile, "w") as f:
+        f.write("\n".join(list(commands) + ["exit"]) + "\n")
+    proc = hdtvpopen(
+        tmpdir, ["--headless", "-b", batchfile] + list(args),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    (out, err) = proc.communicate()
+    return proc.returncode, out, err
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+#-------------------------------------------------------------------------
+# Compare multiplet fits with the analytic gradient and with finite
+# differences (wall time and results)
+#-------------------------------------------------------------------------
+
+from __future__ import print_function
+
+import time
+
+import ROOT
+import hdtv.rootext.fit
+
+import peakgen
+
+ROOT.gRandom.SetSeed(4711)
+
+spec = peakgen.Spectrum(4096, -0.5, 4095.5)
+spec.func.background = peakgen.PolyBg([40.0, -0.005])
+positions = [1000.0 + 14.0 * i for i in range(10)]
+for (i, pos) in enumerate(positions):
+    spec.func.peaks.append(peakgen.TheuerkaufPeak(
+        pos, 2000.0 + 300.0 * i, 8.0, tl=6.0, sh=0.01, sw=1.0))
+hist = spec.GetSampledHist(int(5e5))
+
+Param = ROOT.HDTV.Fit.Param
+
+
+def fit(useGradient):
+    fitter = ROOT.HDTV.Fit.TheuerkaufFitter(970., 1160.)
+    fitter.SetUseGradient(useGradient)
+    for pos in positions:
+        fitter.AddPeak(ROOT.HDTV.Fit.TheuerkaufPeak(
+            fitter.AllocParam(pos), fitter.AllocParam(),
+            fitter.AllocParam(3.4), fitter.AllocParam(),
+            Param.Empty(), fitter.AllocParam(), fitter.AllocParam(1.0)))
+    start = time.time()
+    fitter.Fit(hist, 1)
+    return (time.time() - start, fitter)
+
+
+nruns = 5
+results = {}
+for useGradient in (False, True):
+    times = []
+    for i in range(nruns):
+        (t, fitter) = fit(useGradient)
+        times.append(t)
+    results[useGradient] = fitter
+    print("%-18s best of %d: %8.3f s   chi^2 = %.3f" % (
+        "analytic gradient" if useGradient else "finite differences",
+        nruns, min(times), fitter.GetChisquare()))
+
+for i in range(len(positions)):
+    (num, ana) = (results[False].GetPeak(i), results[True].GetPeak(i))
+    print("peak %2d: pos %9.3f / %9.3f   vol %9.1f / %9.1f" % (
+        i, num.GetPos(), ana.GetPos(), num.GetVol(), ana.GetVol()))
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+#-------------------------------------------------------------------------
+# Check the analytic gradient of the Theuerkauf fit function against
+# finite differences (see gradbench.py for the timing)
+#-------------------------------------------------------------------------
+
+import numpy
+import pytest
+
+import ROOT
+import hdtv.rootext.fit
+
+import peakgen
+
+Param = ROOT.HDTV.Fit.Param
+
+REGION = (960., 1100.)
+# pos, vol, fwhm, left tail, right tail, step height, step width
+PEAKS = [(1000., 6000., 8., 6., None, None, None),
+         (1030., 9000., 8., None, 5., None, None),
+         (1065., 7000., 8., None, None, 0.01, 1.)]
+
+
+@pytest.fixture(scope="module")
+def hist():
+    ROOT.gRandom.SetSeed(4711)
+    spec = peakgen.Spectrum(2048, -0.5, 2047.5)
+    spec.func.background = peakgen.PolyBg([40.0, -0.005])
+    for (pos, vol, fwhm, tl, tr, sh, sw) in PEAKS:
+        spec.func.peaks.append(peakgen.TheuerkaufPeak(
+            pos, vol, fwhm, tl=tl, tr=tr, sh=sh, sw=sw))
+    return spec.GetSampledHist(int(3e5))
+
+
+def fit(hist, useGradient):
+    """
+    Fit PEAKS (with a linear internal background) to hist
+    """
+    fitter = ROOT.HDTV.Fit.TheuerkaufFitter(*REGION)
+    fitter.SetUseGradient(useGradient)
+
+    def param(value):
+        return Param.Empty() if value is None else fitter.AllocParam()
+    for (pos, vol, fwhm, tl, tr, sh, sw) in PEAKS:
+        fitter.AddPeak(ROOT.HDTV.Fit.TheuerkaufPeak(
+            fitter.AllocParam(pos), fitter.AllocParam(),
+            fitter.AllocParam(fwhm / 2.35), param(tl), param(tr), param(sh),
+            Param.Empty() if sw is None else fitter.AllocParam(sw)))
+    fitter.Fit(hist, 1)
+    return fitter
+
+
+def test_gradient_finite_differences(hist):
+    func = fit(hist, True).GetSumFunc()
+    npar = func.GetNpar()
+    params = numpy.array([func.GetParameter(i) for i in range(npar)])
+    xs = [numpy.array([x]) for x in numpy.linspace(REGION[0], REGION[1], 71)]
+    for i in range(npar):
+        h = 1e-5 * max(abs(params[i]), 1.)
+        numeric = []
+        for x in xs:
+            up = params.copy()
+            up[i] += h
+            down = params.copy()
+            down[i] -= h
+            numeric.append(
+                (func.EvalPar(x, up) - func.EvalPar(x, down)) / (2. * h))
+        func.SetParameters(params)
+        analytic = [func.GradientPar(i, x) for x in xs]
+        scale = max(numpy.max(numpy.abs(numeric)), 1e-12)
+        assert analytic == pytest.approx(numeric, rel=1e-3, abs=1e-6 * scale)
+
+
+def test_gradient_fit(hist):
+    results = []
+    for useGradient in (True, False):
+        fitter = fit(hist, useGradient)
+        assert fitter.GetUseGradient() == useGradient
+        values = []
+        errors = []
+        for i in range(fitter.GetNumPeaks()):
+            peak = fitter.GetPeak(i)
+            names = ["Pos", "Vol", "Sigma"]
+            if peak.HasLeftTail():
+                names.append("LeftTail")
+            if peak.HasRightTail():
+                names.append("RightTail")
+            if peak.HasStep():
+                names += ["StepHeight", "StepWidth"]
+            for name in names:
+                values.append(getattr(peak, "Get" + name)())
+                errors.append(getattr(peak, "Get" + name + "Error")())
+        for i in range(2):
+            values.append(fitter.GetIntBgCoeff(i))
+            errors.append(fitter.GetIntBgCoeffError(i))
+        results.append((fitter.GetChisquare(), values, errors))
+    ((chi, values, errors), (chi_num, values_num, errors_num)) = results
+    assert chi == pytest.approx(chi_num, rel=1e-4)
+    assert values == pytest.approx(values_num, rel=1e-3, abs=1e-6)
+    assert errors == pytest.approx(errors_num, rel=1e-2, abs=1e-6)
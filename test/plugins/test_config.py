@@ -113,3 +113,37 @@ def test_register_option_fail():
         error_occurred = True
     assert error_occurred
     assert hdtv.options.Get("test.fail") == "default"
+
+@pytest.fixture
+def lazy_cleanup():
+    yield
+    hdtv.options.variables.pop("test.lazy", None)
+    hdtv.options.lazy.pop("test.lazy", None)
+    try:
+        hdtv.cmdline.RemoveCommand("testlazy run")
+    except (RuntimeError, hdtv.cmdline.HDTVCommandError):
+        pass
+
+def test_lazy_option_and_command(lazy_cleanup):
+    loaded = []
+
+    def load():
+        loaded.append(True)
+        hdtv.options.RegisterOption(
+            "test.lazy", hdtv.options.Option(default=1, parse=int))
+        hdtv.cmdline.AddCommand(
+            "testlazy run", lambda args: hdtv.ui.msg("ran %s" % args))
+
+    hdtv.options.RegisterLazyOption("test.lazy", load)
+    hdtv.cmdline.AddLazyCommand("testlazy run", load)
+    assert "test.lazy" in hdtv.options.Names()
+    assert not loaded
+
+    f, ferr = hdtvcmd("config set test.lazy 5")
+    assert ferr == ""
+    assert hdtv.options.Get("test.lazy") == 5
+    assert len(loaded) == 1
+
+    f, ferr = hdtvcmd("testlazy r 1")
+    assert "ran ['1']" in f
+    assert len(loaded) == 1
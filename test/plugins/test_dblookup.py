@@ -28,6 +28,8 @@ from test.helpers.utils import redirect_stdout, hdtvcmd
 
 import hdtv.cmdline
 import hdtv.options
+import hdtv.database
+import hdtv.database.common
 import hdtv.plugins.dblookup
 
 @pytest.fixture(autouse=True)
@@ -100,6 +102,41 @@ def test_cmd_db_set(db):
     assert "loaded" in f
     assert hdtv.options.Get("database.db") == db
 
+@pytest.mark.parametrize("db", [
+    "promptgammas", "pgaalib_iki2000"])
+def test_db_find_index(db):
+    lib = hdtv.database.databases[db]()
+    energies = [139.94, 510, 511, 1000.5, 2223.3]
+    for fuzziness in [0.005, 0.5, 2.0]:
+        allresults = lib.findmany(energies, fuzziness)
+        for (energy, results) in zip(energies, allresults):
+            expected = [g for g in lib
+                        if abs(g.energy - energy) <= fuzziness]
+            assert results == lib.find(fuzziness, energy=energy)
+            assert [g.ID for g in results] == [g.ID for g in expected]
+    assert all(g.z == 17 for g in lib.find(z=17, energy=1000, fuzziness=500))
+    assert len(lib.find(symbol="cl")) == len(lib.find(z=17))
+
+def test_db_table_cache(tmpdir, monkeypatch):
+    monkeypatch.setattr(hdtv.database.common, "cachedir",
+                        str(tmpdir.join("cache")))
+    table = tmpdir.join("table.dat")
+    table.write("a,b\n1,2\n")
+    calls = []
+
+    def parse(fname):
+        calls.append(fname)
+        return hdtv.database.common.ReadCSV(
+            fname, lambda line: tuple(int(x) for x in line))
+
+    load = hdtv.database.common.LoadTable
+    assert load(str(table), parse) == [(1, 2)]
+    assert load(str(table), parse) == [(1, 2)]
+    assert len(calls) == 1
+    table.write("a,b\n3,4\n")
+    assert load(str(table), parse) == [(3, 4)]
+    assert len(calls) == 2
+
 def count_results(query):
     f, ferr = hdtvcmd(query)
     return int(re.search('Found (\d+) results', f).groups()[0])
@@ -22,14 +22,23 @@
 import re
 import os
 import sys
+import copy
+import math
 
 import pytest
+from uncertainties import ufloat
 
-from test.helpers.utils import redirect_stdout, hdtvcmd
+import ROOT
+
+from test.helpers.utils import redirect_stdout, hdtvcmd, hdtvrun
 
 import hdtv.cmdline
+import hdtv.fit
+import hdtv.fitresults
 import hdtv.options
 import hdtv.session
+import hdtv.spectrum
+import hdtv.window
 
 import __main__
 # We don’t want to see the GUI. Can we prevent this?
@@ -100,6 +109,357 @@ def test_cmd_fit_peakfind():
     assert "Found 68 peaks" in f
     assert ferr == ""
 
+def test_cmd_fit_peakfind_jobs():
+    __main__.s.LoadSpectra(testspectrum)
+    hdtvcmd("fit cache --clear")
+    f, ferr = hdtvcmd("fit peakfind -a -t 0.002 -j 4")
+    assert "Found 68 peaks" in f
+    # No worker processes are forked from a session with a GUI
+    assert "fitting in a single process" in ferr
+    f_list, ferr = hdtvcmd("fit list")
+    spectra.Clear()
+    __main__.s.LoadSpectra(testspectrum)
+    hdtvcmd("fit cache --clear")
+    f, ferr = hdtvcmd("fit peakfind -a -t 0.002")
+    f_serial, ferr = hdtvcmd("fit list")
+    assert f_list == f_serial
+
+def test_peakfind_jobs_headless(tmpdir):
+    commands = ["spectrum get " + os.path.abspath(testspectrum),
+                "fit cache --clear",
+                "fit peakfind -a -t 0.002 -j %d",
+                "fit list"]
+    (status, f_jobs, ferr) = hdtvrun(
+        tmpdir, [c.replace("%d", "4") for c in commands])
+    assert status == 0
+    assert "Found 68 peaks" in f_jobs
+    assert "ERROR" not in ferr
+    assert "single process" not in ferr
+    # Same fits as in a single process
+    (status, f_serial, ferr) = hdtvrun(
+        tmpdir, [c.replace("%d", "1") for c in commands])
+    assert f_jobs == f_serial
+
+def test_peakfind_worker_error(monkeypatch):
+    __main__.s.LoadSpectra(testspectrum)
+    spec = spectra.dict[spectra.activeID]
+    fit = hdtv.fit.Fit(copy.copy(spectra.workFit.fitter), cal=spec.cal)
+
+    def fail(spec):
+        raise RuntimeError("fit failed")
+    monkeypatch.setattr(fit, "FitPeakFunc", fail)
+    # The initializer of the workers resets the hooks
+    monkeypatch.setattr(hdtv.fit.Fit, "FitPeakPreHooks", list())
+    monkeypatch.setattr(hdtv.fit.Fit, "FitPeakPostHooks", list())
+    monkeypatch.setattr(hdtv.plugins.peakfinder, "_worker", None)
+    hdtv.plugins.peakfinder._InitWorker(spec, [fit])
+    (entry, error) = hdtv.plugins.peakfinder._AutoFit(0)
+    assert entry is None
+    assert "RuntimeError: fit failed" in error
+
+def test_cmd_fit_cache():
+    __main__.s.LoadSpectra(testspectrum)
+    hdtvcmd("fit cache --clear")
+    setup_fit()
+    f1, ferr = hdtvcmd("fit execute")
+    assert ferr == ""
+    f, ferr = hdtvcmd("fit cache")
+    assert "0 hits, 1 misses" in f
+    # Same markers and parameters: result is taken from the cache
+    hdtvcmd("fit clear")
+    setup_fit()
+    f2, ferr = hdtvcmd("fit execute")
+    assert ferr == ""
+    assert f2 == f1
+    f, ferr = hdtvcmd("fit cache")
+    assert "1 hits, 1 misses" in f
+    f, ferr = hdtvcmd("fit cache -c")
+    assert "0 entries in memory, 0 hits, 0 misses" in f
+
+@pytest.fixture
+def options():
+    """
+    Set hdtv options for a single test, they are reset afterwards
+    """
+    names = []
+
+    def set_option(name, value):
+        names.append(name)
+        hdtv.options.Set(name, value)
+    yield set_option
+    for name in names:
+        hdtv.options.Reset(name)
+
+def fit_values(fit):
+    """
+    Nominal values and uncertainties of the peak and background parameters
+    of fit
+    """
+    values = []
+    for peak in fit.peaks:
+        for param in (peak.pos, peak.vol, peak.width):
+            values += [param.nominal_value, param.std_dev]
+    for coeff in fit.bgCoeffs:
+        values += [coeff.nominal_value, coeff.std_dev]
+    return values
+
+def test_cmd_fit_background_minuit(options):
+    __main__.s.LoadSpectra(testspectrum)
+    options("fit.cache", "false")
+    setup_fit()
+    f, ferr = hdtvcmd("fit execute")
+    assert ferr == ""
+    linear = fit_values(spectra.workFit)
+    assert len(linear) == 2 * (3 * 2 + 3)
+    # Linear least-squares and MINUIT background fits give the same results
+    options("fit.background.minuit", "true")
+    hdtvcmd("fit clear")
+    setup_fit()
+    f, ferr = hdtvcmd("fit execute")
+    assert ferr == ""
+    assert fit_values(spectra.workFit) == pytest.approx(linear, rel=1e-4)
+
+def test_cmd_fit_cache_options(options):
+    __main__.s.LoadSpectra(testspectrum)
+    hdtvcmd("fit cache --clear")
+    setup_fit()
+    hdtvcmd("fit execute")
+    # Fits with other algorithms are not taken from the cache
+    for (name, value) in (("fit.background.minuit", "true"),
+                          ("fit.gradient", "false")):
+        options(name, value)
+        hdtvcmd("fit clear")
+        setup_fit()
+        f, ferr = hdtvcmd("fit execute")
+        assert ferr == ""
+    f, ferr = hdtvcmd("fit cache")
+    assert "0 hits, 3 misses" in f
+
+def test_headless_fit(options):
+    __main__.s.LoadSpectra(testspectrum)
+    options("fit.cache", "false")
+    setup_fit()
+    f, ferr = hdtvcmd("fit execute")
+    assert ferr == ""
+    workFit = spectra.workFit
+    # Only objects drawn in a headless session are headless
+    assert workFit.headless == spectra.window.headless
+    assert spectra.GetActiveObject().headless == spectra.window.headless
+
+    # A spectrum on a null viewport (as in a headless session) and its fits
+    # get no display objects, but the results are just the same
+    viewport = hdtv.window.NullViewport()
+    spec = hdtv.spectrum.Spectrum(copy.copy(spectra.GetActiveObject().hist))
+    spec.Draw(viewport)
+    assert spec.headless
+    assert spec.displayObj is None
+    fit = copy.copy(workFit)
+    fit.FitPeakFunc(spec)
+    assert fit.headless
+    fit.Draw(viewport)
+    fit.Refresh()
+    assert fit.dispPeakFunc is None
+    assert fit.dispBgFunc is None
+    assert all(p.displayObj is None for p in fit.peaks)
+    assert all(m.displayObj is None for m in fit.peakMarkers)
+    assert fit_values(fit) == fit_values(workFit)
+
+def c_sqrt(x):
+    # like sqrt() in C, which gives NaN instead of raising
+    return math.sqrt(x) if x >= 0. else float("nan")
+
+def c_pow(x, y):
+    return math.pow(x, y) if x >= 0. else float("nan")
+
+def baseline_moments(x, y, e2):
+    """
+    Moments of the bins with centers x, contents y and squared errors e2,
+    computed like the original HDTV::Fit::Integral did: one loop over the
+    bins per moment, in the same order of operations
+    """
+    integral = 0.0
+    for yi in y:
+        integral += yi
+    integral_err = 0.0
+    for e2i in e2:
+        integral_err += e2i
+    integral_err = c_sqrt(integral_err)
+    mean = 0.0
+    for (xi, yi) in zip(x, y):
+        mean += xi * yi
+    mean = mean / integral
+    mean_err = 0.0
+    for (xi, e2i) in zip(x, e2):
+        mean_err += (xi - mean) * (xi - mean) * e2i
+    mean_err = c_sqrt(mean_err) / integral
+    variance = 0.0
+    for (xi, yi) in zip(x, y):
+        variance += (xi - mean) * (xi - mean) * yi
+    variance = variance / integral
+    variance_err = 0.0
+    for (xi, e2i) in zip(x, e2):
+        xm = xi - mean
+        s = xm * xm - variance
+        variance_err += s * s * e2i
+    variance_err = c_sqrt(variance_err) / integral
+    raw_skew = 0.0
+    for (xi, yi) in zip(x, y):
+        xm = xi - mean
+        raw_skew += xm * xm * xm * yi
+    raw_skew = raw_skew / integral
+    raw_skew_err = 0.0
+    for (xi, e2i) in zip(x, e2):
+        xm = xi - mean
+        s = xm * xm * xm - 3. * variance * xm - raw_skew
+        raw_skew_err += s * s * e2i
+    raw_skew_err = c_sqrt(raw_skew_err) / integral
+    skew = raw_skew / c_pow(variance, 1.5)
+    sigma = c_sqrt(variance)
+    (sigma2, sigma3) = (sigma * sigma, sigma * sigma * sigma)
+    skew_err = 0.0
+    for (xi, e2i) in zip(x, e2):
+        xm = xi - mean
+        s = xm * xm * xm / sigma3
+        s -= 3. * xm / sigma
+        s -= 1.5 * skew * xm * xm / sigma2
+        s -= 0.5 * skew
+        skew_err += s * s * e2i
+    skew_err = c_sqrt(skew_err) / integral
+    return [integral, integral_err, mean, mean_err, variance, variance_err,
+            raw_skew, raw_skew_err, skew, skew_err]
+
+def moments_values(moments):
+    return [moments.integral, moments.integralError, moments.mean,
+            moments.meanError, moments.variance, moments.varianceError,
+            moments.rawSkewness, moments.rawSkewnessError, moments.skewness,
+            moments.skewnessError]
+
+def integral_values(integral):
+    return [integral.GetIntegral(), integral.GetIntegralError(),
+            integral.GetMean(), integral.GetMeanError(),
+            integral.GetVariance(), integral.GetVarianceError(),
+            integral.GetRawSkewness(), integral.GetRawSkewnessError(),
+            integral.GetSkewness(), integral.GetSkewnessError()]
+
+def test_integral_batch_baseline():
+    __main__.s.LoadSpectra(testspectrum)
+    setup_fit()
+    hdtvcmd("fit execute", "fit store")
+    spec = spectra.dict[spectra.activeID]
+    bg = spec.dict[spec.ids[0]].fitter.bgFitter
+    hist = spec.hist.hist
+    regions = [(570., 615.), (1100.3, 1200.7), (2000., 2400.)]
+
+    batch = ROOT.HDTV.Fit.IntegralBatch(hist)
+    for (r1, r2) in regions:
+        batch.Add(r1, r2, bg)
+    batch.Add(regions[0][0], regions[0][1])
+    assert batch.GetNumRegions() == len(regions) + 1
+    kinds = (ROOT.HDTV.Fit.IntegralBatch.kTotal,
+             ROOT.HDTV.Fit.IntegralBatch.kBackground,
+             ROOT.HDTV.Fit.IntegralBatch.kBgsub)
+
+    for (i, (r1, r2)) in enumerate(regions):
+        bins = range(hist.FindBin(r1), hist.FindBin(r2) + 1)
+        x = [hist.GetBinCenter(b) for b in bins]
+        y = [hist.GetBinContent(b) for b in bins]
+        e2 = [hist.GetBinError(b) * hist.GetBinError(b) for b in bins]
+        bg_y = [bg.Eval(xi) for xi in x]
+        bg_e2 = [bg.EvalError(xi) * bg.EvalError(xi) for xi in x]
+        sub_y = [yi - bgi for (yi, bgi) in zip(y, bg_y)]
+        sub_e2 = [ei + bgi for (ei, bgi) in zip(e2, bg_e2)]
+        expected = [baseline_moments(x, y, e2),
+                    baseline_moments(x, bg_y, bg_e2),
+                    baseline_moments(x, sub_y, sub_e2)]
+        single = [
+            ROOT.HDTV.Fit.TH1Integral(hist, r1, r2),
+            ROOT.HDTV.Fit.BgIntegral(bg, r1, r2, hist.GetXaxis()),
+            ROOT.HDTV.Fit.TH1BgsubIntegral(hist, bg, r1, r2)]
+        for (kind, values, integral) in zip(kinds, expected, single):
+            # NaN (e.g. the skewness of a single bin) never compares equal
+            values = [repr(v) for v in values]
+            assert [repr(v) for v in moments_values(
+                batch.GetMoments(i, kind))] == values
+            assert [repr(v) for v in integral_values(integral)] == values
+
+    assert all(math.isnan(v) for v in moments_values(
+        batch.GetMoments(len(regions), kinds[1])))
+
+def test_cmd_fit_integral_execute():
+    __main__.s.LoadSpectra(testspectrum)
+    setup_fit()
+    hdtvcmd("fit execute", "fit store", "fit clear")
+    hdtvcmd("fit marker region set 1100", "fit marker region set 1200",
+            "fit marker peak set 1150", "fit execute", "fit store")
+    spec = spectra.dict[spectra.activeID]
+    f, ferr = hdtvcmd("fit integral execute all")
+    assert "Executing integral for region of fit 1 in spectrum" in f
+    assert ferr == ""
+    for fitID in spec.ids:
+        fit = spec.dict[fitID]
+        region = sorted([fit.regionMarkers[0].p1.pos_uncal,
+                         fit.regionMarkers[0].p2.pos_uncal])
+        tot = ROOT.HDTV.Fit.TH1Integral(spec.hist.hist, *region)
+        uncal = fit.integral["tot"]["uncal"]
+        assert uncal["vol"].nominal_value == tot.GetIntegral()
+        assert uncal["vol"].std_dev == tot.GetIntegralError()
+        assert uncal["pos"].nominal_value == tot.GetMean()
+        assert uncal["width"].nominal_value == tot.GetWidth()
+    assert spec.dict[spec.ids[0]].integral["bg"] is not None
+
+def test_fit_results():
+    __main__.s.LoadSpectra(testspectrum)
+    setup_fit()
+    hdtvcmd("fit execute", "fit store")
+    spec = spectra.dict[spectra.activeID]
+    fit = spec.dict[spec.ids[0]]
+    nparams = len(fit.fitter.peakModel.OrderedParamKeys())
+    assert fit.covariance.shape == (2 * nparams, 2 * nparams)
+    results = hdtv.fitresults.FromFits([fit])
+    assert len(results) == 2
+    vol = results.columns["vol"]
+    assert results.Covariance(1, "vol", 1, "vol") == pytest.approx(
+        vol.errors[1] ** 2, rel=1e-3)
+    # Lazily created ufloats agree with the peaks
+    assert results.Row(0)["vol"].nominal_value == \
+        fit.peaks[0].vol.nominal_value
+    # Sorting
+    rows = results.Sort("vol", reverseSort=True).Rows()
+    assert rows[0]["vol"].nominal_value >= rows[1]["vol"].nominal_value
+    f, ferr = hdtvcmd("fit list -k vol -r")
+    assert ferr == ""
+    assert "2 peaks in 1 fits" in f
+    f, ferr = hdtvcmd("fit list -k nonsense")
+    assert "No such attribute" in ferr
+
+def test_fit_results_invalidated():
+    __main__.s.LoadSpectra(testspectrum)
+    setup_fit()
+    hdtvcmd("fit execute", "fit store", "fit integral execute all")
+    spec = spectra.dict[spectra.activeID]
+    fit = spec.dict[spec.ids[0]]
+    # Changing the extras of a peak invalidates the cached results
+    assert "pos_lit" not in fit.PeakResults()
+    fit.peaks[0].extras["pos_lit"] = ufloat(1173.228, 0.003)
+    assert "pos_lit" in fit.PeakResults()
+    fit.peaks[0].extras = dict()
+    assert "pos_lit" not in fit.PeakResults()
+    # Listing the integrals does not change them, a new calibration does
+    spectra.ApplyCalibration(spectra.activeID, [1., 2.])
+    integral = copy.deepcopy(fit.integral)
+    f, ferr = hdtvcmd("fit integral list")
+    assert ferr == ""
+    assert repr(fit.integral) == repr(integral)
+    pos = fit.IntegralResults().Row(0)["pos"]
+    assert pos.nominal_value == pytest.approx(
+        1. + 2. * integral["tot"]["uncal"]["pos"].nominal_value)
+    assert fit.integral["tot"]["cal"]["pos"].nominal_value == \
+        pos.nominal_value
+    spectra.ApplyCalibration(spectra.activeID, None)
+    assert "cal" not in fit.integral["tot"]
+    assert "pos" in fit.IntegralResults()
+
+
 def setup_fit():
     return hdtvcmd(
         "fit parameter background set 2",
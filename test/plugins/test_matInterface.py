@@ -19,10 +19,13 @@
 # along with HDTV; if not, write to the Free Software Foundation,
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
 
+import numpy
 import pytest
 
 from test.helpers.utils import redirect_stdout, hdtvcmd
 
+import ROOT
+
 import hdtv.cmdline
 import hdtv.options
 import hdtv.session
@@ -37,6 +40,8 @@ except RuntimeError:
 
 import hdtv.plugins.specInterface
 import hdtv.plugins.matInterface
+import hdtv.rootext.mfile
+import hdtv.util
 
 s = __main__.s
 spectra = __main__.spectra
@@ -69,10 +74,6 @@ def test_cmd_matrix_view(matrix):
 def test_cmd_cut_marker(matrix):
     raise NotImplementedError
 
-@pytest.mark.skip(reason="need example matrix")
-def test_cmd_cut_execute(matrix):
-    raise NotImplementedError
-
 @pytest.mark.skip(reason="need example matrix")
 def test_cmd_cut_activate(matrix):
     raise NotImplementedError
@@ -88,3 +89,341 @@ def test_cmd_cut_store(matrix):
 @pytest.mark.skip(reason="need example matrix")
 def test_cmd_cut_delete(matrix):
     raise NotImplementedError
+
+
+def write_matrix(fname, fmt, lines, columns, high, seed=42):
+    """
+    Write a random matrix with values in [0, high) to fname and return it
+    as an array of shape (lines, columns)
+    """
+    hist = ROOT.TH2D(fname, fname, columns, -0.5, columns - 0.5,
+                     lines, -0.5, lines - 0.5)
+    values = numpy.random.RandomState(seed).randint(
+        0, high, size=(lines, columns))
+    data = hdtv.util.AsArray(
+        hist.GetArray(), (lines + 2) * (columns + 2), numpy.float64)
+    data.reshape((lines + 2, columns + 2))[1:-1, 1:-1] = values
+    assert (ROOT.MFileHist.WriteTH2(hist, fname, fmt)
+            == ROOT.MFileHist.ERR_SUCCESS)
+    return values
+
+
+def open_matrices(fname, fmt):
+    """
+    Open fname both memory-mapped and through libmfile
+    """
+    mhist = ROOT.MFileHist()
+    assert mhist.Open(fname, fmt) == ROOT.MFileHist.ERR_SUCCESS
+    mmatrix = ROOT.MMapMatrix(fname, mhist, 0)
+    assert not mmatrix.Failed()
+    return mhist, mmatrix, ROOT.MFMatrix(mhist, 0)
+
+
+@pytest.mark.parametrize("fmt, high", [
+    ("le2", 1 << 15), ("le2", 1 << 16), ("he2", 1 << 16),
+    ("le4", 1 << 20), ("he4", 1 << 20), ("lf4", 1000), ("hf8", 1000)])
+def test_mmap_matrix_roundtrip(tmpdir, fmt, high):
+    # Raw matrices have no header, libmfile guesses their size
+    lines, columns = 256, 256
+    fname = str(tmpdir.join("mat." + fmt))
+    write_matrix(fname, fmt, lines, columns, high)
+    mhist, mmatrix, mfmatrix = open_matrices(fname, fmt)
+    assert mmatrix.GetProjXbins() == columns
+    assert mmatrix.GetCutHighBin() == lines - 1
+
+    ref = numpy.zeros(columns)
+    buf = numpy.zeros(columns)
+    for l in range(lines):
+        assert mfmatrix.GetLine(ref, l)
+        assert mmatrix.GetLine(buf, l)
+        assert list(buf) == list(ref)
+
+    for matrix in (mmatrix, mfmatrix):
+        matrix.AddCutRegion(3, 17)
+        matrix.AddCutRegion(40, 45)
+        matrix.AddBgRegion(20, 30)
+    cut = mmatrix.Cut("mmap", "mmap")
+    ref = mfmatrix.Cut("mfile", "mfile")
+    assert ([cut.GetBinContent(b) for b in range(columns + 2)]
+            == [ref.GetBinContent(b) for b in range(columns + 2)])
+
+
+def test_mmap_matrix_truncated(tmpdir):
+    fname = str(tmpdir.join("mat.le4"))
+    write_matrix(fname, "le4", 256, 256, 100)
+    with open(fname, "ab") as f:
+        f.write(b"\0\0")
+    mhist = ROOT.MFileHist()
+    mhist.Open(fname, "le4")
+    assert ROOT.MMapMatrix(fname, mhist, 0).Failed()
+
+
+def read_file(fname):
+    with open(fname, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("fmt", ["le4", "lc"])
+def test_matop_project_threads(tmpdir, fmt):
+    fname = str(tmpdir.join("mat." + fmt))
+    write_matrix(fname, fmt, 256, 256, 1000)
+    for nthreads in (1, 4):
+        prx = str(tmpdir.join("prx%d" % nthreads))
+        pry = str(tmpdir.join("pry%d" % nthreads))
+        assert (ROOT.MatOp.Project(fname, prx, pry, nthreads)
+                == ROOT.MatOp.ERR_SUCCESS)
+    assert read_file(str(tmpdir.join("prx1"))) == read_file(
+        str(tmpdir.join("prx4")))
+    assert read_file(str(tmpdir.join("pry1"))) == read_file(
+        str(tmpdir.join("pry4")))
+
+
+def test_matop_project_no_output(tmpdir):
+    fname = str(tmpdir.join("mat.le4"))
+    write_matrix(fname, "le4", 16, 16, 1000)
+    assert ROOT.MatOp.Project(fname, "", "") == ROOT.MatOp.ERR_NO_OUTPUT
+
+
+@pytest.mark.parametrize("fmt", ["le4", "lc"])
+def test_matop_transpose_threads(tmpdir, fmt):
+    fname = str(tmpdir.join("mat." + fmt))
+    values = write_matrix(fname, fmt, 512, 512, 1000)
+    trans1 = str(tmpdir.join("trans1." + fmt))
+    assert ROOT.MatOp.Transpose(fname, trans1, 1) == ROOT.MatOp.ERR_SUCCESS
+
+    # 1 MB tiles hold 256 columns of the matrix, so this takes two tiles
+    trans4 = str(tmpdir.join("trans4." + fmt))
+    transposer = ROOT.MatTransposer(fname, trans4, 4, 1)
+    steps = 1
+    while transposer.Step():
+        steps += 1
+    assert transposer.Finish() == ROOT.MatOp.ERR_SUCCESS
+    assert steps == 2
+    assert read_file(trans1) == read_file(trans4)
+
+    mhist = ROOT.MFileHist()
+    assert mhist.Open(trans4, fmt) == ROOT.MFileHist.ERR_SUCCESS
+    buf = numpy.zeros(512)
+    for l in (0, 255, 256, 511):
+        mhist.FillBuf1D(buf, 0, l)
+        assert list(buf) == list(values[:, l])
+
+
+def hist_contents(hist):
+    return [hist.GetBinContent(b) for b in range(hist.GetNbinsX() + 2)]
+
+
+GATES = [
+    # (cut regions, background regions), in lines of the matrix
+    ([(10, 20)], [(30, 40), (0, 3)]),
+    ([(15, 25), (24, 31)], [(35, 38)]),
+    ([(100, 100)], []),
+    ([(200, 255), (250, 300)], [(190, 210)])]
+
+
+def add_gate(vmatrix, gate):
+    for (c1, c2) in gate[0]:
+        vmatrix.AddCutRegion(c1, c2)
+    for (b1, b2) in gate[1]:
+        vmatrix.AddBgRegion(b1, b2)
+
+
+def expected_cut(values, gate):
+    """
+    Brute force cut of values (lines x columns) with gate
+    """
+    lines = values.shape[0]
+    cut = numpy.zeros(lines, dtype=bool)
+    bg = numpy.zeros(lines, dtype=bool)
+    for (c1, c2) in gate[0]:
+        cut[min(c1, c2):min(max(c1, c2), lines - 1) + 1] = True
+    for (b1, b2) in gate[1]:
+        bg[min(b1, b2):min(max(b1, b2), lines - 1) + 1] = True
+    result = values[cut].sum(axis=0).astype(numpy.float64)
+    if bg.any():
+        result -= values[bg].sum(axis=0) * (float(cut.sum()) / bg.sum())
+    return list(result)
+
+
+def open_vmatrix(fname, fmt, backend):
+    """
+    Open fname as MMapMatrix or MFMatrix (the MFileHist must be kept alive
+    by the caller)
+    """
+    mhist = ROOT.MFileHist()
+    assert mhist.Open(fname, fmt) == ROOT.MFileHist.ERR_SUCCESS
+    if backend == "mmap":
+        vmatrix = ROOT.MMapMatrix(fname, mhist, 0)
+    else:
+        vmatrix = ROOT.MFMatrix(mhist, 0)
+    assert not vmatrix.Failed()
+    return mhist, vmatrix
+
+
+BACKENDS = [("le4", "mmap"), ("le4", "mfile"), ("lc", "mfile")]
+
+
+@pytest.mark.parametrize("fmt, backend", BACKENDS)
+def test_vmatrix_cut(tmpdir, fmt, backend):
+    fname = str(tmpdir.join("mat." + fmt))
+    values = write_matrix(fname, fmt, 256, 256, 1000)
+    mhist, vmatrix = open_vmatrix(fname, fmt, backend)
+    for gate in GATES:
+        vmatrix.ResetRegions()
+        add_gate(vmatrix, gate)
+        cut = vmatrix.Cut("cut", "cut")
+        assert hist_contents(cut)[1:-1] == pytest.approx(
+            expected_cut(values, gate))
+
+
+@pytest.mark.parametrize("fmt, backend", BACKENDS)
+def test_vmatrix_multicut(tmpdir, fmt, backend):
+    fname = str(tmpdir.join("mat." + fmt))
+    write_matrix(fname, fmt, 256, 256, 1000)
+    mhist, vmatrix = open_vmatrix(fname, fmt, backend)
+
+    single = []
+    for gate in GATES:
+        vmatrix.ResetRegions()
+        add_gate(vmatrix, gate)
+        single.append(hist_contents(vmatrix.Cut("cut", "cut")))
+
+    vmatrix.ResetRegions()
+    for gate in GATES:
+        add_gate(vmatrix, gate)
+        vmatrix.StoreGate()
+    assert vmatrix.GetNGates() == len(GATES)
+    multi = [hist_contents(h) for h in vmatrix.MultiCut("multi", "multi")]
+    assert multi == single
+
+
+class CountingMatrix(ROOT.VMatrix):
+    """
+    VMatrix holding the value l in every column of line l, which records
+    the lines read
+    """
+    def __init__(self, lines, columns):
+        ROOT.VMatrix.__init__(self)
+        self.lines = lines
+        self.columns = columns
+        self.reads = []
+
+    def FindCutBin(self, x):
+        return int(x)
+
+    def GetCutLowBin(self):
+        return 0
+
+    def GetCutHighBin(self):
+        return self.lines - 1
+
+    def GetProjXmin(self):
+        return -0.5
+
+    def GetProjXmax(self):
+        return self.columns - 0.5
+
+    def GetProjXbins(self):
+        return self.columns
+
+    def GetLine(self, buf, l):
+        self.reads.append(l)
+        for c in range(self.columns):
+            buf[c] = l
+        return True
+
+
+def test_vmatrix_read_once():
+    vmatrix = CountingMatrix(64, 5)
+    for gate in GATES[:2]:
+        add_gate(vmatrix, gate)
+        vmatrix.StoreGate()
+    hists = vmatrix.MultiCut("multi", "multi")
+    assert len(hists) == 2
+
+    # Every line belonging to any region is read exactly once, in order
+    lines = set()
+    for (regions, bgs) in GATES[:2]:
+        for (l1, l2) in regions + bgs:
+            lines.update(range(l1, l2 + 1))
+    assert vmatrix.reads == sorted(lines)
+
+    values = numpy.repeat(numpy.arange(64)[:, numpy.newaxis], 5, axis=1)
+    for (hist, gate) in zip(hists, GATES):
+        assert hist_contents(hist)[1:-1] == pytest.approx(
+            expected_cut(values, gate))
+
+
+@pytest.fixture
+def matrix(tmpdir):
+    fname = str(tmpdir.join("mat.mtx"))
+    write_matrix(fname, "lc", 256, 256, 1000)
+    f, ferr = hdtvcmd("matrix get sym %s" % fname)
+    assert "ERROR" not in ferr
+    # ID of the projection
+    return spectra.activeID
+
+
+def cut_spectra(matrix_id):
+    return dict((ID.minor, spec) for (ID, spec) in spectra.dict.items()
+                if ID.major == matrix_id.major and ID.minor < 1000)
+
+
+def test_cmd_cut_execute_list(tmpdir, matrix):
+    gatelist = tmpdir.join("gates.txt")
+    gatelist.write("# gate  background\n"
+                   "10 20  30 40\n"
+                   "\n"
+                   "100 110\n")
+    f, ferr = hdtvcmd("cut execute -l %s" % gatelist)
+    assert "ERROR" not in ferr
+    assert "Executed 2 cuts" in f
+
+    mat = spectra.dict[matrix].matrix
+    assert len(mat.dict) == 2
+    assert len(cut_spectra(matrix)) == 2
+
+    # Each cut of the list is the same as executing it as the work cut
+    spectra.ActivateObject(matrix)
+    for (cutID, markers) in zip(sorted(mat.dict), [(10, 20, 30, 40),
+                                                   (100, 110)]):
+        hdtvcmd("cut clear")
+        hdtvcmd("cut marker region set %s" % markers[0],
+                "cut marker region set %s" % markers[1])
+        for pos in markers[2:]:
+            hdtvcmd("cut marker background set %s" % pos)
+        f, ferr = hdtvcmd("cut execute")
+        assert "ERROR" not in ferr
+        work = spectra.workCut.spec
+        cutSpec = mat.dict[cutID].spec
+        assert cutSpec is not None
+        assert (hist_contents(cutSpec.hist.hist)
+                == hist_contents(work.hist.hist))
+
+
+def test_cmd_cut_execute_write(tmpdir, matrix):
+    gatelist = tmpdir.join("gates.txt")
+    gatelist.write("10 20\n30 40 50 60\n")
+    template = str(tmpdir.join("cut%d.spc"))
+    f, ferr = hdtvcmd("cut execute -l %s -w %s -F lc" % (gatelist, template))
+    assert "ERROR" not in ferr
+    for i in range(2):
+        assert "Wrote cut spectrum to %s" % (template % i) in f
+        assert tmpdir.join("cut%d.spc" % i).check()
+    # Nothing is loaded
+    assert len(spectra.dict[matrix].matrix.dict) == 0
+
+
+def test_cmd_cut_execute_write_errors(tmpdir, matrix):
+    f, ferr = hdtvcmd("cut execute -w %s" % tmpdir.join("cut%d.spc"))
+    assert "--write requires --list" in ferr
+
+    gatelist = tmpdir.join("gates.txt")
+    gatelist.write("10 20\n")
+    f, ferr = hdtvcmd("cut execute -l %s -w %s" % (
+        gatelist, tmpdir.join("cut.spc")))
+    assert "%d placeholder" in ferr
+
+    gatelist.write("10 20 30\n")
+    f, ferr = hdtvcmd("cut execute -l %s" % gatelist)
+    assert "Expected gate limits" in ferr
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import os
+import json
+import pstats
+
+import pytest
+
+from test.helpers.utils import hdtvcmd
+
+import hdtv.cmdline
+import hdtv.options
+import hdtv.timing
+import hdtv.plugins.config
+import hdtv.plugins.profiling
+
+
+@pytest.fixture(autouse=True)
+def prepare():
+    hdtvcmd("profile off", "profile clear")
+    yield
+    hdtvcmd("profile off", "profile clear")
+    hdtv.options.Reset("cmdfile.timing_log")
+
+
+def test_cmd_profile_report():
+    hdtvcmd("config show", "config show table")
+    f, ferr = hdtvcmd("profile report")
+    assert ferr == ""
+    lines = f.split("\n")
+    assert any("config show" in line and " 2 " in line for line in lines)
+    assert "ncalls" not in f
+
+
+def test_cmd_profile_dump(tmpdir):
+    pfile = str(tmpdir.join("hdtv.prof"))
+    sfile = str(tmpdir.join("hdtv.stacks"))
+    hdtvcmd("profile on", "config show", "profile off")
+    f, ferr = hdtvcmd("profile report -n 5")
+    assert "ncalls" in f
+    f, ferr = hdtvcmd("profile dump " + pfile,
+                      "profile dump -f stacks " + sfile)
+    assert ferr == ""
+    assert pstats.Stats(pfile).total_calls > 0
+    with open(sfile) as stacks:
+        lines = stacks.read().splitlines()
+    assert lines
+    for line in lines:
+        assert int(line.rsplit(" ", 1)[1]) >= 0
+
+
+def test_cmd_profile_dump_empty(tmpdir):
+    f, ferr = hdtvcmd("profile dump " + str(tmpdir.join("hdtv.prof")))
+    assert "No profile data" in ferr
+
+
+def test_timing_log(tmpdir):
+    script = str(tmpdir.join("script.hdtv"))
+    with open(script, "w") as f:
+        f.write("# comment\nconfig show\nconfig show table\n")
+    hdtv.options.Set("cmdfile.timing_log", "True")
+    hdtv.cmdline.command_line.ExecCmdfile(script)
+    with open(script + ".timing") as f:
+        entries = [json.loads(line) for line in f]
+    assert [entry["line"] for entry in entries] == [
+        "config show", "config show table"]
+    for entry in entries:
+        assert entry["wall"] >= 0.
+        assert entry["fits"] == 0
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# HDTV - A ROOT-based spectrum analysis software
+#  Copyright (C) 2006-2009  The HDTV development team (see file AUTHORS)
+#
+# This file is part of HDTV.
+#
+# HDTV is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# HDTV is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HDTV; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA
+
+import os
+import time
+import socket
+import subprocess
+
+import pytest
+
+import hdtv.server
+
+from test.helpers.utils import hdtvpopen
+
+testspectrum = os.path.join(
+    os.path.curdir, "test", "share", "osiris_bg.spc")
+
+
+def wait_for_server(path, proc, timeout=60.):
+    """
+    Wait until the server started as proc accepts connections on path
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            return False
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            return True
+        except (OSError, IOError):
+            time.sleep(0.1)
+        finally:
+            probe.close()
+    return False
+
+
+@pytest.fixture
+def server(tmpdir):
+    """
+    Start an hdtv server in a separate (headless) process, yields the path
+    of its socket and its pid
+    """
+    path = str(tmpdir.join("hdtv.sock"))
+    with open(str(tmpdir.join("server.log")), "w") as log:
+        proc = hdtvpopen(
+            tmpdir, ["--headless", "--serve", "--socket", path,
+                     "--workers", "2"],
+            stdout=log, stderr=subprocess.STDOUT)
+    try:
+        assert wait_for_server(path, proc), tmpdir.join("server.log").read()
+        yield (path, proc.pid)
+        hdtv.server.Client(path, stop=True)
+        proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def zombies(pid):
+    """
+    Return the pids of the finished, but not yet collected, children of
+    the process pid
+    """
+    result = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % entry) as f:
+                stat = f.read()
+        except (OSError, IOError):
+            continue
+        # state and parent pid follow the command name in parentheses
+        fields = stat[stat.rfind(")") + 2:].split()
+        if fields[0] == "Z" and int(fields[1]) == pid:
+            result.append(int(entry))
+    return result
+
+
+def test_server_jobs(server, capfd):
+    (path, pid) = server
+    capfd.readouterr()
+    assert hdtv.server.Client(
+        path, commands="spectrum get %s" % testspectrum) == 0
+    out, err = capfd.readouterr()
+    assert "Loaded" in out
+    assert "ERROR" not in err
+    # Each job runs in a fresh copy of the session of the server
+    assert hdtv.server.Client(path, commands="spectrum list") == 0
+    out, err = capfd.readouterr()
+    assert "osiris_bg.spc" not in out
+    # Errors give a nonzero exit status
+    assert hdtv.server.Client(path, commands="spectrum foo") == 1
+    out, err = capfd.readouterr()
+    assert "ERROR" in err
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+def test_server_reap(server):
+    (path, pid) = server
+    assert hdtv.server.Client(path, commands="spectrum list") == 0
+    # Finished workers are collected without waiting for the next client
+    deadline = time.time() + 10 * hdtv.server.Server.reapInterval
+    while zombies(pid) and time.time() < deadline:
+        time.sleep(0.1)
+    assert zombies(pid) == []
+
+
+def test_server_stop(server, capfd):
+    (path, pid) = server
+    assert hdtv.server.Client(path, stop=True) == 0
+    assert hdtv.server.Client(path, commands="spectrum list") == 2
+    out, err = capfd.readouterr()
+    assert "Could not connect" in err
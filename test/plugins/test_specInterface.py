@@ -25,14 +25,20 @@ import sys
 import warnings
 import shutil
 
+import numpy
 import pytest
 
-from test.helpers.utils import redirect_stdout, hdtvcmd
+import ROOT
+
+from test.helpers.utils import redirect_stdout, hdtvcmd, hdtvrun
 from test.helpers.fixtures import temp_file
 
 import hdtv.cmdline
 import hdtv.options
+import hdtv.rootext.display
 import hdtv.session
+import hdtv.speccache
+import hdtv.window
 
 import __main__
 # We don’t want to see the GUI. Can we prevent this?
@@ -90,6 +96,74 @@ def test_cmd_spectrum_get_repeated(num):
     hdtvcmd("spectrum get {}".format(query))
     assert len(s.spectra.dict) == num
 
+def test_cmd_spectrum_get_order():
+    assert len(s.spectra.dict) == 0
+    specfiles = [testspectrum, "test/share/osiris_bg.cal", testspectrum]
+    f, ferr = hdtvcmd("spectrum get {}".format(" ".join(specfiles)))
+    res = re.findall('Loaded (.*) into (\d+)', f)
+    assert len(s.spectra.dict) == len(specfiles)
+    assert [fname for (fname, specid) in res] == specfiles
+    assert [specid for (fname, specid) in res] == ["0", "1", "2"]
+
+def test_cmd_spectrum_get_jobs():
+    assert len(s.spectra.dict) == 0
+    specfiles = [testspectrum, "test/share/osiris_bg.cal", testspectrum]
+    f, ferr = hdtvcmd("spectrum get -j 4 {}".format(" ".join(specfiles)))
+    # No worker processes are forked from a session with a GUI
+    assert "reading in a single process" in ferr
+    res = re.findall('Loaded (.*) into (\d+)', f)
+    assert [fname for (fname, specid) in res] == specfiles
+    assert [specid for (fname, specid) in res] == ["0", "1", "2"]
+
+def test_cmd_spectrum_get_jobs_invalid():
+    f, ferr = hdtvcmd("spectrum get -j 0 {}".format(testspectrum))
+    assert "Invalid number of jobs: 0" in ferr
+    assert len(s.spectra.dict) == 0
+
+def test_spectrum_get_jobs_headless(tmpdir):
+    specfiles = [os.path.abspath(f) for f in [
+        testspectrum, "test/share/osiris_bg.cal", testspectrum,
+        "test/share/osiris_bg.par", testspectrum]]
+    commands = ["config set spectrum.cache false",
+                "spectrum get -j %d {}".format(" ".join(specfiles)),
+                "spectrum list"]
+    commands += ["spectrum write {} lc {}".format(
+        tmpdir.join("j%d_{}.lc".format(i)), i) for i in range(len(specfiles))]
+    outputs = []
+    for jobs in (4, 1):
+        (status, f, ferr) = hdtvrun(
+            tmpdir, [c.replace("%d", str(jobs)) for c in commands])
+        assert status == 0
+        assert "single process" not in ferr
+        f = f.replace(str(tmpdir.join("j%d_" % jobs)), "")
+        outputs.append((f, ferr))
+    # Same spectra, IDs and order as when reading in a single process
+    assert outputs[0] == outputs[1]
+    for i in range(len(specfiles)):
+        written = [tmpdir.join("j{}_{}.lc".format(jobs, i)) for jobs in (4, 1)]
+        assert written[0].check() == written[1].check()
+        if written[1].check():
+            assert written[0].read_binary() == written[1].read_binary()
+
+def test_load_spectra_unlocks(monkeypatch):
+    class Viewport(hdtv.window.NullViewport):
+        locked = 0
+
+        def LockUpdate(self):
+            self.locked += 1
+
+        def UnlockUpdate(self):
+            self.locked -= 1
+
+    def fail(fname, fmt=None):
+        raise RuntimeError("unexpected error")
+    viewport = Viewport()
+    monkeypatch.setattr(s.window, "viewport", viewport)
+    monkeypatch.setattr(hdtv.plugins.specInterface, "FileHistogram", fail)
+    with pytest.raises(RuntimeError):
+        s.LoadSpectra(testspectrum)
+    assert viewport.locked == 0
+
 @pytest.mark.parametrize("pattern", [
     "test/share/osiris_[a-z][a-z].spc"])
 def test_cmd_spectrum_get_pattern(pattern):
@@ -97,6 +171,75 @@ def test_cmd_spectrum_get_pattern(pattern):
     hdtvcmd("spectrum get {}".format(pattern))
     assert len(s.spectra.dict) == 1
 
+@pytest.mark.parametrize("fmt, errors", [
+    ("col", True),
+    ("col:xye", True),
+    ("col:xyi", False)])
+def test_cmd_spectrum_get_col(fmt, errors, temp_file):
+    assert len(s.spectra.dict) == 0
+    with open(temp_file, 'w') as f:
+        f.write("# x y e\n")
+        for x in [2, 0, 3, 1]:
+            f.write("{} {} {}  ! comment\n\n".format(x, 10 * x, x + 1))
+    f, ferr = hdtvcmd("spectrum get {}'{}".format(temp_file, fmt))
+    assert ferr == ""
+    hist = get_spec(0).hist.hist
+    assert hist.GetNbinsX() == 4
+    for x in range(4):
+        assert hist.GetBinCenter(x + 1) == x
+        assert hist.GetBinContent(x + 1) == 10 * x
+        if errors:
+            assert hist.GetBinError(x + 1) == x + 1
+
+@pytest.mark.parametrize("content", [
+    "1 2\n2 3 4\n",
+    "1 2\n2 abc\n",
+    "1 2 3 4\n"])
+def test_cmd_spectrum_get_col_invalid(content, temp_file):
+    assert len(s.spectra.dict) == 0
+    with open(temp_file, 'w') as f:
+        f.write(content)
+    f, ferr = hdtvcmd("spectrum get {}'col".format(temp_file))
+    assert "Could not load" in ferr
+    assert len(s.spectra.dict) == 0
+
+@pytest.mark.parametrize("cache", [
+    "true", "false"])
+def test_cmd_spectrum_get_cached(cache, temp_file):
+    assert len(s.spectra.dict) == 0
+    hdtv.options.Set("spectrum.cache", cache)
+    try:
+        for i in range(3):
+            with open(temp_file, 'w') as f:
+                f.write("\n".join(str(i * x) for x in range(10)))
+            # Ensure a new modification time for each version
+            os.utime(temp_file, (i, i))
+            for _ in range(2):
+                hdtvcmd("spectrum get -s 0 {}'col".format(temp_file))
+                hist = get_spec(0).hist.hist
+                assert hist.GetNbinsX() == 10
+                assert hist.GetBinContent(4) == 3 * i
+                assert hist.GetBinError(4) == pytest.approx((3 * i)**0.5)
+    finally:
+        hdtv.options.Reset("spectrum.cache")
+
+def test_spectrum_cache_evict(tmpdir):
+    cache = hdtv.speccache.SpectrumCache(str(tmpdir))
+    for i in range(3):
+        fname = str(tmpdir.join("spec%d.txt" % i))
+        with open(fname, "w") as f:
+            f.write("1\n")
+        hist = ROOT.TH1D("h%d" % i, "h%d" % i, 1000, 0., 1000.)
+        cache.Put(fname, "col", hist)
+    entries = [str(e) for e in tmpdir.listdir() if e.ext == ".npy"]
+    assert len(entries) == 3
+    # The size is tracked without scanning the directory again
+    assert cache.size == sum(os.path.getsize(e) for e in entries)
+    cache.maxsize = 0
+    cache.Put(fname, "col", hist)
+    assert cache.size == 0
+    assert not [e for e in tmpdir.listdir() if e.ext in (".npy", ".tmp")]
+
 # Loading cal as spec file. This is really stupid, but it works.
 @pytest.mark.parametrize("specfiles", [
     ["test/share/osiris_bg.spc", "test/share/osiris_bg.cal"]])
@@ -272,6 +415,29 @@ def test_cmd_spectrum_rebin(ngroup):
         assert "Rebinning 0 with {} bins per new bin".format(ngroup) in f
         assert get_spec(0).hist.hist.GetNbinsX() == 8192//ngroup
 
+def test_spectrum_counts():
+    hdtvcmd("spectrum get {}".format(testspectrum))
+    hist = get_spec(0).hist
+    counts = hist.counts
+    assert len(counts) == hist.hist.GetNbinsX()
+    assert counts[100] == hist.hist.GetBinContent(101)
+    assert all(hist.errors == numpy.sqrt(counts))
+    with pytest.raises(ValueError):
+        counts[100] = 1.
+    # The array shares memory with the histogram
+    hist.hist.SetBinContent(101, 4711.)
+    assert counts[100] == 4711.
+    hist.counts = numpy.arange(len(counts))
+    assert hist.hist.GetBinContent(101) == 100.
+    hist.errors = numpy.full(len(counts), 2.)
+    assert hist.hist.GetBinError(101) == 2.
+    assert all(hist.variances == 4.)
+    # Rebinning replaces the histogram, old arrays keep the old bins
+    hdtvcmd("spectrum rebin 0 2")
+    assert len(counts) == 8192
+    assert len(hist.counts) == 4096
+    assert hist.counts[50] == 100. + 101.
+
 @pytest.mark.parametrize("copy, matches", [
     ('0', ["0 to 3"]),
     ('0 1', ["0 to 3", "1 to 4"]),
@@ -393,3 +559,60 @@ def test_cmd_spectrum_calbin():
 def get_spec(specid):
     return s.spectra.dict.get(
         [x for x in list(s.spectra.dict) if x.major == specid][0])
+
+
+def display_spec_hist(name, values):
+    """
+    TH1D with the given bin contents (including under- and overflow bin)
+    """
+    nbins = len(values) - 2
+    hist = ROOT.TH1D(name, name, nbins, -0.5, nbins - 0.5)
+    for (b, value) in enumerate(values):
+        hist.SetBinContent(b, value)
+    return hist
+
+
+def check_display_spec(dspec, values, rng):
+    """
+    Compare the region queries of dspec with a brute force over values
+    """
+    nbins = len(values) - 2
+    for overflow in (False, True):
+        dspec.SetDrawUnderflowBin(overflow)
+        dspec.SetDrawOverflowBin(overflow)
+        lo, hi = (0, nbins + 1) if overflow else (1, nbins)
+        for _ in range(300):
+            b1, b2 = (int(b) for b in rng.randint(-3, nbins + 5, size=2))
+            c1 = min(max(b1, lo), hi)
+            c2 = min(max(b2, lo), hi)
+            region = values[c1:c2 + 1]
+            if c2 < c1:
+                assert dspec.GetRegionMaxBin(b1, b2) == c1
+                assert dspec.GetRegionMin(b1, b2) == values[c1]
+                assert dspec.GetRegionSum(b1, b2) == 0.
+            else:
+                assert dspec.GetRegionMaxBin(b1, b2) == c1 + region.argmax()
+                assert dspec.GetRegionMax(b1, b2) == region.max()
+                assert dspec.GetRegionMin(b1, b2) == region.min()
+                assert dspec.GetRegionSum(b1, b2) == region.sum()
+
+            m1, m2 = sorted((max(b1, 0), min(b2, nbins + 1)))
+            c1 = min(max(m1, lo), hi)
+            c2 = min(max(m2, lo), hi)
+            expected = values[c1] if c2 < c1 else values[c1:c2 + 1].max()
+            assert dspec.GetMax_Cached(b1, b2) == expected
+
+
+@pytest.mark.parametrize("nbins", [1, 13, 14, 31, 100, 1001, 4097])
+def test_display_spec_regions(nbins):
+    rng = numpy.random.RandomState(nbins)
+    # Integer counts: sums are exact and there are many equal maxima
+    values = rng.randint(0, 50, size=nbins + 2).astype(numpy.float64)
+    hist = display_spec_hist("dspec", values)
+    dspec = ROOT.HDTV.Display.DisplaySpec(hist)
+    check_display_spec(dspec, values, rng)
+
+    # The summaries of the old histogram must not survive SetHist()
+    values = rng.randint(0, 1000, size=nbins + 35).astype(numpy.float64)
+    dspec.SetHist(display_spec_hist("dspec2", values))
+    check_display_spec(dspec, values, rng)